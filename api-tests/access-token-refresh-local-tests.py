@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+from concurrent.futures import ProcessPoolExecutor
+import time
+import unittest
+import uuid
+
+import common.profiling
+import common.utils
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.utils import BackgroundAccessTokenRefresher
+
+MODULE_NAME = "access-token-refresh-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant. Its tokens
+# expire after _TOKEN_LIFETIME_SECONDS, so they are renewed within the tests.
+_stand_in_server = None
+_TOKEN_LIFETIME_SECONDS = 3
+
+
+def _issue_access_token_in_worker(api_base_url, api_access_key_id):
+    # Runs in a worker process, with its own helper for the shared key.
+    api_helper_util = stand_in_api_helper_util(
+        api_base_url,
+        api_access_key_id=api_access_key_id,
+        api_access_key_expiry_time_seconds=_TOKEN_LIFETIME_SECONDS,
+    )
+    try:
+        return api_helper_util.bearer_access_token(), api_helper_util.access_token_issue_count()
+    finally:
+        api_helper_util.close()
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class AccessTokenRefreshFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        _stand_in_server.add_access_token_route(_TOKEN_LIFETIME_SECONDS)
+        # Every test uses its own key, so no token is shared between tests.
+        self._api_access_key_id = "REFRESH_KEY_{}".format(uuid.uuid4().hex[:8])
+        self._api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(),
+            api_access_key_id=self._api_access_key_id,
+            api_access_key_expiry_time_seconds=_TOKEN_LIFETIME_SECONDS,
+        )
+
+    def tearDown(self):
+        self._api_helper_util.close()
+        _stand_in_server.add_access_token_route(_TOKEN_LIFETIME_SECONDS)
+
+    def _token_request_count(self):
+        return len(
+            [
+                stand_in_request
+                for stand_in_request in _stand_in_server.request_log()
+                if stand_in_request.path == "/api/v2/access/tokens"
+                and stand_in_request.json()["keyId"] == self._api_access_key_id
+            ]
+        )
+
+    def _wait_for(self, condition_function, timeout_seconds=5.0):
+        wait_end_time = time.monotonic() + timeout_seconds
+        while not condition_function() and time.monotonic() < wait_end_time:
+            time.sleep(0.05)
+        return condition_function()
+
+    def test_token_renewed_before_expiry(self):
+        first_bearer_access_token = self._api_helper_util.bearer_access_token()
+        access_token_refresher = self._api_helper_util.start_background_token_refresh(
+            refresh_margin_seconds=1
+        )
+        minimum_time_remaining_seconds = None
+        refresh_end_time = time.monotonic() + _TOKEN_LIFETIME_SECONDS + 0.5
+        while time.monotonic() < refresh_end_time:
+            time_remaining_seconds = (
+                self._api_helper_util.bearer_access_token_time_remaining_seconds()
+            )
+            if minimum_time_remaining_seconds == None:
+                minimum_time_remaining_seconds = time_remaining_seconds
+            minimum_time_remaining_seconds = min(
+                minimum_time_remaining_seconds, time_remaining_seconds
+            )
+            time.sleep(0.05)
+        bearer_access_token = self._api_helper_util.bearer_access_token()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the token was renewed in the background before it expired, so
+        # it was valid throughout, including past the first token's expiry.
+        self.assertGreaterEqual(access_token_refresher.refresh_count(), 1)
+        self.assertNotEqual(bearer_access_token, first_bearer_access_token)
+        self.assertGreater(minimum_time_remaining_seconds, 0)
+
+        # 2.0 Assert that every token after the first was issued by the refresher.
+        self.assertEqual(
+            self._api_helper_util.access_token_issue_count(),
+            1 + access_token_refresher.refresh_count(),
+        )
+        self.assertEqual(access_token_refresher.refresh_failure_count(), 0)
+        return None
+
+    def test_refresh_margin_beyond_token_lifetime(self):
+        self._api_helper_util.bearer_access_token()
+        # A margin longer than the token's lifetime would renew every token at once.
+        access_token_refresher = self._api_helper_util.start_background_token_refresh(
+            refresh_margin_seconds=3600
+        )
+        time.sleep(_TOKEN_LIFETIME_SECONDS)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the margin was cut to a fraction of the token's lifetime.
+        self.assertEqual(
+            access_token_refresher.refresh_margin_seconds(),
+            _TOKEN_LIFETIME_SECONDS
+            * BackgroundAccessTokenRefresher.MAXIMUM_REFRESH_MARGIN_FRACTION,
+        )
+
+        # 2.0 Assert that the refresher renewed the token a few times rather than
+        # issuing tokens continuously.
+        self.assertGreaterEqual(access_token_refresher.refresh_count(), 1)
+        self.assertLessEqual(self._token_request_count(), 4)
+        return None
+
+    def test_failed_refresh_retried(self):
+        retry_interval_seconds = BackgroundAccessTokenRefresher.RETRY_INTERVAL_SECONDS
+        BackgroundAccessTokenRefresher.RETRY_INTERVAL_SECONDS = 0.2
+        self.addCleanup(
+            setattr,
+            BackgroundAccessTokenRefresher,
+            "RETRY_INTERVAL_SECONDS",
+            retry_interval_seconds,
+        )
+        first_bearer_access_token = self._api_helper_util.bearer_access_token()
+        _stand_in_server.add_json_route(
+            "POST", "/api/v2/access/tokens", {"message": "Service Unavailable"}, status_code=503
+        )
+        access_token_refresher = self._api_helper_util.start_background_token_refresh(
+            refresh_margin_seconds=1
+        )
+        refresh_failed = self._wait_for(
+            lambda: access_token_refresher.refresh_failure_count() >= 2
+        )
+        failed_bearer_access_token = self._api_helper_util.bearer_access_token()
+        _stand_in_server.add_access_token_route(_TOKEN_LIFETIME_SECONDS)
+        refreshed = self._wait_for(lambda: access_token_refresher.refresh_count() >= 1)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that failed refreshes were retried while the current token was kept.
+        self.assertTrue(refresh_failed)
+        self.assertEqual(failed_bearer_access_token, first_bearer_access_token)
+
+        # 2.0 Assert that the token was renewed once the API issued tokens again.
+        self.assertTrue(refreshed)
+        self.assertNotEqual(self._api_helper_util.bearer_access_token(), first_bearer_access_token)
+        return None
+
+    def test_token_issued_once_across_processes(self):
+        # The slow issuance keeps the first request in flight while the other worker
+        # processes ask for the same key's token.
+        _stand_in_server.add_access_token_route(_TOKEN_LIFETIME_SECONDS, delay_seconds=0.5)
+        worker_count = 4
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            worker_result_list = list(
+                executor.map(
+                    _issue_access_token_in_worker,
+                    [_stand_in_server.base_url()] * worker_count,
+                    [self._api_access_key_id] * worker_count,
+                )
+            )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that one token was issued, and shared by every worker process.
+        self.assertEqual(self._token_request_count(), 1)
+        self.assertEqual(
+            sum(access_token_issue_count for _, access_token_issue_count in worker_result_list),
+            1,
+        )
+        self.assertEqual(
+            len(set(bearer_access_token for bearer_access_token, _ in worker_result_list)), 1
+        )
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helpers for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
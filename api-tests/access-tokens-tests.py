@@ -1,12 +1,16 @@
 #!/usr/bin/python3
 from datetime import datetime
+import json
 import math
-import requests
 import time
 import unittest
 
 from apiunittestcore import HttpResponseValidator
+import common.profiling
 import common.utils
+from common.benchmarks import StepOutcome
+from common.benchmarks import TokenIssuanceBenchmark
+from common.models import AccessToken
 from common.utils import ApiHelperUtil
 
 MODULE_NAME = "access-tokens-tests"
@@ -21,11 +25,7 @@ class AccessTokensFunctionalTests(unittest.TestCase):
         common.utils.log_info(MODULE_NAME, log_message)
 
     def test_generate_access_token(self):
-        # Create the API Request URL
-        api_request_url = _api_helper_util.get_api_endpoint("access/tokens")
-
         http_headers = {
-            "Content-Type": "application/json",
             "X-LW-UAKS": _api_helper_util.secret_key(),
         }
 
@@ -34,8 +34,13 @@ class AccessTokensFunctionalTests(unittest.TestCase):
             "expiryTime": _api_helper_util.api_access_key_expiry_time_seconds(),
         }
 
-        http_response = requests.post(
-            api_request_url, headers=http_headers, json=post_data_map
+        # The access token request is authenticated by the secret key rather than
+        # a bearer token.
+        http_response = _api_helper_util.make_post_request(
+            "access/tokens",
+            json_data=post_data_map,
+            headers=http_headers,
+            authenticate=False,
         )
         # Let's measure time after the reponse has been generated. This will ignore
         # wait times due to transmission and processing in both directions.
@@ -55,12 +60,7 @@ class AccessTokensFunctionalTests(unittest.TestCase):
 
         # 3.0 Assert that the expected reponse schema is present.
         # The access token should be returned in an application/json schema
-        EXPIRES_AT_JSON_DATA_NAME = "expiresAt"
-        TOKEN_JSON_DATA_NAME = "token"
-        EXPECTED_RESPONSE_JSON_DATA_NAMES = [
-            EXPIRES_AT_JSON_DATA_NAME,
-            TOKEN_JSON_DATA_NAME,
-        ]
+        EXPECTED_RESPONSE_JSON_DATA_NAMES = list(AccessToken.FIELD_NAMES)
         self.assertTrue(
             HttpResponseValidator.validate_response_json(
                 http_response=http_response,
@@ -70,10 +70,8 @@ class AccessTokensFunctionalTests(unittest.TestCase):
 
         # 4.0 Validate the expiration time. The returned time is an ISO 8601
         # formatted UTC date time string: "yyyy-MM-ddTHH:mm:ss.SSSZ"
-        http_response_json_map = http_response.json()
-        returned_expires_at_utc_time_str = http_response_json_map[
-            EXPIRES_AT_JSON_DATA_NAME
-        ]
+        access_token = AccessToken.from_json(http_response.json())
+        returned_expires_at_utc_time_str = access_token.expires_at
         returned_expires_at_utc_time_str = returned_expires_at_utc_time_str.replace(
             "Z", ""
         )
@@ -106,11 +104,47 @@ class AccessTokensFunctionalTests(unittest.TestCase):
 
         # 5.0 Assert that a token string was returned.
         # Are there any rules about token strings we should test?
-        token_string = http_response_json_map[TOKEN_JSON_DATA_NAME]
+        token_string = access_token.token
         self.assertIsInstance(token_string, str)
 
         return None
 
+    def test_access_token_issuance_benchmark(self):
+        # The benchmark is set by "access_token_benchmark" in the configuration file.
+        # It mints many tokens and may throttle the key for a while, so it is best run
+        # on its own:
+        #   python3 access-tokens-tests.py -k=test_access_token_issuance_benchmark
+        token_issuance_benchmark = TokenIssuanceBenchmark.from_map(
+            _api_helper_util.access_token_benchmark_map()
+        )
+        if token_issuance_benchmark == None:
+            self.skipTest("No access token benchmark is configured.")
+        benchmark_report_map = token_issuance_benchmark.run(_api_helper_util)
+        log_message = "Access token issuance benchmark:\n{}".format(
+            json.dumps(benchmark_report_map, indent=2)
+        )
+        common.utils.log_info(MODULE_NAME, log_message)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every rate up to the limiting one was measured.
+        self.assertGreater(len(benchmark_report_map["steps"]), 0)
+        self.assertNotEqual(
+            benchmark_report_map["steps"][0]["outcome"],
+            StepOutcome.FAILED,
+            msg=json.dumps(benchmark_report_map["steps"][0]),
+        )
+
+        # 2.0 Assert that tokens can be issued at least as fast as the configured
+        # minimum sustainable rate, if any.
+        if token_issuance_benchmark.min_sustainable_rate_per_second != None:
+            self.assertGreaterEqual(
+                benchmark_report_map["max_sustainable_rate_per_second"] or 0,
+                token_issuance_benchmark.min_sustainable_rate_per_second,
+                msg=json.dumps(benchmark_report_map, indent=2),
+            )
+        return None
+
 
 if __name__ == "__main__":
     try:
@@ -118,7 +152,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
@@ -1,9 +1,16 @@
 #!/usr/bin/python3
 import time
-import unittest
 
+from apiunittestcore import HttpResponseValidator
+import common.profiling
 import common.utils
+from common.fixtures import ResourceFixtureManager
+from common.fixtures import email_alert_channel_fixture
+from common.fixtures import webhook_alert_channel_fixture
 from common.utils import ApiHelperUtil
+from common.workflow import WorkflowTestCase
+from common.workflow import WorkflowTestSuite
+from common.workflow import workflow_step
 
 MODULE_NAME = "alert-channels-tests"
 _TEST_START_TIMESTAMP = time.time()
@@ -11,11 +18,56 @@ _TEST_START_TIMESTAMP = time.time()
 _api_helper_util = None
 
 
-class AlertChannelsFunctionalTests(unittest.TestCase):
+def load_tests(loader, standard_tests, pattern):
+    # The alert channels created here are consumed by the alert rules and report
+    # rules tests when they are run together.
+    return WorkflowTestSuite(standard_tests)
+
+
+class _UtilFunctions():
+    @staticmethod
+    def create_alert_channel(test_case, resource_fixture):
+        # Creates the alert channel, to be deleted once the workflow has run, and
+        # returns its intgGuid.
+        resource_fixture_manager = ResourceFixtureManager(_api_helper_util)
+        resource_fixture_manager.add_fixture(resource_fixture)
+        test_case.add_workflow_cleanup(resource_fixture_manager.teardown)
+        return resource_fixture_manager.setup()[resource_fixture.fixture_name]
+
+    @staticmethod
+    def make_alert_channel_request(intg_guid):
+        return _api_helper_util.make_get_request("AlertChannels/{}".format(intg_guid))
+
+
+class AlertChannelsFunctionalTests(WorkflowTestCase):
     def setUp(self):
         log_message = "Performing Test ::{}".format(self._testMethodName)
         common.utils.log_info(MODULE_NAME, log_message)
 
+    @workflow_step(produces=["webhook_alert_channel_guid"])
+    def test_create_webhook_alert_channel(self):
+        intg_guid = _UtilFunctions.create_alert_channel(self, webhook_alert_channel_fixture())
+        http_response = _UtilFunctions.make_alert_channel_request(intg_guid)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the created alert channel can be read back.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertEqual(http_response.json()["data"]["intgGuid"], intg_guid)
+        self.produce_value("webhook_alert_channel_guid", intg_guid)
+        return None
+
+    @workflow_step(produces=["email_alert_channel_guid"])
+    def test_create_email_alert_channel(self):
+        intg_guid = _UtilFunctions.create_alert_channel(self, email_alert_channel_fixture())
+        http_response = _UtilFunctions.make_alert_channel_request(intg_guid)
+
+        # 1.0 Assert that the created alert channel can be read back.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertEqual(http_response.json()["data"]["type"], "EmailUser")
+        self.produce_value("email_alert_channel_guid", intg_guid)
+        return None
+
 
 if __name__ == "__main__":
     try:
@@ -23,7 +75,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
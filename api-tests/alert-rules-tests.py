@@ -1,9 +1,17 @@
 #!/usr/bin/python3
 import time
-import unittest
 
+from apiunittestcore import HttpResponseValidator
+import common.profiling
 import common.utils
+from common.fixtures import ResourceFixtureManager
+from common.fixtures import alert_rule_fixture
+from common.fixtures import aws_resource_group_fixture
+from common.fixtures import webhook_alert_channel_fixture
 from common.utils import ApiHelperUtil
+from common.workflow import WorkflowTestCase
+from common.workflow import WorkflowTestSuite
+from common.workflow import workflow_step
 
 MODULE_NAME = "alert-rules-tests"
 _TEST_START_TIMESTAMP = time.time()
@@ -11,11 +19,85 @@ _TEST_START_TIMESTAMP = time.time()
 _api_helper_util = None
 
 
-class AlertRulesFunctionalTests(unittest.TestCase):
+def load_tests(loader, standard_tests, pattern):
+    # An alert rule needs an alert channel and a resource group, created by the alert
+    # channels and resource groups tests. Run them together:
+    #   python3 run-tests.py alert-channels-tests resource-groups-tests alert-rules-tests
+    return WorkflowTestSuite(standard_tests)
+
+
+class AlertRulesFunctionalTests(WorkflowTestCase):
     def setUp(self):
         log_message = "Performing Test ::{}".format(self._testMethodName)
         common.utils.log_info(MODULE_NAME, log_message)
 
+    @workflow_step(
+        consumes=["webhook_alert_channel_guid", "aws_resource_group_guid"],
+        produces=["alert_rule_guid"],
+    )
+    def test_create_alert_rule(self):
+        intg_guid = self.consumed_value("webhook_alert_channel_guid")
+        resource_guid = self.consumed_value("aws_resource_group_guid")
+        resource_fixture_manager = ResourceFixtureManager(_api_helper_util)
+        resource_fixture_manager.add_fixture(
+            alert_rule_fixture(alert_channel_guid=intg_guid, resource_group_guid=resource_guid)
+        )
+        self.add_workflow_cleanup(resource_fixture_manager.teardown)
+        mc_guid = resource_fixture_manager.setup()["alert_rule"]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the alert rule was created.
+        self.assertIsNotNone(mc_guid)
+        self.produce_value("alert_rule_guid", mc_guid)
+        return None
+
+    @workflow_step(consumes=["alert_rule_guid", "webhook_alert_channel_guid"])
+    def test_alert_rule_details(self):
+        http_response = _api_helper_util.make_get_request(
+            "AlertRules/{}".format(self.consumed_value("alert_rule_guid"))
+        )
+
+        # 1.0 Assert that a successful response was returned.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+
+        # 2.0 Assert that the alert rule notifies the alert channel it was created with.
+        self.assertEqual(
+            http_response.json()["data"]["intgGuidList"],
+            [self.consumed_value("webhook_alert_channel_guid")],
+        )
+        return None
+
+    def test_alert_rule_with_prerequisites(self):
+        # Without the alert channels and resource groups tests, the alert rule is
+        # created with an alert channel and a resource group of its own: those two at
+        # once, then the alert rule.
+        resource_fixture_manager = ResourceFixtureManager(_api_helper_util)
+        resource_fixture_manager.add_fixture(webhook_alert_channel_fixture())
+        resource_fixture_manager.add_fixture(aws_resource_group_fixture())
+        resource_fixture_manager.add_fixture(
+            alert_rule_fixture("webhook_alert_channel", "aws_resource_group")
+        )
+        self.addCleanup(resource_fixture_manager.teardown)
+        guid_map = resource_fixture_manager.setup()
+        http_response = _api_helper_util.make_get_request(
+            "AlertRules/{}".format(guid_map["alert_rule"])
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a successful response was returned.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+
+        # 2.0 Assert that the alert rule notifies the alert channel and covers the
+        # resource group it was created with.
+        alert_rule_map = http_response.json()["data"]
+        self.assertEqual(alert_rule_map["intgGuidList"], [guid_map["webhook_alert_channel"]])
+        self.assertEqual(
+            alert_rule_map["filters"]["resourceGroups"], [guid_map["aws_resource_group"]]
+        )
+        return None
+
 
 if __name__ == "__main__":
     try:
@@ -23,7 +105,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+from collections import Counter
+import time
+import unittest
+import uuid
+
+from apiunittestcore import HttpResponseValidator
+import common.profiling
+import common.utils
+from common.standin import StandInResponse
+from common.standin import bearer_token_api_access_key_id
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "api-key-pool-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant. Its tokens
+# name the key they were issued to, and its UserProfile route answers the keys listed
+# in _key_status_code_map with their status code and the tokens in
+# _revoked_bearer_token_set with 401.
+_stand_in_server = None
+_key_status_code_map = {}
+_revoked_bearer_token_set = set()
+
+
+def _user_profile(stand_in_request):
+    authorization = stand_in_request.headers.get("Authorization") or ""
+    if authorization.replace("Bearer ", "") in _revoked_bearer_token_set:
+        return StandInResponse(status_code=401, json_data={"message": "Token revoked"})
+    status_code = _key_status_code_map.get(bearer_token_api_access_key_id(stand_in_request))
+    if status_code != None:
+        return StandInResponse(
+            status_code=status_code,
+            json_data={"message": "Stand-in status {}".format(status_code)},
+            headers={"Retry-After": "30"} if status_code == 429 else None,
+        )
+    return StandInResponse(json_data={"data": [{"username": "stand-in@lacework.net"}]})
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_route("GET", "/api/v2/UserProfile", _user_profile)
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class ApiKeyPoolFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        _key_status_code_map.clear()
+        _revoked_bearer_token_set.clear()
+        # Every test uses its own keys, so no token is shared between tests.
+        self._key_prefix = uuid.uuid4().hex[:8]
+        self._api_helper_util = None
+
+    def tearDown(self):
+        _key_status_code_map.clear()
+        if self._api_helper_util != None:
+            self._api_helper_util.close()
+
+    def _key_id(self, key_name):
+        return "{}_{}".format(self._key_prefix, key_name)
+
+    def _create_api_helper_util(self, api_key_map_list):
+        # The keys are the pool's only ones: the stand-in key is not configured.
+        self._api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(),
+            api_access_key_id=None,
+            secret_key=None,
+            api_keys=[
+                dict(
+                    {
+                        data_name: data_value
+                        for data_name, data_value in api_key_map.items()
+                        if data_name != "name"
+                    },
+                    api_access_key_id=self._key_id(api_key_map["name"]),
+                )
+                for api_key_map in api_key_map_list
+            ],
+        )
+        return self._api_helper_util
+
+    def _key_request_count_map(self):
+        # Requests per key name, as seen by the stand-in server.
+        return Counter(
+            bearer_token_api_access_key_id(stand_in_request).replace(self._key_prefix + "_", "")
+            for stand_in_request in _stand_in_server.request_log()
+            if stand_in_request.path == "/api/v2/UserProfile"
+            and bearer_token_api_access_key_id(stand_in_request).startswith(self._key_prefix)
+        )
+
+    def _key_statistics_map(self):
+        return {
+            key_statistics_map["api_access_key_id"].replace(self._key_prefix + "_", ""): (
+                key_statistics_map
+            )
+            for key_statistics_map in self._api_helper_util.request_statistics()[
+                "api_key_pool"
+            ]["api_keys"]
+        }
+
+    def _get_user_profiles(self, request_count):
+        return [
+            self._api_helper_util.make_get_request("UserProfile", coalesce=False)
+            for _ in range(request_count)
+        ]
+
+    def test_requests_rotate_over_keys(self):
+        api_helper_util = self._create_api_helper_util(
+            [{"name": key_name, "secret_key": "SECRET"} for key_name in ["a", "b", "c"]]
+        )
+        http_response_list = self._get_user_profiles(30)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every request succeeded and the keys took turns.
+        self.assertTrue(
+            all(
+                HttpResponseValidator.is_successful_200_ok_response(http_response)
+                for http_response in http_response_list
+            )
+        )
+        self.assertEqual(self._key_request_count_map(), {"a": 10, "b": 10, "c": 10})
+
+        # 2.0 Assert that each key was issued its own token, once.
+        self.assertEqual(api_helper_util.access_token_issue_count(), 3)
+        self.assertEqual(
+            [
+                key_statistics_map["access_token_issue_count"]
+                for key_statistics_map in self._key_statistics_map().values()
+            ],
+            [1, 1, 1],
+        )
+        return None
+
+    def test_requests_follow_headroom(self):
+        # The first key's budget holds two requests a second; the second's, fifty.
+        self._create_api_helper_util(
+            [
+                {"name": "slow", "secret_key": "SECRET", "rate_limit_requests_per_second": 2},
+                {"name": "fast", "secret_key": "SECRET", "rate_limit_requests_per_second": 50},
+            ]
+        )
+        request_start_time = time.perf_counter()
+        self._get_user_profiles(40)
+        duration_seconds = time.perf_counter() - request_start_time
+
+        # 1.0 Assert that the requests went to the key with headroom left, and ran
+        # far faster than the slow key's budget alone allows.
+        key_request_count_map = self._key_request_count_map()
+        self.assertEqual(sum(key_request_count_map.values()), 40)
+        self.assertGreater(key_request_count_map["fast"], 3 * key_request_count_map["slow"])
+        self.assertLess(duration_seconds, 2.0)
+        return None
+
+    def test_throttled_key_is_quarantined(self):
+        self._create_api_helper_util(
+            [{"name": key_name, "secret_key": "SECRET"} for key_name in ["a", "b", "c"]]
+        )
+        _key_status_code_map[self._key_id("b")] = 429
+        http_response_list = self._get_user_profiles(12)
+
+        # 1.0 Assert that the throttled request was retried by another key, so every
+        # request succeeded.
+        self.assertEqual(
+            [http_response.status_code for http_response in http_response_list], [200] * 12
+        )
+
+        # 2.0 Assert that the throttled key was quarantined after its first request
+        # and the other keys took the rest.
+        self.assertEqual(self._key_request_count_map()["b"], 1)
+        key_statistics_map = self._key_statistics_map()
+        self.assertEqual(key_statistics_map["b"]["quarantine_count"], 1)
+        self.assertTrue(key_statistics_map["b"]["quarantined"])
+        self.assertEqual(key_statistics_map["b"]["last_quarantine_status_code"], 429)
+        return None
+
+    def test_rejected_key_is_quarantined(self):
+        self._create_api_helper_util(
+            [{"name": key_name, "secret_key": "SECRET"} for key_name in ["a", "b"]]
+        )
+        _key_status_code_map[self._key_id("a")] = 401
+        http_response_list = self._get_user_profiles(6)
+
+        # 1.0 Assert that the rejected request was answered to the caller, not retried,
+        # and the rejected key was not used again.
+        self.assertEqual(
+            [http_response.status_code for http_response in http_response_list],
+            [401] + [200] * 5,
+        )
+        self.assertEqual(self._key_request_count_map(), {"a": 1, "b": 5})
+
+        # 2.0 Assert that with every key rejected, requests are still made rather than
+        # held back, so the failure shows.
+        _key_status_code_map[self._key_id("b")] = 403
+        http_response_list = self._get_user_profiles(3)
+        self.assertEqual(
+            [http_response.status_code for http_response in http_response_list], [403, 401, 401]
+        )
+        self.assertEqual(self._key_request_count_map(), {"a": 3, "b": 6})
+        self.assertTrue(
+            all(
+                key_statistics_map["quarantined"]
+                for key_statistics_map in self._key_statistics_map().values()
+            )
+        )
+        return None
+
+
+    def test_revoked_token_is_replaced(self):
+        api_helper_util = self._create_api_helper_util([{"name": "a", "secret_key": "SECRET"}])
+        self._get_user_profiles(1)
+        revoked_bearer_token = api_helper_util.bearer_access_token(
+            api_helper_util.api_key_pool().api_keys()[0]
+        )
+        _revoked_bearer_token_set.add(revoked_bearer_token)
+        http_response_list = self._get_user_profiles(2)
+        # A helper of another process using the same key starts from the shared token
+        # cache file.
+        other_api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(),
+            api_access_key_id=self._key_id("a"),
+            secret_key="SECRET",
+        )
+        self.addCleanup(other_api_helper_util.close)
+        other_http_response = other_api_helper_util.make_get_request("UserProfile")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the request made with the revoked token was answered with
+        # 401, and that the key's next request was made with a new token.
+        self.assertEqual(
+            [http_response.status_code for http_response in http_response_list], [401, 200]
+        )
+        self.assertEqual(api_helper_util.access_token_issue_count(), 2)
+        self.assertNotEqual(
+            api_helper_util.bearer_access_token(api_helper_util.api_key_pool().api_keys()[0]),
+            revoked_bearer_token,
+        )
+
+        # 2.0 Assert that the revoked token was dropped from the shared token cache too.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(other_http_response))
+        return None
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
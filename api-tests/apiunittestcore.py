@@ -1,7 +1,15 @@
 #!/usr/bin/python3
+from concurrent.futures import ThreadPoolExecutor
+import math
+import threading
+import time
 
 MODULE_NAME = "apiunittestcore"
 
+# The endpoint family of bearer access token requests, which are not timed as part of
+# a measured call.
+ACCESS_TOKEN_ENDPOINT_NAME = "access"
+
 
 class HttpResponseCode:
     SUCCESSFUL_RESPONSE_200_OK = 200
@@ -19,6 +27,72 @@ class HttpResponseCode:
     SERVER_ERROR_RESPONSE_500_INTERNAL_SERVER_ERROR = 500
     SERVER_ERROR_RESPONSE_503_SERVICE_UNAVAILABLE = 503
 
+class JsonRecordShapeValidator:
+    # Validates the data names of many JSON records against one expected set of data
+    # names. The data names of a record (its shape) are checked once per unique shape
+    # and the verdict is cached, so validating a long list of records costs one set
+    # hash per record. A shape is the set of a record's data names, in any order. Data
+    # values are only checked for the data names given a value validator: a type, a
+    # tuple of types or a function returning a bool.
+    def __init__(
+        self,
+        expected_json_data_names,
+        match_set_explicitly=False,
+        json_data_value_validators=None,
+    ):
+        self._expected_json_data_names = frozenset(expected_json_data_names)
+        self._match_set_explicitly = match_set_explicitly
+        self._json_data_value_validator_list = list(
+            (json_data_value_validators or {}).items()
+        )
+        self._shape_verdict_map = {}
+
+    def unique_shape_count(self):
+        return len(self._shape_verdict_map)
+
+    def _validate_shape(self, json_data_names):
+        input_json_data_names = frozenset(json_data_names)
+        if self._match_set_explicitly and len(input_json_data_names) != len(
+            self._expected_json_data_names
+        ):
+            return False
+        return self._expected_json_data_names <= input_json_data_names
+
+    def _validate_values(self, json_map):
+        for key, value_validator in self._json_data_value_validator_list:
+            if key not in json_map:
+                continue
+            value = json_map[key]
+            if isinstance(value_validator, (type, tuple)):
+                if not isinstance(value, value_validator):
+                    return False
+            elif not value_validator(value):
+                return False
+        return True
+
+    def validate(self, json_map):
+        if not isinstance(json_map, dict):
+            return False
+        shape = frozenset(json_map)
+        shape_verdict = self._shape_verdict_map.get(shape)
+        if shape_verdict == None:
+            shape_verdict = self._validate_shape(shape)
+            self._shape_verdict_map[shape] = shape_verdict
+        if not shape_verdict:
+            return False
+        return (not self._json_data_value_validator_list) or self._validate_values(
+            json_map
+        )
+
+    def validate_all(self, json_map_list):
+        if not isinstance(json_map_list, list):
+            return False
+        for json_map in json_map_list:
+            if not self.validate(json_map):
+                return False
+        return True
+
+
 class JsonDataValidator:
     @staticmethod
     def validate_json_data_names(
@@ -39,6 +113,22 @@ class JsonDataValidator:
                     break
         return expected_names_found
 
+    @staticmethod
+    def validate_json_data_names_list(
+        json_map_list,
+        expected_json_data_names,
+        match_set_explicitly=False,
+        json_data_value_validators=None,
+    ):
+        # The bulk form of validate_json_data_names for lists of JSON records.
+        if not isinstance(expected_json_data_names, list):
+            return False
+        return JsonRecordShapeValidator(
+            expected_json_data_names,
+            match_set_explicitly=match_set_explicitly,
+            json_data_value_validators=json_data_value_validators,
+        ).validate_all(json_map_list)
+
     @staticmethod
     def validate_json_data(
         json_map, expected_json_data_map, match_data_explicitly=False
@@ -59,6 +149,184 @@ class JsonDataValidator:
 
         return expected_data_found
 
+class LatencyDistribution:
+    # The response times of repeated calls to one endpoint. Calls that raised an error
+    # are kept as unsuccessful samples, with their errors.
+    def __init__(
+        self,
+        latency_seconds_list,
+        elapsed_time_seconds,
+        unsuccessful_response_count=0,
+        request_error_list=None,
+    ):
+        self._sorted_latency_seconds_list = sorted(latency_seconds_list)
+        self._elapsed_time_seconds = elapsed_time_seconds
+        self._unsuccessful_response_count = unsuccessful_response_count
+        self._request_error_list = list(request_error_list or [])
+
+    def sample_count(self):
+        return len(self._sorted_latency_seconds_list)
+
+    def unsuccessful_response_count(self):
+        return self._unsuccessful_response_count
+
+    def request_error_list(self):
+        return list(self._request_error_list)
+
+    def percentile_ms(self, percentile):
+        # Nearest-rank percentile.
+        if not self._sorted_latency_seconds_list:
+            return 0.0
+        rank = max(1, math.ceil(percentile / 100.0 * self.sample_count()))
+        return self._sorted_latency_seconds_list[rank - 1] * 1000.0
+
+    def p50_ms(self):
+        return self.percentile_ms(50)
+
+    def p95_ms(self):
+        return self.percentile_ms(95)
+
+    def max_ms(self):
+        return self.percentile_ms(100)
+
+    def throughput_rps(self):
+        if self._elapsed_time_seconds <= 0:
+            return 0.0
+        return self.sample_count() / self._elapsed_time_seconds
+
+    def as_map(self):
+        return {
+            "sample_count": self.sample_count(),
+            "unsuccessful_response_count": self._unsuccessful_response_count,
+            "request_errors": [repr(request_error) for request_error in self._request_error_list],
+            "min_ms": round(self.percentile_ms(0), 1),
+            "p50_ms": round(self.p50_ms(), 1),
+            "p90_ms": round(self.percentile_ms(90), 1),
+            "p95_ms": round(self.p95_ms(), 1),
+            "p99_ms": round(self.percentile_ms(99), 1),
+            "max_ms": round(self.max_ms(), 1),
+            "throughput_rps": round(self.throughput_rps(), 2),
+            "latencies_ms": [
+                round(latency_seconds * 1000.0, 1)
+                for latency_seconds in self._sorted_latency_seconds_list
+            ],
+        }
+
+
+class LatencyBudget:
+    # The latency and throughput an endpoint must meet. Any limit left as None is not
+    # checked. Budgets are configured per endpoint in "latency_budgets", e.g.
+    # {"Queries": {"iterations": 20, "concurrency": 4, "p95_ms": 1500}}
+    ITERATIONS = "iterations"
+    CONCURRENCY = "concurrency"
+    P50_MS = "p50_ms"
+    P95_MS = "p95_ms"
+    MAX_MS = "max_ms"
+    MIN_THROUGHPUT_RPS = "min_throughput_rps"
+
+    def __init__(
+        self,
+        iterations=10,
+        concurrency=1,
+        p50_ms=None,
+        p95_ms=None,
+        max_ms=None,
+        min_throughput_rps=None,
+    ):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.p50_ms = p50_ms
+        self.p95_ms = p95_ms
+        self.max_ms = max_ms
+        self.min_throughput_rps = min_throughput_rps
+
+    @staticmethod
+    def from_map(latency_budget_map):
+        if not isinstance(latency_budget_map, dict):
+            return None
+        validated_latency_budget_map = {
+            key: value
+            for key, value in latency_budget_map.items()
+            if key
+            in [
+                LatencyBudget.ITERATIONS,
+                LatencyBudget.CONCURRENCY,
+                LatencyBudget.P50_MS,
+                LatencyBudget.P95_MS,
+                LatencyBudget.MAX_MS,
+                LatencyBudget.MIN_THROUGHPUT_RPS,
+            ]
+        }
+        return LatencyBudget(**validated_latency_budget_map)
+
+
+class LatencyBudgetVerdict:
+    # The outcome of checking a latency distribution against a budget. It is true when
+    # the budget is met. Its string form holds every violation and the full latency
+    # distribution, so it can be passed straight to an assertion as its message.
+    def __init__(self, endpoint_name, latency_distribution, latency_budget):
+        self.endpoint_name = endpoint_name
+        self.latency_distribution = latency_distribution
+        self.latency_budget = latency_budget
+        self.violation_list = []
+        self._check_budget()
+
+    def _check_budget(self):
+        for budget_name, budget_ms, measured_ms in [
+            (LatencyBudget.P50_MS, self.latency_budget.p50_ms, self.latency_distribution.p50_ms()),
+            (LatencyBudget.P95_MS, self.latency_budget.p95_ms, self.latency_distribution.p95_ms()),
+            (LatencyBudget.MAX_MS, self.latency_budget.max_ms, self.latency_distribution.max_ms()),
+        ]:
+            if budget_ms != None and measured_ms > budget_ms:
+                self.violation_list.append(
+                    "{} {:.1f} exceeds the budget of {}".format(budget_name, measured_ms, budget_ms)
+                )
+        if (
+            self.latency_budget.min_throughput_rps != None
+            and self.latency_distribution.throughput_rps() < self.latency_budget.min_throughput_rps
+        ):
+            self.violation_list.append(
+                "{} {:.2f} is below the budget of {}".format(
+                    LatencyBudget.MIN_THROUGHPUT_RPS,
+                    self.latency_distribution.throughput_rps(),
+                    self.latency_budget.min_throughput_rps,
+                )
+            )
+        if self.latency_distribution.unsuccessful_response_count() > 0:
+            self.violation_list.append(
+                "{} of {} responses were unsuccessful".format(
+                    self.latency_distribution.unsuccessful_response_count(),
+                    self.latency_distribution.sample_count(),
+                )
+            )
+        request_error_list = self.latency_distribution.request_error_list()
+        if request_error_list:
+            self.violation_list.append(
+                "{} requests raised an error, the first: {!r}".format(
+                    len(request_error_list), request_error_list[0]
+                )
+            )
+
+    def within_budget(self):
+        return not self.violation_list
+
+    def __bool__(self):
+        return self.within_budget()
+
+    def __repr__(self):
+        verdict_message = "Latency budget {} for {}".format(
+            "met" if self.within_budget() else "missed", self.endpoint_name
+        )
+        for violation in self.violation_list:
+            verdict_message += "\n    {}".format(violation)
+        verdict_message += "\n    Latency distribution: {}".format(
+            self.latency_distribution.as_map()
+        )
+        return verdict_message
+
+    __str__ = __repr__
+
+
 class HttpResponseValidator:
     @staticmethod
     def validate_response_json(
@@ -81,6 +349,85 @@ class HttpResponseValidator:
                 )
         return expected_response
 
+    @staticmethod
+    def measure_response_latency(
+        request_function, iteration_count=10, concurrency=1, api_helper_util=None
+    ):
+        # Calls request_function iteration_count times, with up to concurrency calls
+        # at once, and returns the distribution of its response times. A call that
+        # raises an error is kept as an unsuccessful sample.
+        #
+        # Given the API helper making the requests, its bearer token is issued before
+        # timing starts, and a call's latency is that of its API requests as reported
+        # to the helper's response listeners, without the time they queued for the
+        # helper's rate and concurrency limits.
+        request_latency_state = threading.local()
+
+        def record_request_latency(endpoint_name, http_response, latency_seconds):
+            if endpoint_name == ACCESS_TOKEN_ENDPOINT_NAME:
+                return None
+            request_latency_state.latency_seconds = (
+                getattr(request_latency_state, "latency_seconds", None) or 0.0
+            ) + latency_seconds
+
+        def timed_request(_):
+            request_latency_state.latency_seconds = None
+            request_start_time = time.perf_counter()
+            try:
+                http_response = request_function()
+            except Exception as error:
+                return time.perf_counter() - request_start_time, False, error
+            latency_seconds = time.perf_counter() - request_start_time
+            if request_latency_state.latency_seconds != None:
+                latency_seconds = request_latency_state.latency_seconds
+            return (
+                latency_seconds,
+                HttpResponseValidator.is_successful_response(http_response),
+                None,
+            )
+
+        if api_helper_util != None:
+            api_helper_util.bearer_access_token()
+            api_helper_util.add_response_listener(record_request_latency)
+        try:
+            measurement_start_time = time.perf_counter()
+            if concurrency > 1:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    timed_response_list = list(
+                        executor.map(timed_request, range(iteration_count))
+                    )
+            else:
+                timed_response_list = [timed_request(i) for i in range(iteration_count)]
+            elapsed_time_seconds = time.perf_counter() - measurement_start_time
+        finally:
+            if api_helper_util != None:
+                api_helper_util.remove_response_listener(record_request_latency)
+
+        return LatencyDistribution(
+            [latency_seconds for latency_seconds, _, _ in timed_response_list],
+            elapsed_time_seconds,
+            unsuccessful_response_count=len(
+                [successful for _, successful, _ in timed_response_list if not successful]
+            ),
+            request_error_list=[
+                request_error
+                for _, _, request_error in timed_response_list
+                if request_error != None
+            ],
+        )
+
+    @staticmethod
+    def validate_response_latency(
+        endpoint_name, request_function, latency_budget, api_helper_util=None
+    ):
+        latency_distribution = HttpResponseValidator.measure_response_latency(
+            request_function,
+            iteration_count=latency_budget.iterations,
+            concurrency=latency_budget.concurrency,
+            api_helper_util=api_helper_util,
+        )
+        return LatencyBudgetVerdict(endpoint_name, latency_distribution, latency_budget)
+
     @staticmethod
     def is_informational_response(http_response):
         return http_response.status_code >= 100 and http_response.status_code < 200
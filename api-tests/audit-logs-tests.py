@@ -1,10 +1,12 @@
 #!/usr/bin/python3
-
+from datetime import timedelta
 import time
 import unittest
 
+import common.profiling
 import common.utils
 from common.utils import ApiHelperUtil
+from common.sharding import assert_sharded_time_range_fetch
 
 MODULE_NAME = "audit-logs-tests"
 _TEST_START_TIMESTAMP = time.time()
@@ -17,6 +19,37 @@ class AuditLogsFunctionalTests(unittest.TestCase):
         log_message = "Performing Test ::{}".format(self._testMethodName)
         common.utils.log_info(MODULE_NAME, log_message)
 
+    def test_list_audit_logs_over_time_range(self):
+        # Fetch the last 7 days of audit logs as time window shards fetched in parallel.
+        # The shards are merged back into one time ordered stream of records.
+        TEST_TIME_RANGE = timedelta(days=7)
+        CREATED_TIME_JSON_DATA_NAME = "createdTime"
+        USER_NAME_JSON_DATA_NAME = "userName"
+        USER_ACTION_JSON_DATA_NAME = "userAction"
+        EXPECTED_RECORD_JSON_DATA_NAMES = [
+            CREATED_TIME_JSON_DATA_NAME,
+            USER_NAME_JSON_DATA_NAME,
+            USER_ACTION_JSON_DATA_NAME,
+        ]
+
+        # Begin assertions and validations
+        # https://yourlacework.lacework.net/api/v2/docs#tag/AuditLogs
+
+        # 1.0 Assert that every record has the expected record schema, and that the
+        # records are within the time range and time ordered.
+        sharded_fetch_statistics = assert_sharded_time_range_fetch(
+            self,
+            _api_helper_util,
+            "AuditLogs",
+            CREATED_TIME_JSON_DATA_NAME,
+            EXPECTED_RECORD_JSON_DATA_NAMES,
+            time_range=TEST_TIME_RANGE,
+        )
+
+        log_message = "::{} fetched {}".format(self._testMethodName, sharded_fetch_statistics)
+        common.utils.log_info(MODULE_NAME, log_message)
+        return None
+
 
 if __name__ == "__main__":
     try:
@@ -24,7 +57,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+import threading
+import time
+import unittest
+import uuid
+
+import common.profiling
+import common.utils
+from common.benchmarks import StepOutcome
+from common.benchmarks import TokenIssuanceBenchmark
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.utils import RequestRateLimiter
+
+MODULE_NAME = "benchmarks-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant. Its
+# access/tokens route issues tokens at up to _ISSUANCE_RATE_PER_SECOND, answers
+# faster requests with 429, takes _ISSUANCE_LATENCY_SECONDS per token and runs its
+# clock _SERVER_CLOCK_OFFSET_SECONDS ahead of the local clock.
+_stand_in_server = None
+_ISSUANCE_RATE_PER_SECOND = 40
+_ISSUANCE_LATENCY_SECONDS = 0.02
+_SERVER_CLOCK_OFFSET_SECONDS = 1.5
+_EXPIRY_TIME_SECONDS = 3600
+
+
+class _ThrottlingTokenIssuer:
+    def __init__(self):
+        self._rate_limiter = RequestRateLimiter(_ISSUANCE_RATE_PER_SECOND, burst_size=4)
+        self.issued_count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, stand_in_request):
+        time.sleep(_ISSUANCE_LATENCY_SECONDS)
+        if self._rate_limiter.try_acquire() > 0.0:
+            return StandInResponse(status_code=429, json_data={"message": "Too Many Requests"})
+        with self._lock:
+            self.issued_count += 1
+        expires_at_date_time = datetime.now(timezone.utc) + timedelta(
+            seconds=stand_in_request.json()["expiryTime"] + _SERVER_CLOCK_OFFSET_SECONDS
+        )
+        return StandInResponse(
+            status_code=201,
+            json_data={
+                "expiresAt": expires_at_date_time.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+                "token": uuid.uuid4().hex,
+            },
+        )
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    # Replaces the stand-in's own access/tokens route.
+    _stand_in_server.add_route("POST", "/api/v2/access/tokens", _ThrottlingTokenIssuer())
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class BenchmarksFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(), api_access_key_expiry_time_seconds=_EXPIRY_TIME_SECONDS
+        )
+
+    def tearDown(self):
+        self._api_helper_util.close()
+
+    def test_highest_sustainable_issuance_rate(self):
+        benchmark_report_map = TokenIssuanceBenchmark.from_map(
+            {"rates_per_second": [20, 10, 80], "concurrency": 8, "step_duration_seconds": 1.0}
+        ).run(self._api_helper_util)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the rates were tried in rising order up to the first
+        # throttled rate, and the rate below it is the highest sustainable rate.
+        self.assertEqual(
+            [
+                (step_map["rate_per_second"], step_map["outcome"])
+                for step_map in benchmark_report_map["steps"]
+            ],
+            [
+                (10, StepOutcome.SUSTAINED),
+                (20, StepOutcome.SUSTAINED),
+                (80, StepOutcome.THROTTLED),
+            ],
+        )
+        self.assertEqual(benchmark_report_map["max_sustainable_rate_per_second"], 20)
+        self.assertEqual(benchmark_report_map["limited_at_rate_per_second"], 80)
+        self.assertEqual(benchmark_report_map["limited_by"], StepOutcome.THROTTLED)
+
+        # 2.0 Assert that the sustained steps issued a token for every request, at
+        # their rate, and their latencies include the issuance time.
+        for step_map in benchmark_report_map["steps"][:2]:
+            self.assertEqual(step_map["issued_count"], step_map["rate_per_second"])
+            self.assertGreater(
+                step_map["issued_rate_per_second"], 0.9 * step_map["rate_per_second"]
+            )
+            self.assertGreaterEqual(
+                step_map["latency"]["min_ms"], _ISSUANCE_LATENCY_SECONDS * 1000
+            )
+        throttled_step_map = benchmark_report_map["steps"][2]
+        self.assertEqual(throttled_step_map["request_count"], 80)
+        self.assertGreater(throttled_step_map["throttled_count"], 0)
+
+        # 3.0 Assert that the expiresAt skew shows the server clock offset, within
+        # the precision of expiresAt and half the issuance latency.
+        expires_at_skew_map = benchmark_report_map["expires_at_skew"]
+        self.assertGreaterEqual(expires_at_skew_map["sample_count"], 30)
+        self.assertAlmostEqual(
+            expires_at_skew_map["p50_ms"], _SERVER_CLOCK_OFFSET_SECONDS * 1000, delta=50
+        )
+        return None
+
+    def test_saturated_concurrency(self):
+        # One request in flight at 20ms each cannot issue 100 tokens a second. The few
+        # requests throttled as it catches up are tolerated.
+        benchmark_report_map = TokenIssuanceBenchmark(
+            rates_per_second=[100],
+            concurrency=1,
+            step_duration_seconds=0.5,
+            max_throttled_ratio=0.5,
+        ).run(self._api_helper_util)
+
+        # 1.0 Assert that the step is reported as saturated rather than sustained, and
+        # its requests fell behind their schedule.
+        step_map = benchmark_report_map["steps"][0]
+        self.assertEqual(step_map["outcome"], StepOutcome.SATURATED)
+        self.assertEqual(benchmark_report_map["max_sustainable_rate_per_second"], None)
+        self.assertGreater(step_map["schedule_lag"]["max_ms"], 100)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
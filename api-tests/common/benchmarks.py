@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import math
+import threading
+import time
+
+from apiunittestcore import LatencyDistribution
+from common.utils import ApiHelperUtil
+from common.utils import api_endpoint_family
+from common.utils import configure_test_environment
+from common.utils import log_info
+
+MODULE_NAME = "benchmarks"
+
+ACCESS_TOKENS_API_REQUEST = "access/tokens"
+THROTTLED_HTTP_STATUS_CODE = 429
+# A step whose successful issuance rate falls below this share of its target rate
+# could not keep up, e.g. because its concurrency was too low for the latency.
+SATURATED_RATE_RATIO = 0.9
+
+
+class StepOutcome:
+    SUSTAINED = "sustained"
+    THROTTLED = "throttled"
+    FAILED = "failed"
+    SATURATED = "saturated"
+
+
+def _distribution_map(value_seconds_list):
+    # Nearest-rank percentiles in milliseconds of values which may be negative.
+    sorted_value_seconds_list = sorted(value_seconds_list)
+    if not sorted_value_seconds_list:
+        return {"sample_count": 0}
+
+    def percentile_ms(percentile):
+        rank = max(1, math.ceil(percentile / 100.0 * len(sorted_value_seconds_list)))
+        return round(sorted_value_seconds_list[rank - 1] * 1000.0, 1)
+
+    return {
+        "sample_count": len(sorted_value_seconds_list),
+        "min_ms": percentile_ms(0),
+        "p50_ms": percentile_ms(50),
+        "p95_ms": percentile_ms(95),
+        "p99_ms": percentile_ms(99),
+        "max_ms": percentile_ms(100),
+    }
+
+
+def _expires_at_timestamp(expires_at_utc_time_str):
+    # The API returns an ISO 8601 formatted UTC date time string: "yyyy-MM-ddTHH:mm:ss.SSSZ"
+    try:
+        return datetime.fromisoformat(expires_at_utc_time_str.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+class TokenIssuanceStep:
+    # The tokens issued at one target rate.
+    def __init__(self, rate_per_second, concurrency, elapsed_time_seconds):
+        self.rate_per_second = rate_per_second
+        self.concurrency = concurrency
+        self.elapsed_time_seconds = elapsed_time_seconds
+        self.latency_seconds_list = []
+        self.expires_at_skew_seconds_list = []
+        self.issued_count = 0
+        self.throttled_count = 0
+        self.failed_count = 0
+        # How late the requests were sent against their schedule, which grows when
+        # the concurrency cannot keep up with the rate.
+        self.schedule_lag_seconds_list = []
+
+    def request_count(self):
+        return self.issued_count + self.throttled_count + self.failed_count
+
+    def issued_rate_per_second(self):
+        if self.elapsed_time_seconds <= 0:
+            return 0.0
+        return self.issued_count / self.elapsed_time_seconds
+
+    def throttled_ratio(self):
+        return self.throttled_count / max(1, self.request_count())
+
+    def outcome(self, max_throttled_ratio):
+        if self.throttled_count and self.throttled_ratio() > max_throttled_ratio:
+            return StepOutcome.THROTTLED
+        if self.failed_count:
+            return StepOutcome.FAILED
+        if self.issued_rate_per_second() < SATURATED_RATE_RATIO * self.rate_per_second:
+            return StepOutcome.SATURATED
+        return StepOutcome.SUSTAINED
+
+    def as_map(self, max_throttled_ratio):
+        latency_map = LatencyDistribution(
+            self.latency_seconds_list,
+            self.elapsed_time_seconds,
+            unsuccessful_response_count=self.throttled_count + self.failed_count,
+        ).as_map()
+        # The individual latencies of a long step would swamp the report.
+        del latency_map["latencies_ms"]
+        return {
+            "rate_per_second": self.rate_per_second,
+            "concurrency": self.concurrency,
+            "outcome": self.outcome(max_throttled_ratio),
+            "request_count": self.request_count(),
+            "issued_count": self.issued_count,
+            "throttled_count": self.throttled_count,
+            "failed_count": self.failed_count,
+            "issued_rate_per_second": round(self.issued_rate_per_second(), 2),
+            "elapsed_time_seconds": round(self.elapsed_time_seconds, 3),
+            "latency": latency_map,
+            "expires_at_skew": _distribution_map(self.expires_at_skew_seconds_list),
+            "schedule_lag": _distribution_map(self.schedule_lag_seconds_list),
+        }
+
+
+class TokenIssuanceBenchmark:
+    # Mints access tokens at a rising series of target rates, rates_per_second, each
+    # for step_duration_seconds with up to concurrency requests in flight, and stops
+    # at the first rate which is throttled (more than max_throttled_ratio of the
+    # requests answered with 429), fails or cannot be kept up. Requests are sent on a
+    # fixed schedule, whatever the response times, so the offered rate is the target.
+    #
+    # Each step records the issuance latency distribution and the distribution of the
+    # expiresAt skew: the returned expiresAt less the local time the request was
+    # served (the midpoint of request and response) plus the requested expiry time.
+    # A steady positive skew is a server clock ahead of the local clock; its spread is
+    # the margin a token refresh must keep.
+    #
+    # Tokens are minted with the helper's key over its session, but around its
+    # adaptive concurrency limit, which would otherwise back off from the throttling
+    # being measured. Minting many tokens may throttle the key for a while, so run the
+    # benchmark on its own.
+    RATES_PER_SECOND = "rates_per_second"
+    CONCURRENCY = "concurrency"
+    STEP_DURATION_SECONDS = "step_duration_seconds"
+    MAX_THROTTLED_RATIO = "max_throttled_ratio"
+    EXPIRY_TIME_SECONDS = "expiry_time_seconds"
+    MIN_SUSTAINABLE_RATE_PER_SECOND = "min_sustainable_rate_per_second"
+
+    def __init__(
+        self,
+        rates_per_second=(1, 2, 4, 8),
+        concurrency=4,
+        step_duration_seconds=10.0,
+        max_throttled_ratio=0.0,
+        expiry_time_seconds=None,
+        min_sustainable_rate_per_second=None,
+    ):
+        self.rates_per_second = sorted(rates_per_second)
+        self.concurrency = concurrency
+        self.step_duration_seconds = step_duration_seconds
+        self.max_throttled_ratio = max_throttled_ratio
+        self.expiry_time_seconds = expiry_time_seconds
+        self.min_sustainable_rate_per_second = min_sustainable_rate_per_second
+
+    @staticmethod
+    def from_map(benchmark_map):
+        if not isinstance(benchmark_map, dict):
+            return None
+        validated_benchmark_map = {
+            key: value
+            for key, value in benchmark_map.items()
+            if key
+            in [
+                TokenIssuanceBenchmark.RATES_PER_SECOND,
+                TokenIssuanceBenchmark.CONCURRENCY,
+                TokenIssuanceBenchmark.STEP_DURATION_SECONDS,
+                TokenIssuanceBenchmark.MAX_THROTTLED_RATIO,
+                TokenIssuanceBenchmark.EXPIRY_TIME_SECONDS,
+                TokenIssuanceBenchmark.MIN_SUSTAINABLE_RATE_PER_SECOND,
+            ]
+        }
+        return TokenIssuanceBenchmark(**validated_benchmark_map)
+
+    def run(self, api_helper_util):
+        # Returns the benchmark report map.
+        expiry_time_seconds = self.expiry_time_seconds
+        if expiry_time_seconds == None:
+            expiry_time_seconds = api_helper_util.api_access_key_expiry_time_seconds() or 3600
+        step_map_list = []
+        all_skew_seconds_list = []
+        max_sustainable_rate_per_second = None
+        limiting_step_map = None
+        for rate_per_second in self.rates_per_second:
+            token_issuance_step = self._run_step(
+                api_helper_util, rate_per_second, expiry_time_seconds
+            )
+            step_map = token_issuance_step.as_map(self.max_throttled_ratio)
+            step_map_list.append(step_map)
+            all_skew_seconds_list.extend(token_issuance_step.expires_at_skew_seconds_list)
+            log_message = "access/tokens at {}/s: {} tokens issued, {} throttled, p95 {} ms".format(
+                rate_per_second,
+                step_map["issued_count"],
+                step_map["throttled_count"],
+                step_map["latency"]["p95_ms"],
+            )
+            log_info(MODULE_NAME, log_message)
+            if step_map["outcome"] != StepOutcome.SUSTAINED:
+                limiting_step_map = step_map
+                break
+            max_sustainable_rate_per_second = rate_per_second
+        return {
+            "endpoint": ACCESS_TOKENS_API_REQUEST,
+            "concurrency": self.concurrency,
+            "step_duration_seconds": self.step_duration_seconds,
+            "expiry_time_seconds": expiry_time_seconds,
+            "max_sustainable_rate_per_second": max_sustainable_rate_per_second,
+            "limited_at_rate_per_second": (
+                limiting_step_map["rate_per_second"] if limiting_step_map != None else None
+            ),
+            "limited_by": limiting_step_map["outcome"] if limiting_step_map != None else None,
+            "expires_at_skew": _distribution_map(all_skew_seconds_list),
+            "steps": step_map_list,
+        }
+
+    def _run_step(self, api_helper_util, rate_per_second, expiry_time_seconds):
+        request_count = max(1, int(round(rate_per_second * self.step_duration_seconds)))
+        api_request_url = api_helper_util.get_api_endpoint(ACCESS_TOKENS_API_REQUEST)
+        http_headers = {
+            "Content-Type": "application/json",
+            "X-LW-UAKS": api_helper_util.secret_key(),
+        }
+        post_data_map = {
+            "keyId": api_helper_util.api_access_key_id(),
+            "expiryTime": expiry_time_seconds,
+        }
+        http_session = api_helper_util.http_session()
+        # The token requests are sent on the helper's session directly, so they take
+        # the timeout configured for the access tokens endpoint themselves.
+        request_timeout = api_helper_util.request_timeouts().timeout(
+            api_endpoint_family(api_request_url)
+        )
+        step_lock = threading.Lock()
+        token_issuance_step = TokenIssuanceStep(rate_per_second, self.concurrency, 0.0)
+        step_start_time = time.perf_counter()
+
+        def issue_token(request_index):
+            scheduled_time = step_start_time + request_index / rate_per_second
+            delay_seconds = scheduled_time - time.perf_counter()
+            if delay_seconds > 0:
+                time.sleep(delay_seconds)
+            schedule_lag_seconds = max(0.0, time.perf_counter() - scheduled_time)
+            request_start_timestamp = time.time()
+            request_start_time = time.perf_counter()
+            try:
+                http_response = http_session.post(
+                    api_request_url,
+                    headers=http_headers,
+                    json=post_data_map,
+                    timeout=request_timeout,
+                )
+            except Exception:
+                http_response = None
+            latency_seconds = time.perf_counter() - request_start_time
+            served_timestamp = request_start_timestamp + latency_seconds / 2
+            expires_at_time = None
+            if http_response != None and http_response.status_code in [200, 201]:
+                try:
+                    expires_at_time = _expires_at_timestamp(http_response.json().get("expiresAt"))
+                except (ValueError, AttributeError):
+                    expires_at_time = None
+            with step_lock:
+                token_issuance_step.schedule_lag_seconds_list.append(schedule_lag_seconds)
+                token_issuance_step.latency_seconds_list.append(latency_seconds)
+                if (
+                    http_response != None
+                    and http_response.status_code == THROTTLED_HTTP_STATUS_CODE
+                ):
+                    token_issuance_step.throttled_count += 1
+                elif expires_at_time == None:
+                    token_issuance_step.failed_count += 1
+                else:
+                    token_issuance_step.issued_count += 1
+                    token_issuance_step.expires_at_skew_seconds_list.append(
+                        expires_at_time - (served_timestamp + expiry_time_seconds)
+                    )
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(issue_token, range(request_count)))
+        token_issuance_step.elapsed_time_seconds = time.perf_counter() - step_start_time
+        return token_issuance_step
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(
+        description="Benchmark the access/tokens issuance rate of the configured API key."
+    )
+    argument_parser.add_argument(
+        "--rates",
+        default="1,2,4,8",
+        help="Comma separated target issuance rates per second, tried in rising order.",
+    )
+    argument_parser.add_argument("--concurrency", type=int, default=4)
+    argument_parser.add_argument("--step-duration", type=float, default=10.0)
+    argument_parser.add_argument("--max-throttled-ratio", type=float, default=0.0)
+    argument_parser.add_argument("--config", default=None)
+    argument_parser.add_argument("--output", default="access-token-benchmark.json")
+    arguments = argument_parser.parse_args()
+    api_helper_util = ApiHelperUtil(configure_test_environment(arguments.config))
+    benchmark_report_map = TokenIssuanceBenchmark(
+        rates_per_second=[float(rate) for rate in arguments.rates.split(",")],
+        concurrency=arguments.concurrency,
+        step_duration_seconds=arguments.step_duration,
+        max_throttled_ratio=arguments.max_throttled_ratio,
+    ).run(api_helper_util)
+    api_helper_util.close()
+    with open(arguments.output, "w") as output_file:
+        json.dump(benchmark_report_map, output_file, indent=2)
+    print(
+        "Highest sustainable issuance rate: {}/s, written to {}".format(
+            benchmark_report_map["max_sustainable_rate_per_second"], arguments.output
+        )
+    )
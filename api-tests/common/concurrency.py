@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+import collections
+import math
+import threading
+import time
+
+MODULE_NAME = "concurrency"
+
+THROTTLED_HTTP_STATUS_CODES = [429, 503]
+
+
+class ConcurrencyLimitTimeoutError(Exception):
+    # Raised when no request slot was free within the caller's acquire timeout.
+    pass
+
+
+class AdaptiveConcurrencyLimiter:
+    # Bounds the number of requests in flight with an additive increase, multiplicative
+    # decrease (AIMD) limit. Each time a full limit's worth of requests completes
+    # healthily the limit grows by additive_increase. A throttled response (429/503),
+    # a failed request or a latency spike shrinks it by multiplicative_decrease.
+    #
+    # A latency spike is a response slower than latency_spike_ratio times the moving
+    # average latency of its latency key, e.g. the method and path template of the
+    # request. Keys are tracked separately as their latencies differ widely.
+    #
+    # time_function is the monotonic clock of the decrease cooldown and limit history,
+    # replaceable to test the limiter without waiting.
+    LATENCY_AVERAGE_WEIGHT = 0.1
+    MINIMUM_LATENCY_SAMPLE_COUNT = 10
+    # The most recent changes of limit kept, so a soak run does not grow the history
+    # without bound.
+    LIMIT_HISTORY_LENGTH = 1000
+
+    INITIAL_LIMIT = "initial_limit"
+    MINIMUM_LIMIT = "minimum_limit"
+    MAXIMUM_LIMIT = "maximum_limit"
+    ADDITIVE_INCREASE = "additive_increase"
+    MULTIPLICATIVE_DECREASE = "multiplicative_decrease"
+    LATENCY_SPIKE_RATIO = "latency_spike_ratio"
+    DECREASE_COOLDOWN_SECONDS = "decrease_cooldown_seconds"
+
+    def __init__(
+        self,
+        initial_limit=8,
+        minimum_limit=1,
+        maximum_limit=64,
+        additive_increase=1,
+        multiplicative_decrease=0.5,
+        latency_spike_ratio=3.0,
+        decrease_cooldown_seconds=1.0,
+        time_function=time.monotonic,
+    ):
+        self._time_function = time_function
+        self._limit = float(min(maximum_limit, max(minimum_limit, initial_limit)))
+        self._minimum_limit = minimum_limit
+        self._maximum_limit = maximum_limit
+        self._additive_increase = additive_increase
+        self._multiplicative_decrease = multiplicative_decrease
+        self._latency_spike_ratio = latency_spike_ratio
+        self._decrease_cooldown_seconds = decrease_cooldown_seconds
+        self._in_flight_count = 0
+        self._healthy_completion_count = 0
+        self._decrease_cooldown_end_time = 0.0
+        self._average_latency_map = {}
+        self._start_time = self._time_function()
+        self._limit_history = collections.deque(
+            [(0.0, self.current_limit())], maxlen=AdaptiveConcurrencyLimiter.LIMIT_HISTORY_LENGTH
+        )
+        self._increase_count = 0
+        self._decrease_count = 0
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def from_map(adaptive_concurrency_map):
+        validated_map = {
+            key: value
+            for key, value in (adaptive_concurrency_map or {}).items()
+            if key
+            in [
+                AdaptiveConcurrencyLimiter.INITIAL_LIMIT,
+                AdaptiveConcurrencyLimiter.MINIMUM_LIMIT,
+                AdaptiveConcurrencyLimiter.MAXIMUM_LIMIT,
+                AdaptiveConcurrencyLimiter.ADDITIVE_INCREASE,
+                AdaptiveConcurrencyLimiter.MULTIPLICATIVE_DECREASE,
+                AdaptiveConcurrencyLimiter.LATENCY_SPIKE_RATIO,
+                AdaptiveConcurrencyLimiter.DECREASE_COOLDOWN_SECONDS,
+            ]
+        }
+        return AdaptiveConcurrencyLimiter(**validated_map)
+
+    def current_limit(self):
+        return int(math.floor(self._limit))
+
+    def maximum_limit(self):
+        return self._maximum_limit
+
+    def in_flight_count(self):
+        return self._in_flight_count
+
+    def limit_history(self):
+        # (seconds since the limiter was created, limit) for the most recent changes of
+        # limit.
+        with self._condition:
+            return list(self._limit_history)
+
+    def statistics(self):
+        with self._condition:
+            return {
+                "current_limit": self.current_limit(),
+                "increase_count": self._increase_count,
+                "decrease_count": self._decrease_count,
+                "limit_history": [
+                    [round(elapsed_time_seconds, 3), limit]
+                    for elapsed_time_seconds, limit in self._limit_history
+                ],
+            }
+
+    def acquire(self, timeout_seconds=None):
+        # Waits for a free request slot, at most timeout_seconds when given. Returns
+        # whether a slot was taken.
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._in_flight_count < self.current_limit(), timeout_seconds
+            ):
+                return False
+            self._in_flight_count += 1
+            return True
+
+    def release(self, latency_seconds, http_status_code=None, failed=False, latency_key=None):
+        with self._condition:
+            # The limit only grows while it is in use, so a serial caller never inflates
+            # it.
+            limit_in_use = self._in_flight_count * 2 >= self.current_limit()
+            self._in_flight_count -= 1
+            throttled = failed or http_status_code in THROTTLED_HTTP_STATUS_CODES
+            if throttled or self._latency_spike(latency_key, latency_seconds):
+                self._decrease_limit()
+            elif limit_in_use:
+                self._healthy_completion_count += 1
+                if self._healthy_completion_count >= self.current_limit():
+                    self._healthy_completion_count = 0
+                    self._increase_limit()
+            self._condition.notify_all()
+
+    def call(self, request_function, latency_key=None, acquire_timeout_seconds=None):
+        # Runs request_function in a limited slot. A result with a status_code, such as
+        # a requests response, feeds its status code back into the limit.
+        if not self.acquire(acquire_timeout_seconds):
+            raise ConcurrencyLimitTimeoutError(
+                "No request slot of the {} allowed in flight was free within {:.3f}s.".format(
+                    self.current_limit(), acquire_timeout_seconds
+                )
+            )
+        request_start_time = time.perf_counter()
+        try:
+            http_response = request_function()
+        except Exception:
+            self.release(time.perf_counter() - request_start_time, failed=True, latency_key=latency_key)
+            raise
+        self.release(
+            time.perf_counter() - request_start_time,
+            http_status_code=getattr(http_response, "status_code", None),
+            latency_key=latency_key,
+        )
+        return http_response
+
+    def _latency_spike(self, latency_key, latency_seconds):
+        sample_count, average_latency_seconds = self._average_latency_map.get(
+            latency_key, (0, latency_seconds)
+        )
+        latency_spike = (
+            sample_count >= AdaptiveConcurrencyLimiter.MINIMUM_LATENCY_SAMPLE_COUNT
+            and latency_seconds > self._latency_spike_ratio * average_latency_seconds
+        )
+        if not latency_spike:
+            # Spikes are kept out of the average so it tracks healthy latency.
+            average_latency_seconds += AdaptiveConcurrencyLimiter.LATENCY_AVERAGE_WEIGHT * (
+                latency_seconds - average_latency_seconds
+            )
+        self._average_latency_map[latency_key] = (sample_count + 1, average_latency_seconds)
+        return latency_spike
+
+    def _increase_limit(self):
+        if self._limit >= self._maximum_limit:
+            return None
+        self._limit = min(self._maximum_limit, self._limit + self._additive_increase)
+        self._increase_count += 1
+        self._record_limit()
+
+    def _decrease_limit(self):
+        # Requests already in flight when the limit drops report the same congestion,
+        # so only one decrease is made per cooldown.
+        current_time = self._time_function()
+        self._healthy_completion_count = 0
+        if current_time < self._decrease_cooldown_end_time:
+            return None
+        self._decrease_cooldown_end_time = current_time + self._decrease_cooldown_seconds
+        self._limit = max(self._minimum_limit, self._limit * self._multiplicative_decrease)
+        self._decrease_count += 1
+        self._record_limit()
+
+    def _record_limit(self):
+        limit = self.current_limit()
+        if self._limit_history[-1][1] != limit:
+            self._limit_history.append((self._time_function() - self._start_time, limit))
@@ -0,0 +1,325 @@
+#!/usr/bin/python3
+import fnmatch
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import math
+import random
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urlsplit
+
+import urllib3
+
+MODULE_NAME = "faultproxy"
+
+# Body bytes are written in chunks of this size when their pace is limited.
+_PACED_WRITE_CHUNK_BYTES = 1024
+# Hop-by-hop headers apply to one connection and are never forwarded.
+_HOP_BY_HOP_HEADER_NAMES = frozenset(
+    [
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "te",
+        "trailers",
+        "transfer-encoding",
+        "upgrade",
+        "host",
+        "content-length",
+    ]
+)
+
+
+def lognormal_latency(median_seconds, sigma=0.5):
+    # A long-tailed latency distribution for FaultRule(latency_function=...).
+    return lambda rng: median_seconds * math.exp(rng.gauss(0.0, sigma))
+
+
+def exponential_latency(mean_seconds):
+    return lambda rng: rng.expovariate(1.0 / mean_seconds)
+
+
+class FaultRule:
+    # The faults injected into the requests matching path_pattern (an fnmatch pattern
+    # of the request path, e.g. "/api/v2/Queries*") and http_method, if given. Rules are
+    # tried in the order they were added; the first matching rule applies.
+    #
+    # A matching request is faulted with the given probability, skipping the first
+    # after_count matches and faulting at most max_count, e.g. a burst of five 429s:
+    #
+    #   FaultRule("/api/v2/Queries", status_code=429, retry_after_seconds=1, max_count=5)
+    #
+    # Faults:
+    #   latency_seconds, jitter_seconds, latency_function(rng)
+    #       Delay the response by latency_seconds, plus a uniform jitter up to
+    #       jitter_seconds, plus a latency drawn from latency_function.
+    #   status_code, retry_after_seconds
+    #       Answer with this status, without contacting the upstream.
+    #   connection_reset
+    #       Reset the connection instead of answering.
+    #   truncate_body_fraction
+    #       Announce the whole body but send only this fraction of it, then close.
+    #   bandwidth_bytes_per_second
+    #       Send the body no faster than this.
+    #   slow_loris_interval_seconds
+    #       Send the body one byte per interval, so every read returns just in time.
+    def __init__(
+        self,
+        path_pattern="*",
+        http_method=None,
+        probability=1.0,
+        after_count=0,
+        max_count=None,
+        latency_seconds=0.0,
+        jitter_seconds=0.0,
+        latency_function=None,
+        status_code=None,
+        retry_after_seconds=None,
+        connection_reset=False,
+        truncate_body_fraction=None,
+        bandwidth_bytes_per_second=None,
+        slow_loris_interval_seconds=None,
+    ):
+        self.path_pattern = path_pattern
+        self.http_method = http_method
+        self.probability = probability
+        self.after_count = after_count
+        self.max_count = max_count
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.latency_function = latency_function
+        self.status_code = status_code
+        self.retry_after_seconds = retry_after_seconds
+        self.connection_reset = connection_reset
+        self.truncate_body_fraction = truncate_body_fraction
+        self.bandwidth_bytes_per_second = bandwidth_bytes_per_second
+        self.slow_loris_interval_seconds = slow_loris_interval_seconds
+        self.match_count = 0
+        self.injected_count = 0
+
+    def matches(self, http_method, path):
+        if self.http_method != None and self.http_method != http_method:
+            return False
+        return fnmatch.fnmatchcase(path, self.path_pattern)
+
+    def latency(self, rng):
+        latency_seconds = self.latency_seconds
+        if self.jitter_seconds:
+            latency_seconds += rng.uniform(0.0, self.jitter_seconds)
+        if self.latency_function != None:
+            latency_seconds += self.latency_function(rng)
+        return max(0.0, latency_seconds)
+
+    def statistics(self):
+        return {
+            "path_pattern": self.path_pattern,
+            "http_method": self.http_method,
+            "match_count": self.match_count,
+            "injected_count": self.injected_count,
+        }
+
+
+class _FaultProxyRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        return None
+
+    def _handle_request(self):
+        content_length = int(self.headers.get("Content-Length") or 0)
+        request_body = self.rfile.read(content_length) if content_length else None
+        fault_proxy = self.server.fault_proxy
+        fault_rule, latency_seconds = fault_proxy.fault_rule(self.command, urlsplit(self.path).path)
+        if latency_seconds > 0:
+            time.sleep(latency_seconds)
+        if fault_rule != None and fault_rule.connection_reset:
+            self._reset_connection()
+            return None
+        if fault_rule != None and fault_rule.status_code != None:
+            status_code = fault_rule.status_code
+            header_list = [("Content-Type", "application/json")]
+            if fault_rule.retry_after_seconds != None:
+                header_list.append(("Retry-After", str(fault_rule.retry_after_seconds)))
+            body = json.dumps({"message": "Injected fault {}".format(status_code)}).encode()
+        else:
+            status_code, header_list, body = fault_proxy.forward(
+                self.command, self.path, self.headers, request_body
+            )
+
+        self.send_response(status_code)
+        for header_name, header_value in header_list:
+            self.send_header(header_name, header_value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "HEAD":
+            return None
+        if fault_rule != None and fault_rule.truncate_body_fraction != None:
+            # The client waits for the announced Content-Length and reads a short body
+            # when the connection closes.
+            body = body[: int(len(body) * fault_rule.truncate_body_fraction)]
+            self.close_connection = True
+        self._write_body(body, fault_rule)
+
+    def _write_body(self, body, fault_rule):
+        if fault_rule == None or (
+            fault_rule.bandwidth_bytes_per_second == None
+            and fault_rule.slow_loris_interval_seconds == None
+        ):
+            self.wfile.write(body)
+            return None
+        if fault_rule.slow_loris_interval_seconds != None:
+            chunk_size_bytes = 1
+            chunk_interval_seconds = fault_rule.slow_loris_interval_seconds
+        else:
+            chunk_size_bytes = _PACED_WRITE_CHUNK_BYTES
+            chunk_interval_seconds = chunk_size_bytes / fault_rule.bandwidth_bytes_per_second
+        # Chunks are paced against the start time, so sleep overshoot does not add up.
+        write_start_time = time.perf_counter()
+        for chunk_index, chunk_start_index in enumerate(range(0, len(body), chunk_size_bytes)):
+            chunk_write_time = write_start_time + chunk_index * chunk_interval_seconds
+            delay_seconds = chunk_write_time - time.perf_counter()
+            if delay_seconds > 0:
+                time.sleep(delay_seconds)
+            self.wfile.write(body[chunk_start_index : chunk_start_index + chunk_size_bytes])
+            self.wfile.flush()
+
+    def _reset_connection(self):
+        # Closing a socket with a zero linger time sends a TCP reset.
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        self.connection.close()
+        self.close_connection = True
+
+    do_GET = _handle_request
+    do_POST = _handle_request
+    do_PUT = _handle_request
+    do_PATCH = _handle_request
+    do_DELETE = _handle_request
+    do_HEAD = _handle_request
+
+
+class FaultInjectingProxy:
+    # A local reverse proxy between the suite and an upstream, e.g. a LocalStandInServer
+    # or a tenant, which injects faults into the requests matching its rules. Configure
+    # an API helper with "api_base_url" set to base_url() to send its requests through
+    # it. Rules may be added and removed while requests are in flight.
+    #
+    #   with FaultInjectingProxy(stand_in_server.base_url()) as fault_proxy:
+    #       fault_proxy.add_rule(FaultRule("/api/v2/Queries*", latency_seconds=0.5))
+    def __init__(self, upstream_base_url, seed=0, host="127.0.0.1", upstream_timeout_seconds=60):
+        self._upstream_base_url = upstream_base_url.rstrip("/")
+        self._random = random.Random(seed)
+        self._rule_list = []
+        self._forwarded_request_count = 0
+        self._upstream_error_count = 0
+        self._lock = threading.Lock()
+        self._pool_manager = urllib3.PoolManager(
+            timeout=urllib3.Timeout(total=upstream_timeout_seconds), retries=False
+        )
+        self._http_server = ThreadingHTTPServer((host, 0), _FaultProxyRequestHandler)
+        self._http_server.daemon_threads = True
+        self._http_server.fault_proxy = self
+        self._thread = None
+
+    def base_url(self):
+        host, port = self._http_server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def upstream_base_url(self):
+        return self._upstream_base_url
+
+    def add_rule(self, fault_rule):
+        with self._lock:
+            self._rule_list.append(fault_rule)
+        return fault_rule
+
+    def remove_rule(self, fault_rule):
+        with self._lock:
+            if fault_rule in self._rule_list:
+                self._rule_list.remove(fault_rule)
+
+    def clear_rules(self):
+        with self._lock:
+            self._rule_list = []
+
+    def fault_rule(self, http_method, path):
+        # The rule faulting this request, or None, and the latency to inject.
+        with self._lock:
+            for fault_rule in self._rule_list:
+                if not fault_rule.matches(http_method, path):
+                    continue
+                fault_rule.match_count += 1
+                if fault_rule.match_count <= fault_rule.after_count:
+                    return None, 0.0
+                if (
+                    fault_rule.max_count != None
+                    and fault_rule.injected_count >= fault_rule.max_count
+                ):
+                    return None, 0.0
+                if self._random.random() >= fault_rule.probability:
+                    return None, 0.0
+                fault_rule.injected_count += 1
+                return fault_rule, fault_rule.latency(self._random)
+        return None, 0.0
+
+    def forward(self, http_method, path, headers, body):
+        # Sends a request upstream and returns the status, headers and undecoded body
+        # of its response. An unreachable upstream is answered with a 502.
+        forward_header_map = {
+            header_name: header_value
+            for header_name, header_value in headers.items()
+            if header_name.lower() not in _HOP_BY_HOP_HEADER_NAMES
+        }
+        try:
+            upstream_response = self._pool_manager.request(
+                http_method,
+                self._upstream_base_url + path,
+                headers=forward_header_map,
+                body=body,
+                decode_content=False,
+                redirect=False,
+            )
+        except urllib3.exceptions.HTTPError as error:
+            with self._lock:
+                self._upstream_error_count += 1
+            body = json.dumps({"message": "Upstream error: {}".format(error)}).encode()
+            return 502, [("Content-Type", "application/json")], body
+        with self._lock:
+            self._forwarded_request_count += 1
+        header_list = [
+            (header_name, header_value)
+            for header_name, header_value in upstream_response.headers.items()
+            if header_name.lower() not in _HOP_BY_HOP_HEADER_NAMES
+        ]
+        return upstream_response.status, header_list, upstream_response.data
+
+    def statistics(self):
+        with self._lock:
+            return {
+                "forwarded_request_count": self._forwarded_request_count,
+                "upstream_error_count": self._upstream_error_count,
+                "rules": [fault_rule.statistics() for fault_rule in self._rule_list],
+            }
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._http_server.serve_forever, name="fault-proxy", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._pool_manager.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
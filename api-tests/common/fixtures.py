@@ -0,0 +1,530 @@
+#!/usr/bin/python3
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+from common.timeouts import propagate_deadline
+from common.timeouts import without_deadline
+from common.utils import InterProcessFileLock
+import common.utils
+
+MODULE_NAME = "fixtures"
+
+# The data name holding the GUID of a created resource, per resource endpoint.
+RESOURCE_GUID_DATA_NAMES = {
+    "AlertChannels": "intgGuid",
+    "AlertRules": "mcGuid",
+    "ReportRules": "mcGuid",
+    "ResourceGroups": "resourceGuid",
+    "TeamMembers": "userGuid",
+    "VulnerabilityExceptions": "exceptionGuid",
+}
+
+# Every fixture resource is named with this prefix, the run ID and the fixture name.
+RESOURCE_NAME_PREFIX = "api-test"
+
+_JOURNAL_CREATING = "creating"
+_JOURNAL_CREATED = "created"
+_JOURNAL_DELETED = "deleted"
+
+
+class ResourceFixtureError(Exception):
+    pass
+
+
+class ResourceFixture:
+    # A resource a test needs, created with a POST to api_request. The body is built by
+    # json_data_function(resource_name, guid_map), where guid_map holds the GUIDs of the
+    # fixtures named in depends_on.
+    def __init__(self, fixture_name, api_request, json_data_function, depends_on=None):
+        self.fixture_name = fixture_name
+        self.api_request = api_request
+        self.json_data_function = json_data_function
+        self.depends_on = list(depends_on or [])
+
+
+class CreatedResource:
+    def __init__(self, fixture_name, api_request, resource_name, guid, data_map):
+        self.fixture_name = fixture_name
+        self.api_request = api_request
+        self.resource_name = resource_name
+        self.guid = guid
+        self.data_map = data_map
+
+
+def resource_guid(api_request, data_map):
+    guid_data_name = RESOURCE_GUID_DATA_NAMES.get(api_request.split("/")[0])
+    if guid_data_name == None or not isinstance(data_map, dict):
+        return None
+    return data_map.get(guid_data_name)
+
+
+def _contains_string(json_data, string):
+    if isinstance(json_data, dict):
+        return any(_contains_string(value, string) for value in json_data.values())
+    if isinstance(json_data, list):
+        return any(_contains_string(value, string) for value in json_data)
+    return json_data == string
+
+
+def _process_alive(host_name, process_id):
+    if host_name != socket.gethostname():
+        # The processes of other hosts cannot be checked, so they are assumed alive.
+        return True
+    try:
+        os.kill(process_id, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ResourceJournal:
+    # An append-only JSON lines file recording every fixture resource before it is
+    # created, once it is created and once it is deleted. Resources whose run's
+    # process died before deleting them are orphans, found by the next run.
+    #
+    # "creating" is written before the POST, so a resource whose creation was cut off
+    # before its GUID was recorded is still found, by its unique name.
+    def __init__(self, journal_file_uri):
+        self._journal_file_uri = journal_file_uri
+        self._lock = threading.Lock()
+
+    def journal_file_uri(self):
+        return self._journal_file_uri
+
+    def append(self, journal_entry_map):
+        with self._lock, InterProcessFileLock(self._journal_file_uri + ".lock"):
+            with open(self._journal_file_uri, "a") as journal_file:
+                journal_file.write(json.dumps(journal_entry_map) + "\n")
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def _read_entries(self):
+        journal_entry_list = []
+        try:
+            with open(self._journal_file_uri, "r") as journal_file:
+                for journal_line in journal_file:
+                    try:
+                        journal_entry_list.append(json.loads(journal_line))
+                    except ValueError:
+                        # A line cut off by a crash.
+                        continue
+        except IOError:
+            pass
+        return journal_entry_list
+
+    def live_entries(self):
+        # The latest entry of every resource which was not deleted, keyed by resource
+        # name.
+        live_entry_map = {}
+        for journal_entry_map in self._read_entries():
+            resource_name = journal_entry_map.get("resource_name")
+            if journal_entry_map.get("event") == _JOURNAL_DELETED:
+                live_entry_map.pop(resource_name, None)
+            else:
+                live_entry_map[resource_name] = journal_entry_map
+        return live_entry_map
+
+    def compact(self):
+        # Rewrites the journal with only the resources not yet deleted.
+        if not os.path.exists(self._journal_file_uri):
+            return None
+        with self._lock, InterProcessFileLock(self._journal_file_uri + ".lock"):
+            live_entry_list = list(self.live_entries().values())
+            journal_file_uri = self._journal_file_uri + ".tmp"
+            with open(journal_file_uri, "w") as journal_file:
+                for journal_entry_map in live_entry_list:
+                    journal_file.write(json.dumps(journal_entry_map) + "\n")
+            os.replace(journal_file_uri, self._journal_file_uri)
+
+
+class ResourceFixtureManager:
+    # Creates the fixture resources of a test module concurrently, tracks them by GUID
+    # and deletes them all concurrently at the end.
+    #
+    # Fixtures are created in waves: every fixture whose dependencies exist is created
+    # at once, then the fixtures depending on those, and so on. Teardown deletes the
+    # waves in reverse order. Every resource is recorded in a journal shared by all
+    # runs against the tenant, so resources left behind by an aborted run are deleted
+    # by cleanup_orphaned_resources() at the start of the next.
+    def __init__(self, api_helper_util, journal_file_uri=None, max_workers=None):
+        self._api_helper_util = api_helper_util
+        if journal_file_uri == None:
+            journal_key = hashlib.sha256(
+                api_helper_util.get_api_endpoint("").encode()
+            ).hexdigest()[:16]
+            journal_file_uri = os.path.join(
+                tempfile.gettempdir(),
+                "lacework-api-test-fixtures-{}.journal".format(journal_key),
+            )
+        self._journal = ResourceJournal(journal_file_uri)
+        self._max_workers = max_workers or api_helper_util.max_request_concurrency()
+        self._run_id = uuid.uuid4().hex[:12]
+        self._fixture_map = {}
+        self._created_resource_map = {}
+        self._creation_wave_list = []
+        self._lock = threading.Lock()
+        self._statistics_map = {
+            "setup_duration_seconds": 0.0,
+            "teardown_duration_seconds": 0.0,
+            "created_count": 0,
+            "deleted_count": 0,
+            "orphan_deleted_count": 0,
+        }
+
+    def journal(self):
+        return self._journal
+
+    def run_id(self):
+        return self._run_id
+
+    def add_fixture(self, resource_fixture):
+        self._fixture_map[resource_fixture.fixture_name] = resource_fixture
+        return resource_fixture
+
+    def resource_name(self, fixture_name):
+        return "{}-{}-{}".format(RESOURCE_NAME_PREFIX, self._run_id, fixture_name)
+
+    def guid(self, fixture_name):
+        created_resource = self._created_resource_map.get(fixture_name)
+        return created_resource.guid if created_resource != None else None
+
+    def created_resource(self, fixture_name):
+        return self._created_resource_map.get(fixture_name)
+
+    def guid_map(self):
+        return {
+            fixture_name: created_resource.guid
+            for fixture_name, created_resource in self._created_resource_map.items()
+        }
+
+    def statistics(self):
+        return dict(self._statistics_map)
+
+    def _creation_waves(self):
+        wave_list = []
+        placed_fixture_names = set()
+        remaining_fixture_names = [
+            fixture_name
+            for fixture_name in self._fixture_map
+            if fixture_name not in self._created_resource_map
+        ]
+        placed_fixture_names.update(self._created_resource_map)
+        while remaining_fixture_names:
+            wave = [
+                fixture_name
+                for fixture_name in remaining_fixture_names
+                if all(
+                    dependency in placed_fixture_names
+                    for dependency in self._fixture_map[fixture_name].depends_on
+                )
+            ]
+            if not wave:
+                raise ResourceFixtureError(
+                    "The fixtures {} depend on unknown fixtures or on each other.".format(
+                        remaining_fixture_names
+                    )
+                )
+            wave_list.append(wave)
+            placed_fixture_names.update(wave)
+            remaining_fixture_names = [
+                fixture_name
+                for fixture_name in remaining_fixture_names
+                if fixture_name not in wave
+            ]
+        return wave_list
+
+    def _journal_entry(self, event, api_request, resource_name, guid=None):
+        return {
+            "event": event,
+            "run_id": self._run_id,
+            "host_name": socket.gethostname(),
+            "process_id": os.getpid(),
+            "api_request": api_request,
+            "resource_name": resource_name,
+            "guid": guid,
+            "time": time.time(),
+        }
+
+    def _create_resource(self, fixture_name):
+        resource_fixture = self._fixture_map[fixture_name]
+        resource_name = self.resource_name(fixture_name)
+        json_data = resource_fixture.json_data_function(resource_name, self.guid_map())
+        self._journal.append(
+            self._journal_entry(_JOURNAL_CREATING, resource_fixture.api_request, resource_name)
+        )
+        http_response = self._api_helper_util.make_post_request(
+            resource_fixture.api_request, json_data=json_data
+        )
+        data_map = None
+        if 200 <= http_response.status_code < 300:
+            data_map = http_response.json().get("data")
+        else:
+            # A rejected POST created nothing to clean up.
+            self._journal.append(
+                self._journal_entry(
+                    _JOURNAL_DELETED, resource_fixture.api_request, resource_name
+                )
+            )
+        guid = resource_guid(resource_fixture.api_request, data_map)
+        if guid == None:
+            return ResourceFixtureError(
+                "The {} fixture could not be created: {} {}".format(
+                    fixture_name, http_response.status_code, http_response.text[:200]
+                )
+            )
+        self._journal.append(
+            self._journal_entry(
+                _JOURNAL_CREATED, resource_fixture.api_request, resource_name, guid
+            )
+        )
+        with self._lock:
+            self._created_resource_map[fixture_name] = CreatedResource(
+                fixture_name, resource_fixture.api_request, resource_name, guid, data_map
+            )
+            self._statistics_map["created_count"] += 1
+        return None
+
+    def setup(self):
+        # Creates every fixture not created yet. Raises ResourceFixtureError, after
+        # deleting what was created, when a fixture cannot be created. An error raised
+        # while creating, such as a timeout, is re-raised after the deletion too.
+        setup_start_time = time.perf_counter()
+        error_list = []
+        try:
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                for wave in self._creation_waves():
+                    self._creation_wave_list.append(wave)
+                    error_list = [
+                        error
+                        for error in executor.map(
+                            propagate_deadline(self._create_resource), wave
+                        )
+                        if error != None
+                    ]
+                    if error_list:
+                        break
+        except Exception:
+            self.teardown()
+            raise
+        finally:
+            self._statistics_map["setup_duration_seconds"] += (
+                time.perf_counter() - setup_start_time
+            )
+        if error_list:
+            self.teardown()
+            raise ResourceFixtureError("\n".join(str(error) for error in error_list))
+        return self.guid_map()
+
+    def _delete_resource(self, api_request, resource_name, guid):
+        http_response = self._api_helper_util.make_delete_request(
+            "{}/{}".format(api_request, guid)
+        )
+        # A resource which is already gone needs no cleanup.
+        if not (200 <= http_response.status_code < 300 or http_response.status_code == 404):
+            return "{} {}: {} {}".format(
+                api_request, guid, http_response.status_code, http_response.text[:200]
+            )
+        self._journal.append(
+            self._journal_entry(_JOURNAL_DELETED, api_request, resource_name, guid)
+        )
+        return None
+
+    def teardown(self):
+        # Deletes every created fixture, the last created wave first. Returns the
+        # errors of the deletions which failed; their resources stay in the journal.
+        # The resources of a test which ran out of time are deleted too, so teardown
+        # is not bounded by the test deadline.
+        teardown_start_time = time.perf_counter()
+        error_list = []
+        with without_deadline(), ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            for wave in reversed(self._creation_wave_list):
+                created_resource_list = [
+                    self._created_resource_map[fixture_name]
+                    for fixture_name in wave
+                    if fixture_name in self._created_resource_map
+                ]
+                for created_resource, error in zip(
+                    created_resource_list,
+                    executor.map(
+                        lambda created_resource: self._delete_resource(
+                            created_resource.api_request,
+                            created_resource.resource_name,
+                            created_resource.guid,
+                        ),
+                        created_resource_list,
+                    ),
+                ):
+                    if error != None:
+                        error_list.append(error)
+                        continue
+                    del self._created_resource_map[created_resource.fixture_name]
+                    self._statistics_map["deleted_count"] += 1
+        self._creation_wave_list = []
+        self._statistics_map["teardown_duration_seconds"] += (
+            time.perf_counter() - teardown_start_time
+        )
+        for error in error_list:
+            common.utils.log_warning(MODULE_NAME, "A fixture was not deleted: {}".format(error))
+        return error_list
+
+    def _find_orphan_guid(self, api_request, resource_name):
+        # Finds a resource by its unique name, for an orphan whose GUID was never
+        # recorded, on every page of the resources listed.
+        for http_response in self._api_helper_util.make_paged_get_requests(api_request):
+            if not 200 <= http_response.status_code < 300:
+                return None
+            for data_map in http_response.json().get("data") or []:
+                if _contains_string(data_map, resource_name):
+                    return resource_guid(api_request, data_map)
+        return None
+
+    def cleanup_orphaned_resources(self):
+        # Deletes the journaled resources of runs whose process is no longer alive.
+        # Returns the number of orphans deleted.
+        orphan_entry_list = [
+            journal_entry_map
+            for journal_entry_map in self._journal.live_entries().values()
+            if journal_entry_map.get("run_id") != self._run_id
+            and not _process_alive(
+                journal_entry_map.get("host_name"), journal_entry_map.get("process_id")
+            )
+        ]
+
+        def delete_orphan(journal_entry_map):
+            api_request = journal_entry_map["api_request"]
+            resource_name = journal_entry_map["resource_name"]
+            guid = journal_entry_map.get("guid")
+            if guid == None:
+                guid = self._find_orphan_guid(api_request, resource_name)
+            if guid == None:
+                # The POST never created it.
+                self._journal.append(
+                    self._journal_entry(_JOURNAL_DELETED, api_request, resource_name)
+                )
+                return False
+            return self._delete_resource(api_request, resource_name, guid) == None
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            orphan_deleted_count = sum(executor.map(delete_orphan, orphan_entry_list))
+        self._statistics_map["orphan_deleted_count"] += orphan_deleted_count
+        self._journal.compact()
+        return orphan_deleted_count
+
+
+def webhook_alert_channel_fixture(fixture_name="webhook_alert_channel", webhook_url=None):
+    return ResourceFixture(
+        fixture_name,
+        "AlertChannels",
+        lambda resource_name, guid_map: {
+            "name": resource_name,
+            "type": "Webhook",
+            "enabled": 1,
+            "data": {"webhookUrl": webhook_url or "https://example.com/{}".format(resource_name)},
+        },
+    )
+
+
+def email_alert_channel_fixture(fixture_name="email_alert_channel", recipients=None):
+    return ResourceFixture(
+        fixture_name,
+        "AlertChannels",
+        lambda resource_name, guid_map: {
+            "name": resource_name,
+            "type": "EmailUser",
+            "enabled": 1,
+            "data": {"channelProps": {"recipients": recipients or ["api-test@example.com"]}},
+        },
+    )
+
+
+def aws_resource_group_fixture(fixture_name="aws_resource_group"):
+    return ResourceFixture(
+        fixture_name,
+        "ResourceGroups",
+        lambda resource_name, guid_map: {
+            "resourceName": resource_name,
+            "resourceType": "AWS",
+            "enabled": 1,
+            "props": {"description": resource_name, "accountIds": ["*"]},
+        },
+    )
+
+
+def _dependency_guid(guid_map, fixture_name, guid):
+    # The GUID of a resource a fixture needs: an existing resource's GUID, or else the
+    # GUID of the fixture of the same manager it depends on.
+    if guid != None:
+        return guid
+    return guid_map[fixture_name]
+
+
+def _dependency_fixture_names(*fixture_name_guid_pairs):
+    return [fixture_name for fixture_name, guid in fixture_name_guid_pairs if guid == None]
+
+
+def alert_rule_fixture(
+    alert_channel_fixture_name=None,
+    resource_group_fixture_name=None,
+    fixture_name="alert_rule",
+    alert_channel_guid=None,
+    resource_group_guid=None,
+):
+    # An alert rule notifying an alert channel for a resource group. Each is either a
+    # fixture of the same manager, by its fixture name, or an existing resource, by
+    # its GUID, e.g. one produced by another workflow step.
+    return ResourceFixture(
+        fixture_name,
+        "AlertRules",
+        lambda resource_name, guid_map: {
+            "type": "Event",
+            "filters": {
+                "name": resource_name,
+                "enabled": 1,
+                "severity": [1, 2, 3],
+                "resourceGroups": [
+                    _dependency_guid(guid_map, resource_group_fixture_name, resource_group_guid)
+                ],
+            },
+            "intgGuidList": [
+                _dependency_guid(guid_map, alert_channel_fixture_name, alert_channel_guid)
+            ],
+        },
+        depends_on=_dependency_fixture_names(
+            (alert_channel_fixture_name, alert_channel_guid),
+            (resource_group_fixture_name, resource_group_guid),
+        ),
+    )
+
+
+def report_rule_fixture(
+    alert_channel_fixture_name=None, fixture_name="report_rule", alert_channel_guid=None
+):
+    # A report rule sending its reports to an email alert channel, either a fixture of
+    # the same manager, by its fixture name, or an existing one, by its GUID.
+    return ResourceFixture(
+        fixture_name,
+        "ReportRules",
+        lambda resource_name, guid_map: {
+            "type": "Report",
+            "filters": {
+                "name": resource_name,
+                "description": resource_name,
+                "enabled": 1,
+                "severity": [1, 2, 3],
+            },
+            "intgGuidList": [
+                _dependency_guid(guid_map, alert_channel_fixture_name, alert_channel_guid)
+            ],
+            "reportNotificationTypes": {"agentEvents": True, "trendReport": True},
+        },
+        depends_on=_dependency_fixture_names((alert_channel_fixture_name, alert_channel_guid)),
+    )
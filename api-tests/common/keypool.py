@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+import threading
+import time
+
+MODULE_NAME = "keypool"
+
+# A key answered with one of these is put in quarantine: its token was rejected (401),
+# it may not make the request (403) or it ran out of budget (429).
+QUARANTINE_HTTP_STATUS_CODES = [401, 403, 429]
+THROTTLED_HTTP_STATUS_CODE = 429
+UNAUTHORIZED_HTTP_STATUS_CODE = 401
+
+
+class ApiKey:
+    # One API access key, with its own bearer token lifecycle, request budget and
+    # quarantine. The API helper issues and renews the token; the pool hands out the
+    # key and tracks its budget and health.
+    API_ACCESS_KEY_ID = "api_access_key_id"
+    SECRET_KEY = "secret_key"
+    RATE_LIMIT_REQUESTS_PER_SECOND = "rate_limit_requests_per_second"
+
+    def __init__(self, api_access_key_id, secret_key, rate_limiter=None):
+        self.api_access_key_id = api_access_key_id
+        self.secret_key = secret_key
+        # A RequestRateLimiter holding the key's request budget, or None for no budget.
+        self.rate_limiter = rate_limiter
+        # The token and its expiry time (seconds since the epoch) are swapped together
+        # as one tuple, so readers never see a token with another token's expiry time.
+        self.access_token_state = (None, 0.0)
+        self.access_token_lock = threading.Lock()
+        self.access_token_refresher = None
+        self.access_token_issue_count = 0
+        self.in_flight_count = 0
+        self.request_count = 0
+        self.quarantine_count = 0
+        self.quarantine_end_time = 0.0
+        self.quarantine_status_code = None
+        self.consecutive_quarantine_count = 0
+        self.last_acquire_sequence = 0
+
+    def quarantined(self, current_time=None):
+        if current_time == None:
+            current_time = time.monotonic()
+        return self.quarantine_end_time > current_time
+
+    def headroom(self):
+        # The share of the key's budget available now, from 0.0 to 1.0. A key without
+        # a budget always has full headroom.
+        if self.rate_limiter == None:
+            return 1.0
+        return self.rate_limiter.available_tokens() / self.rate_limiter.burst_size()
+
+    def statistics(self):
+        return {
+            "api_access_key_id": self.api_access_key_id,
+            "request_count": self.request_count,
+            "access_token_issue_count": self.access_token_issue_count,
+            "quarantine_count": self.quarantine_count,
+            "quarantined": self.quarantined(),
+            "last_quarantine_status_code": self.quarantine_status_code,
+        }
+
+
+class ApiKeyPool:
+    # Spreads the requests of an API helper over several API keys, so a large fan-out
+    # run is bounded by the sum of their rate limits rather than by one key's.
+    #
+    # Each request takes the key with the most headroom left in its budget, then the
+    # fewest requests in flight, then the one used longest ago, so keys without a
+    # budget are used in turn. When no key has budget left the request waits for the
+    # first one to refill.
+    #
+    # A key answered with 401, 403 or 429 is quarantined for Retry-After seconds, or
+    # else quarantine_seconds, doubled for each consecutive quarantine up to
+    # maximum_quarantine_seconds. Quarantined keys are skipped while other keys are
+    # healthy. When every key is quarantined, requests wait for the first throttled
+    # key to be released; keys quarantined for a rejected token are used anyway, so
+    # the failure shows in the test rather than as a stall.
+    def __init__(self, api_key_list, quarantine_seconds=60.0, maximum_quarantine_seconds=None):
+        if not api_key_list:
+            raise ValueError("An API key pool needs at least one API key.")
+        self._api_key_list = list(api_key_list)
+        self._quarantine_seconds = float(quarantine_seconds)
+        self._maximum_quarantine_seconds = float(
+            maximum_quarantine_seconds
+            if maximum_quarantine_seconds != None
+            else 8 * self._quarantine_seconds
+        )
+        self._acquire_sequence = 0
+        self._budget_wait_time_seconds = 0.0
+        self._quarantine_wait_time_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def api_keys(self):
+        return list(self._api_key_list)
+
+    def budget_wait_time_seconds(self):
+        return self._budget_wait_time_seconds
+
+    def available(self, excluded_api_key_list=()):
+        # Whether a key other than the excluded ones is out of quarantine.
+        current_time = time.monotonic()
+        return any(
+            not api_key.quarantined(current_time)
+            for api_key in self._api_key_list
+            if api_key not in excluded_api_key_list
+        )
+
+    def acquire(self, excluded_api_key_list=(), timeout_seconds=None):
+        # The key for the next request, which must be handed back with release(). Waits
+        # for a key at most timeout_seconds when given, and returns None when none was
+        # free in time.
+        end_time = None
+        if timeout_seconds != None:
+            end_time = time.monotonic() + timeout_seconds
+        while True:
+            with self._lock:
+                api_key, wait_time_seconds, quarantine_wait = self._try_acquire(
+                    excluded_api_key_list
+                )
+                if api_key != None:
+                    return api_key
+                if end_time != None:
+                    wait_time_seconds = min(wait_time_seconds, end_time - time.monotonic())
+                    if wait_time_seconds <= 0:
+                        return None
+                if quarantine_wait:
+                    self._quarantine_wait_time_seconds += wait_time_seconds
+                else:
+                    self._budget_wait_time_seconds += wait_time_seconds
+            time.sleep(wait_time_seconds)
+
+    def _try_acquire(self, excluded_api_key_list):
+        # Returns the acquired key, or None and the time to wait before trying again.
+        current_time = time.monotonic()
+        candidate_api_key_list = [
+            api_key for api_key in self._api_key_list if api_key not in excluded_api_key_list
+        ] or list(self._api_key_list)
+        healthy_api_key_list = [
+            api_key
+            for api_key in candidate_api_key_list
+            if not api_key.quarantined(current_time)
+        ]
+        if not healthy_api_key_list:
+            api_key = min(
+                candidate_api_key_list, key=lambda api_key: api_key.quarantine_end_time
+            )
+            if api_key.quarantine_status_code == THROTTLED_HTTP_STATUS_CODE:
+                return None, api_key.quarantine_end_time - current_time, True
+            healthy_api_key_list = [api_key]
+        healthy_api_key_list.sort(
+            key=lambda api_key: (
+                -api_key.headroom(),
+                api_key.in_flight_count,
+                api_key.last_acquire_sequence,
+            )
+        )
+        minimum_wait_time_seconds = None
+        for api_key in healthy_api_key_list:
+            wait_time_seconds = 0.0
+            if api_key.rate_limiter != None:
+                wait_time_seconds = api_key.rate_limiter.try_acquire()
+            if wait_time_seconds <= 0.0:
+                self._acquire_sequence += 1
+                api_key.last_acquire_sequence = self._acquire_sequence
+                api_key.in_flight_count += 1
+                api_key.request_count += 1
+                return api_key, 0.0, False
+            if minimum_wait_time_seconds == None or wait_time_seconds < minimum_wait_time_seconds:
+                minimum_wait_time_seconds = wait_time_seconds
+        return None, minimum_wait_time_seconds, False
+
+    def release(self, api_key, http_status_code=None, retry_after_seconds=None):
+        # Hands back a key with the status of its response, or None when the request
+        # failed before a response arrived.
+        with self._lock:
+            api_key.in_flight_count -= 1
+            if http_status_code not in QUARANTINE_HTTP_STATUS_CODES:
+                if http_status_code != None:
+                    api_key.consecutive_quarantine_count = 0
+                return None
+            # Requests in flight when a key is quarantined report the same condition,
+            # so they do not extend its quarantine.
+            if api_key.quarantined():
+                return None
+            api_key.consecutive_quarantine_count += 1
+            api_key.quarantine_count += 1
+            api_key.quarantine_status_code = http_status_code
+            quarantine_seconds = retry_after_seconds
+            if quarantine_seconds == None:
+                quarantine_seconds = min(
+                    self._maximum_quarantine_seconds,
+                    self._quarantine_seconds * 2 ** (api_key.consecutive_quarantine_count - 1),
+                )
+            api_key.quarantine_end_time = time.monotonic() + quarantine_seconds
+
+    def statistics(self):
+        with self._lock:
+            return {
+                "budget_wait_time_seconds": round(self._budget_wait_time_seconds, 3),
+                "quarantine_wait_time_seconds": round(self._quarantine_wait_time_seconds, 3),
+                "api_keys": [api_key.statistics() for api_key in self._api_key_list],
+            }
+
+
+def retry_after_seconds(http_response):
+    # The Retry-After of a response given in seconds, or None.
+    try:
+        return max(0.0, float(http_response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+from collections.abc import Mapping
+from collections.abc import Sequence
+import json
+import re
+
+try:
+    import simdjson
+except ImportError:
+    # The pure Python index below is used instead.
+    simdjson = None
+
+MODULE_NAME = "lazyjson"
+
+# The patterns are written as "unrolled loops", which never backtrack.
+_STRING_PATTERN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR_PATTERN = re.compile(rb"[^\s,\]}]+")
+_WHITESPACE_PATTERN = re.compile(rb"\s*")
+_SEPARATOR_PATTERN = re.compile(rb"\s*([,:\]}])\s*")
+# A container holding no other container, skipped in one call. Most records of a
+# large list are flat, so most elements are skipped here.
+_FLAT_CONTAINER_PATTERN = re.compile(
+    rb'[{\[][^{}\[\]"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^{}\[\]"]*)*[}\]]', re.DOTALL
+)
+_STRUCTURAL_PATTERN = re.compile(rb'["{}\[\]]')
+
+_OBJECT_START = ord("{")
+_ARRAY_START = ord("[")
+_STRING_START = ord('"')
+
+
+class LazyJsonError(ValueError):
+    pass
+
+
+def _skip_value(raw_bytes, start_index):
+    # Returns the index just past the JSON value starting at start_index, without
+    # decoding it.
+    first_byte = raw_bytes[start_index]
+    if first_byte == _STRING_START:
+        string_match = _STRING_PATTERN.match(raw_bytes, start_index)
+        if string_match == None:
+            raise LazyJsonError("Unterminated string at {}".format(start_index))
+        return string_match.end()
+    if first_byte != _OBJECT_START and first_byte != _ARRAY_START:
+        scalar_match = _SCALAR_PATTERN.match(raw_bytes, start_index)
+        if scalar_match == None:
+            raise LazyJsonError("Expected a value at {}".format(start_index))
+        return scalar_match.end()
+    flat_container_match = _FLAT_CONTAINER_PATTERN.match(raw_bytes, start_index)
+    if flat_container_match != None:
+        return flat_container_match.end()
+    byte_index = start_index + 1
+    while True:
+        structural_match = _STRUCTURAL_PATTERN.search(raw_bytes, byte_index)
+        if structural_match == None:
+            raise LazyJsonError("Unclosed container at {}".format(start_index))
+        structural_index = structural_match.start()
+        structural_byte = raw_bytes[structural_index]
+        if structural_byte in (_STRING_START, _OBJECT_START, _ARRAY_START):
+            byte_index = _skip_value(raw_bytes, structural_index)
+        else:
+            return structural_index + 1
+
+
+def _decode_string(raw_bytes, start_index, end_index):
+    string_bytes = raw_bytes[start_index + 1 : end_index - 1]
+    if b"\\" not in string_bytes:
+        return string_bytes.decode("utf-8")
+    return json.loads(raw_bytes[start_index:end_index])
+
+
+def _value(raw_bytes, start_index):
+    # Containers become lazy views; scalars are decoded.
+    first_byte = raw_bytes[start_index]
+    if first_byte == _OBJECT_START:
+        return LazyJsonObject(raw_bytes, start_index)
+    if first_byte == _ARRAY_START:
+        return LazyJsonArray(raw_bytes, start_index)
+    end_index = _skip_value(raw_bytes, start_index)
+    if first_byte == _STRING_START:
+        return _decode_string(raw_bytes, start_index, end_index)
+    return json.loads(raw_bytes[start_index:end_index])
+
+
+class _LazyJsonContainer:
+    # A container is indexed from its start as far as it is read. Only the start of a
+    # value is recorded when it is reached; the value is skipped, to find the next
+    # one, only when a later value is read.
+    __slots__ = [
+        "_raw_bytes",
+        "_start_index",
+        "_end_index",
+        "_scan_index",
+        "_scan_complete",
+        "_last_value_start_index",
+    ]
+
+    def __init__(self, raw_bytes, start_index):
+        self._raw_bytes = raw_bytes
+        self._start_index = start_index
+        self._end_index = None
+        self._scan_index = _WHITESPACE_PATTERN.match(raw_bytes, start_index + 1).end()
+        self._scan_complete = raw_bytes[self._scan_index : self._scan_index + 1] in (b"}", b"]")
+        self._last_value_start_index = None
+
+    def _next_separator(self, byte_index):
+        separator_match = _SEPARATOR_PATTERN.match(self._raw_bytes, byte_index)
+        if separator_match == None:
+            raise LazyJsonError("Expected a separator at {}".format(byte_index))
+        return separator_match.group(1), separator_match.end()
+
+    def _skip_last_value(self):
+        # Skips the last indexed value. Returns False at the end of the container.
+        separator, self._scan_index = self._next_separator(
+            _skip_value(self._raw_bytes, self._last_value_start_index)
+        )
+        if separator != b",":
+            self._scan_complete = True
+            self._end_index = self._scan_index
+            return False
+        return True
+
+    def raw_json(self):
+        if self._end_index == None:
+            self._end_index = _skip_value(self._raw_bytes, self._start_index)
+        return self._raw_bytes[self._start_index : self._end_index]
+
+    def to_python(self):
+        # Decodes the whole container.
+        return json.loads(self.raw_json())
+
+
+class LazyJsonObject(_LazyJsonContainer, Mapping):
+    # A read-only view of a JSON object in a raw JSON document. Members are indexed
+    # only as far as needed to find a data name, and values are decoded when read.
+    __slots__ = ["_value_start_index_map"]
+
+    def __init__(self, raw_bytes, start_index):
+        super().__init__(raw_bytes, start_index)
+        self._value_start_index_map = {}
+
+    def _scan_member(self):
+        if self._last_value_start_index != None and not self._skip_last_value():
+            return None
+        key_end_index = _skip_value(self._raw_bytes, self._scan_index)
+        data_name = _decode_string(self._raw_bytes, self._scan_index, key_end_index)
+        separator, value_start_index = self._next_separator(key_end_index)
+        if separator != b":":
+            raise LazyJsonError("Expected ':' at {}".format(key_end_index))
+        self._value_start_index_map[data_name] = value_start_index
+        self._last_value_start_index = value_start_index
+        return data_name
+
+    def _scan_all(self):
+        while not self._scan_complete:
+            self._scan_member()
+
+    def __getitem__(self, data_name):
+        value_start_index = self._value_start_index_map.get(data_name)
+        while value_start_index == None and not self._scan_complete:
+            if self._scan_member() == data_name:
+                value_start_index = self._value_start_index_map[data_name]
+        if value_start_index == None:
+            raise KeyError(data_name)
+        return _value(self._raw_bytes, value_start_index)
+
+    def __iter__(self):
+        self._scan_all()
+        return iter(self._value_start_index_map)
+
+    def __len__(self):
+        self._scan_all()
+        return len(self._value_start_index_map)
+
+
+class LazyJsonArray(_LazyJsonContainer, Sequence):
+    # A read-only view of a JSON array in a raw JSON document. Elements are indexed
+    # only up to the highest index read, and decoded when read.
+    __slots__ = ["_element_start_index_list"]
+
+    def __init__(self, raw_bytes, start_index):
+        super().__init__(raw_bytes, start_index)
+        self._element_start_index_list = []
+
+    def _scan_element(self):
+        if self._last_value_start_index != None and not self._skip_last_value():
+            return False
+        self._element_start_index_list.append(self._scan_index)
+        self._last_value_start_index = self._scan_index
+        return True
+
+    def __getitem__(self, element_index):
+        if isinstance(element_index, slice):
+            return [self[index] for index in range(*element_index.indices(len(self)))]
+        if element_index < 0:
+            element_index += len(self)
+        while element_index >= len(self._element_start_index_list) and not self._scan_complete:
+            self._scan_element()
+        if not 0 <= element_index < len(self._element_start_index_list):
+            raise IndexError(element_index)
+        return _value(self._raw_bytes, self._element_start_index_list[element_index])
+
+    def __iter__(self):
+        element_index = 0
+        while element_index < len(self._element_start_index_list) or (
+            not self._scan_complete and self._scan_element()
+        ):
+            yield _value(self._raw_bytes, self._element_start_index_list[element_index])
+            element_index += 1
+
+    def __len__(self):
+        while not self._scan_complete:
+            self._scan_element()
+        return len(self._element_start_index_list)
+
+
+def lazy_json_view(raw_bytes, use_simdjson=True):
+    # Returns a lazy view of a raw JSON document: a mapping for an object, a sequence
+    # for an array, or the decoded value of a scalar document.
+    #
+    # With the optional pysimdjson package installed the document is parsed by
+    # simdjson, whose objects and arrays are also decoded on access. Otherwise it is
+    # indexed in pure Python, as far as it is read: reading the first record of a
+    # large list costs next to nothing, while reading a data name of every record
+    # costs a skip over every record.
+    if isinstance(raw_bytes, str):
+        raw_bytes = raw_bytes.encode("utf-8")
+    if simdjson != None and use_simdjson:
+        return simdjson.Parser().parse(raw_bytes)
+    start_index = _WHITESPACE_PATTERN.match(raw_bytes).end()
+    if start_index == len(raw_bytes):
+        raise LazyJsonError("Empty JSON document")
+    return _value(raw_bytes, start_index)
+
+
+def lazy_response_json(http_response, use_simdjson=True):
+    # A lazy view of a response's JSON body, for tests reading a few data names of a
+    # large response. Use http_response.json() to decode the whole body.
+    return lazy_json_view(http_response.content, use_simdjson=use_simdjson)
+
+
+def to_python(json_value):
+    # Decodes a lazy view, of either backend, into dictionaries and lists.
+    if isinstance(json_value, _LazyJsonContainer):
+        return json_value.to_python()
+    if simdjson != None and isinstance(json_value, simdjson.Object):
+        return json_value.as_dict()
+    if simdjson != None and isinstance(json_value, simdjson.Array):
+        return json_value.as_list()
+    return json_value
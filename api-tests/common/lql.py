@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+import re
+import threading
+
+MODULE_NAME = "lql"
+
+
+class LqlValidationMode:
+    # Validate locally and only send locally valid queries to Queries/validate.
+    LOCAL_FIRST = "local"
+    # Send every query to Queries/validate and compare its verdict with the local one.
+    COMPARE = "compare"
+    # Send every query to Queries/validate without validating it locally.
+    SERVER_ONLY = "server"
+
+
+class LqlSyntaxError:
+    def __init__(self, message, line_number, column_number):
+        self.message = message
+        self.line_number = line_number
+        self.column_number = column_number
+
+    def __str__(self):
+        return "line {}, column {}: {}".format(
+            self.line_number, self.column_number, self.message
+        )
+
+    def __repr__(self):
+        return "LqlSyntaxError({})".format(str(self))
+
+
+class _LqlToken:
+    __slots__ = ["token_type", "text", "line_number", "column_number"]
+
+    def __init__(self, token_type, text, line_number, column_number):
+        self.token_type = token_type
+        self.text = text
+        self.line_number = line_number
+        self.column_number = column_number
+
+
+# Token types
+_IDENTIFIER = "identifier"
+_STRING = "string"
+_PUNCTUATION = "punctuation"
+_END = "end"
+
+# Characters without a meaning to the structure checks, such as the ! of a negation or
+# the ? of a JSON path, are lexed as opaque tokens and left to Queries/validate.
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<whitespace>\s+)
+    |(?P<comment>//[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<identifier>[A-Za-z_$][A-Za-z0-9_$]*)
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<punctuation>[{}()\[\],:.;])
+    |(?P<operator><>|<=|>=|!=|=|<|>|\+|-|\*|/|%|\|\||&&|::)
+    |(?P<opaque>[!&|?@^~#])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_OPENING_BRACKETS = {"{": "}", "(": ")", "[": "]"}
+_CLOSING_BRACKETS = {"}": "{", ")": "(", "]": "["}
+
+SOURCE_SECTION = "source"
+FILTER_SECTION = "filter"
+RETURN_SECTION = "return"
+_SECTION_NAMES = [SOURCE_SECTION, FILTER_SECTION, RETURN_SECTION]
+
+
+def _tokenize(query_text):
+    token_list = []
+    line_number = 1
+    line_start_index = 0
+    text_index = 0
+    while text_index < len(query_text):
+        token_match = _TOKEN_PATTERN.match(query_text, text_index)
+        column_number = text_index - line_start_index + 1
+        if token_match == None:
+            character = query_text[text_index]
+            message = "Unexpected character {!r}".format(character)
+            if character in ["'", '"']:
+                message = "Unterminated string literal"
+            return token_list, LqlSyntaxError(message, line_number, column_number)
+        if token_match.lastgroup != "comment" and query_text.startswith("/*", text_index):
+            return token_list, LqlSyntaxError("Unterminated comment", line_number, column_number)
+        token_type = token_match.lastgroup
+        token_text = token_match.group()
+        if token_type not in ["whitespace", "comment"]:
+            token_list.append(_LqlToken(token_type, token_text, line_number, column_number))
+        newline_count = token_text.count("\n")
+        if newline_count:
+            line_number += newline_count
+            line_start_index = text_index + token_text.rindex("\n") + 1
+        text_index = token_match.end()
+    token_list.append(
+        _LqlToken(_END, "", line_number, text_index - line_start_index + 1)
+    )
+    return token_list, None
+
+
+class _LqlParser:
+    # Checks the structure of a query:
+    #
+    #   [QueryName [( parameters )]] {
+    #       source { ... }
+    #       [filter { ... }]
+    #       return [distinct] { ... }
+    #   }
+    #
+    # The contents of the sections are only checked for balanced brackets and for not
+    # being empty; expressions are left to Queries/validate.
+    def __init__(self, token_list):
+        self._token_list = token_list
+        self._token_index = 0
+
+    def _token(self):
+        return self._token_list[self._token_index]
+
+    def _error(self, message, token=None):
+        token = token or self._token()
+        return LqlSyntaxError(message, token.line_number, token.column_number)
+
+    def _describe(self, token):
+        if token.token_type == _END:
+            return "the end of the query"
+        return "{!r}".format(token.text)
+
+    def _expect(self, text):
+        token = self._token()
+        if token.text != text or token.token_type in [_STRING, _END]:
+            return self._error(
+                "Expected {!r} but found {}".format(text, self._describe(token))
+            )
+        self._token_index += 1
+        return None
+
+    def _skip_bracketed(self):
+        # Skips from an opening bracket past its closing bracket. Returns the number
+        # of tokens between them, or an error.
+        opening_token = self._token()
+        bracket_stack = [opening_token]
+        self._token_index += 1
+        content_token_count = 0
+        while bracket_stack:
+            token = self._token()
+            if token.token_type == _END:
+                return None, self._error(
+                    "Unclosed {!r}".format(bracket_stack[-1].text), bracket_stack[-1]
+                )
+            if token.token_type == _PUNCTUATION and token.text in _OPENING_BRACKETS:
+                bracket_stack.append(token)
+            elif token.token_type == _PUNCTUATION and token.text in _CLOSING_BRACKETS:
+                if bracket_stack[-1].text != _CLOSING_BRACKETS[token.text]:
+                    return None, self._error(
+                        "Mismatched {!r}, expected {!r}".format(
+                            token.text, _OPENING_BRACKETS[bracket_stack[-1].text]
+                        )
+                    )
+                bracket_stack.pop()
+            self._token_index += 1
+            if bracket_stack:
+                content_token_count += 1
+        return content_token_count, None
+
+    def _parse_section_block(self, section_name):
+        if self._token().text != "{":
+            return self._error(
+                "Expected '{{' after {} but found {}".format(
+                    section_name, self._describe(self._token())
+                )
+            )
+        opening_token = self._token()
+        content_token_count, error = self._skip_bracketed()
+        if error != None:
+            return error
+        if content_token_count == 0:
+            return self._error("Empty {} section".format(section_name), opening_token)
+        return None
+
+    def parse(self):
+        # The query name is optional, the query may start with the '{' of its body.
+        query_name_token = self._token()
+        if query_name_token.token_type == _IDENTIFIER:
+            self._token_index += 1
+            if self._token().text == "(":
+                _, error = self._skip_bracketed()
+                if error != None:
+                    return error
+        elif query_name_token.text != "{" or query_name_token.token_type != _PUNCTUATION:
+            return self._error(
+                "Expected a query name or '{{' but found {}".format(
+                    self._describe(query_name_token)
+                )
+            )
+        error = self._expect("{")
+        if error != None:
+            return error
+
+        section_name_list = []
+        while not (self._token().token_type == _PUNCTUATION and self._token().text == "}"):
+            section_token = self._token()
+            if section_token.token_type == _END:
+                return self._error("Unclosed '{' of the query body", query_name_token)
+            section_name = section_token.text.lower()
+            if section_token.token_type != _IDENTIFIER or section_name not in _SECTION_NAMES:
+                return self._error(
+                    "Expected a source, filter or return section but found {}".format(
+                        self._describe(section_token)
+                    )
+                )
+            if section_name in section_name_list:
+                return self._error("Duplicate {} section".format(section_name))
+            if not section_name_list and section_name != SOURCE_SECTION:
+                return self._error("The query must start with a source section")
+            if RETURN_SECTION in section_name_list:
+                return self._error("The return section must be the last section")
+            section_name_list.append(section_name)
+            self._token_index += 1
+            if section_name == RETURN_SECTION and self._token().text.lower() == "distinct":
+                self._token_index += 1
+            error = self._parse_section_block(section_name)
+            if error != None:
+                return error
+
+        if not section_name_list:
+            return self._error("Empty query body")
+        if RETURN_SECTION not in section_name_list:
+            return self._error("The query has no return section")
+        self._token_index += 1
+        if self._token().token_type != _END:
+            return self._error(
+                "Unexpected {} after the query body".format(self._describe(self._token()))
+            )
+        return None
+
+
+def validate_lql_query_text(query_text):
+    # Returns None for a structurally valid query, otherwise the first LqlSyntaxError.
+    if not isinstance(query_text, str) or not query_text.strip():
+        return LqlSyntaxError("Empty query text", 1, 1)
+    token_list, error = _tokenize(query_text)
+    if error != None:
+        return error
+    return _LqlParser(token_list).parse()
+
+
+class LqlVerdictDisagreement:
+    def __init__(self, query_text, local_syntax_error, http_status_code):
+        self.query_text = query_text
+        self.local_syntax_error = local_syntax_error
+        self.http_status_code = http_status_code
+
+    def __str__(self):
+        return "local verdict: {}, server status: {}, query: {!r}".format(
+            self.local_syntax_error or "valid", self.http_status_code, self.query_text
+        )
+
+
+class LqlPreValidator:
+    # Validates query texts locally before, or instead of, sending them to
+    # Queries/validate, depending on the LqlValidationMode.
+    #
+    # In COMPARE mode every query is sent and the server's verdict (200 valid, 400
+    # invalid, other status codes not compared) is checked against the local one.
+    # Disagreements show where the local parser is stricter or looser than the API.
+    def __init__(self, validation_mode=LqlValidationMode.LOCAL_FIRST):
+        self._validation_mode = validation_mode or LqlValidationMode.LOCAL_FIRST
+        self._local_rejection_count = 0
+        self._server_request_count = 0
+        self._disagreement_list = []
+        self._lock = threading.Lock()
+
+    def validation_mode(self):
+        return self._validation_mode
+
+    def validate(self, query_text, server_validation_function):
+        # Returns the local syntax error, or None, and the Queries/validate response,
+        # or None when the query failed local validation and was not sent.
+        local_syntax_error = None
+        if self._validation_mode != LqlValidationMode.SERVER_ONLY:
+            local_syntax_error = validate_lql_query_text(query_text)
+        if local_syntax_error != None and self._validation_mode == LqlValidationMode.LOCAL_FIRST:
+            with self._lock:
+                self._local_rejection_count += 1
+            return local_syntax_error, None
+
+        http_response = server_validation_function(query_text)
+        with self._lock:
+            self._server_request_count += 1
+        if self._validation_mode == LqlValidationMode.COMPARE and http_response != None:
+            server_verdict = {200: True, 400: False}.get(http_response.status_code)
+            if server_verdict != None and server_verdict != (local_syntax_error == None):
+                with self._lock:
+                    self._disagreement_list.append(
+                        LqlVerdictDisagreement(
+                            query_text, local_syntax_error, http_response.status_code
+                        )
+                    )
+        return local_syntax_error, http_response
+
+    def disagreements(self):
+        with self._lock:
+            return list(self._disagreement_list)
+
+    def statistics(self):
+        with self._lock:
+            return {
+                "validation_mode": self._validation_mode,
+                "local_rejection_count": self._local_rejection_count,
+                "server_request_count": self._server_request_count,
+                "disagreement_count": len(self._disagreement_list),
+            }
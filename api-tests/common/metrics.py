@@ -0,0 +1,480 @@
+#!/usr/bin/python3
+import bisect
+import glob
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+
+MODULE_NAME = "metrics"
+
+METRIC_NAME_PREFIX = "lacework_api_test_"
+DEFAULT_PUBLISH_INTERVAL_SECONDS = 5.0
+DEFAULT_LATENCY_BUCKETS_SECONDS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_WORKER_SNAPSHOT_FILE_PATTERN = "*.metrics.json"
+
+
+class MetricType:
+    COUNTER = "counter"
+    GAUGE = "gauge"
+    HISTOGRAM = "histogram"
+
+
+class Metric:
+    # The metrics of a run, without their prefix. Counters are exposed with a _total
+    # suffix.
+    REQUESTS = "requests"
+    REQUEST_LATENCY_SECONDS = "request_latency_seconds"
+    RESPONSE_BYTES = "response_bytes"
+    IN_FLIGHT_REQUESTS = "in_flight_requests"
+    CONCURRENCY_LIMIT = "concurrency_limit"
+    THROTTLED_RETRIES = "throttled_retries"
+    ACCESS_TOKENS_ISSUED = "access_tokens_issued"
+    ACCESS_TOKEN_REFRESHES = "access_token_refreshes"
+    TESTS = "tests"
+
+
+_METRIC_DESCRIPTION_MAP = {
+    Metric.REQUESTS: (MetricType.COUNTER, "API requests by endpoint and status code."),
+    Metric.REQUEST_LATENCY_SECONDS: (MetricType.HISTOGRAM, "API request latency by endpoint."),
+    Metric.RESPONSE_BYTES: (MetricType.COUNTER, "Response body bytes received by endpoint."),
+    Metric.IN_FLIGHT_REQUESTS: (MetricType.GAUGE, "API requests in flight per worker."),
+    Metric.CONCURRENCY_LIMIT: (MetricType.GAUGE, "Adaptive concurrency limit per worker."),
+    Metric.THROTTLED_RETRIES: (
+        MetricType.COUNTER,
+        "Throttled requests retried by another pooled API key.",
+    ),
+    Metric.ACCESS_TOKENS_ISSUED: (MetricType.COUNTER, "Bearer access tokens issued."),
+    Metric.ACCESS_TOKEN_REFRESHES: (
+        MetricType.COUNTER,
+        "Bearer access tokens renewed in the background.",
+    ),
+    Metric.TESTS: (MetricType.COUNTER, "Tests run by outcome."),
+}
+
+
+def _labels_key(labels_map):
+    return tuple(
+        sorted(
+            (str(label_name), str(label_value)) for label_name, label_value in labels_map.items()
+        )
+    )
+
+
+class _ThreadMetrics:
+    # The metrics recorded by one thread. Only that thread writes them.
+    def __init__(self):
+        self.counter_map = {}
+        # (metric name, labels key) -> [bucket counts..., +Inf count, sum]
+        self.histogram_map = {}
+
+
+class MetricsRecorder:
+    # Records the metrics of one process. Every thread records into its own shard, so
+    # the request path takes no lock; shards are summed when a snapshot is taken.
+    # Copying a dictionary or list is a single step under the GIL, so a snapshot never
+    # sees a shard half updated.
+    #
+    # With metrics_directory_uri the recorder publishes its snapshot to its own file
+    # in that directory every publish_interval_seconds, for a MetricsExporter in
+    # another process to merge. No file is shared between processes.
+    def __init__(
+        self,
+        worker_name=None,
+        metrics_directory_uri=None,
+        publish_interval_seconds=DEFAULT_PUBLISH_INTERVAL_SECONDS,
+        latency_buckets_seconds=DEFAULT_LATENCY_BUCKETS_SECONDS,
+    ):
+        self._worker_name = worker_name or str(os.getpid())
+        self._metrics_directory_uri = metrics_directory_uri
+        self._publish_interval_seconds = publish_interval_seconds
+        self._latency_buckets_seconds = tuple(latency_buckets_seconds)
+        self._thread_local = threading.local()
+        self._thread_metrics_list = []
+        # Functions returning [(metric type, metric name, labels map, value), ...],
+        # sampled when a snapshot is taken.
+        self._sample_function_list = []
+        self._stop_event = threading.Event()
+        self._publish_thread = None
+
+    def worker_name(self):
+        return self._worker_name
+
+    def _thread_metrics(self):
+        thread_metrics = getattr(self._thread_local, "thread_metrics", None)
+        if thread_metrics == None:
+            thread_metrics = _ThreadMetrics()
+            self._thread_local.thread_metrics = thread_metrics
+            self._thread_metrics_list.append(thread_metrics)
+        return thread_metrics
+
+    def increment(self, metric_name, labels_map=None, amount=1):
+        counter_map = self._thread_metrics().counter_map
+        metric_key = (metric_name, _labels_key(labels_map or {}))
+        counter_map[metric_key] = counter_map.get(metric_key, 0) + amount
+
+    def observe(self, metric_name, value, labels_map=None):
+        histogram_map = self._thread_metrics().histogram_map
+        metric_key = (metric_name, _labels_key(labels_map or {}))
+        histogram_value_list = histogram_map.get(metric_key)
+        if histogram_value_list == None:
+            histogram_value_list = [0] * (len(self._latency_buckets_seconds) + 1) + [0.0]
+            histogram_map[metric_key] = histogram_value_list
+        # Buckets are stored uncumulated; the exposition adds them up.
+        histogram_value_list[bisect.bisect_left(self._latency_buckets_seconds, value)] += 1
+        histogram_value_list[-1] += value
+
+    def add_sample_function(self, sample_function):
+        self._sample_function_list.append(sample_function)
+
+    def attach(self, api_helper_util, tenant_name):
+        # Records every request of the helper, and samples its in-flight requests,
+        # concurrency limit, retries and tokens.
+        def record_response(endpoint_name, http_response, latency_seconds):
+            self.increment(
+                Metric.REQUESTS,
+                {
+                    "tenant": tenant_name,
+                    "endpoint": endpoint_name,
+                    "status_code": http_response.status_code,
+                },
+            )
+            self.observe(
+                Metric.REQUEST_LATENCY_SECONDS,
+                latency_seconds,
+                {"tenant": tenant_name, "endpoint": endpoint_name},
+            )
+            content_length = http_response.headers.get("Content-Length")
+            if content_length != None and content_length.isdigit():
+                self.increment(
+                    Metric.RESPONSE_BYTES,
+                    {"tenant": tenant_name, "endpoint": endpoint_name},
+                    int(content_length),
+                )
+
+        def sample_helper():
+            concurrency_limiter = api_helper_util.concurrency_limiter()
+            worker_labels_map = {"tenant": tenant_name, "worker": self._worker_name}
+            tenant_labels_map = {"tenant": tenant_name}
+            return [
+                (
+                    MetricType.GAUGE,
+                    Metric.IN_FLIGHT_REQUESTS,
+                    worker_labels_map,
+                    concurrency_limiter.in_flight_count(),
+                ),
+                (
+                    MetricType.GAUGE,
+                    Metric.CONCURRENCY_LIMIT,
+                    worker_labels_map,
+                    concurrency_limiter.current_limit(),
+                ),
+                (
+                    MetricType.COUNTER,
+                    Metric.THROTTLED_RETRIES,
+                    tenant_labels_map,
+                    api_helper_util.throttled_retry_count(),
+                ),
+                (
+                    MetricType.COUNTER,
+                    Metric.ACCESS_TOKENS_ISSUED,
+                    tenant_labels_map,
+                    api_helper_util.access_token_issue_count(),
+                ),
+                (
+                    MetricType.COUNTER,
+                    Metric.ACCESS_TOKEN_REFRESHES,
+                    tenant_labels_map,
+                    api_helper_util.access_token_refresh_count(),
+                ),
+            ]
+
+        api_helper_util.add_response_listener(record_response)
+        self.add_sample_function(sample_helper)
+        return self
+
+    def snapshot(self):
+        # The metrics of the process as a JSON serializable map.
+        counter_map = {}
+        histogram_map = {}
+        for thread_metrics in list(self._thread_metrics_list):
+            for metric_key, value in dict(thread_metrics.counter_map).items():
+                counter_map[metric_key] = counter_map.get(metric_key, 0) + value
+            for metric_key, histogram_value_list in dict(thread_metrics.histogram_map).items():
+                histogram_map[metric_key] = _add_value_lists(
+                    histogram_map.get(metric_key), list(histogram_value_list)
+                )
+        gauge_map = {}
+        for sample_function in list(self._sample_function_list):
+            for metric_type, metric_name, labels_map, value in sample_function():
+                metric_key = (metric_name, _labels_key(labels_map))
+                if metric_type == MetricType.GAUGE:
+                    gauge_map[metric_key] = value
+                else:
+                    counter_map[metric_key] = counter_map.get(metric_key, 0) + value
+        return {
+            "worker": self._worker_name,
+            "timestamp": time.time(),
+            "latency_buckets_seconds": list(self._latency_buckets_seconds),
+            "counters": [
+                [name, dict(labels), value] for (name, labels), value in counter_map.items()
+            ],
+            "gauges": [
+                [name, dict(labels), value] for (name, labels), value in gauge_map.items()
+            ],
+            "histograms": [
+                [name, dict(labels), value_list]
+                for (name, labels), value_list in histogram_map.items()
+            ],
+        }
+
+    def publish(self):
+        # Writes the snapshot to the worker's own file in the metrics directory.
+        if self._metrics_directory_uri == None:
+            return None
+        snapshot_file_uri = os.path.join(
+            self._metrics_directory_uri,
+            "{}.metrics.json".format(self._worker_name.replace(os.sep, "_")),
+        )
+        temporary_file_uri = "{}.tmp".format(snapshot_file_uri)
+        with open(temporary_file_uri, "w") as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(temporary_file_uri, snapshot_file_uri)
+
+    def start(self):
+        if self._metrics_directory_uri != None and self._publish_thread == None:
+            self._publish_thread = threading.Thread(
+                target=self._run_publisher, name="metrics-publisher", daemon=True
+            )
+            self._publish_thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._publish_thread != None and self._publish_thread.is_alive():
+            self._publish_thread.join()
+        self.publish()
+
+    def _run_publisher(self):
+        while not self._stop_event.wait(self._publish_interval_seconds):
+            self.publish()
+
+
+def _add_value_lists(first_value_list, second_value_list):
+    if first_value_list == None:
+        return second_value_list
+    return [
+        first_value + second_value
+        for first_value, second_value in zip(first_value_list, second_value_list)
+    ]
+
+
+def merge_snapshots(snapshot_map_list):
+    # Sums the counters and histograms of every worker. Gauges are kept per worker.
+    counter_map = {}
+    gauge_map = {}
+    histogram_map = {}
+    latency_buckets_seconds = list(DEFAULT_LATENCY_BUCKETS_SECONDS)
+    for snapshot_map in snapshot_map_list:
+        latency_buckets_seconds = snapshot_map.get(
+            "latency_buckets_seconds", latency_buckets_seconds
+        )
+        for metric_name, labels_map, value in snapshot_map.get("counters", []):
+            metric_key = (metric_name, _labels_key(labels_map))
+            counter_map[metric_key] = counter_map.get(metric_key, 0) + value
+        for metric_name, labels_map, value in snapshot_map.get("gauges", []):
+            gauge_map[(metric_name, _labels_key(labels_map))] = value
+        for metric_name, labels_map, value_list in snapshot_map.get("histograms", []):
+            metric_key = (metric_name, _labels_key(labels_map))
+            histogram_map[metric_key] = _add_value_lists(histogram_map.get(metric_key), value_list)
+    return counter_map, gauge_map, histogram_map, latency_buckets_seconds
+
+
+def _format_labels(labels_key, extra_label_list=()):
+    label_list = list(labels_key) + list(extra_label_list)
+    if not label_list:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                label_name,
+                label_value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+            )
+            for label_name, label_value in label_list
+        )
+    )
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def exposition_text(snapshot_map_list, openmetrics=True):
+    # The merged metrics in the OpenMetrics text format, or with openmetrics=False in
+    # the Prometheus text format read by the node exporter's textfile collector.
+    counter_map, gauge_map, histogram_map, latency_buckets_seconds = merge_snapshots(
+        snapshot_map_list
+    )
+    metric_sample_map = {}
+    for metric_map in [counter_map, gauge_map, histogram_map]:
+        for (metric_name, labels_key), value in metric_map.items():
+            metric_sample_map.setdefault(metric_name, []).append((labels_key, value))
+    line_list = []
+    for metric_name in sorted(metric_sample_map):
+        metric_type, metric_help = _METRIC_DESCRIPTION_MAP.get(
+            metric_name, (MetricType.GAUGE, metric_name)
+        )
+        family_name = METRIC_NAME_PREFIX + metric_name
+        if metric_type == MetricType.COUNTER and not openmetrics:
+            family_name += "_total"
+        line_list.append("# TYPE {} {}".format(family_name, metric_type))
+        line_list.append("# HELP {} {}".format(family_name, metric_help))
+        for labels_key, value in sorted(metric_sample_map[metric_name]):
+            sample_name = METRIC_NAME_PREFIX + metric_name
+            if metric_type == MetricType.COUNTER:
+                line_list.append(
+                    "{}_total{} {}".format(
+                        sample_name, _format_labels(labels_key), _format_value(value)
+                    )
+                )
+            elif metric_type == MetricType.HISTOGRAM:
+                cumulative_count = 0
+                for bucket_seconds, bucket_count in zip(
+                    list(latency_buckets_seconds) + ["+Inf"], value[:-1]
+                ):
+                    cumulative_count += bucket_count
+                    line_list.append(
+                        "{}_bucket{} {}".format(
+                            sample_name,
+                            _format_labels(labels_key, [("le", str(bucket_seconds))]),
+                            cumulative_count,
+                        )
+                    )
+                line_list.append(
+                    "{}_count{} {}".format(
+                        sample_name, _format_labels(labels_key), cumulative_count
+                    )
+                )
+                line_list.append(
+                    "{}_sum{} {}".format(
+                        sample_name, _format_labels(labels_key), repr(float(value[-1]))
+                    )
+                )
+            else:
+                line_list.append(
+                    "{}{} {}".format(sample_name, _format_labels(labels_key), _format_value(value))
+                )
+    if openmetrics:
+        line_list.append("# EOF")
+    return "\n".join(line_list) + "\n"
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        return None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return None
+        openmetrics = "application/openmetrics-text" in (self.headers.get("Accept") or "")
+        body = self.server.metrics_exporter.exposition_text(openmetrics).encode()
+        self.send_response(200)
+        self.send_header(
+            "Content-Type",
+            OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_TEXT_CONTENT_TYPE,
+        )
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsExporter:
+    # Exposes the metrics published by every worker to metrics_directory_uri, and those
+    # of the local recorders, at http://<host>:<port>/metrics for a Prometheus scrape,
+    # and/or writes them to a textfile every interval_seconds. OpenMetrics is served
+    # to scrapers which accept it, the Prometheus text format otherwise.
+    def __init__(self, metrics_directory_uri=None, recorder_list=None):
+        self._metrics_directory_uri = metrics_directory_uri
+        self._recorder_list = list(recorder_list or [])
+        self._http_server = None
+        self._http_server_thread = None
+        self._textfile_uri = None
+        self._textfile_interval_seconds = DEFAULT_PUBLISH_INTERVAL_SECONDS
+        self._textfile_thread = None
+        self._stop_event = threading.Event()
+
+    def add_recorder(self, metrics_recorder):
+        self._recorder_list.append(metrics_recorder)
+
+    def snapshots(self):
+        snapshot_map_list = [
+            metrics_recorder.snapshot() for metrics_recorder in self._recorder_list
+        ]
+        if self._metrics_directory_uri != None:
+            for snapshot_file_uri in sorted(
+                glob.glob(os.path.join(self._metrics_directory_uri, _WORKER_SNAPSHOT_FILE_PATTERN))
+            ):
+                try:
+                    with open(snapshot_file_uri, "r") as snapshot_file:
+                        snapshot_map_list.append(json.load(snapshot_file))
+                except (IOError, ValueError):
+                    continue
+        return snapshot_map_list
+
+    def exposition_text(self, openmetrics=True):
+        return exposition_text(self.snapshots(), openmetrics=openmetrics)
+
+    def base_url(self):
+        host, port = self._http_server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def serve(self, port=0, host="127.0.0.1"):
+        self._http_server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        self._http_server.daemon_threads = True
+        self._http_server.metrics_exporter = self
+        self._http_server_thread = threading.Thread(
+            target=self._http_server.serve_forever, name="metrics-exporter", daemon=True
+        )
+        self._http_server_thread.start()
+        return self
+
+    def write_textfile(self, textfile_uri=None):
+        textfile_uri = textfile_uri or self._textfile_uri
+        temporary_file_uri = "{}.{}.tmp".format(textfile_uri, os.getpid())
+        with open(temporary_file_uri, "w") as textfile:
+            textfile.write(self.exposition_text(openmetrics=False))
+        os.replace(temporary_file_uri, textfile_uri)
+
+    def start_textfile_writer(
+        self, textfile_uri, interval_seconds=DEFAULT_PUBLISH_INTERVAL_SECONDS
+    ):
+        self._textfile_uri = textfile_uri
+        self._textfile_interval_seconds = interval_seconds
+        self._textfile_thread = threading.Thread(
+            target=self._run_textfile_writer, name="metrics-textfile-writer", daemon=True
+        )
+        self._textfile_thread.start()
+        return self
+
+    def _run_textfile_writer(self):
+        while not self._stop_event.wait(self._textfile_interval_seconds):
+            self.write_textfile()
+
+    def stop(self):
+        # The textfile is written a last time with the final metrics.
+        self._stop_event.set()
+        if self._textfile_thread != None:
+            self._textfile_thread.join()
+            self.write_textfile()
+        if self._http_server != None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
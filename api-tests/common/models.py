@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+import json
+import os
+import re
+
+from apiunittestcore import JsonRecordShapeValidator
+
+MODULE_NAME = "models"
+
+API_V2_RESPONSE_SCHEMAS_FILE_URI = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "api-v2-response-schemas.json"
+)
+
+
+class ResponseModelError(Exception):
+    pass
+
+
+def attribute_name(json_data_name):
+    # "lastUpdateTime" -> "last_update_time"
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", json_data_name).lower()
+
+
+class ResponseModel:
+    # The base of the response models generated from a JSON schema. A model is a
+    # __slots__ class with one attribute per data name, so a record holds no
+    # per-instance dictionary. The data names are kept in one field table per model:
+    #
+    #   FIELD_NAMES           every data name of the schema, in schema order
+    #   REQUIRED_FIELD_NAMES  the data names every record holds
+    #
+    # The values of a record are checked against the "type" of their schema property.
+    # Optional data names may be missing or null, and are None on the model.
+    __slots__ = ()
+    FIELD_NAMES = ()
+    REQUIRED_FIELD_NAMES = ()
+    # data name -> value validator of JsonRecordShapeValidator
+    _VALUE_VALIDATOR_MAP = {}
+    # (data name, attribute name, nested model or None, nested model is a list)
+    _FIELD_TABLE = ()
+    _shape_validator = None
+
+    @classmethod
+    def shape_validator(cls):
+        # Accepts the records holding every required data name, no data name outside
+        # the schema and values of their schema types.
+        if cls._shape_validator == None:
+            cls._shape_validator = _SchemaShapeValidator(
+                cls.REQUIRED_FIELD_NAMES, cls.FIELD_NAMES, cls._VALUE_VALIDATOR_MAP
+            )
+        return cls._shape_validator
+
+    @classmethod
+    def validate(cls, json_map):
+        return cls.shape_validator().validate(json_map)
+
+    @classmethod
+    def validate_list(cls, json_map_list):
+        return cls.shape_validator().validate_all(json_map_list)
+
+    @classmethod
+    def from_json(cls, json_map):
+        if not cls.validate(json_map):
+            raise ResponseModelError(
+                "The JSON data does not match the {} schema: {}".format(
+                    cls.__name__,
+                    sorted(json_map) if isinstance(json_map, dict) else type(json_map).__name__,
+                )
+            )
+        response_model = cls.__new__(cls)
+        for data_name, attribute_name, nested_model, nested_list in cls._FIELD_TABLE:
+            value = json_map.get(data_name)
+            if nested_model != None and value != None:
+                if nested_list:
+                    value = nested_model.from_json_list(value)
+                else:
+                    value = nested_model.from_json(value)
+            setattr(response_model, attribute_name, value)
+        return response_model
+
+    @classmethod
+    def from_json_list(cls, json_map_list):
+        if not isinstance(json_map_list, list):
+            raise ResponseModelError(
+                "A list of {} JSON data was expected.".format(cls.__name__)
+            )
+        return [cls.from_json(json_map) for json_map in json_map_list]
+
+    def as_map(self):
+        json_map = {}
+        for data_name, attribute_name, nested_model, nested_list in self._FIELD_TABLE:
+            value = getattr(self, attribute_name)
+            if value == None and data_name not in self.REQUIRED_FIELD_NAMES:
+                continue
+            if nested_model != None and value != None:
+                if nested_list:
+                    value = [nested_value.as_map() for nested_value in value]
+                else:
+                    value = value.as_map()
+            json_map[data_name] = value
+        return json_map
+
+    def __eq__(self, other):
+        return type(self) == type(other) and all(
+            getattr(self, field[1]) == getattr(other, field[1]) for field in self._FIELD_TABLE
+        )
+
+    def __repr__(self):
+        return "{}({})".format(
+            type(self).__name__,
+            ", ".join(
+                "{}={!r}".format(field[1], getattr(self, field[1])) for field in self._FIELD_TABLE
+            ),
+        )
+
+
+class _SchemaShapeValidator(JsonRecordShapeValidator):
+    # JsonRecordShapeValidator for a schema with optional data names: a shape is valid
+    # when it holds every required data name and nothing outside the schema.
+    def __init__(self, required_json_data_names, json_data_names, json_data_value_validators):
+        super().__init__(
+            required_json_data_names, json_data_value_validators=json_data_value_validators
+        )
+        self._json_data_names = frozenset(json_data_names)
+
+    def _validate_shape(self, json_data_names):
+        input_json_data_names = frozenset(json_data_names)
+        return (
+            self._expected_json_data_names <= input_json_data_names
+            and input_json_data_names <= self._json_data_names
+        )
+
+
+# JSON schema type -> Python types of a decoded JSON value. A bool is not an integer
+# or a number in JSON, although it is an int in Python.
+_JSON_SCHEMA_TYPE_MAP = {
+    "string": (str,),
+    "boolean": (bool,),
+    "integer": (int,),
+    "number": (int, float),
+    "array": (list,),
+    "object": (dict,),
+    "null": (type(None),),
+}
+
+
+def _json_schema_value_validator(property_schema_map, required):
+    # The value validator of a schema property, or None when its type is not given.
+    # An optional property may be null.
+    json_schema_type_list = property_schema_map.get("type")
+    if json_schema_type_list == None:
+        return None
+    if not isinstance(json_schema_type_list, list):
+        json_schema_type_list = [json_schema_type_list]
+    if not required:
+        json_schema_type_list = json_schema_type_list + ["null"]
+    value_type_tuple = tuple(
+        value_type
+        for json_schema_type in json_schema_type_list
+        for value_type in _JSON_SCHEMA_TYPE_MAP.get(json_schema_type, ())
+    )
+    if not value_type_tuple:
+        return None
+    if bool in value_type_tuple:
+        return value_type_tuple
+    return lambda value: isinstance(value, value_type_tuple) and not isinstance(value, bool)
+
+
+def response_model_from_json_schema(model_name, json_schema_map, model_map=None):
+    # Generates a ResponseModel class from an object JSON schema. Object and array of
+    # object properties become nested models named by their "title", or by the model
+    # name and the property name. Generated models are added to model_map.
+    if model_map == None:
+        model_map = {}
+    property_map = json_schema_map.get("properties") or {}
+    required_json_data_names = tuple(json_schema_map.get("required") or ())
+    field_table = []
+    value_validator_map = {}
+    for data_name, property_schema_map in property_map.items():
+        nested_model = None
+        nested_list = property_schema_map.get("type") == "array"
+        nested_schema_map = property_schema_map
+        if nested_list:
+            nested_schema_map = property_schema_map.get("items") or {}
+        if nested_schema_map.get("properties"):
+            nested_model = response_model_from_json_schema(
+                nested_schema_map.get("title")
+                or model_name + data_name[:1].upper() + data_name[1:],
+                nested_schema_map,
+                model_map,
+            )
+        field_table.append((data_name, attribute_name(data_name), nested_model, nested_list))
+        value_validator = _json_schema_value_validator(
+            property_schema_map, data_name in required_json_data_names
+        )
+        if value_validator != None:
+            value_validator_map[data_name] = value_validator
+    response_model_class = type(
+        model_name,
+        (ResponseModel,),
+        {
+            "__slots__": tuple(field[1] for field in field_table),
+            "__doc__": json_schema_map.get("description"),
+            "FIELD_NAMES": tuple(field[0] for field in field_table),
+            "REQUIRED_FIELD_NAMES": required_json_data_names,
+            "_FIELD_TABLE": tuple(field_table),
+            "_VALUE_VALIDATOR_MAP": value_validator_map,
+            "_shape_validator": None,
+        },
+    )
+    model_map[model_name] = response_model_class
+    return response_model_class
+
+
+def response_models_from_json_schemas(json_schema_map_by_name):
+    model_map = {}
+    for model_name, json_schema_map in json_schema_map_by_name.items():
+        response_model_from_json_schema(model_name, json_schema_map, model_map)
+    return model_map
+
+
+with open(API_V2_RESPONSE_SCHEMAS_FILE_URI, "r") as _json_schemas_file:
+    _response_model_map = response_models_from_json_schemas(json.load(_json_schemas_file))
+
+UserProfileOrganization = _response_model_map["UserProfileOrganization"]
+UserProfileAccount = _response_model_map["UserProfileAccount"]
+Query = _response_model_map["Query"]
+AccessToken = _response_model_map["AccessToken"]
@@ -0,0 +1,392 @@
+#!/usr/bin/python3
+import heapq
+import itertools
+import socket
+import ssl
+import threading
+import time
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_CA_BUNDLE_PATH
+from urllib3.connection import HTTPConnection
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.exceptions import NameResolutionError
+from urllib3.exceptions import NewConnectionError
+
+from common.timeouts import remaining_deadline_seconds
+
+MODULE_NAME = "network"
+
+_installed_dns_cache = None
+_installed_dns_cache_lock = threading.Lock()
+_shared_ssl_context_map = {}
+_shared_ssl_context_lock = threading.Lock()
+_response_deadline_watchdog = None
+_response_deadline_watchdog_lock = threading.Lock()
+
+
+class DnsCache:
+    # Caches socket.getaddrinfo results for ttl_seconds. Once installed it serves the
+    # name lookups of the new connections of every helper's HTTP adapter; other name
+    # lookups of the process are not affected.
+    def __init__(self, ttl_seconds=300):
+        self._ttl_seconds = ttl_seconds
+        self._address_info_map = {}
+        self._hit_count = 0
+        self._miss_count = 0
+        self._lock = threading.Lock()
+        self._resolve_function = socket.getaddrinfo
+
+    def ttl_seconds(self):
+        return self._ttl_seconds
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        lookup_key = (host, port, family, type, proto, flags)
+        with self._lock:
+            cached_address_info = self._address_info_map.get(lookup_key)
+            if (
+                cached_address_info != None
+                and time.monotonic() - cached_address_info[0] < self._ttl_seconds
+            ):
+                self._hit_count += 1
+                return list(cached_address_info[1])
+            self._miss_count += 1
+        address_info_list = self._resolve_function(host, port, family, type, proto, flags)
+        with self._lock:
+            self._address_info_map[lookup_key] = (
+                time.monotonic(),
+                list(address_info_list),
+            )
+        return address_info_list
+
+    def clear(self):
+        with self._lock:
+            self._address_info_map.clear()
+
+    def statistics(self):
+        return {
+            "ttl_seconds": self._ttl_seconds,
+            "hit_count": self._hit_count,
+            "miss_count": self._miss_count,
+        }
+
+
+def install_dns_cache(ttl_seconds=300):
+    # Installs one process wide DNS cache for the helpers' connections. Later calls
+    # return the installed cache.
+    global _installed_dns_cache
+    with _installed_dns_cache_lock:
+        if _installed_dns_cache == None:
+            _installed_dns_cache = DnsCache(ttl_seconds)
+        return _installed_dns_cache
+
+
+def installed_dns_cache():
+    return _installed_dns_cache
+
+
+class TlsSessionCache:
+    # The TLS sessions of this process per server host name, used to resume sessions
+    # rather than repeat full handshakes on new connections.
+    #
+    # With TLS 1.3 the session ticket arrives after the handshake, with the first
+    # response, so sessions are read from the live sockets of a host when the next
+    # connection to it is made.
+    def __init__(self):
+        self._session_map = {}
+        self._live_socket_map = {}
+        self._full_handshake_count = 0
+        self._resumed_session_count = 0
+        self._lock = threading.Lock()
+
+    def session(self, server_hostname):
+        with self._lock:
+            live_socket_set = self._live_socket_map.get(server_hostname) or weakref.WeakSet()
+            for ssl_socket in list(live_socket_set):
+                try:
+                    ssl_session = ssl_socket.session
+                except (OSError, ValueError):
+                    continue
+                if ssl_session != None and ssl_session.has_ticket:
+                    self._session_map[server_hostname] = ssl_session
+            return self._session_map.get(server_hostname)
+
+    def add_socket(self, server_hostname, ssl_socket):
+        with self._lock:
+            if ssl_socket.session_reused:
+                self._resumed_session_count += 1
+            else:
+                self._full_handshake_count += 1
+            self._live_socket_map.setdefault(server_hostname, weakref.WeakSet()).add(
+                ssl_socket
+            )
+            if ssl_socket.session != None:
+                self._session_map.setdefault(server_hostname, ssl_socket.session)
+
+    def statistics(self):
+        return {
+            "full_handshake_count": self._full_handshake_count,
+            "resumed_session_count": self._resumed_session_count,
+        }
+
+
+class SessionResumingSSLContext(ssl.SSLContext):
+    # An SSL context offering the cached TLS session of a host on every new connection
+    # to it. urllib3 wraps the sockets of a connection pool through its context.
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.tls_session_cache = TlsSessionCache()
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        server_hostname = kwargs.get("server_hostname")
+        if server_hostname != None and kwargs.get("session") == None:
+            kwargs["session"] = self.tls_session_cache.session(server_hostname)
+        ssl_socket = super().wrap_socket(sock, *args, **kwargs)
+        if server_hostname != None:
+            self.tls_session_cache.add_socket(server_hostname, ssl_socket)
+        return ssl_socket
+
+
+def shared_ssl_context(verify=True, cert=None):
+    # The session resuming SSL context of this process for one verify setting of a
+    # session, shared by every helper verifying the same way so that the test modules
+    # run one after another by a batch runner worker resume the sessions of the
+    # modules before them. urllib3 sets the verify mode and CA bundle of a request on
+    # the context it connects with, so helpers verifying differently never share one.
+    # SSL sessions cannot be exported from OpenSSL through the ssl module, so each
+    # worker process holds its own sessions.
+    ssl_context_key = (verify, tuple(cert) if isinstance(cert, (list, tuple)) else cert)
+    with _shared_ssl_context_lock:
+        ssl_context = _shared_ssl_context_map.get(ssl_context_key)
+        if ssl_context == None:
+            ssl_context = SessionResumingSSLContext()
+            if verify == False:
+                ssl_context.check_hostname = False
+            elif verify == True:
+                ssl_context.load_verify_locations(DEFAULT_CA_BUNDLE_PATH)
+            _shared_ssl_context_map[ssl_context_key] = ssl_context
+        return ssl_context
+
+
+class _ResponseDeadlineWatchdog:
+    # Cuts off the responses still being read when the test deadline they were
+    # requested under passes. A read timeout bounds each wait for the next bytes of a
+    # response, not the whole response, so a server trickling its body would otherwise
+    # hold a request past the deadline. One thread waits for the earliest deadline of
+    # the watched connections, and shuts down the socket of a connection whose deadline
+    # passed, which ends its response read with a broken connection.
+    def __init__(self):
+        self._deadline_heap = []
+        self._watch_map = {}
+        self._sequence = itertools.count()
+        self._cut_count = 0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="response-deadline-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def watch(self, connection, deadline_time):
+        with self._condition:
+            watch_entry = (deadline_time, next(self._sequence), connection)
+            self._watch_map[connection] = watch_entry
+            heapq.heappush(self._deadline_heap, watch_entry)
+            # The thread only needs waking when its next deadline moved earlier.
+            if self._deadline_heap[0] is watch_entry:
+                self._condition.notify()
+
+    def unwatch(self, connection):
+        # The entry left in the heap is skipped when it comes up.
+        with self._condition:
+            self._watch_map.pop(connection, None)
+
+    def statistics(self):
+        with self._condition:
+            return {"watched_count": len(self._watch_map), "cut_count": self._cut_count}
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    while self._deadline_heap and (
+                        self._watch_map.get(self._deadline_heap[0][2])
+                        is not self._deadline_heap[0]
+                    ):
+                        heapq.heappop(self._deadline_heap)
+                    if not self._deadline_heap:
+                        self._condition.wait()
+                        continue
+                    wait_seconds = self._deadline_heap[0][0] - time.monotonic()
+                    if wait_seconds <= 0:
+                        break
+                    self._condition.wait(wait_seconds)
+                connection = heapq.heappop(self._deadline_heap)[2]
+                del self._watch_map[connection]
+                self._cut_count += 1
+            connection_socket = getattr(connection, "sock", None)
+            if connection_socket == None:
+                continue
+            try:
+                # The plain socket's shutdown, so that a TLS socket being read in
+                # another thread is not torn down under it.
+                socket.socket.shutdown(connection_socket, socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def response_deadline_watchdog():
+    # The process wide watchdog of the helpers' connections, started when first used.
+    global _response_deadline_watchdog
+    with _response_deadline_watchdog_lock:
+        if _response_deadline_watchdog == None:
+            _response_deadline_watchdog = _ResponseDeadlineWatchdog()
+        return _response_deadline_watchdog
+
+
+class _ResponseDeadlineConnectionMixin:
+    # Watches a connection from sending a request under a test deadline until its
+    # response was read, when the connection is returned to its pool, or until it is
+    # closed.
+    def request(self, *args, **kwargs):
+        remaining_seconds = remaining_deadline_seconds()
+        if remaining_seconds != None:
+            response_deadline_watchdog().watch(self, time.monotonic() + remaining_seconds)
+        return super().request(*args, **kwargs)
+
+    def close(self):
+        if _response_deadline_watchdog != None:
+            _response_deadline_watchdog.unwatch(self)
+        super().close()
+
+
+class _ResponseDeadlineConnectionPoolMixin:
+    def _put_conn(self, conn):
+        if conn != None and _response_deadline_watchdog != None:
+            _response_deadline_watchdog.unwatch(conn)
+        super()._put_conn(conn)
+
+
+class _DnsCachingConnectionMixin:
+    # Resolves the host of a new connection through the installed DNS cache, if any,
+    # and connects to its addresses in turn. The TLS handshake still names and
+    # verifies the host.
+    def _new_conn(self):
+        dns_cache = installed_dns_cache()
+        if dns_cache == None:
+            return super()._new_conn()
+        host = self._dns_host
+        try:
+            address_info_list = dns_cache.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror as error:
+            raise NameResolutionError(host, self, error) from error
+        connection_error = None
+        for _, _, _, _, socket_address in address_info_list:
+            self._dns_host = socket_address[0]
+            try:
+                return super()._new_conn()
+            except (ConnectTimeoutError, NewConnectionError) as error:
+                connection_error = error
+            finally:
+                self._dns_host = host
+        raise connection_error
+
+
+class _DnsCachingHTTPConnection(
+    _ResponseDeadlineConnectionMixin, _DnsCachingConnectionMixin, HTTPConnection
+):
+    pass
+
+
+class _DnsCachingHTTPSConnection(
+    _ResponseDeadlineConnectionMixin, _DnsCachingConnectionMixin, HTTPSConnection
+):
+    pass
+
+
+class _DnsCachingHTTPConnectionPool(_ResponseDeadlineConnectionPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _DnsCachingHTTPConnection
+
+
+class _DnsCachingHTTPSConnectionPool(
+    _ResponseDeadlineConnectionPoolMixin, HTTPSConnectionPool
+):
+    ConnectionCls = _DnsCachingHTTPSConnection
+
+
+class DnsCachingHTTPAdapter(HTTPAdapter):
+    # An HTTP adapter whose new connections resolve their host through the installed
+    # DNS cache, and whose responses are cut off by the test deadline they were
+    # requested under.
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _DnsCachingHTTPConnectionPool,
+            "https": _DnsCachingHTTPSConnectionPool,
+        }
+
+
+class SessionResumingHTTPAdapter(DnsCachingHTTPAdapter):
+    # An HTTP adapter whose connections use the shared session resuming SSL context of
+    # their request's verify setting. The context for verify=True loads the CA bundle
+    # requests uses by default; a verify path is loaded into its own context by
+    # urllib3.
+    def __init__(self, **kwargs):
+        self._ssl_context_list = []
+        super().__init__(**kwargs)
+
+    def tls_session_statistics(self):
+        # The TLS sessions of every context this adapter connected with.
+        tls_session_statistics_map = {"full_handshake_count": 0, "resumed_session_count": 0}
+        for ssl_context in list(self._ssl_context_list):
+            for statistics_name, count in ssl_context.tls_session_cache.statistics().items():
+                tls_session_statistics_map[statistics_name] += count
+        return tls_session_statistics_map
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(
+            request, verify, cert
+        )
+        if host_params["scheme"] == "https":
+            ssl_context = shared_ssl_context(verify, cert)
+            if ssl_context not in self._ssl_context_list:
+                self._ssl_context_list.append(ssl_context)
+            pool_kwargs["ssl_context"] = ssl_context
+        return host_params, pool_kwargs
+
+
+def prewarm_connections(head_request_function, connection_count, timeout_seconds=10):
+    # Opens connection_count connections to the API host at once, by calling
+    # head_request_function, which sends one HEAD request, from as many threads
+    # together. The connections are returned to the session's pool, so each pays for
+    # its DNS lookup and TLS handshake here rather than in a test. Returns the number
+    # of requests which got a response.
+    start_barrier = threading.Barrier(connection_count)
+    response_count = 0
+    response_count_lock = threading.Lock()
+
+    def open_connection():
+        nonlocal response_count
+        try:
+            start_barrier.wait(timeout_seconds)
+            head_request_function()
+        except (threading.BrokenBarrierError, requests.RequestException):
+            return None
+        with response_count_lock:
+            response_count += 1
+
+    thread_list = [
+        threading.Thread(target=open_connection, name="prewarm-connection-{}".format(index))
+        for index in range(connection_count)
+    ]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    return response_count
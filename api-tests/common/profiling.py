@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+import argparse
+import cProfile
+import collections
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import unittest
+
+MODULE_NAME = "profiling"
+
+DEFAULT_PROFILE_DIRECTORY_URI = "api-test-profiles"
+DEFAULT_SAMPLING_INTERVAL_SECONDS = 0.005
+MAXIMUM_COLLAPSED_STACK_DEPTH = 64
+
+
+class ProfilerMode:
+    # cProfile traces every call of the test's thread: exact, with a higher overhead.
+    DETERMINISTIC = "deterministic"
+    # Samples the stacks of the test's thread and the threads it starts at an interval:
+    # approximate, with an overhead low enough for nightly runs.
+    SAMPLING = "sampling"
+
+
+def _function_label(function_key):
+    filename, line_number, function_name = function_key
+    return "{}:{}:{}".format(os.path.basename(filename), line_number, function_name)
+
+
+def profile_file_name(profile_name):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", profile_name)
+
+
+class _StackSampler:
+    # Periodically records the Python stacks of the thread that started it and of the
+    # threads started since, such as the workers of the test. Threads already running
+    # before, such as idle server or background threads of the test module, are left
+    # out.
+    def __init__(self, sampling_interval_seconds):
+        self._sampling_interval_seconds = sampling_interval_seconds
+        self._excluded_thread_ids = set()
+        self._stack_sample_counter = collections.Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def stack_sample_counter(self):
+        return self._stack_sample_counter
+
+    def start(self):
+        self._excluded_thread_ids = set(sys._current_frames()) - {threading.get_ident()}
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        sampler_thread_id = threading.get_ident()
+        while not self._stop_event.wait(self._sampling_interval_seconds):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_thread_id or thread_id in self._excluded_thread_ids:
+                    continue
+                stack = []
+                while frame != None and len(stack) < MAXIMUM_COLLAPSED_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+                self._stack_sample_counter[tuple(stack)] += 1
+
+
+class TestProfiler:
+    # Profiles each test separately and writes two files per test into the output
+    # directory: "<test id>.pstats", readable with pstats.Stats, and
+    # "<test id>.collapsed", collapsed stacks for flamegraph tools.
+    def __init__(
+        self,
+        output_directory_uri=DEFAULT_PROFILE_DIRECTORY_URI,
+        profiler_mode=ProfilerMode.SAMPLING,
+        sampling_interval_seconds=DEFAULT_SAMPLING_INTERVAL_SECONDS,
+    ):
+        self._output_directory_uri = output_directory_uri
+        self._profiler_mode = profiler_mode
+        self._sampling_interval_seconds = sampling_interval_seconds
+        self._test_id = None
+        self._profile = None
+        self._stack_sampler = None
+
+    def output_directory_uri(self):
+        return self._output_directory_uri
+
+    def start(self, test_id):
+        self._test_id = test_id
+        if self._profiler_mode == ProfilerMode.DETERMINISTIC:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._stack_sampler = _StackSampler(self._sampling_interval_seconds)
+            self._stack_sampler.start()
+
+    def stop(self):
+        if self._test_id == None:
+            return None
+        if self._profile != None:
+            self._profile.disable()
+        else:
+            self._stack_sampler.stop()
+        os.makedirs(self._output_directory_uri, exist_ok=True)
+        profile_file_uri = os.path.join(
+            self._output_directory_uri, profile_file_name(self._test_id)
+        )
+        if self._profile != None:
+            self._profile.dump_stats(profile_file_uri + ".pstats")
+            collapsed_stack_list = self._collapsed_stacks_from_profile()
+            self._profile = None
+        else:
+            pstats_map = self._pstats_from_stack_samples()
+            # pstats cannot load an empty profile, as written for a test shorter than
+            # the sampling interval. Only its empty collapsed stack file is written.
+            if pstats_map:
+                with open(profile_file_uri + ".pstats", "wb") as pstats_file:
+                    marshal.dump(pstats_map, pstats_file)
+            collapsed_stack_list = [
+                (";".join(_function_label(function_key) for function_key in stack), count)
+                for stack, count in self._stack_sampler.stack_sample_counter().items()
+            ]
+            self._stack_sampler = None
+        with open(profile_file_uri + ".collapsed", "w") as collapsed_file:
+            for collapsed_stack, weight in sorted(collapsed_stack_list):
+                collapsed_file.write("{} {}\n".format(collapsed_stack, weight))
+        self._test_id = None
+
+    def _collapsed_stacks_from_profile(self):
+        # cProfile only records caller/callee pairs, not whole stacks. Each function's
+        # own time is attributed to the stack found by following its most expensive
+        # caller upwards. Weights are in microseconds.
+        stats_map = pstats.Stats(self._profile).stats
+        collapsed_stack_list = []
+        for function_key, (_, _, total_time, _, caller_map) in stats_map.items():
+            weight = int(total_time * 1000000)
+            if weight <= 0:
+                continue
+            stack = [function_key]
+            while caller_map and len(stack) < MAXIMUM_COLLAPSED_STACK_DEPTH:
+                caller_key = max(caller_map, key=lambda key: caller_map[key][3])
+                if caller_key in stack:
+                    break
+                stack.append(caller_key)
+                caller_map = stats_map.get(caller_key, (0, 0, 0, 0, {}))[4]
+            stack.reverse()
+            collapsed_stack_list.append(
+                (";".join(_function_label(key) for key in stack), weight)
+            )
+        return collapsed_stack_list
+
+    def _pstats_from_stack_samples(self):
+        # Builds the marshalled dictionary pstats.Stats loads: for every function the
+        # primitive and total call counts (here: samples), own time, cumulative time and
+        # the same figures per caller.
+        stats_map = {}
+        for stack, count in self._stack_sampler.stack_sample_counter().items():
+            sample_time_seconds = count * self._sampling_interval_seconds
+            counted_function_keys = set()
+            for stack_index, function_key in enumerate(stack):
+                call_count, _, own_time, cumulative_time, caller_map = stats_map.get(
+                    function_key, (0, 0, 0.0, 0.0, {})
+                )
+                own_sample_time_seconds = 0.0
+                if stack_index == len(stack) - 1:
+                    own_sample_time_seconds = sample_time_seconds
+                # A recursive function is only counted once per sample.
+                if function_key not in counted_function_keys:
+                    counted_function_keys.add(function_key)
+                    call_count += count
+                    cumulative_time += sample_time_seconds
+                if stack_index > 0:
+                    caller_key = stack[stack_index - 1]
+                    caller_call_count, _, caller_own_time, caller_cumulative_time = (
+                        caller_map.get(caller_key, (0, 0, 0.0, 0.0))
+                    )
+                    caller_map[caller_key] = (
+                        caller_call_count + count,
+                        caller_call_count + count,
+                        caller_own_time + own_sample_time_seconds,
+                        caller_cumulative_time + sample_time_seconds,
+                    )
+                stats_map[function_key] = (
+                    call_count,
+                    call_count,
+                    own_time + own_sample_time_seconds,
+                    cumulative_time,
+                    caller_map,
+                )
+        return stats_map
+
+
+def profile_test_result(test_result, test_profiler):
+    # Profiles every test reported to test_result.
+    start_test = test_result.startTest
+    stop_test = test_result.stopTest
+
+    def profiled_start_test(test):
+        start_test(test)
+        test_profiler.start(test.id())
+
+    def profiled_stop_test(test):
+        test_profiler.stop()
+        stop_test(test)
+
+    test_result.startTest = profiled_start_test
+    test_result.stopTest = profiled_stop_test
+    return test_result
+
+
+class ProfilingTextTestRunner(unittest.TextTestRunner):
+    def __init__(self, test_profiler, **kwargs):
+        super().__init__(**kwargs)
+        self._test_profiler = test_profiler
+
+    def _makeResult(self):
+        return profile_test_result(super()._makeResult(), self._test_profiler)
+
+
+def add_profile_arguments(argument_parser):
+    argument_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile every test.",
+    )
+    argument_parser.add_argument(
+        "--profile-mode",
+        default=ProfilerMode.SAMPLING,
+        choices=[ProfilerMode.SAMPLING, ProfilerMode.DETERMINISTIC],
+        help="The profiler used by --profile: sampling (the default) or deterministic.",
+    )
+    argument_parser.add_argument(
+        "--profile-dir",
+        default=DEFAULT_PROFILE_DIRECTORY_URI,
+        help="The directory the per-test pstats and collapsed stack files are written to.",
+    )
+    argument_parser.add_argument(
+        "--profile-interval",
+        type=float,
+        default=DEFAULT_SAMPLING_INTERVAL_SECONDS,
+        help="The sampling profiler's interval in seconds.",
+    )
+
+
+def unittest_main():
+    # unittest.main() extended with the --profile options. The profile options are
+    # removed from the command line before unittest parses the rest.
+    argument_parser = argparse.ArgumentParser(add_help=False)
+    add_profile_arguments(argument_parser)
+    profile_arguments, unittest_argv = argument_parser.parse_known_args(sys.argv[1:])
+    if not profile_arguments.profile:
+        return unittest.main(argv=sys.argv[:1] + unittest_argv)
+    test_profiler = TestProfiler(
+        output_directory_uri=profile_arguments.profile_dir,
+        profiler_mode=profile_arguments.profile_mode,
+        sampling_interval_seconds=profile_arguments.profile_interval,
+    )
+    return unittest.main(
+        argv=sys.argv[:1] + unittest_argv,
+        testRunner=ProfilingTextTestRunner(test_profiler),
+    )
@@ -0,0 +1,399 @@
+#!/usr/bin/python3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+import json
+import os
+import time
+
+from apiunittestcore import HttpResponseValidator
+from common.lazyjson import lazy_response_json
+from common.utils import ApiHelperUtil
+from common.utils import configure_test_environment
+from common.utils import log_info
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # Only NDJSON can be exported.
+    pyarrow = None
+
+MODULE_NAME = "queryexport"
+
+QUERIES_API_REQUEST = "Queries"
+
+
+class ExportFormat:
+    NDJSON = "ndjson"
+    PARQUET = "parquet"
+
+
+class ExportStatus:
+    EXPORTED = "exported"
+    FAILED = "failed"
+
+
+class QueryExportError(ValueError):
+    pass
+
+
+def lql_time_range_value(date_time):
+    # The API takes ISO 8601 formatted UTC date time strings: "yyyy-MM-ddTHH:mm:ss.SSSZ"
+    return date_time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+class _NdjsonResultWriter:
+    # Writes one JSON object per line.
+    def __init__(self, file_uri):
+        self._result_file = open(file_uri, "wb")
+        self.bytes_written = 0
+
+    def write_rows(self, row_list):
+        page_bytes = b"".join(
+            json.dumps(row, separators=(",", ":")).encode() + b"\n" for row in row_list
+        )
+        self._result_file.write(page_bytes)
+        self.bytes_written += len(page_bytes)
+
+    def close(self):
+        self._result_file.close()
+
+    def discard(self):
+        self._result_file.close()
+
+
+class _ParquetResultWriter:
+    # Writes every page as a row group, nested objects and lists stored as JSON
+    # strings. The columns are those of every page: a column missing from a page is
+    # null in its rows, and a column whose type widens in a later page, such as
+    # integers followed by floats, takes the wider type. Columns without a value in
+    # any page are strings. A column whose types do not widen into one, such as
+    # numbers and strings, fails the export.
+    #
+    # As the columns are only known once every page has arrived, each page is spooled
+    # to a file of its own next to file_uri and written to file_uri on close, one
+    # page at a time.
+    def __init__(self, file_uri):
+        self._file_uri = file_uri
+        self._page_file_uri_list = []
+        self._schema = None
+        self.bytes_written = 0
+
+    @staticmethod
+    def _parquet_row(row):
+        return {
+            column_name: (
+                json.dumps(value, sort_keys=True) if isinstance(value, (dict, list)) else value
+            )
+            for column_name, value in row.items()
+        }
+
+    def write_rows(self, row_list):
+        parquet_row_list = [self._parquet_row(row) for row in row_list]
+        # The columns of every row of the page, not only those of its first row.
+        column_name_list = list(
+            dict.fromkeys(
+                column_name for parquet_row in parquet_row_list for column_name in parquet_row
+            )
+        )
+        try:
+            page_table = pyarrow.Table.from_pydict(
+                {
+                    column_name: [parquet_row.get(column_name) for parquet_row in parquet_row_list]
+                    for column_name in column_name_list
+                }
+            )
+            if self._schema == None:
+                self._schema = page_table.schema
+            else:
+                self._schema = pyarrow.unify_schemas(
+                    [self._schema, page_table.schema], promote_options="permissive"
+                )
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as error:
+            raise QueryExportError(
+                "The column types of page {} do not match: {}".format(
+                    len(self._page_file_uri_list) + 1, error
+                )
+            )
+        page_file_uri = "{}.page-{}".format(self._file_uri, len(self._page_file_uri_list))
+        self._page_file_uri_list.append(page_file_uri)
+        pyarrow.parquet.write_table(page_table, page_file_uri)
+
+    def _result_schema(self):
+        return pyarrow.schema(
+            [
+                pyarrow.field(field.name, pyarrow.string())
+                if pyarrow.types.is_null(field.type)
+                else field
+                for field in self._schema
+            ]
+        )
+
+    def close(self):
+        try:
+            if self._schema != None:
+                result_schema = self._result_schema()
+                with pyarrow.parquet.ParquetWriter(self._file_uri, result_schema) as parquet_writer:
+                    for page_file_uri in self._page_file_uri_list:
+                        page_table = pyarrow.parquet.read_table(page_file_uri)
+                        parquet_writer.write_table(
+                            pyarrow.Table.from_arrays(
+                                [
+                                    page_table.column(field.name).cast(field.type)
+                                    if field.name in page_table.column_names
+                                    else pyarrow.nulls(page_table.num_rows, field.type)
+                                    for field in result_schema
+                                ],
+                                schema=result_schema,
+                            )
+                        )
+        finally:
+            self.discard()
+        if os.path.exists(self._file_uri):
+            self.bytes_written = os.path.getsize(self._file_uri)
+
+    def discard(self):
+        for page_file_uri in self._page_file_uri_list:
+            if os.path.exists(page_file_uri):
+                os.remove(page_file_uri)
+        self._page_file_uri_list = []
+
+
+class QueryResultExport:
+    # Executes registered LQL queries (Queries/{queryId}/execute) over the time window
+    # ending now and exports their results, one file per query, to output_dir as
+    # NDJSON or Parquet.
+    #
+    # Results are streamed a page at a time: each page is decoded, written and
+    # dropped before the next page is requested, so memory is bounded by the page
+    # size rather than the result size. Up to concurrency queries are exported at
+    # once, by default the helper's concurrency limit; the helper's rate limit and
+    # adaptive concurrency limit still apply to every request.
+    #
+    # A result is written to a temporary file which is renamed when the query is
+    # exported, so a failed query never leaves a partial file behind. Without
+    # query_ids every registered query is exported.
+    QUERY_IDS = "query_ids"
+    OUTPUT_DIR = "output_dir"
+    FORMAT = "format"
+    CONCURRENCY = "concurrency"
+    TIME_WINDOW_HOURS = "time_window_hours"
+
+    def __init__(
+        self,
+        query_ids=None,
+        output_dir="query-exports",
+        format=ExportFormat.NDJSON,
+        concurrency=None,
+        time_window_hours=1.0,
+    ):
+        if format not in [ExportFormat.NDJSON, ExportFormat.PARQUET]:
+            raise QueryExportError('Unknown query export format "{}".'.format(format))
+        if format == ExportFormat.PARQUET and pyarrow == None:
+            raise QueryExportError("Exporting to Parquet needs the pyarrow package.")
+        self.query_ids = query_ids
+        self.output_dir = output_dir
+        self.format = format
+        self.concurrency = concurrency
+        self.time_window_hours = time_window_hours
+
+    @staticmethod
+    def from_map(export_map):
+        if not isinstance(export_map, dict):
+            return None
+        validated_export_map = {
+            key: value
+            for key, value in export_map.items()
+            if key
+            in [
+                QueryResultExport.QUERY_IDS,
+                QueryResultExport.OUTPUT_DIR,
+                QueryResultExport.FORMAT,
+                QueryResultExport.CONCURRENCY,
+                QueryResultExport.TIME_WINDOW_HOURS,
+            ]
+        }
+        return QueryResultExport(**validated_export_map)
+
+    def registered_query_ids(self, api_helper_util):
+        http_response = api_helper_util.make_get_request(QUERIES_API_REQUEST)
+        if not HttpResponseValidator.is_successful_response(http_response):
+            raise QueryExportError(
+                "The registered queries could not be listed: {}".format(http_response.status_code)
+            )
+        return [query["queryId"] for query in lazy_response_json(http_response)["data"]]
+
+    def run(self, api_helper_util):
+        # Returns the export report map.
+        end_date_time = datetime.now(timezone.utc)
+        start_date_time = end_date_time - timedelta(hours=self.time_window_hours)
+        query_id_list = self.query_ids
+        if query_id_list == None:
+            query_id_list = self.registered_query_ids(api_helper_util)
+        os.makedirs(self.output_dir, exist_ok=True)
+        concurrency = self.concurrency or api_helper_util.max_request_concurrency()
+        export_start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            query_report_map_list = list(
+                executor.map(
+                    lambda query_id: self._export_query(
+                        api_helper_util, query_id, start_date_time, end_date_time
+                    ),
+                    query_id_list,
+                )
+            )
+        duration_seconds = time.perf_counter() - export_start_time
+
+        export_report_map = {
+            "format": self.format,
+            "start_time": lql_time_range_value(start_date_time),
+            "end_time": lql_time_range_value(end_date_time),
+            "concurrency": concurrency,
+            "query_count": len(query_report_map_list),
+            "exported_count": sum(
+                1
+                for query_report_map in query_report_map_list
+                if query_report_map["status"] == ExportStatus.EXPORTED
+            ),
+            "failed_count": sum(
+                1
+                for query_report_map in query_report_map_list
+                if query_report_map["status"] == ExportStatus.FAILED
+            ),
+        }
+        export_report_map.update(
+            _throughput_map(
+                sum(query_report_map["row_count"] for query_report_map in query_report_map_list),
+                sum(
+                    query_report_map["bytes_received"]
+                    for query_report_map in query_report_map_list
+                ),
+                sum(
+                    query_report_map["bytes_written"]
+                    for query_report_map in query_report_map_list
+                ),
+                duration_seconds,
+            )
+        )
+        export_report_map["queries"] = query_report_map_list
+        return export_report_map
+
+    def _export_query(self, api_helper_util, query_id, start_date_time, end_date_time):
+        result_file_uri = os.path.join(self.output_dir, "{}.{}".format(query_id, self.format))
+        temporary_file_uri = "{}.tmp".format(result_file_uri)
+        execute_request_map = {
+            "arguments": [
+                {"name": "StartTimeRange", "value": lql_time_range_value(start_date_time)},
+                {"name": "EndTimeRange", "value": lql_time_range_value(end_date_time)},
+            ]
+        }
+        query_report_map = {
+            "query_id": query_id,
+            "status": ExportStatus.FAILED,
+            "file": None,
+            "status_code": None,
+            "page_count": 0,
+        }
+        row_count = 0
+        bytes_received = 0
+        result_writer = None
+        query_start_time = time.perf_counter()
+        try:
+            if self.format == ExportFormat.PARQUET:
+                result_writer = _ParquetResultWriter(temporary_file_uri)
+            else:
+                result_writer = _NdjsonResultWriter(temporary_file_uri)
+            for http_response in api_helper_util.make_paged_post_requests(
+                "Queries/{}/execute".format(query_id), json_data=execute_request_map
+            ):
+                query_report_map["status_code"] = http_response.status_code
+                if not HttpResponseValidator.is_successful_response(http_response):
+                    raise QueryExportError(_response_message(http_response))
+                bytes_received += len(http_response.content)
+                row_list = http_response.json().get("data") or []
+                if row_list:
+                    result_writer.write_rows(row_list)
+                row_count += len(row_list)
+                query_report_map["page_count"] += 1
+            result_writer.close()
+            os.replace(temporary_file_uri, result_file_uri)
+            query_report_map["status"] = ExportStatus.EXPORTED
+            query_report_map["file"] = result_file_uri
+        except Exception as error:
+            if result_writer != None:
+                result_writer.discard()
+            if os.path.exists(temporary_file_uri):
+                os.remove(temporary_file_uri)
+            query_report_map["error"] = str(error)
+        query_report_map.update(
+            _throughput_map(
+                row_count,
+                bytes_received,
+                result_writer.bytes_written if result_writer != None else 0,
+                time.perf_counter() - query_start_time,
+            )
+        )
+        return query_report_map
+
+
+def _throughput_map(row_count, bytes_received, bytes_written, duration_seconds):
+    return {
+        "row_count": row_count,
+        "bytes_received": bytes_received,
+        "bytes_written": bytes_written,
+        "duration_seconds": round(duration_seconds, 3),
+        "rows_per_second": round(row_count / duration_seconds, 1) if duration_seconds > 0 else None,
+        "bytes_per_second": (
+            round(bytes_received / duration_seconds, 1) if duration_seconds > 0 else None
+        ),
+    }
+
+
+def _response_message(http_response):
+    try:
+        message = http_response.json().get("message")
+    except (ValueError, AttributeError):
+        message = None
+    return "{} {}".format(http_response.status_code, message or http_response.reason)
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(
+        description="Execute registered LQL queries and export their results."
+    )
+    argument_parser.add_argument(
+        "query_ids",
+        nargs="*",
+        help="The queries to execute. All registered queries are executed by default.",
+    )
+    argument_parser.add_argument(
+        "--format", choices=[ExportFormat.NDJSON, ExportFormat.PARQUET], default="ndjson"
+    )
+    argument_parser.add_argument("--output-dir", default="query-exports")
+    argument_parser.add_argument("--concurrency", type=int, default=None)
+    argument_parser.add_argument("--time-window-hours", type=float, default=1.0)
+    argument_parser.add_argument("--config", default=None)
+    argument_parser.add_argument("--report", default="query-export-report.json")
+    arguments = argument_parser.parse_args()
+    api_helper_util = ApiHelperUtil(configure_test_environment(arguments.config))
+    export_report_map = QueryResultExport(
+        query_ids=arguments.query_ids or None,
+        output_dir=arguments.output_dir,
+        format=arguments.format,
+        concurrency=arguments.concurrency,
+        time_window_hours=arguments.time_window_hours,
+    ).run(api_helper_util)
+    api_helper_util.close()
+    with open(arguments.report, "w") as report_file:
+        json.dump(export_report_map, report_file, indent=2)
+    log_message = "Exported {} rows of {}/{} queries at {} rows/s, written to {}".format(
+        export_report_map["row_count"],
+        export_report_map["exported_count"],
+        export_report_map["query_count"],
+        export_report_map["rows_per_second"],
+        arguments.output_dir,
+    )
+    log_info(MODULE_NAME, log_message)
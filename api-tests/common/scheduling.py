@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+import heapq
+import json
+import os
+import statistics
+
+from common.utils import InterProcessFileLock
+from common.utils import log_warning
+
+MODULE_NAME = "scheduling"
+
+DEFAULT_TEST_DURATIONS_FILE_URI = ".api-test-durations.json"
+# The predicted duration of a test never run before, when no test has been run yet.
+DEFAULT_UNKNOWN_DURATION_SECONDS = 1.0
+# The weight of a new duration in a test's exponentially smoothed duration.
+DURATION_SMOOTHING_WEIGHT = 0.5
+# The module level list of a test module naming its shardable tests. A shardable test
+# reads the module's _test_shard and only handles its share of the items, e.g.
+#
+#   SHARDABLE_TESTS = ["test_validate_all_account_queries"]
+#   _test_shard = None
+#   ...
+#   for query in shard_items(available_queries, _test_shard):
+SHARDABLE_TESTS_NAME = "SHARDABLE_TESTS"
+TEST_SHARD_NAME = "_test_shard"
+
+
+def shard_items(item_list, test_shard):
+    # The items of one shard, (shard index, shard count), of a shardable test. Every
+    # shard count-th item is taken, so shards of a sorted list are alike in size and
+    # cost. All items are returned when the test is not sharded.
+    if test_shard == None:
+        return list(item_list)
+    shard_index, shard_count = test_shard
+    return list(item_list)[shard_index::shard_count]
+
+
+class TestUnit:
+    # A unit of scheduled work: one test, or one shard of a shardable test.
+    def __init__(self, module_uri, test_id, test_name, shard_index=None, shard_count=None):
+        self.module_uri = module_uri
+        # test_id is the unittest id of the test, test_name its name within its module.
+        self.test_id = test_id
+        self.test_name = test_name
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+    def test_shard(self):
+        if self.shard_count == None:
+            return None
+        return (self.shard_index, self.shard_count)
+
+    def unit_key(self):
+        if self.shard_count == None:
+            return self.test_id
+        return "{}[{}/{}]".format(self.test_id, self.shard_index + 1, self.shard_count)
+
+    def __repr__(self):
+        return "TestUnit({})".format(self.unit_key())
+
+
+class TestDurationHistory:
+    # The smoothed durations of past test runs, persisted in a JSON file shared by the
+    # runs and worker processes of a machine:
+    #
+    #   {"durations": {"<test id>": <seconds>, "<test id>[<shard>/<shards>]": <seconds>}}
+    #
+    # A sharded test is recorded both per shard and as the sum of its shards, so a
+    # test run with another shard count is still predicted.
+    def __init__(self, durations_file_uri=DEFAULT_TEST_DURATIONS_FILE_URI):
+        self._durations_file_uri = durations_file_uri
+        self._duration_map = self._read_duration_map()
+        self._recorded_duration_map = {}
+
+    def durations_file_uri(self):
+        return self._durations_file_uri
+
+    def _read_duration_map(self):
+        try:
+            with open(self._durations_file_uri, "r") as durations_file:
+                duration_map = json.load(durations_file).get("durations")
+        except (IOError, ValueError, AttributeError):
+            return {}
+        if not isinstance(duration_map, dict):
+            return {}
+        return duration_map
+
+    def predicted_duration_seconds(self, test_unit):
+        duration_seconds = self._duration_map.get(test_unit.unit_key())
+        if duration_seconds != None:
+            return duration_seconds
+        if test_unit.shard_count != None and test_unit.test_id in self._duration_map:
+            return self._duration_map[test_unit.test_id] / test_unit.shard_count
+        # A new test is assumed to take as long as a typical known test.
+        if self._duration_map:
+            return statistics.median(self._duration_map.values())
+        return DEFAULT_UNKNOWN_DURATION_SECONDS
+
+    def record(self, unit_key, duration_seconds):
+        self._recorded_duration_map[unit_key] = (
+            self._recorded_duration_map.get(unit_key, 0.0) + duration_seconds
+        )
+
+    def record_test_unit(self, test_unit, duration_seconds):
+        self.record(test_unit.unit_key(), duration_seconds)
+        if test_unit.shard_count != None:
+            self.record(test_unit.test_id, duration_seconds)
+
+    def save(self):
+        # Merges the recorded durations into the file, which other runs may have
+        # updated meanwhile.
+        if not self._recorded_duration_map:
+            return None
+        try:
+            with InterProcessFileLock(self._durations_file_uri + ".lock"):
+                duration_map = self._read_duration_map()
+                for unit_key, duration_seconds in self._recorded_duration_map.items():
+                    previous_duration_seconds = duration_map.get(unit_key)
+                    if previous_duration_seconds != None:
+                        duration_seconds = (
+                            DURATION_SMOOTHING_WEIGHT * duration_seconds
+                            + (1.0 - DURATION_SMOOTHING_WEIGHT) * previous_duration_seconds
+                        )
+                    duration_map[unit_key] = round(duration_seconds, 3)
+                temporary_file_uri = "{}.{}.tmp".format(self._durations_file_uri, os.getpid())
+                with open(temporary_file_uri, "w") as durations_file:
+                    json.dump({"durations": duration_map}, durations_file, indent=2, sort_keys=True)
+                os.replace(temporary_file_uri, self._durations_file_uri)
+        except OSError as error:
+            log_message = "The test durations could not be saved: {}".format(error)
+            log_warning(MODULE_NAME, log_message)
+            return None
+        self._duration_map = duration_map
+        self._recorded_duration_map = {}
+
+
+def longest_processing_time_schedule(test_unit_list, worker_count, duration_function):
+    # Longest processing time first: units are taken longest first, each by the worker
+    # with the least predicted work so far. Returns the units in that order, the
+    # predicted makespan and the predicted work of each worker.
+    #
+    # Units handed out in this order to workers which each take the next unit when
+    # they are free follow the same schedule, but adapt when predictions are off.
+    ordered_test_unit_list = sorted(
+        test_unit_list, key=lambda test_unit: duration_function(test_unit), reverse=True
+    )
+    worker_load_heap = [(0.0, worker_index) for worker_index in range(max(1, worker_count))]
+    for test_unit in ordered_test_unit_list:
+        worker_load_seconds, worker_index = heapq.heappop(worker_load_heap)
+        heapq.heappush(
+            worker_load_heap, (worker_load_seconds + duration_function(test_unit), worker_index)
+        )
+    worker_load_list = [
+        worker_load_seconds
+        for worker_load_seconds, _ in sorted(worker_load_heap, key=lambda load: load[1])
+    ]
+    return ordered_test_unit_list, max(worker_load_list), worker_load_list
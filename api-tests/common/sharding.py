@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+import threading
+import time
+
+from apiunittestcore import JsonRecordShapeValidator
+from common.timeouts import propagate_deadline
+
+MODULE_NAME = "sharding"
+
+DATA_JSON_NAME = "data"
+
+
+def format_api_time(date_time):
+    # The API takes ISO 8601 formatted UTC date time strings: "yyyy-MM-ddTHH:mm:ssZ"
+    if date_time.tzinfo != None:
+        date_time = date_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return date_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_api_time(date_time_str):
+    date_time = datetime.fromisoformat(date_time_str.replace("Z", "+00:00"))
+    if date_time.tzinfo != None:
+        date_time = date_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return date_time
+
+
+def record_time_from_data_name(time_json_data_name):
+    # Returns a function reading the UTC time of a record from one of its data names.
+    def record_time(record_map):
+        return parse_api_time(record_map[time_json_data_name])
+
+    return record_time
+
+
+def make_time_window_fetch_function(api_helper_util, api_request, params=None):
+    # Returns a function fetching every record of a time window from a paged API
+    # endpoint taking "startTime" and "endTime", e.g. AuditLogs or CloudActivities.
+    # The API takes whole seconds, so a window with fractional edges is widened to the
+    # whole seconds around it, and its records outside the window are left to the
+    # caller to drop.
+    def fetch_time_window(start_time, end_time):
+        request_params = dict(params or {})
+        request_params["startTime"] = format_api_time(start_time.replace(microsecond=0))
+        whole_second_end_time = end_time.replace(microsecond=0)
+        if whole_second_end_time < end_time:
+            whole_second_end_time += timedelta(seconds=1)
+        request_params["endTime"] = format_api_time(whole_second_end_time)
+        record_list = []
+        for http_response in api_helper_util.make_paged_get_requests(
+            api_request, params=request_params
+        ):
+            http_response.raise_for_status()
+            record_list.extend(http_response.json().get(DATA_JSON_NAME) or [])
+        return record_list
+
+    return fetch_time_window
+
+
+class TimeWindowShard:
+    def __init__(self, shard_index, start_time, end_time):
+        self.shard_index = shard_index
+        self.start_time = start_time
+        self.end_time = end_time
+
+    def duration_seconds(self):
+        return (self.end_time - self.start_time).total_seconds()
+
+
+class TimeWindowShardedFetcher:
+    # Splits a long time range into sub-windows (shards), fetches them in parallel
+    # with bounded concurrency and yields the records of all shards as one
+    # time-ordered stream.
+    #
+    # The shard duration adapts as shards complete: it is sized so a shard holds
+    # about target_records_per_shard records at the observed record density, and is
+    # shortened when shards take longer than target_shard_latency_seconds. It is kept
+    # to whole seconds, the precision of the API's time parameters, so the shards of a
+    # range starting on a whole second meet on whole seconds.
+    #
+    # Given an adaptive concurrency limiter, no more shards are fetched at once than
+    # its current limit allows.
+    def __init__(
+        self,
+        fetch_time_window_function,
+        record_time_function=None,
+        max_concurrent_shards=4,
+        initial_shard_duration=timedelta(hours=1),
+        minimum_shard_duration=timedelta(minutes=1),
+        maximum_shard_duration=timedelta(days=1),
+        target_records_per_shard=5000,
+        target_shard_latency_seconds=10.0,
+        concurrency_limiter=None,
+    ):
+        self._fetch_time_window_function = fetch_time_window_function
+        self._record_time_function = record_time_function
+        self._max_concurrent_shards = max_concurrent_shards
+        self._shard_duration_seconds = float(max(1, round(initial_shard_duration.total_seconds())))
+        self._minimum_shard_duration_seconds = minimum_shard_duration.total_seconds()
+        self._maximum_shard_duration_seconds = maximum_shard_duration.total_seconds()
+        self._target_records_per_shard = target_records_per_shard
+        self._target_shard_latency_seconds = target_shard_latency_seconds
+        self._concurrency_limiter = concurrency_limiter
+        self._shard_count = 0
+        self._record_count = 0
+        self._shard_duration_history = []
+        self._statistics_lock = threading.Lock()
+
+    def statistics(self):
+        return {
+            "shard_count": self._shard_count,
+            "record_count": self._record_count,
+            "shard_duration_seconds_history": list(self._shard_duration_history),
+        }
+
+    def fetch(self, start_time, end_time):
+        next_shard_start_time = start_time
+        next_shard_index = 0
+        next_yield_shard_index = 0
+        completed_shard_record_map = {}
+        pending_future_shard_map = {}
+        # The shards are fetched under the deadline of the test consuming the records.
+        fetch_shard = propagate_deadline(self._fetch_shard)
+
+        with ThreadPoolExecutor(max_workers=self._max_concurrent_shards) as executor:
+            try:
+                while pending_future_shard_map or next_shard_start_time < end_time:
+                    # Keep every worker busy with the next shard of the time range.
+                    while (
+                        len(pending_future_shard_map) < self._current_concurrency_limit()
+                        and next_shard_start_time < end_time
+                    ):
+                        shard = TimeWindowShard(
+                            next_shard_index,
+                            next_shard_start_time,
+                            min(
+                                end_time,
+                                next_shard_start_time
+                                + timedelta(seconds=self._shard_duration_seconds),
+                            ),
+                        )
+                        pending_future_shard_map[
+                            executor.submit(fetch_shard, shard)
+                        ] = shard
+                        self._shard_duration_history.append(shard.duration_seconds())
+                        next_shard_start_time = shard.end_time
+                        next_shard_index += 1
+
+                    done_futures, _ = wait(
+                        list(pending_future_shard_map), return_when=FIRST_COMPLETED
+                    )
+                    for future in done_futures:
+                        shard = pending_future_shard_map.pop(future)
+                        record_list, latency_seconds = future.result()
+                        self._adapt_shard_duration(shard, len(record_list), latency_seconds)
+                        completed_shard_record_map[shard.shard_index] = record_list
+
+                    # Shards cover consecutive windows, so records are yielded shard by
+                    # shard in order as soon as the earliest outstanding shard is done.
+                    while next_yield_shard_index in completed_shard_record_map:
+                        for record in completed_shard_record_map.pop(next_yield_shard_index):
+                            yield record
+                        next_yield_shard_index += 1
+            finally:
+                for future in pending_future_shard_map:
+                    future.cancel()
+
+    def _current_concurrency_limit(self):
+        if self._concurrency_limiter == None:
+            return self._max_concurrent_shards
+        return max(
+            1,
+            min(self._max_concurrent_shards, self._concurrency_limiter.current_limit()),
+        )
+
+    def _fetch_shard(self, shard):
+        fetch_start_time = time.perf_counter()
+        record_list = self._fetch_time_window_function(shard.start_time, shard.end_time)
+        latency_seconds = time.perf_counter() - fetch_start_time
+        if self._record_time_function != None:
+            # Drop records on the window edges that belong to the neighbouring shard
+            # and order the shard's records by time.
+            timed_record_list = []
+            for record in record_list:
+                record_time = self._record_time_function(record)
+                if shard.start_time <= record_time < shard.end_time:
+                    timed_record_list.append((record_time, record))
+            timed_record_list.sort(key=lambda timed_record: timed_record[0])
+            record_list = [record for _, record in timed_record_list]
+        with self._statistics_lock:
+            self._shard_count += 1
+            self._record_count += len(record_list)
+        return record_list, latency_seconds
+
+    def _adapt_shard_duration(self, shard, record_count, latency_seconds):
+        shard_duration_seconds = max(shard.duration_seconds(), 1.0)
+        if record_count > 0:
+            record_density = record_count / shard_duration_seconds
+            next_shard_duration_seconds = self._target_records_per_shard / record_density
+        else:
+            next_shard_duration_seconds = shard_duration_seconds * 2
+        if latency_seconds > self._target_shard_latency_seconds:
+            next_shard_duration_seconds = min(
+                next_shard_duration_seconds,
+                shard_duration_seconds
+                * self._target_shard_latency_seconds
+                / latency_seconds,
+            )
+        next_shard_duration_seconds = min(
+            self._maximum_shard_duration_seconds,
+            max(self._minimum_shard_duration_seconds, next_shard_duration_seconds),
+        )
+        self._shard_duration_seconds = float(max(1, round(next_shard_duration_seconds)))
+
+
+def assert_sharded_time_range_fetch(
+    test_case,
+    api_helper_util,
+    api_request,
+    time_json_data_name,
+    expected_json_data_names,
+    time_range=timedelta(days=7),
+):
+    # Fetches the records of a time-windowed endpoint over the last time_range as time
+    # window shards fetched in parallel, and fails test_case unless every record has
+    # the expected data names, lies within the time range and is time ordered.
+    # Returns the statistics of the fetch.
+    end_time = datetime.utcnow().replace(microsecond=0)
+    start_time = end_time - time_range
+    record_time = record_time_from_data_name(time_json_data_name)
+    sharded_fetcher = TimeWindowShardedFetcher(
+        make_time_window_fetch_function(api_helper_util, api_request),
+        record_time_function=record_time,
+        max_concurrent_shards=api_helper_util.max_request_concurrency(),
+        concurrency_limiter=api_helper_util.concurrency_limiter(),
+    )
+    record_shape_validator = JsonRecordShapeValidator(expected_json_data_names)
+    previous_record_time = None
+    for record_map in sharded_fetcher.fetch(start_time, end_time):
+        test_case.assertTrue(record_shape_validator.validate(record_map))
+        current_record_time = record_time(record_map)
+        test_case.assertGreaterEqual(current_record_time, start_time)
+        test_case.assertLess(current_record_time, end_time)
+        if previous_record_time != None:
+            test_case.assertGreaterEqual(current_record_time, previous_record_time)
+        previous_record_time = current_record_time
+    return sharded_fetcher.statistics()
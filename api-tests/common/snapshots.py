@@ -0,0 +1,424 @@
+#!/usr/bin/python3
+import hashlib
+import json
+import os
+
+from common.utils import InterProcessFileLock
+
+MODULE_NAME = "snapshots"
+
+SNAPSHOT_FORMAT_VERSION = 1
+_HASH_DIGEST_SIZE_BYTES = 8
+
+
+class ShapeKind:
+    OBJECT = "object"
+    ARRAY = "array"
+    STRING = "string"
+    NUMBER = "number"
+    BOOLEAN = "boolean"
+    NULL = "null"
+    # A value of several kinds, e.g. a string or null.
+    UNION = "union"
+
+
+class DriftKind:
+    ADDED = "added"
+    REMOVED = "removed"
+    TYPE_CHANGED = "type_changed"
+    BECAME_OPTIONAL = "became_optional"
+    BECAME_REQUIRED = "became_required"
+
+
+class ShapeDrift:
+    # A structural change at one JSON path, e.g. "UserProfile $.data[].accounts[].admin".
+    # Array elements are written as "[]", as the elements of an array share one shape.
+    def __init__(self, snapshot_key, json_path, drift_kind, old_kinds=None, new_kinds=None):
+        self.snapshot_key = snapshot_key
+        self.json_path = json_path
+        self.drift_kind = drift_kind
+        self.old_kinds = old_kinds
+        self.new_kinds = new_kinds
+
+    def as_map(self):
+        return {
+            "snapshot_key": self.snapshot_key,
+            "json_path": self.json_path,
+            "drift_kind": self.drift_kind,
+            "old_kinds": self.old_kinds,
+            "new_kinds": self.new_kinds,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, ShapeDrift) and self.as_map() == other.as_map()
+
+    def __repr__(self):
+        drift_str = "{} {}: {}".format(self.snapshot_key, self.json_path, self.drift_kind)
+        if self.drift_kind == DriftKind.TYPE_CHANGED:
+            drift_str += " {} -> {}".format("|".join(self.old_kinds), "|".join(self.new_kinds))
+        return drift_str
+
+
+def _scalar_kind(json_value):
+    if json_value == None:
+        return ShapeKind.NULL
+    if isinstance(json_value, bool):
+        return ShapeKind.BOOLEAN
+    if isinstance(json_value, (int, float)):
+        return ShapeKind.NUMBER
+    if isinstance(json_value, str):
+        return ShapeKind.STRING
+    raise TypeError("Not a JSON value: {}".format(type(json_value).__name__))
+
+
+class StructuralSnapshot:
+    # The structure of JSON responses as a Merkle tree: every shape node is stored once,
+    # under the hash of its kind and its children's hashes, so identical substructures
+    # of any response share one node. The records of an array are merged into one
+    # shape, whose object data names missing from some records are optional; a
+    # thousand records of one shape take a single node.
+    #
+    # Each snapshot key, e.g. "UserProfile" or "Queries/{queryId}", has one root shape.
+    # Adding another response to a key merges it into the root, so the responses of a
+    # templated endpoint share one shape.
+    #
+    # Two snapshots are diffed top down, only following the children whose hashes
+    # differ, so the time taken grows with what changed rather than with the size of
+    # the responses.
+    def __init__(self):
+        # hash -> node, a dictionary holding "kind" and, by kind:
+        #   object  "properties": {data name: hash}, "optional": [data name, ...]
+        #   array   "items": hash, or None for arrays only ever seen empty
+        #   union   "members": [hash, ...], at most one per kind
+        self._node_map = {}
+        self._root_hash_map = {}
+        self._merge_cache = {}
+
+    def keys(self):
+        return sorted(self._root_hash_map)
+
+    def root_hash(self, snapshot_key):
+        return self._root_hash_map.get(snapshot_key)
+
+    def node(self, node_hash):
+        return self._node_map[node_hash]
+
+    def node_count(self):
+        return len(self._node_map)
+
+    def _store(self, node_map):
+        node_hash = hashlib.blake2b(
+            json.dumps(node_map, sort_keys=True, separators=(",", ":")).encode(),
+            digest_size=_HASH_DIGEST_SIZE_BYTES,
+        ).hexdigest()
+        self._node_map.setdefault(node_hash, node_map)
+        return node_hash
+
+    def shape(self, json_value):
+        # Stores the shape of a JSON value and returns its hash.
+        if isinstance(json_value, dict):
+            return self._store(
+                {
+                    "kind": ShapeKind.OBJECT,
+                    "properties": {
+                        data_name: self.shape(data_value)
+                        for data_name, data_value in json_value.items()
+                    },
+                    "optional": [],
+                }
+            )
+        if isinstance(json_value, list):
+            items_hash = None
+            # Records mostly share a shape, so each distinct shape is merged once.
+            for element_hash in dict.fromkeys(self.shape(element) for element in json_value):
+                items_hash = self.merge(items_hash, element_hash)
+            return self._store({"kind": ShapeKind.ARRAY, "items": items_hash})
+        return self._store({"kind": _scalar_kind(json_value)})
+
+    def _members(self, node_hash):
+        # kind -> hash of the non-union shapes a shape is made of.
+        node_map = self._node_map[node_hash]
+        if node_map["kind"] != ShapeKind.UNION:
+            return {node_map["kind"]: node_hash}
+        return {
+            self._node_map[member_hash]["kind"]: member_hash
+            for member_hash in node_map["members"]
+        }
+
+    def merge(self, first_hash, second_hash):
+        # The shape of values of either shape. None stands for no shape.
+        if first_hash == None or first_hash == second_hash:
+            return second_hash
+        if second_hash == None:
+            return first_hash
+        merge_key = tuple(sorted([first_hash, second_hash]))
+        if merge_key in self._merge_cache:
+            return self._merge_cache[merge_key]
+        member_map = self._members(first_hash)
+        for kind, member_hash in self._members(second_hash).items():
+            if kind not in member_map or member_map[kind] == member_hash:
+                member_map[kind] = member_hash
+            elif kind == ShapeKind.OBJECT:
+                member_map[kind] = self._merge_objects(member_map[kind], member_hash)
+            elif kind == ShapeKind.ARRAY:
+                member_map[kind] = self._store(
+                    {
+                        "kind": ShapeKind.ARRAY,
+                        "items": self.merge(
+                            self._node_map[member_map[kind]]["items"],
+                            self._node_map[member_hash]["items"],
+                        ),
+                    }
+                )
+        if len(member_map) == 1:
+            merged_hash = next(iter(member_map.values()))
+        else:
+            merged_hash = self._store(
+                {"kind": ShapeKind.UNION, "members": sorted(member_map.values())}
+            )
+        self._merge_cache[merge_key] = merged_hash
+        return merged_hash
+
+    def _merge_objects(self, first_hash, second_hash):
+        first_node_map = self._node_map[first_hash]
+        second_node_map = self._node_map[second_hash]
+        first_property_map = first_node_map["properties"]
+        second_property_map = second_node_map["properties"]
+        property_map = {}
+        optional_data_names = set(first_node_map["optional"]) | set(second_node_map["optional"])
+        for data_name in set(first_property_map) | set(second_property_map):
+            if data_name not in first_property_map or data_name not in second_property_map:
+                optional_data_names.add(data_name)
+            property_map[data_name] = self.merge(
+                first_property_map.get(data_name), second_property_map.get(data_name)
+            )
+        return self._store(
+            {
+                "kind": ShapeKind.OBJECT,
+                "properties": property_map,
+                "optional": sorted(optional_data_names),
+            }
+        )
+
+    def add(self, snapshot_key, json_value):
+        # Merges the shape of a response into the snapshot key's root shape.
+        self._root_hash_map[snapshot_key] = self.merge(
+            self._root_hash_map.get(snapshot_key), self.shape(json_value)
+        )
+        return self._root_hash_map[snapshot_key]
+
+    def set_root(self, snapshot_key, node_hash, source_snapshot):
+        # Copies a root shape, and every node below it, from another snapshot.
+        pending_hash_list = [node_hash]
+        while pending_hash_list:
+            pending_hash = pending_hash_list.pop()
+            if pending_hash == None or pending_hash in self._node_map:
+                continue
+            node_map = source_snapshot.node(pending_hash)
+            self._node_map[pending_hash] = node_map
+            pending_hash_list.extend(_child_hashes(node_map))
+        self._root_hash_map[snapshot_key] = node_hash
+
+    def _reachable_node_map(self):
+        reachable_node_map = {}
+        pending_hash_list = list(self._root_hash_map.values())
+        while pending_hash_list:
+            node_hash = pending_hash_list.pop()
+            if node_hash == None or node_hash in reachable_node_map:
+                continue
+            reachable_node_map[node_hash] = self._node_map[node_hash]
+            pending_hash_list.extend(_child_hashes(self._node_map[node_hash]))
+        return reachable_node_map
+
+    def as_map(self):
+        # Only the nodes below a root are kept; shapes merged away are dropped.
+        return {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "roots": dict(sorted(self._root_hash_map.items())),
+            "nodes": dict(sorted(self._reachable_node_map().items())),
+        }
+
+    @staticmethod
+    def from_map(snapshot_map):
+        if snapshot_map.get("version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                "Unsupported snapshot format version: {}".format(snapshot_map.get("version"))
+            )
+        structural_snapshot = StructuralSnapshot()
+        structural_snapshot._node_map = dict(snapshot_map["nodes"])
+        structural_snapshot._root_hash_map = dict(snapshot_map["roots"])
+        return structural_snapshot
+
+    def save(self, snapshot_file_uri):
+        temporary_file_uri = "{}.{}.tmp".format(snapshot_file_uri, os.getpid())
+        with open(temporary_file_uri, "w") as snapshot_file:
+            json.dump(self.as_map(), snapshot_file, separators=(",", ":"))
+        os.replace(temporary_file_uri, snapshot_file_uri)
+
+    @staticmethod
+    def load(snapshot_file_uri):
+        with open(snapshot_file_uri, "r") as snapshot_file:
+            return StructuralSnapshot.from_map(json.load(snapshot_file))
+
+    def diff(self, new_snapshot, snapshot_keys=None):
+        # The drifts from this snapshot to new_snapshot, for every key of either, or
+        # for snapshot_keys.
+        if snapshot_keys == None:
+            snapshot_keys = sorted(set(self._root_hash_map) | set(new_snapshot._root_hash_map))
+        shape_drift_list = []
+        for snapshot_key in snapshot_keys:
+            old_root_hash = self._root_hash_map.get(snapshot_key)
+            new_root_hash = new_snapshot._root_hash_map.get(snapshot_key)
+            if old_root_hash == None and new_root_hash != None:
+                shape_drift_list.append(ShapeDrift(snapshot_key, "$", DriftKind.ADDED))
+            elif old_root_hash != None and new_root_hash == None:
+                shape_drift_list.append(ShapeDrift(snapshot_key, "$", DriftKind.REMOVED))
+            else:
+                self._diff_shapes(
+                    new_snapshot, snapshot_key, "$", old_root_hash, new_root_hash, shape_drift_list
+                )
+        return shape_drift_list
+
+    def _diff_shapes(
+        self, new_snapshot, snapshot_key, json_path, old_hash, new_hash, shape_drift_list
+    ):
+        # Equal hashes hold equal structures, so they are never descended into.
+        if old_hash == new_hash or old_hash == None or new_hash == None:
+            return None
+        old_member_map = self._members(old_hash)
+        new_member_map = new_snapshot._members(new_hash)
+        if set(old_member_map) != set(new_member_map):
+            shape_drift_list.append(
+                ShapeDrift(
+                    snapshot_key,
+                    json_path,
+                    DriftKind.TYPE_CHANGED,
+                    sorted(old_member_map),
+                    sorted(new_member_map),
+                )
+            )
+        old_object_hash = old_member_map.get(ShapeKind.OBJECT)
+        new_object_hash = new_member_map.get(ShapeKind.OBJECT)
+        if old_object_hash != None and new_object_hash != None:
+            self._diff_objects(
+                new_snapshot,
+                snapshot_key,
+                json_path,
+                old_object_hash,
+                new_object_hash,
+                shape_drift_list,
+            )
+        old_array_hash = old_member_map.get(ShapeKind.ARRAY)
+        new_array_hash = new_member_map.get(ShapeKind.ARRAY)
+        if old_array_hash != None and new_array_hash != None:
+            self._diff_shapes(
+                new_snapshot,
+                snapshot_key,
+                json_path + "[]",
+                self._node_map[old_array_hash]["items"],
+                new_snapshot._node_map[new_array_hash]["items"],
+                shape_drift_list,
+            )
+
+    def _diff_objects(
+        self, new_snapshot, snapshot_key, json_path, old_hash, new_hash, shape_drift_list
+    ):
+        if old_hash == new_hash:
+            return None
+        old_node_map = self._node_map[old_hash]
+        new_node_map = new_snapshot._node_map[new_hash]
+        old_property_map = old_node_map["properties"]
+        new_property_map = new_node_map["properties"]
+        old_optional_data_names = set(old_node_map["optional"])
+        new_optional_data_names = set(new_node_map["optional"])
+        for data_name in sorted(set(old_property_map) | set(new_property_map)):
+            property_json_path = "{}.{}".format(json_path, data_name)
+            if data_name not in new_property_map:
+                shape_drift_list.append(
+                    ShapeDrift(snapshot_key, property_json_path, DriftKind.REMOVED)
+                )
+                continue
+            if data_name not in old_property_map:
+                shape_drift_list.append(
+                    ShapeDrift(snapshot_key, property_json_path, DriftKind.ADDED)
+                )
+                continue
+            if data_name in new_optional_data_names and data_name not in old_optional_data_names:
+                shape_drift_list.append(
+                    ShapeDrift(snapshot_key, property_json_path, DriftKind.BECAME_OPTIONAL)
+                )
+            elif data_name in old_optional_data_names and data_name not in new_optional_data_names:
+                shape_drift_list.append(
+                    ShapeDrift(snapshot_key, property_json_path, DriftKind.BECAME_REQUIRED)
+                )
+            self._diff_shapes(
+                new_snapshot,
+                snapshot_key,
+                property_json_path,
+                old_property_map[data_name],
+                new_property_map[data_name],
+                shape_drift_list,
+            )
+
+
+def _child_hashes(node_map):
+    if node_map["kind"] == ShapeKind.OBJECT:
+        return list(node_map["properties"].values())
+    if node_map["kind"] == ShapeKind.ARRAY:
+        return [node_map["items"]]
+    if node_map["kind"] == ShapeKind.UNION:
+        return list(node_map["members"])
+    return []
+
+
+class ResponseSnapshotStore:
+    # A snapshot file of the response structures seen by the tests, used as the
+    # baseline of later runs. The first response recorded for a key becomes its
+    # baseline; later responses are diffed against it. Delete the file, or a key from
+    # it, to record a new baseline. The file is shared by the worker processes of a run.
+    def __init__(self, snapshot_file_uri):
+        self._snapshot_file_uri = snapshot_file_uri
+
+    def snapshot_file_uri(self):
+        return self._snapshot_file_uri
+
+    def _load(self):
+        try:
+            return StructuralSnapshot.load(self._snapshot_file_uri)
+        except (IOError, ValueError, KeyError):
+            return StructuralSnapshot()
+
+    def compare_and_record(self, snapshot_key, json_value):
+        # Returns the drifts of the response from the baseline of its key, and records
+        # the response as the baseline if the key has none.
+        response_snapshot = StructuralSnapshot()
+        response_snapshot.add(snapshot_key, json_value)
+        with InterProcessFileLock(self._snapshot_file_uri + ".lock"):
+            baseline_snapshot = self._load()
+            if baseline_snapshot.root_hash(snapshot_key) != None:
+                return baseline_snapshot.diff(response_snapshot, [snapshot_key])
+            baseline_snapshot.set_root(
+                snapshot_key, response_snapshot.root_hash(snapshot_key), response_snapshot
+            )
+            baseline_snapshot.save(self._snapshot_file_uri)
+        return []
+
+
+def assert_no_response_drift(test_case, api_helper_util, snapshot_key, json_value):
+    # Fails test_case if the response drifted from its baseline in the helper's
+    # "response_snapshot_file". Does nothing when no snapshot file is configured.
+    snapshot_file_uri = api_helper_util.response_snapshot_file()
+    if snapshot_file_uri == None:
+        return None
+    shape_drift_list = ResponseSnapshotStore(snapshot_file_uri).compare_and_record(
+        snapshot_key, json_value
+    )
+    test_case.assertEqual(
+        shape_drift_list,
+        [],
+        msg="The {} response drifted from {}:\n{}".format(
+            snapshot_key,
+            snapshot_file_uri,
+            "\n".join(str(shape_drift) for shape_drift in shape_drift_list),
+        ),
+    )
@@ -0,0 +1,355 @@
+#!/usr/bin/python3
+import itertools
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+from apiunittestcore import LatencyDistribution
+
+try:
+    import resource
+except ImportError:
+    # Unavailable on Windows. The resident set size is then only sampled from /proc.
+    resource = None
+
+MODULE_NAME = "soak"
+
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 60.0
+# The first and last windows compared for drift are this fraction of the samples.
+DEFAULT_WINDOW_FRACTION = 0.2
+DEFAULT_LEAK_GROWTH_RATIO = 0.1
+DEFAULT_LATENCY_DRIFT_RATIO = 1.5
+# The latencies kept per sample interval, chosen by reservoir sampling so memory stays
+# flat however many requests an interval holds.
+MAXIMUM_LATENCY_SAMPLES_PER_INTERVAL = 1000
+
+# The resource metrics checked for leaks, and the smallest growth between the first
+# and last windows which is reported as a leak.
+_LEAK_METRIC_MINIMUM_GROWTH_MAP = {
+    "rss_bytes": 8 * 1024 * 1024,
+    "open_file_descriptor_count": 4,
+    "thread_count": 2,
+    "pool_count": 2,
+}
+# Reported with their trends, but not checked for leaks: connections are opened
+# again whenever the server closes one, and tokens are issued as they expire.
+_TREND_METRIC_NAMES = [
+    "opened_connection_count",
+    "idle_connection_count",
+    "access_token_issue_count",
+]
+
+
+def process_rss_bytes():
+    # The current resident set size, or the peak one where /proc is unavailable.
+    try:
+        with open("/proc/self/statm", "r") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource == None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform == "darwin":
+        return peak_rss
+    return peak_rss * 1024
+
+
+def open_file_descriptor_count():
+    for file_descriptor_directory_uri in ["/proc/self/fd", "/dev/fd"]:
+        try:
+            return len(os.listdir(file_descriptor_directory_uri))
+        except OSError:
+            continue
+    return None
+
+
+def connection_pool_statistics(http_session):
+    # The urllib3 connection pools of every adapter mounted on a requests session.
+    pool_statistics_map = {
+        "pool_count": 0,
+        "opened_connection_count": 0,
+        "idle_connection_count": 0,
+    }
+    adapter_ids = set()
+    for http_adapter in http_session.adapters.values():
+        pool_manager = getattr(http_adapter, "poolmanager", None)
+        if pool_manager == None or id(http_adapter) in adapter_ids:
+            continue
+        adapter_ids.add(id(http_adapter))
+        for pool_key in list(pool_manager.pools.keys()):
+            connection_pool = pool_manager.pools.get(pool_key)
+            if connection_pool == None:
+                continue
+            pool_statistics_map["pool_count"] += 1
+            pool_statistics_map["opened_connection_count"] += connection_pool.num_connections
+            if connection_pool.pool != None:
+                pool_statistics_map["idle_connection_count"] += connection_pool.pool.qsize()
+    return pool_statistics_map
+
+
+def _latency_percentiles_map(latency_seconds_list):
+    latency_distribution = LatencyDistribution(latency_seconds_list, 0.0)
+    return {
+        "sample_count": latency_distribution.sample_count(),
+        "p50_ms": round(latency_distribution.p50_ms(), 1),
+        "p95_ms": round(latency_distribution.p95_ms(), 1),
+        "p99_ms": round(latency_distribution.percentile_ms(99), 1),
+    }
+
+
+def _linear_slope(point_list):
+    # The least squares slope of (x, y) points.
+    point_count = len(point_list)
+    mean_x = sum(point[0] for point in point_list) / point_count
+    mean_y = sum(point[1] for point in point_list) / point_count
+    variance_x = sum((point[0] - mean_x) ** 2 for point in point_list)
+    if variance_x == 0:
+        return 0.0
+    return sum((point[0] - mean_x) * (point[1] - mean_y) for point in point_list) / variance_x
+
+
+def _window_size(sample_count, window_fraction):
+    return max(1, int(math.ceil(sample_count * window_fraction)))
+
+
+def resource_trends(
+    sample_list,
+    window_fraction=DEFAULT_WINDOW_FRACTION,
+    leak_growth_ratio=DEFAULT_LEAK_GROWTH_RATIO,
+):
+    # The trend of every resource metric over the samples. A leak is suspected when a
+    # metric rises over the run and its last window is higher than its first window by
+    # leak_growth_ratio, and by at least the metric's minimum growth.
+    trend_map = {}
+    for metric_name in list(_LEAK_METRIC_MINIMUM_GROWTH_MAP) + _TREND_METRIC_NAMES:
+        point_list = [
+            (sample_map["elapsed_seconds"], sample_map[metric_name])
+            for sample_map in sample_list
+            if sample_map.get(metric_name) != None
+        ]
+        if not point_list:
+            continue
+        window_size = _window_size(len(point_list), window_fraction)
+        first_window_mean = sum(point[1] for point in point_list[:window_size]) / window_size
+        last_window_mean = sum(point[1] for point in point_list[-window_size:]) / window_size
+        slope_per_hour = _linear_slope(point_list) * 3600.0
+        metric_trend_map = {
+            "first": point_list[0][1],
+            "last": point_list[-1][1],
+            "first_window_mean": round(first_window_mean, 1),
+            "last_window_mean": round(last_window_mean, 1),
+            "slope_per_hour": round(slope_per_hour, 1),
+        }
+        if metric_name in _LEAK_METRIC_MINIMUM_GROWTH_MAP:
+            metric_trend_map["leak_suspected"] = (
+                len(point_list) >= 3
+                and slope_per_hour > 0
+                and last_window_mean - first_window_mean
+                >= max(
+                    _LEAK_METRIC_MINIMUM_GROWTH_MAP[metric_name],
+                    leak_growth_ratio * first_window_mean,
+                )
+            )
+        trend_map[metric_name] = metric_trend_map
+    return trend_map
+
+
+class SoakMonitor:
+    # Samples the process and an ApiHelperUtil at an interval while a soak runs: the
+    # resident set size, open file descriptors, threads, connection pools, bearer
+    # token issues and the latency of the helper's requests.
+    def __init__(self, api_helper_util, sample_interval_seconds=DEFAULT_SAMPLE_INTERVAL_SECONDS):
+        self._api_helper_util = api_helper_util
+        self._sample_interval_seconds = sample_interval_seconds
+        self._sample_list = []
+        self._interval_latency_list = []
+        self._interval_latency_count = 0
+        self._interval_latency_lists = []
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self._start_time = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def samples(self):
+        with self._lock:
+            return list(self._sample_list)
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._api_helper_util.add_response_listener(self._record_latency)
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="soak-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread != None:
+            self._thread.join()
+        self._api_helper_util.remove_response_listener(self._record_latency)
+        self.sample()
+
+    def _run(self):
+        while not self._stop_event.wait(self._sample_interval_seconds):
+            self.sample()
+
+    def _record_latency(self, endpoint_name, http_response, latency_seconds):
+        with self._lock:
+            self._interval_latency_count += 1
+            if len(self._interval_latency_list) < MAXIMUM_LATENCY_SAMPLES_PER_INTERVAL:
+                self._interval_latency_list.append(latency_seconds)
+            else:
+                sample_index = self._random.randrange(self._interval_latency_count)
+                if sample_index < MAXIMUM_LATENCY_SAMPLES_PER_INTERVAL:
+                    self._interval_latency_list[sample_index] = latency_seconds
+
+    def sample(self):
+        api_helper_util = self._api_helper_util
+        request_statistics_map = api_helper_util.request_statistics()
+        sample_map = {
+            "elapsed_seconds": round(time.perf_counter() - self._start_time, 3),
+            "rss_bytes": process_rss_bytes(),
+            "open_file_descriptor_count": open_file_descriptor_count(),
+            "thread_count": threading.active_count(),
+        }
+        sample_map.update(connection_pool_statistics(api_helper_util.http_session()))
+        sample_map.update(
+            {
+                "request_count": request_statistics_map["request_count"],
+                "access_token_issue_count": api_helper_util.access_token_issue_count(),
+                "access_token_refresh_count": request_statistics_map[
+                    "access_token_refresh_count"
+                ],
+                "access_token_time_remaining_seconds": round(
+                    api_helper_util.bearer_access_token_time_remaining_seconds(), 1
+                ),
+            }
+        )
+        with self._lock:
+            interval_latency_list = self._interval_latency_list
+            self._interval_latency_list = []
+            self._interval_latency_count = 0
+            sample_map["latency"] = _latency_percentiles_map(interval_latency_list)
+            self._interval_latency_lists.append(interval_latency_list)
+            self._sample_list.append(sample_map)
+        return sample_map
+
+    def latency_drift(
+        self,
+        window_fraction=DEFAULT_WINDOW_FRACTION,
+        latency_drift_ratio=DEFAULT_LATENCY_DRIFT_RATIO,
+    ):
+        # Compares the request latencies of the first and last windows of samples.
+        with self._lock:
+            interval_latency_lists = [
+                interval_latency_list
+                for interval_latency_list in self._interval_latency_lists
+                if interval_latency_list
+            ]
+        if not interval_latency_lists:
+            return None
+        window_size = _window_size(len(interval_latency_lists), window_fraction)
+        first_window_map = _latency_percentiles_map(
+            list(itertools.chain.from_iterable(interval_latency_lists[:window_size]))
+        )
+        last_window_map = _latency_percentiles_map(
+            list(itertools.chain.from_iterable(interval_latency_lists[-window_size:]))
+        )
+        drift_ratio_map = {}
+        for percentile_name in ["p50_ms", "p95_ms", "p99_ms"]:
+            drift_ratio = None
+            if first_window_map[percentile_name] > 0:
+                drift_ratio = round(
+                    last_window_map[percentile_name] / first_window_map[percentile_name], 2
+                )
+            drift_ratio_map[percentile_name] = drift_ratio
+        return {
+            "first_window": first_window_map,
+            "last_window": last_window_map,
+            "drift_ratio": drift_ratio_map,
+            "drift_suspected": len(interval_latency_lists) >= 2
+            and drift_ratio_map["p95_ms"] != None
+            and drift_ratio_map["p95_ms"] > latency_drift_ratio,
+        }
+
+    def report(
+        self,
+        window_fraction=DEFAULT_WINDOW_FRACTION,
+        leak_growth_ratio=DEFAULT_LEAK_GROWTH_RATIO,
+        latency_drift_ratio=DEFAULT_LATENCY_DRIFT_RATIO,
+    ):
+        sample_list = self.samples()
+        trend_map = resource_trends(sample_list, window_fraction, leak_growth_ratio)
+        latency_drift_map = self.latency_drift(window_fraction, latency_drift_ratio)
+        # The samples taken once the helper held its first bearer token.
+        token_sample_list = list(
+            itertools.dropwhile(
+                lambda sample_map: sample_map["access_token_time_remaining_seconds"] <= 0,
+                sample_list,
+            )
+        )
+        return {
+            "sample_interval_seconds": self._sample_interval_seconds,
+            "sample_count": len(sample_list),
+            "leak_suspected_metrics": sorted(
+                metric_name
+                for metric_name, metric_trend_map in trend_map.items()
+                if metric_trend_map.get("leak_suspected")
+            ),
+            "latency_drift_suspected": bool(
+                latency_drift_map and latency_drift_map["drift_suspected"]
+            ),
+            "trends": trend_map,
+            "latency": latency_drift_map,
+            "access_tokens": {
+                "issue_count": sample_list[-1]["access_token_issue_count"] if sample_list else 0,
+                "background_refresh_count": sample_list[-1]["access_token_refresh_count"]
+                if sample_list
+                else 0,
+                "expired_token_sample_count": len(
+                    [
+                        sample_map
+                        for sample_map in token_sample_list
+                        if sample_map["access_token_time_remaining_seconds"] <= 0
+                    ]
+                ),
+            },
+            "samples": sample_list,
+        }
+
+
+def run_soak(
+    api_helper_util,
+    iteration_function,
+    duration_seconds,
+    sample_interval_seconds=DEFAULT_SAMPLE_INTERVAL_SECONDS,
+    window_fraction=DEFAULT_WINDOW_FRACTION,
+    leak_growth_ratio=DEFAULT_LEAK_GROWTH_RATIO,
+    latency_drift_ratio=DEFAULT_LATENCY_DRIFT_RATIO,
+):
+    # Calls iteration_function(iteration_index) again and again for duration_seconds,
+    # e.g. to run the selected tests, and returns the soak report. An iteration is
+    # never cut short, so the soak may run over by up to one iteration.
+    soak_monitor = SoakMonitor(api_helper_util, sample_interval_seconds).start()
+    soak_start_time = time.perf_counter()
+    iteration_count = 0
+    try:
+        while iteration_count == 0 or time.perf_counter() - soak_start_time < duration_seconds:
+            iteration_function(iteration_count)
+            iteration_count += 1
+    finally:
+        soak_monitor.stop()
+    soak_report_map = {
+        "duration_seconds": round(time.perf_counter() - soak_start_time, 3),
+        "iteration_count": iteration_count,
+    }
+    soak_report_map.update(
+        soak_monitor.report(window_fraction, leak_growth_ratio, latency_drift_ratio)
+    )
+    return soak_report_map
@@ -0,0 +1,389 @@
+#!/usr/bin/python3
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import threading
+import time
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+import uuid
+import zlib
+
+from common.utils import ApiConfigParameters
+from common.utils import ApiHelperUtil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+MODULE_NAME = "standin"
+
+# The credentials of the API helpers sending their requests to a stand-in server.
+STAND_IN_API_ACCESS_KEY_ID = "STAND_IN_KEY_ID"
+STAND_IN_SECRET_KEY = "STAND_IN_SECRET_KEY"
+STAND_IN_CUSTOMER_ACCOUNT_NAME = "stand-in"
+
+
+class ContentEncoding:
+    IDENTITY = "identity"
+    GZIP = "gzip"
+    DEFLATE = "deflate"
+    BROTLI = "br"
+    ZSTANDARD = "zstd"
+
+
+def available_content_encodings():
+    content_encoding_list = [
+        ContentEncoding.IDENTITY,
+        ContentEncoding.GZIP,
+        ContentEncoding.DEFLATE,
+    ]
+    if brotli != None:
+        content_encoding_list.append(ContentEncoding.BROTLI)
+    if zstd != None:
+        content_encoding_list.append(ContentEncoding.ZSTANDARD)
+    return content_encoding_list
+
+
+class ContentEncoder:
+    # Compresses a body chunk by chunk into a single encoded stream.
+    def __init__(self, content_encoding):
+        self._compress_function = lambda body_chunk: body_chunk
+        self._flush_function = lambda: b""
+        if content_encoding == ContentEncoding.GZIP:
+            compressor = zlib.compressobj(wbits=31)
+        elif content_encoding == ContentEncoding.DEFLATE:
+            compressor = zlib.compressobj()
+        elif content_encoding == ContentEncoding.BROTLI and brotli != None:
+            compressor = brotli.Compressor()
+            self._compress_function = compressor.process
+            self._flush_function = compressor.finish
+            return None
+        elif content_encoding == ContentEncoding.ZSTANDARD and zstd != None:
+            compressor = zstd.ZstdCompressor()
+        else:
+            return None
+        self._compress_function = compressor.compress
+        self._flush_function = compressor.flush
+
+    def compress(self, body_chunk):
+        return self._compress_function(body_chunk)
+
+    def flush(self):
+        return self._flush_function()
+
+
+def encode_content(body, content_encoding):
+    content_encoder = ContentEncoder(content_encoding)
+    return content_encoder.compress(body) + content_encoder.flush()
+
+
+class StandInRequest:
+    def __init__(
+        self,
+        http_method,
+        path,
+        query_map,
+        headers,
+        body,
+        client_address=None,
+        tls_session_reused=None,
+    ):
+        self.http_method = http_method
+        self.path = path
+        self.query_map = query_map
+        self.headers = headers
+        self.body = body
+        # The (host, port) of the client connection the request arrived on.
+        self.client_address = client_address
+        # Whether the TLS connection resumed an earlier session; None without TLS.
+        self.tls_session_reused = tls_session_reused
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+    def accepted_content_encodings(self):
+        accept_encoding = self.headers.get("Accept-Encoding") or ""
+        return [
+            content_encoding.split(";")[0].strip()
+            for content_encoding in accept_encoding.split(",")
+            if content_encoding.strip()
+        ]
+
+
+class StandInResponse:
+    # A response of the stand-in server. The body is given as bytes, as JSON data, or
+    # as an iterable of byte chunks which is streamed with chunked transfer encoding.
+    # content_encoding compresses the body, or, with "auto", picks the first encoding
+    # the client accepts.
+    def __init__(
+        self,
+        status_code=200,
+        json_data=None,
+        body=b"",
+        body_chunks=None,
+        headers=None,
+        content_encoding=None,
+    ):
+        self.status_code = status_code
+        self.body = body
+        if json_data != None:
+            self.body = json.dumps(json_data).encode()
+        self.body_chunks = body_chunks
+        self.headers = dict(headers or {})
+        self.content_encoding = content_encoding
+
+
+def create_self_signed_certificate(output_directory_uri, host_name="localhost"):
+    # Writes a self-signed certificate for host_name and 127.0.0.1, and its key, with
+    # the openssl command. Returns the certificate and key file paths, or None when
+    # openssl is not installed.
+    if shutil.which("openssl") == None:
+        return None
+    certificate_file_uri = os.path.join(output_directory_uri, "stand-in-certificate.pem")
+    key_file_uri = os.path.join(output_directory_uri, "stand-in-key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN={}".format(host_name),
+            "-addext",
+            "subjectAltName=DNS:{},IP:127.0.0.1".format(host_name),
+            "-keyout",
+            key_file_uri,
+            "-out",
+            certificate_file_uri,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certificate_file_uri, key_file_uri
+
+
+def server_ssl_context(certificate_file_uri, key_file_uri):
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(certificate_file_uri, key_file_uri)
+    return ssl_context
+
+
+class _StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        return None
+
+    def _handle_request(self):
+        split_url = urlsplit(self.path)
+        content_length = int(self.headers.get("Content-Length") or 0)
+        stand_in_request = StandInRequest(
+            self.command,
+            split_url.path,
+            parse_qs(split_url.query),
+            self.headers,
+            self.rfile.read(content_length) if content_length else b"",
+            client_address=self.client_address,
+            tls_session_reused=getattr(self.connection, "session_reused", None),
+        )
+        stand_in_response = self.server.stand_in_server.handle_request(stand_in_request)
+
+        content_encoding = stand_in_response.content_encoding
+        if content_encoding == "auto":
+            content_encoding = next(
+                (
+                    accepted_content_encoding
+                    for accepted_content_encoding in stand_in_request.accepted_content_encodings()
+                    if accepted_content_encoding in available_content_encodings()
+                ),
+                ContentEncoding.IDENTITY,
+            )
+
+        self.send_response(stand_in_response.status_code)
+        for header_name, header_value in stand_in_response.headers.items():
+            self.send_header(header_name, header_value)
+        if content_encoding not in [None, ContentEncoding.IDENTITY]:
+            self.send_header("Content-Encoding", content_encoding)
+        if self.command == "HEAD":
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif stand_in_response.body_chunks != None:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            content_encoder = ContentEncoder(content_encoding)
+            for body_chunk in stand_in_response.body_chunks:
+                self._write_chunk(content_encoder.compress(body_chunk))
+            self._write_chunk(content_encoder.flush())
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            body = encode_content(stand_in_response.body, content_encoding)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def _write_chunk(self, body_chunk):
+        if body_chunk:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(body_chunk), body_chunk))
+
+    do_GET = _handle_request
+    do_POST = _handle_request
+    do_PUT = _handle_request
+    do_PATCH = _handle_request
+    do_DELETE = _handle_request
+    do_HEAD = _handle_request
+
+
+class LocalStandInServer:
+    # A local HTTP(S) server standing in for the Lacework API in tests which must not
+    # depend on a real tenant. Routes map a method and path to a function returning a
+    # StandInResponse. Configure an API helper with "api_base_url" set to base_url()
+    # to send its requests here.
+    def __init__(self, ssl_context=None, host="127.0.0.1"):
+        self._route_map = {}
+        self._request_log = []
+        self._lock = threading.Lock()
+        self._http_server = ThreadingHTTPServer((host, 0), _StandInRequestHandler)
+        self._http_server.daemon_threads = True
+        self._http_server.stand_in_server = self
+        self._ssl_context = ssl_context
+        if ssl_context != None:
+            self._http_server.socket = ssl_context.wrap_socket(
+                self._http_server.socket, server_side=True
+            )
+        self._thread = None
+
+    def base_url(self):
+        host, port = self._http_server.server_address[:2]
+        return "{}://{}:{}".format("https" if self._ssl_context else "http", host, port)
+
+    def port(self):
+        return self._http_server.server_address[1]
+
+    def request_log(self):
+        with self._lock:
+            return list(self._request_log)
+
+    def add_route(self, http_method, path, response_function):
+        # A path ending with "/*" routes every request one path segment below it, e.g.
+        # "/api/v2/AlertChannels/*" routes "/api/v2/AlertChannels/<guid>".
+        self._route_map[(http_method, path)] = response_function
+
+    def add_json_route(self, http_method, path, json_data, status_code=200, content_encoding=None):
+        self.add_route(
+            http_method,
+            path,
+            lambda stand_in_request: StandInResponse(
+                status_code=status_code, json_data=json_data, content_encoding=content_encoding
+            ),
+        )
+
+    def add_access_token_route(self, expiry_time_seconds=3600, delay_seconds=0.0):
+        # Issues a new bearer token for every access/tokens request, as the API does,
+        # after delay_seconds. The token names the key it was issued to, see
+        # bearer_token_api_access_key_id().
+        def issue_access_token(stand_in_request):
+            time.sleep(delay_seconds)
+            expires_at_date_time = datetime.now(timezone.utc) + timedelta(
+                seconds=expiry_time_seconds
+            )
+            return StandInResponse(
+                status_code=201,
+                json_data={
+                    "expiresAt": expires_at_date_time.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "token": "{}:{}".format(
+                        (stand_in_request.json() or {}).get("keyId"), uuid.uuid4().hex
+                    ),
+                },
+            )
+
+        self.add_route("POST", "/api/v2/access/tokens", issue_access_token)
+
+    def handle_request(self, stand_in_request):
+        with self._lock:
+            self._request_log.append(stand_in_request)
+        response_function = self._route_map.get(
+            (stand_in_request.http_method, stand_in_request.path)
+        )
+        if response_function == None:
+            # A route path ending with "/*" matches every path one segment below it.
+            response_function = self._route_map.get(
+                (stand_in_request.http_method, stand_in_request.path.rsplit("/", 1)[0] + "/*")
+            )
+        if response_function == None:
+            return StandInResponse(status_code=404, json_data={"message": "Not Found"})
+        return response_function(stand_in_request)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._http_server.serve_forever, name="stand-in-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._http_server.shutdown()
+        self._http_server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+def bearer_token_api_access_key_id(stand_in_request):
+    # The key the bearer token of a request was issued to by add_access_token_route().
+    authorization = stand_in_request.headers.get("Authorization") or ""
+    return authorization.replace("Bearer ", "").rsplit(":", 1)[0]
+
+
+def start_stand_in_server(ssl_context=None, access_token_expiry_time_seconds=3600):
+    # Starts a stand-in server issuing bearer tokens. The tests add their own routes.
+    stand_in_server = LocalStandInServer(ssl_context=ssl_context).start()
+    stand_in_server.add_access_token_route(access_token_expiry_time_seconds)
+    return stand_in_server
+
+
+def stand_in_api_config_parameters(api_base_url, **api_config_map):
+    # The configuration of an API helper sending its requests to api_base_url, a
+    # stand-in server or a proxy in front of one. api_config_map adds to or overrides
+    # the stand-in credentials.
+    return ApiConfigParameters(
+        **dict(
+            {
+                ApiConfigParameters.API_ACCESS_KEY_ID: STAND_IN_API_ACCESS_KEY_ID,
+                ApiConfigParameters.API_ACCESS_KEY_EXPIRY_TIME_SECONDS: 3600,
+                ApiConfigParameters.CUSTOMER_ACCOUNT_NAME: STAND_IN_CUSTOMER_ACCOUNT_NAME,
+                ApiConfigParameters.SECRET_KEY: STAND_IN_SECRET_KEY,
+                ApiConfigParameters.API_BASE_URL: api_base_url,
+            },
+            **api_config_map
+        )
+    )
+
+
+def stand_in_api_helper_util(api_base_url, **api_config_map):
+    return ApiHelperUtil(stand_in_api_config_parameters(api_base_url, **api_config_map))
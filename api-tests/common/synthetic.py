@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+import argparse
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+import json
+import random
+
+from common.standin import StandInResponse
+
+MODULE_NAME = "synthetic"
+
+DEFAULT_CHUNK_SIZE_BYTES = 64 * 1024
+
+_BASE_DATE_TIME = datetime(2022, 1, 1, tzinfo=timezone.utc)
+_OWNERS = ["Lacework", "lacework-labs", "security-team"]
+_DATASOURCES = [
+    ("LW_HA_DNS_REQUESTS", ["HOSTNAME", "HOST_IP_ADDR", "MID"]),
+    ("CloudTrailRawEvents", ["INSERT_ID", "INSERT_TIME", "EVENT_TIME", "EVENT"]),
+    ("LW_HE_PROCESSES", ["RECORD_CREATED_TIME", "MID", "PID", "EXE_PATH", "USERNAME"]),
+    ("LW_CFG_AWS_S3", ["ACCOUNT_ID", "ARN", "RESOURCE_CONFIG", "RESOURCE_REGION"]),
+]
+_RESULT_SCHEMA_TYPES = ["String", "Number", "Timestamp", "JSON"]
+_WORDS = [
+    "Alpha", "Bravo", "Cloud", "Delta", "Edge", "Falcon", "Gateway", "Harbor",
+    "Index", "Jetty", "Kernel", "Lambda", "Matrix", "Nexus", "Orbit", "Pulse",
+]
+
+
+class SyntheticPayload:
+    # The Queries list: {"data": [<query>, ...]} with record_count queries.
+    QUERIES = "queries"
+    # A Queries/<queryId> detail: {"data": <query>} whose result schema has
+    # record_count columns.
+    QUERY_DETAILS = "query_details"
+    # UserProfile: {"data": [<organization>]} whose organization has record_count
+    # accounts.
+    USER_PROFILE = "user_profile"
+    # An access/tokens response. record_count is ignored.
+    ACCESS_TOKEN = "access_token"
+
+
+class SyntheticPayloadGenerator:
+    # Generates schema-faithful JSON payloads of any size for the response shapes the
+    # suite validates. The same seed always generates the same bytes.
+    #
+    # Payloads are generated record by record and streamed in chunks of about
+    # chunk_size_bytes, so generating a gigabyte payload, to a file or through a
+    # stand-in server, holds only one chunk in memory.
+    def __init__(self, seed=0, chunk_size_bytes=DEFAULT_CHUNK_SIZE_BYTES):
+        self._seed = seed
+        self._chunk_size_bytes = chunk_size_bytes
+
+    def _random(self, payload_name):
+        return random.Random("{}:{}".format(self._seed, payload_name))
+
+    def _date_time_str(self, rng):
+        date_time = _BASE_DATE_TIME + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        return date_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    def _guid(self, rng, prefix):
+        return "{}_{:032X}".format(prefix, rng.getrandbits(128))
+
+    def _query_record(self, rng, record_index, result_column_count=None, evaluator_id=False):
+        datasource_name, column_names = rng.choice(_DATASOURCES)
+        if result_column_count != None:
+            column_names = [
+                "{}_{}".format(column_names[column_index % len(column_names)], column_index)
+                for column_index in range(result_column_count)
+            ]
+        query_id = "LW_Synthetic_{}_{}".format(rng.choice(_WORDS), record_index)
+        query_map = {}
+        if evaluator_id:
+            query_map["evaluatorId"] = "Cloudtrail"
+        query_map.update(
+            {
+                "queryId": query_id,
+                "queryText": "{} {{\n    source {{\n        {}\n    }}\n    return distinct {{\n        {}\n    }}\n}}".format(
+                    query_id, datasource_name, ",\n        ".join(column_names)
+                ),
+                "owner": rng.choice(_OWNERS),
+                "lastUpdateTime": self._date_time_str(rng),
+                "lastUpdateUser": "{}.{}@lacework.net".format(
+                    rng.choice(_WORDS).lower(), rng.choice(_WORDS).lower()
+                ),
+                "resultSchema": [
+                    {"name": column_name, "type": rng.choice(_RESULT_SCHEMA_TYPES)}
+                    for column_name in column_names
+                ],
+            }
+        )
+        return query_map
+
+    def _account_record(self, rng, record_index):
+        return {
+            "admin": rng.random() < 0.2,
+            "accountName": "SYNTHETIC-{}-{}".format(rng.choice(_WORDS).upper(), record_index),
+            "custGuid": self._guid(rng, "SYNTHETIC"),
+            "userGuid": self._guid(rng, "SYNTHETIC"),
+            "userEnabled": int(rng.random() < 0.9),
+        }
+
+    def _json_fragments(self, payload_name, record_count):
+        # Yields the payload as JSON text fragments, one per record.
+        rng = self._random(payload_name)
+        if payload_name == SyntheticPayload.QUERIES:
+            yield '{"data": ['
+            for record_index in range(record_count):
+                yield (", " if record_index else "") + json.dumps(
+                    self._query_record(rng, record_index)
+                )
+            yield "]}"
+        elif payload_name == SyntheticPayload.QUERY_DETAILS:
+            yield json.dumps(
+                {
+                    "data": self._query_record(
+                        rng, 0, result_column_count=record_count, evaluator_id=True
+                    )
+                }
+            )
+        elif payload_name == SyntheticPayload.USER_PROFILE:
+            organization_map = {
+                "username": "synthetic@lacework.net",
+                "orgAccount": True,
+                "url": "synthetic.lacework.net",
+                "orgAdmin": True,
+                "orgUser": False,
+            }
+            yield '{"data": [' + json.dumps(organization_map)[:-1] + ', "accounts": ['
+            for record_index in range(record_count):
+                yield (", " if record_index else "") + json.dumps(
+                    self._account_record(rng, record_index)
+                )
+            yield "]}]}"
+        elif payload_name == SyntheticPayload.ACCESS_TOKEN:
+            yield json.dumps(
+                {
+                    "expiresAt": self._date_time_str(rng),
+                    "token": "_{:064x}".format(rng.getrandbits(256)),
+                }
+            )
+        else:
+            raise ValueError("Unknown synthetic payload: {}".format(payload_name))
+
+    def iter_chunks(self, payload_name, record_count):
+        # Yields the UTF-8 encoded payload in chunks of about chunk_size_bytes.
+        fragment_list = []
+        fragment_size_bytes = 0
+        for json_fragment in self._json_fragments(payload_name, record_count):
+            fragment_list.append(json_fragment)
+            fragment_size_bytes += len(json_fragment)
+            if fragment_size_bytes >= self._chunk_size_bytes:
+                yield "".join(fragment_list).encode()
+                fragment_list = []
+                fragment_size_bytes = 0
+        if fragment_list:
+            yield "".join(fragment_list).encode()
+
+    def payload_map(self, payload_name, record_count):
+        # The whole payload in memory, for small payloads.
+        return json.loads(b"".join(self.iter_chunks(payload_name, record_count)))
+
+    def write(self, file_uri, payload_name, record_count):
+        # Streams the payload to file_uri and returns the number of bytes written.
+        byte_count = 0
+        with open(file_uri, "wb") as payload_file:
+            for payload_chunk in self.iter_chunks(payload_name, record_count):
+                payload_file.write(payload_chunk)
+                byte_count += len(payload_chunk)
+        return byte_count
+
+    def stand_in_response_function(self, payload_name, record_count, content_encoding=None):
+        # A stand-in server route function streaming a freshly generated payload with
+        # chunked transfer encoding on every request.
+        return lambda stand_in_request: StandInResponse(
+            body_chunks=self.iter_chunks(payload_name, record_count),
+            headers={"Content-Type": "application/json"},
+            content_encoding=content_encoding,
+        )
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(
+        description="Write a synthetic API response payload to a file."
+    )
+    argument_parser.add_argument(
+        "payload",
+        choices=[
+            SyntheticPayload.QUERIES,
+            SyntheticPayload.QUERY_DETAILS,
+            SyntheticPayload.USER_PROFILE,
+            SyntheticPayload.ACCESS_TOKEN,
+        ],
+    )
+    argument_parser.add_argument("record_count", type=int)
+    argument_parser.add_argument("output_file")
+    argument_parser.add_argument("--seed", type=int, default=0)
+    arguments = argument_parser.parse_args()
+    byte_count = SyntheticPayloadGenerator(seed=arguments.seed).write(
+        arguments.output_file, arguments.payload, arguments.record_count
+    )
+    print("{} bytes written to {}".format(byte_count, arguments.output_file))
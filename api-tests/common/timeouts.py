@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+import contextlib
+import contextvars
+import socket
+import time
+
+import requests
+import urllib3
+
+MODULE_NAME = "timeouts"
+
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 10.0
+DEFAULT_READ_TIMEOUT_SECONDS = 120.0
+# The test attribute holding a test's own deadline, set by the deadline decorator.
+DEADLINE_ATTRIBUTE = "deadline_seconds"
+
+# The deadline of the test running in this thread, as a time.monotonic() time.
+_deadline_time = contextvars.ContextVar("deadline_time", default=None)
+
+
+class TimeoutKind:
+    CONNECT = "connect"
+    READ = "read"
+    DEADLINE = "deadline"
+
+
+class DeadlineExceededError(Exception):
+    # Raised by a helper call made once the running test's deadline has passed, or
+    # cut short by it.
+    pass
+
+
+class RequestTimeouts:
+    # The connect and read timeouts of the helper's requests, per endpoint family. The
+    # "default" entry applies to every family without its own:
+    #
+    #   {"default": {"connect_seconds": 5, "read_seconds": 60},
+    #    "Queries": {"read_seconds": 300}}
+    #
+    # The read timeout bounds every wait for data from the server, not the whole
+    # response.
+    CONNECT_SECONDS = "connect_seconds"
+    READ_SECONDS = "read_seconds"
+    DEFAULT = "default"
+
+    def __init__(
+        self,
+        connect_seconds=DEFAULT_CONNECT_TIMEOUT_SECONDS,
+        read_seconds=DEFAULT_READ_TIMEOUT_SECONDS,
+        endpoint_timeouts_map=None,
+    ):
+        self._connect_seconds = connect_seconds
+        self._read_seconds = read_seconds
+        self._endpoint_timeouts_map = endpoint_timeouts_map or {}
+
+    @staticmethod
+    def from_map(request_timeouts_map):
+        request_timeouts_map = dict(request_timeouts_map or {})
+        default_timeouts_map = request_timeouts_map.pop(RequestTimeouts.DEFAULT, None) or {}
+        return RequestTimeouts(
+            connect_seconds=default_timeouts_map.get(
+                RequestTimeouts.CONNECT_SECONDS, DEFAULT_CONNECT_TIMEOUT_SECONDS
+            ),
+            read_seconds=default_timeouts_map.get(
+                RequestTimeouts.READ_SECONDS, DEFAULT_READ_TIMEOUT_SECONDS
+            ),
+            endpoint_timeouts_map=request_timeouts_map,
+        )
+
+    def timeout(self, endpoint_name):
+        # The (connect, read) timeout of a request to the endpoint family.
+        endpoint_timeouts_map = self._endpoint_timeouts_map.get(endpoint_name) or {}
+        return (
+            endpoint_timeouts_map.get(RequestTimeouts.CONNECT_SECONDS, self._connect_seconds),
+            endpoint_timeouts_map.get(RequestTimeouts.READ_SECONDS, self._read_seconds),
+        )
+
+
+def deadline(deadline_seconds):
+    # Gives a test its own deadline, e.g. for a test known to run long, in place of the
+    # run's test deadline.
+    def decorator(test_function):
+        setattr(test_function, DEADLINE_ATTRIBUTE, deadline_seconds)
+        return test_function
+
+    return decorator
+
+
+def deadline_seconds_of(test, default_deadline_seconds=None):
+    # The deadline of a test: its own, or the default.
+    test_method = getattr(test, getattr(test, "_testMethodName", ""), None)
+    return getattr(test_method, DEADLINE_ATTRIBUTE, default_deadline_seconds)
+
+
+def enter_deadline(deadline_seconds):
+    # Starts a deadline for the helper calls of this thread, and of the work it hands
+    # to other threads with propagate_deadline(). A deadline inside another keeps the
+    # earlier of the two. Returns the token to pass to exit_deadline().
+    deadline_time = _deadline_time.get()
+    if deadline_seconds != None:
+        new_deadline_time = time.monotonic() + deadline_seconds
+        if deadline_time == None or new_deadline_time < deadline_time:
+            deadline_time = new_deadline_time
+    return _deadline_time.set(deadline_time)
+
+
+def exit_deadline(token):
+    _deadline_time.reset(token)
+
+
+@contextlib.contextmanager
+def deadline_scope(deadline_seconds):
+    token = enter_deadline(deadline_seconds)
+    try:
+        yield None
+    finally:
+        exit_deadline(token)
+
+
+@contextlib.contextmanager
+def without_deadline():
+    # Lifts the deadline, e.g. so the resources of a test which ran out of time are
+    # still deleted. The requests keep their own timeouts.
+    token = _deadline_time.set(None)
+    try:
+        yield None
+    finally:
+        _deadline_time.reset(token)
+
+
+def remaining_deadline_seconds():
+    # The time left before the deadline of this thread, or None without a deadline.
+    deadline_time = _deadline_time.get()
+    if deadline_time == None:
+        return None
+    return deadline_time - time.monotonic()
+
+
+def propagate_deadline(function):
+    # Wraps function to run under the caller's deadline in whichever thread calls it,
+    # e.g. a thread pool's.
+    deadline_time = _deadline_time.get()
+
+    def deadline_function(*args, **kwargs):
+        token = _deadline_time.set(deadline_time)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _deadline_time.reset(token)
+
+    return deadline_function
+
+
+def check_deadline(action_description):
+    remaining_seconds = remaining_deadline_seconds()
+    if remaining_seconds != None and remaining_seconds <= 0:
+        raise DeadlineExceededError(
+            "The test deadline passed {:.3f}s before {}.".format(
+                -remaining_seconds, action_description
+            )
+        )
+
+
+def bounded_request_timeout(connect_seconds, read_seconds):
+    # The (connect, read) timeout of a request, cut to the time left before the
+    # deadline.
+    remaining_seconds = remaining_deadline_seconds()
+    if remaining_seconds == None:
+        return (connect_seconds, read_seconds)
+    return (min(connect_seconds, remaining_seconds), min(read_seconds, remaining_seconds))
+
+
+def request_timeout_kind(error):
+    # The kind of timeout a requests error is, or None.
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return TimeoutKind.CONNECT
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return TimeoutKind.READ
+    # A timeout while the body is read is raised as a connection error.
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        if isinstance(error.args[0], urllib3.exceptions.ReadTimeoutError):
+            return TimeoutKind.READ
+    return None
+
+
+def timeout_kind(error):
+    # The kind of timeout which caused error, following its causes, or None.
+    visited_error_id_set = set()
+    while error != None and id(error) not in visited_error_id_set:
+        visited_error_id_set.add(id(error))
+        if isinstance(error, DeadlineExceededError):
+            return TimeoutKind.DEADLINE
+        error_timeout_kind = request_timeout_kind(error)
+        if error_timeout_kind != None:
+            return error_timeout_kind
+        if isinstance(error, urllib3.exceptions.ConnectTimeoutError):
+            return TimeoutKind.CONNECT
+        if isinstance(error, (urllib3.exceptions.ReadTimeoutError, socket.timeout)):
+            return TimeoutKind.READ
+        error = error.__cause__ or error.__context__
+    return None
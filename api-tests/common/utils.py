@@ -1,9 +1,45 @@
 #!/usr/bin/python3
+import copy
 from datetime import datetime
+import hashlib
 import json
 import logging
 import os
+import re
 import requests
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+from urllib3.util.request import ACCEPT_ENCODING
+
+from common.concurrency import AdaptiveConcurrencyLimiter
+from common.concurrency import ConcurrencyLimitTimeoutError
+from common.keypool import ApiKey
+from common.keypool import ApiKeyPool
+from common.keypool import THROTTLED_HTTP_STATUS_CODE
+from common.keypool import UNAUTHORIZED_HTTP_STATUS_CODE
+from common.keypool import retry_after_seconds
+from common.network import DnsCachingHTTPAdapter
+from common.network import SessionResumingHTTPAdapter
+from common.network import install_dns_cache
+from common.network import installed_dns_cache
+from common.network import prewarm_connections
+from common.timeouts import DeadlineExceededError
+from common.timeouts import RequestTimeouts
+from common.timeouts import TimeoutKind
+from common.timeouts import bounded_request_timeout
+from common.timeouts import check_deadline
+from common.timeouts import remaining_deadline_seconds
+from common.timeouts import request_timeout_kind
+from common.timeouts import timeout_kind
+
+try:
+    import fcntl
+except ImportError:
+    # Cross process locking is unavailable, e.g. on Windows. Token refreshes are
+    # then single-flight within a process only.
+    fcntl = None
 
 logging.basicConfig(level=logging.INFO)
 _test_logger = logging.getLogger()
@@ -61,6 +97,23 @@ class ApiConfigParameters:
     API_ACCESS_KEY_EXPIRY_TIME_SECONDS = "api_access_key_expiry_time_seconds"
     CUSTOMER_ACCOUNT_NAME = "customer_account_name"
     SECRET_KEY = "secret_key"
+    RATE_LIMIT_REQUESTS_PER_SECOND = "rate_limit_requests_per_second"
+    ACCESS_TOKEN_REFRESH_MARGIN_SECONDS = "access_token_refresh_margin_seconds"
+    COALESCE_GET_REQUESTS = "coalesce_get_requests"
+    LATENCY_BUDGETS = "latency_budgets"
+    ADAPTIVE_CONCURRENCY = "adaptive_concurrency"
+    API_BASE_URL = "api_base_url"
+    PREWARM_CONNECTION_COUNT = "prewarm_connection_count"
+    DNS_CACHE_TTL_SECONDS = "dns_cache_ttl_seconds"
+    TLS_SESSION_RESUMPTION = "tls_session_resumption"
+    LQL_VALIDATION_MODE = "lql_validation_mode"
+    RESPONSE_SNAPSHOT_FILE = "response_snapshot_file"
+    API_KEYS = "api_keys"
+    API_KEY_QUARANTINE_SECONDS = "api_key_quarantine_seconds"
+    ACCESS_TOKEN_BENCHMARK = "access_token_benchmark"
+    QUERY_EXPORT = "query_export"
+    REQUEST_TIMEOUTS = "request_timeouts"
+    TEST_DEADLINE_SECONDS = "test_deadline_seconds"
 
     def __init__(
         self,
@@ -68,11 +121,45 @@ class ApiConfigParameters:
         api_access_key_expiry_time_seconds=None,
         customer_account_name=None,
         secret_key=None,
+        rate_limit_requests_per_second=None,
+        access_token_refresh_margin_seconds=None,
+        coalesce_get_requests=True,
+        latency_budgets=None,
+        adaptive_concurrency=None,
+        api_base_url=None,
+        prewarm_connection_count=None,
+        dns_cache_ttl_seconds=None,
+        tls_session_resumption=True,
+        lql_validation_mode=None,
+        response_snapshot_file=None,
+        api_keys=None,
+        api_key_quarantine_seconds=None,
+        access_token_benchmark=None,
+        query_export=None,
+        request_timeouts=None,
+        test_deadline_seconds=None,
     ):
         self.api_access_key_id = api_access_key_id
         self.api_access_key_expiry_time_seconds = api_access_key_expiry_time_seconds
         self.customer_account_name = customer_account_name
         self.secret_key = secret_key
+        self.rate_limit_requests_per_second = rate_limit_requests_per_second
+        self.access_token_refresh_margin_seconds = access_token_refresh_margin_seconds
+        self.coalesce_get_requests = coalesce_get_requests
+        self.latency_budgets = latency_budgets
+        self.adaptive_concurrency = adaptive_concurrency
+        self.api_base_url = api_base_url
+        self.prewarm_connection_count = prewarm_connection_count
+        self.dns_cache_ttl_seconds = dns_cache_ttl_seconds
+        self.tls_session_resumption = tls_session_resumption
+        self.lql_validation_mode = lql_validation_mode
+        self.response_snapshot_file = response_snapshot_file
+        self.api_keys = api_keys
+        self.api_key_quarantine_seconds = api_key_quarantine_seconds
+        self.access_token_benchmark = access_token_benchmark
+        self.query_export = query_export
+        self.request_timeouts = request_timeouts
+        self.test_deadline_seconds = test_deadline_seconds
 
     def as_map(self):
         return {
@@ -80,6 +167,23 @@ class ApiConfigParameters:
             ApiConfigParameters.API_ACCESS_KEY_EXPIRY_TIME_SECONDS: self.api_access_key_expiry_time_seconds,
             ApiConfigParameters.CUSTOMER_ACCOUNT_NAME: self.customer_account_name,
             ApiConfigParameters.SECRET_KEY: self.secret_key,
+            ApiConfigParameters.RATE_LIMIT_REQUESTS_PER_SECOND: self.rate_limit_requests_per_second,
+            ApiConfigParameters.ACCESS_TOKEN_REFRESH_MARGIN_SECONDS: self.access_token_refresh_margin_seconds,
+            ApiConfigParameters.COALESCE_GET_REQUESTS: self.coalesce_get_requests,
+            ApiConfigParameters.LATENCY_BUDGETS: self.latency_budgets,
+            ApiConfigParameters.ADAPTIVE_CONCURRENCY: self.adaptive_concurrency,
+            ApiConfigParameters.API_BASE_URL: self.api_base_url,
+            ApiConfigParameters.PREWARM_CONNECTION_COUNT: self.prewarm_connection_count,
+            ApiConfigParameters.DNS_CACHE_TTL_SECONDS: self.dns_cache_ttl_seconds,
+            ApiConfigParameters.TLS_SESSION_RESUMPTION: self.tls_session_resumption,
+            ApiConfigParameters.LQL_VALIDATION_MODE: self.lql_validation_mode,
+            ApiConfigParameters.RESPONSE_SNAPSHOT_FILE: self.response_snapshot_file,
+            ApiConfigParameters.API_KEYS: self.api_keys,
+            ApiConfigParameters.API_KEY_QUARANTINE_SECONDS: self.api_key_quarantine_seconds,
+            ApiConfigParameters.ACCESS_TOKEN_BENCHMARK: self.access_token_benchmark,
+            ApiConfigParameters.QUERY_EXPORT: self.query_export,
+            ApiConfigParameters.REQUEST_TIMEOUTS: self.request_timeouts,
+            ApiConfigParameters.TEST_DEADLINE_SECONDS: self.test_deadline_seconds,
         }
 
     @staticmethod
@@ -87,6 +191,323 @@ class ApiConfigParameters:
         return json.dumps(self.as_map(), indent=2)
 
 
+class RequestRateLimiter:
+    # A token bucket limiting the request rate of a single API helper. Each tenant
+    # owns its own helper and hence its own bucket, so one throttled tenant never
+    # slows down another.
+    def __init__(self, requests_per_second, burst_size=None):
+        self._requests_per_second = float(requests_per_second)
+        self._burst_size = float(
+            burst_size if burst_size != None else max(1.0, self._requests_per_second)
+        )
+        self._available_tokens = self._burst_size
+        self._last_refill_time = time.monotonic()
+        self._total_wait_time_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def requests_per_second(self):
+        return self._requests_per_second
+
+    def burst_size(self):
+        return self._burst_size
+
+    def total_wait_time_seconds(self):
+        return self._total_wait_time_seconds
+
+    def _refill(self):
+        current_time = time.monotonic()
+        self._available_tokens = min(
+            self._burst_size,
+            self._available_tokens
+            + (current_time - self._last_refill_time) * self._requests_per_second,
+        )
+        self._last_refill_time = current_time
+
+    def available_tokens(self):
+        with self._lock:
+            self._refill()
+            return self._available_tokens
+
+    def try_acquire(self):
+        # Takes a token without waiting. Returns 0.0 when a token was taken, otherwise
+        # the time until one is available.
+        with self._lock:
+            self._refill()
+            if self._available_tokens >= 1.0:
+                self._available_tokens -= 1.0
+                return 0.0
+            return (1.0 - self._available_tokens) / self._requests_per_second
+
+    def acquire(self, timeout_seconds=None):
+        # Waits for a token, at most timeout_seconds when given. Returns whether a
+        # token was taken.
+        end_time = None
+        if timeout_seconds != None:
+            end_time = time.monotonic() + timeout_seconds
+        while True:
+            wait_time_seconds = self.try_acquire()
+            if wait_time_seconds <= 0.0:
+                return True
+            if end_time != None and time.monotonic() + wait_time_seconds > end_time:
+                return False
+            with self._lock:
+                self._total_wait_time_seconds += wait_time_seconds
+            time.sleep(wait_time_seconds)
+
+
+class BackgroundAccessTokenRefresher:
+    # Renews the bearer access token of an API helper's key, the helper's own key by
+    # default, a margin before it expires, so API requests keep using a valid token
+    # and never wait on its issuance.
+    RETRY_INTERVAL_SECONDS = 5.0
+    MINIMUM_WAIT_TIME_SECONDS = 1.0
+    # A margin as long as the token's lifetime would renew every token as soon as it
+    # was issued, so the margin is cut to this fraction of the lifetime.
+    MAXIMUM_REFRESH_MARGIN_FRACTION = 0.5
+
+    def __init__(self, api_helper_util, refresh_margin_seconds, api_key=None):
+        self._api_helper_util = api_helper_util
+        token_lifetime_seconds = api_helper_util.api_access_key_expiry_time_seconds()
+        maximum_refresh_margin_fraction = (
+            BackgroundAccessTokenRefresher.MAXIMUM_REFRESH_MARGIN_FRACTION
+        )
+        if (
+            token_lifetime_seconds
+            and refresh_margin_seconds > token_lifetime_seconds * maximum_refresh_margin_fraction
+        ):
+            log_message = "The access token refresh margin of {}s is cut to {:.0%} of the ".format(
+                refresh_margin_seconds, maximum_refresh_margin_fraction
+            )
+            log_message += "{}s token lifetime.".format(token_lifetime_seconds)
+            log_warning(MODULE_NAME, log_message)
+            refresh_margin_seconds = token_lifetime_seconds * maximum_refresh_margin_fraction
+        self._refresh_margin_seconds = refresh_margin_seconds
+        self._api_key = api_key
+        self._refresh_count = 0
+        self._refresh_failure_count = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="access-token-refresher", daemon=True
+        )
+
+    def refresh_margin_seconds(self):
+        return self._refresh_margin_seconds
+
+    def refresh_count(self):
+        return self._refresh_count
+
+    def refresh_failure_count(self):
+        return self._refresh_failure_count
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread.is_alive() and self._thread != threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            wait_time_seconds = (
+                self._api_helper_util.bearer_access_token_time_remaining_seconds(self._api_key)
+                - self._refresh_margin_seconds
+            )
+            if wait_time_seconds > 0:
+                self._stop_event.wait(
+                    max(wait_time_seconds, BackgroundAccessTokenRefresher.MINIMUM_WAIT_TIME_SECONDS)
+                )
+                continue
+            try:
+                refreshed = self._api_helper_util.refresh_bearer_access_token(
+                    minimum_time_remaining_seconds=self._refresh_margin_seconds,
+                    api_key=self._api_key,
+                )
+            except Exception as error:
+                log_message = "The background access token refresh failed: {}".format(
+                    error
+                )
+                log_warning(MODULE_NAME, log_message)
+                refreshed = False
+            if refreshed:
+                self._refresh_count += 1
+                # The API may issue tokens shorter lived than requested, which would
+                # be due for renewal again at once.
+                self._stop_event.wait(BackgroundAccessTokenRefresher.MINIMUM_WAIT_TIME_SECONDS)
+            else:
+                # Keep using the current token and try again shortly.
+                self._refresh_failure_count += 1
+                self._stop_event.wait(BackgroundAccessTokenRefresher.RETRY_INTERVAL_SECONDS)
+
+
+class WireStatistics:
+    # Bytes moved per API endpoint family. Response bytes are counted both as received
+    # on the wire (compressed) and after decoding.
+    def __init__(self):
+        self._endpoint_statistics_map = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint_name, http_response, transfer_time_seconds):
+        compressed_response_bytes = len(http_response.content)
+        if http_response.raw != None and hasattr(http_response.raw, "tell"):
+            compressed_response_bytes = http_response.raw.tell()
+        request_body = http_response.request.body or b""
+        content_encoding = http_response.headers.get("Content-Encoding") or "identity"
+        with self._lock:
+            endpoint_statistics_map = self._endpoint_statistics_map.setdefault(
+                endpoint_name,
+                {
+                    "response_count": 0,
+                    "request_bytes": 0,
+                    "compressed_response_bytes": 0,
+                    "uncompressed_response_bytes": 0,
+                    "transfer_time_seconds": 0.0,
+                    "content_encodings": {},
+                },
+            )
+            endpoint_statistics_map["response_count"] += 1
+            endpoint_statistics_map["request_bytes"] += len(request_body)
+            endpoint_statistics_map["compressed_response_bytes"] += compressed_response_bytes
+            endpoint_statistics_map["uncompressed_response_bytes"] += len(
+                http_response.content
+            )
+            endpoint_statistics_map["transfer_time_seconds"] += transfer_time_seconds
+            content_encoding_count_map = endpoint_statistics_map["content_encodings"]
+            content_encoding_count_map[content_encoding] = (
+                content_encoding_count_map.get(content_encoding, 0) + 1
+            )
+
+    def endpoint_statistics(self, endpoint_name):
+        with self._lock:
+            return dict(self._endpoint_statistics_map.get(endpoint_name) or {})
+
+    def statistics(self):
+        statistics_map = {}
+        with self._lock:
+            for endpoint_name, endpoint_statistics_map in self._endpoint_statistics_map.items():
+                endpoint_statistics_map = dict(endpoint_statistics_map)
+                compression_ratio = 1.0
+                if endpoint_statistics_map["compressed_response_bytes"] > 0:
+                    compression_ratio = (
+                        endpoint_statistics_map["uncompressed_response_bytes"]
+                        / endpoint_statistics_map["compressed_response_bytes"]
+                    )
+                endpoint_statistics_map["compression_ratio"] = round(compression_ratio, 2)
+                endpoint_statistics_map["transfer_time_seconds"] = round(
+                    endpoint_statistics_map["transfer_time_seconds"], 3
+                )
+                endpoint_statistics_map["content_encodings"] = dict(
+                    endpoint_statistics_map["content_encodings"]
+                )
+                statistics_map[endpoint_name] = endpoint_statistics_map
+        return statistics_map
+
+
+class SingleFlightTimeoutError(Exception):
+    # Raised to a caller which waited longer than its wait timeout for the in-flight
+    # call it joined.
+    pass
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done_event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlightGroup:
+    # Coalesces identical in-flight calls: while a call for a key is running, callers
+    # with the same key wait for it and share its result instead of repeating it.
+    # With a copy_function, every waiting caller gets its own copy of the result.
+    def __init__(self):
+        self._in_flight_call_map = {}
+        self._executed_call_count = 0
+        self._coalesced_call_count = 0
+        self._lock = threading.Lock()
+
+    def do(self, call_key, call_function, copy_function=None, wait_timeout_seconds=None):
+        # A caller joining an in-flight call waits for it at most wait_timeout_seconds
+        # when given. A call which ran out of its caller's test deadline is made again
+        # by each joined caller, under the caller's own deadline, rather than failing
+        # callers whose deadline has not passed.
+        wait_end_time = None
+        if wait_timeout_seconds != None:
+            wait_end_time = time.monotonic() + wait_timeout_seconds
+        while True:
+            with self._lock:
+                in_flight_call = self._in_flight_call_map.get(call_key)
+                leading_call = in_flight_call == None
+                if leading_call:
+                    in_flight_call = _InFlightCall()
+                    self._in_flight_call_map[call_key] = in_flight_call
+                    self._executed_call_count += 1
+                else:
+                    self._coalesced_call_count += 1
+            if leading_call:
+                break
+
+            wait_seconds = None
+            if wait_end_time != None:
+                wait_seconds = max(0.0, wait_end_time - time.monotonic())
+            if not in_flight_call.done_event.wait(wait_seconds):
+                raise SingleFlightTimeoutError(
+                    "The in-flight call joined did not complete within {:.3f}s.".format(
+                        wait_timeout_seconds
+                    )
+                )
+            if in_flight_call.error != None:
+                if timeout_kind(in_flight_call.error) == TimeoutKind.DEADLINE:
+                    continue
+                raise in_flight_call.error
+            if copy_function != None:
+                return copy_function(in_flight_call.result)
+            return in_flight_call.result
+
+        try:
+            in_flight_call.result = call_function()
+        except Exception as error:
+            in_flight_call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight_call_map[call_key]
+            in_flight_call.done_event.set()
+        return in_flight_call.result
+
+    def statistics(self):
+        total_call_count = self._executed_call_count + self._coalesced_call_count
+        coalesced_call_ratio = 0.0
+        if total_call_count > 0:
+            coalesced_call_ratio = self._coalesced_call_count / total_call_count
+        return {
+            "executed_call_count": self._executed_call_count,
+            "coalesced_call_count": self._coalesced_call_count,
+            "coalesced_call_ratio": round(coalesced_call_ratio, 3),
+        }
+
+
+class InterProcessFileLock:
+    # An exclusive lock on a lock file, held across the worker processes of a run,
+    # e.g. to serialise bearer access token issuance for a shared API access key.
+    def __init__(self, lock_file_uri):
+        self._lock_file_uri = lock_file_uri
+        self._lock_file = None
+
+    def __enter__(self):
+        if fcntl != None:
+            self._lock_file = open(self._lock_file_uri, "a")
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._lock_file != None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        return False
+
+
 class ApiHelperUtil:
     API_ACCESS_KEY_ID = "api_access_key_id"
     API_ACCESS_KEY_EXPIRY_TIME_SECONDS = "api_access_key_expiry_time_seconds"
@@ -100,9 +521,78 @@ class ApiHelperUtil:
         )
         self._customer_account_name = api_config_parameters.customer_account_name
         self._secret_key = api_config_parameters.secret_key
-        self._access_token = None
-        self._access_token_creation_time = None
-        self._access_token_expiry_time_seconds = None
+        self._api_base_url = api_config_parameters.api_base_url
+        # The helper's own key holds its bearer token. With "api_keys" configured the
+        # requests are spread over a pool of keys, each with its own token and budget,
+        # and the rate limit applies to each key rather than to the helper.
+        self._api_key_pool = None
+        self._rate_limiter = None
+        if api_config_parameters.api_keys:
+            self._api_key_pool = _api_key_pool(api_config_parameters)
+            self._api_key = self._api_key_pool.api_keys()[0]
+            self._api_access_key_id = self._api_key.api_access_key_id
+            self._secret_key = self._api_key.secret_key
+        else:
+            self._api_key = ApiKey(self._api_access_key_id, self._secret_key)
+            if api_config_parameters.rate_limit_requests_per_second:
+                self._rate_limiter = RequestRateLimiter(
+                    api_config_parameters.rate_limit_requests_per_second
+                )
+        self._access_token_issue_count = 0
+        self._throttled_retry_count = 0
+        self._access_token_refresh_margin_seconds = (
+            api_config_parameters.access_token_refresh_margin_seconds
+        )
+        # Every request made through the helper is bounded by one adaptive concurrency
+        # limit, whichever parallel path it comes from.
+        self._concurrency_limiter = AdaptiveConcurrencyLimiter.from_map(
+            api_config_parameters.adaptive_concurrency
+        )
+        # Every helper owns its own session, and hence its own connection pool. The
+        # pool holds a connection for every request the limiter may allow in flight.
+        self._http_session = requests.Session()
+        http_adapter_class = DnsCachingHTTPAdapter
+        if api_config_parameters.tls_session_resumption:
+            http_adapter_class = SessionResumingHTTPAdapter
+        http_adapter = http_adapter_class(
+            pool_maxsize=self._concurrency_limiter.maximum_limit()
+        )
+        self._http_session.mount("https://", http_adapter)
+        self._http_session.mount("http://", http_adapter)
+        # Advertise every content encoding urllib3 can decode here: gzip and deflate,
+        # plus br and zstd when their packages are installed. Bodies are decoded chunk
+        # by chunk as they are read.
+        self._http_session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        self._wire_statistics = WireStatistics()
+        self._request_count = 0
+        self._request_count_lock = threading.Lock()
+        self._response_listener_list = []
+        self._latency_budget_map = api_config_parameters.latency_budgets or {}
+        self._lql_validation_mode = api_config_parameters.lql_validation_mode
+        self._response_snapshot_file = api_config_parameters.response_snapshot_file
+        self._access_token_benchmark_map = api_config_parameters.access_token_benchmark
+        self._query_export_map = api_config_parameters.query_export
+        # Every request is bounded by the connect and read timeouts of its endpoint
+        # family, and by the deadline of the test making it.
+        self._request_timeouts = RequestTimeouts.from_map(api_config_parameters.request_timeouts)
+        self._test_deadline_seconds = api_config_parameters.test_deadline_seconds
+        self._timeout_count_map = {}
+        self._get_request_single_flight_group = None
+        if api_config_parameters.coalesce_get_requests:
+            self._get_request_single_flight_group = SingleFlightGroup()
+        if api_config_parameters.dns_cache_ttl_seconds:
+            install_dns_cache(api_config_parameters.dns_cache_ttl_seconds)
+        # Connections are pre-warmed in the background while the first test starts.
+        self._prewarm_connection_count = 0
+        self._prewarm_thread = None
+        if api_config_parameters.prewarm_connection_count:
+            self._prewarm_thread = threading.Thread(
+                target=self.prewarm_connections,
+                args=(api_config_parameters.prewarm_connection_count,),
+                name="prewarm-connections",
+                daemon=True,
+            )
+            self._prewarm_thread.start()
 
     def api_access_key_id(self):
         return self._api_access_key_id
@@ -117,40 +607,117 @@ class ApiHelperUtil:
         return self._secret_key
 
     def access_token(self):
-        return self._access_token
+        return self._api_key.access_token_state[0]
+
+    def http_session(self):
+        return self._http_session
+
+    def concurrency_limiter(self):
+        return self._concurrency_limiter
+
+    def api_key_pool(self):
+        # The pool of API keys, or None when the helper uses a single key.
+        return self._api_key_pool
+
+    def max_request_concurrency(self):
+        # The number of worker threads a parallel path needs to reach the highest
+        # concurrency limit.
+        return self._concurrency_limiter.maximum_limit()
+
+    def latency_budget_map(self, endpoint_name):
+        return self._latency_budget_map.get(endpoint_name)
+
+    def wire_statistics(self):
+        return self._wire_statistics
+
+    def lql_validation_mode(self):
+        return self._lql_validation_mode
+
+    def response_snapshot_file(self):
+        return self._response_snapshot_file
+
+    def access_token_benchmark_map(self):
+        return self._access_token_benchmark_map
+
+    def query_export_map(self):
+        return self._query_export_map
+
+    def request_timeouts(self):
+        return self._request_timeouts
+
+    def test_deadline_seconds(self):
+        # The deadline of every test run with this helper, or None.
+        return self._test_deadline_seconds
+
+    def timeout_count_map(self):
+        # The requests which timed out, by endpoint family and timeout kind.
+        with self._request_count_lock:
+            return {
+                endpoint_name: dict(kind_count_map)
+                for endpoint_name, kind_count_map in self._timeout_count_map.items()
+            }
+
+    def prewarm_connections(self, connection_count):
+        # Opens connection_count pooled connections to the API host ahead of the
+        # requests which will use them, at most as many as the concurrency limit lets
+        # the requests use. The requests opening them are held to the helper's rate and
+        # concurrency limits like any other.
+        api_base_url = self.get_api_endpoint("")
+        prewarm_connection_count = prewarm_connections(
+            lambda: self._send_request("HEAD", api_base_url, allow_redirects=False),
+            min(connection_count, self._concurrency_limiter.current_limit()),
+        )
+        self._prewarm_connection_count += prewarm_connection_count
+        return prewarm_connection_count
+
+    def wait_for_prewarmed_connections(self, timeout_seconds=None):
+        if self._prewarm_thread != None:
+            self._prewarm_thread.join(timeout_seconds)
+        return self._prewarm_connection_count
 
     def get_api_endpoint(self, api_requst):
         endpoint_url = None
-        if isinstance(api_requst, str) and isinstance(self._customer_account_name, str):
+        if isinstance(api_requst, str) and isinstance(self._api_base_url, str):
+            # A configured base URL, e.g. a local stand-in server, replaces the tenant's.
+            endpoint_url = "{}/api/v2/{}".format(self._api_base_url.rstrip("/"), api_requst)
+        elif isinstance(api_requst, str) and isinstance(self._customer_account_name, str):
             endpoint_url = "https://{}.lacework.net/api/v2/{}".format(
                 self._customer_account_name, api_requst
             )
         return endpoint_url
 
-    def create_new_bearer_access_token(self, expiry_time_seconds=3600):
+    def create_new_bearer_access_token(self, expiry_time_seconds=3600, api_key=None):
+        # Issues a bearer token for api_key, the helper's own key by default.
+        if api_key == None:
+            api_key = self._api_key
+        bearer_access_token = None
         api_request_url = self.get_api_endpoint("access/tokens")
 
         http_headers = {
             "Content-Type": "application/json",
-            "X-LW-UAKS": self.secret_key(),
+            "X-LW-UAKS": api_key.secret_key,
         }
 
         post_data_map = {
-            "keyId": self.api_access_key_id(),
+            "keyId": api_key.api_access_key_id,
             "expiryTime": self.api_access_key_expiry_time_seconds(),
         }
 
-        http_response = requests.post(
-            api_request_url, headers=http_headers, json=post_data_map
+        http_response = self._send_request(
+            "POST", api_request_url, headers=http_headers, json=post_data_map
         )
 
         http_response_json_map = http_response.json()
         if isinstance(http_response_json_map, dict):
             bearer_access_token = http_response_json_map.get("token")
             if bearer_access_token != None:
-                self._access_token = bearer_access_token
-                self._access_token_creation_time = datetime.now()
-                self._access_token_expiry_time_seconds = expiry_time_seconds
+                expires_at_time = _expires_at_timestamp(
+                    http_response_json_map.get("expiresAt"),
+                    time.time() + expiry_time_seconds,
+                )
+                api_key.access_token_state = (bearer_access_token, expires_at_time)
+                api_key.access_token_issue_count += 1
+                self._access_token_issue_count += 1
         else:
             log_message = "An error occured while creating a new bearer access token.\n"
             log_message += "    API endpoint: {}\n".format(api_request_url)
@@ -158,15 +725,423 @@ class ApiHelperUtil:
 
         return bearer_access_token
 
-    def bearer_access_token_valid(self):
-        valid_time_remaining_seconds = 0
-        if self._access_token_creation_time != None and isinstance(
-            self._access_token_expiry_time_seconds, int
+    def bearer_access_token_time_remaining_seconds(self, api_key=None):
+        if api_key == None:
+            api_key = self._api_key
+        bearer_access_token, expires_at_time = api_key.access_token_state
+        if not isinstance(bearer_access_token, str):
+            return 0.0
+        return expires_at_time - time.time()
+
+    def bearer_access_token_valid(self, minimum_time_remaining_seconds=0, api_key=None):
+        return (
+            self.bearer_access_token_time_remaining_seconds(api_key)
+            > minimum_time_remaining_seconds
+        )
+
+    def bearer_access_token(self, api_key=None):
+        # Reuse the current bearer token while it is valid rather than requesting a
+        # new one for every API call. Once the background refresher is running the
+        # token is renewed before it expires, so this only blocks for the first token.
+        if api_key == None:
+            api_key = self._api_key
+        bearer_access_token, expires_at_time = api_key.access_token_state
+        if not (isinstance(bearer_access_token, str) and expires_at_time > time.time()):
+            self.refresh_bearer_access_token(api_key=api_key)
+            bearer_access_token = api_key.access_token_state[0]
+        if (
+            self._access_token_refresh_margin_seconds != None
+            and api_key.access_token_refresher == None
         ):
-            valid_time_remaining_seconds = (
-                datetime.now() - self._access_token_expiry_time_seconds
+            self._start_access_token_refresher(
+                api_key, self._access_token_refresh_margin_seconds
+            )
+        return bearer_access_token
+
+    def refresh_bearer_access_token(self, minimum_time_remaining_seconds=0, api_key=None):
+        # Single-flight: threads of this process share one lock and worker processes
+        # share a lock file, so only one caller issues a new token. The others pick up
+        # that token from the shared token cache file.
+        if api_key == None:
+            api_key = self._api_key
+        with api_key.access_token_lock:
+            if self.bearer_access_token_valid(minimum_time_remaining_seconds, api_key):
+                return True
+            cache_file_uri = self._access_token_cache_file_uri(api_key)
+            with InterProcessFileLock(cache_file_uri + ".lock"):
+                if self._load_shared_access_token(minimum_time_remaining_seconds, api_key):
+                    return True
+                if self.create_new_bearer_access_token(api_key=api_key) == None:
+                    return False
+                self._store_shared_access_token(api_key)
+        return True
+
+    def discard_bearer_access_token(self, bearer_access_token, api_key=None):
+        # Drops a token the API rejected, from the key and from the shared token cache
+        # file, so the next request issues a new one. A newer token issued meanwhile by
+        # another caller is kept.
+        if api_key == None:
+            api_key = self._api_key
+        with api_key.access_token_lock:
+            if api_key.access_token_state[0] == bearer_access_token:
+                api_key.access_token_state = (None, 0.0)
+            cache_file_uri = self._access_token_cache_file_uri(api_key)
+            with InterProcessFileLock(cache_file_uri + ".lock"):
+                try:
+                    with open(cache_file_uri, "r") as cache_file:
+                        cached_bearer_access_token = json.load(cache_file).get("token")
+                    if cached_bearer_access_token == bearer_access_token:
+                        os.remove(cache_file_uri)
+                except (IOError, ValueError, AttributeError):
+                    pass
+
+    def start_background_token_refresh(self, refresh_margin_seconds=300):
+        # Renews the token of every key of the helper in the background.
+        for api_key in self._api_keys():
+            self._start_access_token_refresher(api_key, refresh_margin_seconds)
+        return self._api_key.access_token_refresher
+
+    def _start_access_token_refresher(self, api_key, refresh_margin_seconds):
+        with api_key.access_token_lock:
+            if api_key.access_token_refresher == None:
+                api_key.access_token_refresher = BackgroundAccessTokenRefresher(
+                    self, refresh_margin_seconds, api_key
+                )
+                api_key.access_token_refresher.start()
+
+    def stop_background_token_refresh(self):
+        for api_key in self._api_keys():
+            if api_key.access_token_refresher != None:
+                api_key.access_token_refresher.stop()
+
+    def _api_keys(self):
+        if self._api_key_pool == None:
+            return [self._api_key]
+        return self._api_key_pool.api_keys()
+
+    def _access_token_cache_file_uri(self, api_key):
+        cache_key = hashlib.sha256(
+            "{}:{}".format(self.get_api_endpoint(""), api_key.api_access_key_id).encode()
+        ).hexdigest()[:16]
+        return os.path.join(
+            tempfile.gettempdir(), "lacework-api-test-token-{}.json".format(cache_key)
+        )
+
+    def _load_shared_access_token(self, minimum_time_remaining_seconds, api_key):
+        try:
+            with open(self._access_token_cache_file_uri(api_key), "r") as cache_file:
+                cache_map = json.load(cache_file)
+            bearer_access_token = cache_map["token"]
+            expires_at_time = float(cache_map["expiresAt"])
+        except (IOError, ValueError, KeyError, TypeError):
+            return False
+        if expires_at_time - time.time() <= minimum_time_remaining_seconds:
+            return False
+        api_key.access_token_state = (bearer_access_token, expires_at_time)
+        return True
+
+    def _store_shared_access_token(self, api_key):
+        bearer_access_token, expires_at_time = api_key.access_token_state
+        cache_file_uri = self._access_token_cache_file_uri(api_key)
+        temporary_file_uri = "{}.{}.tmp".format(cache_file_uri, os.getpid())
+        try:
+            # The token is a credential; only the current user may read it.
+            file_descriptor = os.open(
+                temporary_file_uri, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+            )
+            with os.fdopen(file_descriptor, "w") as cache_file:
+                json.dump({"token": bearer_access_token, "expiresAt": expires_at_time}, cache_file)
+            os.replace(temporary_file_uri, cache_file_uri)
+        except OSError as error:
+            log_message = "The bearer access token could not be shared: {}".format(error)
+            log_warning(MODULE_NAME, log_message)
+
+    def make_get_request(self, api_request, params=None, headers=None, coalesce=True):
+        # Pass coalesce=False for requests that must reach the server, e.g. when
+        # measuring its latency.
+        return self._make_get_request_to_url(
+            self.get_api_endpoint(api_request),
+            params=params,
+            headers=headers,
+            coalesce=coalesce,
+        )
+
+    def make_paged_get_requests(self, api_request, params=None, headers=None):
+        # Yields every page of a paged API response, following the next page URLs
+        # returned in "paging".
+        http_response = self.make_get_request(api_request, params=params, headers=headers)
+        while True:
+            yield http_response
+            next_page_url = _next_page_url(http_response)
+            if next_page_url == None:
+                return None
+            http_response = self._make_get_request_to_url(next_page_url, headers=headers)
+
+    def _make_get_request_to_url(
+        self, api_request_url, params=None, headers=None, coalesce=True
+    ):
+        def get_request():
+            return self._send_authenticated_request(
+                "GET", api_request_url, headers=headers, params=params
+            )
+
+        if self._get_request_single_flight_group == None or not coalesce:
+            return get_request()
+        # Identical GET requests made at the same time by several threads share one
+        # network request. The access key scopes the request, as all of this helper's
+        # bearer tokens authenticate as the same key.
+        call_key = (
+            api_request_url,
+            self._api_access_key_id,
+            tuple(sorted((params or {}).items())),
+            tuple(sorted((headers or {}).items())),
+        )
+        try:
+            return self._get_request_single_flight_group.do(
+                call_key,
+                get_request,
+                copy_function=_copy_http_response,
+                wait_timeout_seconds=remaining_deadline_seconds(),
+            )
+        except SingleFlightTimeoutError as error:
+            raise self._deadline_exceeded_error(
+                api_endpoint_family(api_request_url), "GET {}".format(api_request_url)
+            ) from error
+
+    def make_post_request(
+        self, api_request, json_data=None, headers=None, authenticate=True
+    ):
+        http_headers = self.http_content_type_header("application/json")
+        if isinstance(headers, dict):
+            http_headers.update(headers)
+        if authenticate:
+            return self._send_authenticated_request(
+                "POST", self.get_api_endpoint(api_request), headers=http_headers, json=json_data
             )
-        return isinstance(self._access_token, str) and valid_time_remaining_seconds > 0
+        return self._send_request(
+            "POST", self.get_api_endpoint(api_request), headers=http_headers, json=json_data
+        )
+
+    def make_paged_post_requests(self, api_request, json_data=None, headers=None):
+        # Yields every page of a paged response to a POST request, e.g. a query
+        # execution. The next pages are requested with GET from the URLs returned in
+        # "paging".
+        http_response = self.make_post_request(api_request, json_data=json_data, headers=headers)
+        while True:
+            yield http_response
+            next_page_url = _next_page_url(http_response)
+            if next_page_url == None:
+                return None
+            http_response = self._make_get_request_to_url(
+                next_page_url, headers=headers, coalesce=False
+            )
+
+    def make_delete_request(self, api_request, headers=None):
+        return self._send_authenticated_request(
+            "DELETE", self.get_api_endpoint(api_request), headers=headers
+        )
+
+    def access_token_issue_count(self):
+        # The bearer tokens this helper requested from the server. Tokens picked up
+        # from the shared token cache file are not counted.
+        return self._access_token_issue_count
+
+    def access_token_refresh_count(self):
+        # The bearer tokens renewed by the background token refreshers.
+        return sum(
+            api_key.access_token_refresher.refresh_count()
+            for api_key in self._api_keys()
+            if api_key.access_token_refresher != None
+        )
+
+    def throttled_retry_count(self):
+        # The throttled requests retried by another key of the API key pool.
+        return self._throttled_retry_count
+
+    def add_response_listener(self, response_listener):
+        # response_listener(endpoint_name, http_response, latency_seconds) is called
+        # after every API request made by the helper, from the requesting thread. The
+        # latency leaves out the time the request queued for the rate and concurrency
+        # limits.
+        self._response_listener_list.append(response_listener)
+
+    def remove_response_listener(self, response_listener):
+        if response_listener in self._response_listener_list:
+            self._response_listener_list.remove(response_listener)
+
+    def request_statistics(self):
+        rate_limit_wait_time_seconds = 0.0
+        if self._rate_limiter != None:
+            rate_limit_wait_time_seconds = self._rate_limiter.total_wait_time_seconds()
+        if self._api_key_pool != None:
+            rate_limit_wait_time_seconds = self._api_key_pool.budget_wait_time_seconds()
+        request_statistics_map = {
+            "request_count": self._request_count,
+            "rate_limit_wait_time_seconds": round(rate_limit_wait_time_seconds, 3),
+            "access_token_refresh_count": self.access_token_refresh_count(),
+            "access_token_issue_count": self._access_token_issue_count,
+        }
+        if self._get_request_single_flight_group != None:
+            request_statistics_map[
+                "get_request_coalescing"
+            ] = self._get_request_single_flight_group.statistics()
+        request_statistics_map[
+            "concurrency_limit"
+        ] = self._concurrency_limiter.statistics()
+        if self._timeout_count_map:
+            request_statistics_map["timeouts"] = self.timeout_count_map()
+        request_statistics_map["wire_statistics"] = self._wire_statistics.statistics()
+        if self._api_key_pool != None:
+            request_statistics_map["api_key_pool"] = self._api_key_pool.statistics()
+        connection_statistics_map = {
+            "prewarm_connection_count": self._prewarm_connection_count,
+        }
+        http_adapter = self._http_session.get_adapter(self.get_api_endpoint(""))
+        if isinstance(http_adapter, SessionResumingHTTPAdapter):
+            # TLS sessions and DNS results are shared by every helper of the process.
+            connection_statistics_map["tls_sessions"] = http_adapter.tls_session_statistics()
+        if installed_dns_cache() != None:
+            connection_statistics_map["dns_cache"] = installed_dns_cache().statistics()
+        request_statistics_map["connections"] = connection_statistics_map
+        return request_statistics_map
+
+    def close(self):
+        self.stop_background_token_refresh()
+        self._http_session.close()
+
+    def _send_authenticated_request(
+        self, http_method, api_request_url, headers=None, **request_kwargs
+    ):
+        # Sends a request authenticated by a bearer token, unless headers hold their
+        # own Authorization. With an API key pool the request is authenticated by the
+        # key the pool hands out, and a throttled request is tried once by each other
+        # key out of quarantine.
+        # A token answered with 401 is discarded, so the key's next request is
+        # authenticated by a new one.
+        http_headers = dict(headers or {})
+        if "Authorization" in http_headers:
+            return self._send_request(
+                http_method, api_request_url, headers=http_headers, **request_kwargs
+            )
+        if self._api_key_pool == None:
+            bearer_access_token = self.bearer_access_token()
+            http_headers.update(self.http_authentication_header(bearer_access_token))
+            http_response = self._send_request(
+                http_method, api_request_url, headers=http_headers, **request_kwargs
+            )
+            if http_response.status_code == UNAUTHORIZED_HTTP_STATUS_CODE:
+                self.discard_bearer_access_token(bearer_access_token)
+            return http_response
+        attempted_api_key_list = []
+        while True:
+            api_key = self._api_key_pool.acquire(
+                attempted_api_key_list, timeout_seconds=remaining_deadline_seconds()
+            )
+            if api_key == None:
+                raise self._deadline_exceeded_error(
+                    api_endpoint_family(api_request_url),
+                    "{} {}".format(http_method, api_request_url),
+                )
+            try:
+                bearer_access_token = self.bearer_access_token(api_key)
+                http_headers.update(self.http_authentication_header(bearer_access_token))
+                http_response = self._send_request(
+                    http_method, api_request_url, headers=http_headers, **request_kwargs
+                )
+            except Exception:
+                self._api_key_pool.release(api_key)
+                raise
+            if http_response.status_code == UNAUTHORIZED_HTTP_STATUS_CODE:
+                self.discard_bearer_access_token(bearer_access_token, api_key)
+            self._api_key_pool.release(
+                api_key, http_response.status_code, retry_after_seconds(http_response)
+            )
+            attempted_api_key_list.append(api_key)
+            if http_response.status_code != THROTTLED_HTTP_STATUS_CODE or not (
+                self._api_key_pool.available(attempted_api_key_list)
+            ):
+                return http_response
+            with self._request_count_lock:
+                self._throttled_retry_count += 1
+
+    def _send_request(self, http_method, api_request_url, **request_kwargs):
+        # Every API request made by the helper is sent from here, so every call and
+        # retry is bounded by the request timeouts and the running test's deadline.
+        # Queueing for a rate limiter token or a concurrency slot is bounded by the
+        # deadline too, and the request timeout is cut to the time left once the slot
+        # is taken.
+        with self._request_count_lock:
+            self._request_count += 1
+        endpoint_name = api_endpoint_family(api_request_url)
+        request_description = "{} {}".format(http_method, api_request_url)
+        check_deadline(request_description)
+        if self._rate_limiter != None:
+            if not self._rate_limiter.acquire(remaining_deadline_seconds()):
+                raise self._deadline_exceeded_error(endpoint_name, request_description)
+        configured_request_timeout = self._request_timeouts.timeout(endpoint_name)
+        request_timeout_specified = "timeout" in request_kwargs
+        request_time_map = {}
+
+        def limited_request():
+            # The request is timed from its concurrency slot, so its latency leaves out
+            # the time spent queueing for the slot.
+            check_deadline(request_description)
+            request_time_map["timeout"] = bounded_request_timeout(*configured_request_timeout)
+            request_time_map["start"] = time.perf_counter()
+            limited_request_kwargs = dict(request_kwargs)
+            if not request_timeout_specified:
+                limited_request_kwargs["timeout"] = request_time_map["timeout"]
+            return self._http_session.request(
+                http_method, api_request_url, **limited_request_kwargs
+            )
+
+        try:
+            http_response = self._concurrency_limiter.call(
+                limited_request,
+                # The operations of a family differ widely in latency, e.g. listing
+                # queries and executing one, so each has its own latency average.
+                latency_key="{} {}".format(http_method, api_path_template(api_request_url)),
+                acquire_timeout_seconds=remaining_deadline_seconds(),
+            )
+        except ConcurrencyLimitTimeoutError as error:
+            raise self._deadline_exceeded_error(endpoint_name, request_description) from error
+        except requests.exceptions.RequestException as error:
+            error_timeout_kind = request_timeout_kind(error)
+            remaining_seconds = remaining_deadline_seconds()
+            if error_timeout_kind == None:
+                # A response cut off by the deadline fails as a broken connection.
+                if remaining_seconds == None or remaining_seconds > 0:
+                    raise
+                error_timeout_kind = TimeoutKind.DEADLINE
+            # A timeout cut short by the deadline is the deadline's.
+            timeout_index = 0 if error_timeout_kind == TimeoutKind.CONNECT else 1
+            request_timeout = request_time_map.get("timeout", configured_request_timeout)
+            if request_timeout[timeout_index] < configured_request_timeout[timeout_index]:
+                error_timeout_kind = TimeoutKind.DEADLINE
+            if error_timeout_kind == TimeoutKind.DEADLINE:
+                raise self._deadline_exceeded_error(
+                    endpoint_name, request_description
+                ) from error
+            self._record_timeout(endpoint_name, error_timeout_kind)
+            raise
+        latency_seconds = time.perf_counter() - request_time_map["start"]
+        self._wire_statistics.record(endpoint_name, http_response, latency_seconds)
+        for response_listener in list(self._response_listener_list):
+            response_listener(endpoint_name, http_response, latency_seconds)
+        return http_response
+
+    def _record_timeout(self, endpoint_name, error_timeout_kind):
+        with self._request_count_lock:
+            kind_count_map = self._timeout_count_map.setdefault(endpoint_name, {})
+            kind_count_map[error_timeout_kind] = kind_count_map.get(error_timeout_kind, 0) + 1
+
+    def _deadline_exceeded_error(self, endpoint_name, request_description):
+        # The error for a request the deadline cut short, while it queued or while it
+        # waited for its response, counted as a deadline timeout of its endpoint.
+        self._record_timeout(endpoint_name, TimeoutKind.DEADLINE)
+        return DeadlineExceededError(
+            "The test deadline passed during {}.".format(request_description)
+        )
 
     @staticmethod
     def http_authentication_header(authentication_token):
@@ -177,6 +1152,110 @@ class ApiHelperUtil:
         return {"Content-Type": "{}".format(content_type)}
 
 
+def _copy_http_response(http_response):
+    # A coalesced GET response for a waiting caller. The copy holds the body read by
+    # the request, and its own headers and history, but no raw stream, which was
+    # consumed reading the body.
+    http_response_copy = copy.copy(http_response)
+    http_response_copy.headers = http_response.headers.copy()
+    http_response_copy.history = list(http_response.history)
+    return http_response_copy
+
+
+def _api_key_pool(api_config_parameters):
+    # The pool of the configured key, if any, and the "api_keys" entries. Each key's
+    # budget is its own "rate_limit_requests_per_second", or the configured one.
+    api_key_map_list = []
+    if api_config_parameters.api_access_key_id != None:
+        api_key_map_list.append(
+            {
+                ApiKey.API_ACCESS_KEY_ID: api_config_parameters.api_access_key_id,
+                ApiKey.SECRET_KEY: api_config_parameters.secret_key,
+            }
+        )
+    api_key_map_list.extend(api_config_parameters.api_keys)
+    api_key_list = []
+    for api_key_map in api_key_map_list:
+        api_access_key_id = api_key_map.get(ApiKey.API_ACCESS_KEY_ID)
+        if api_access_key_id in [api_key.api_access_key_id for api_key in api_key_list]:
+            continue
+        rate_limiter = None
+        rate_limit_requests_per_second = api_key_map.get(
+            ApiKey.RATE_LIMIT_REQUESTS_PER_SECOND,
+            api_config_parameters.rate_limit_requests_per_second,
+        )
+        if rate_limit_requests_per_second:
+            rate_limiter = RequestRateLimiter(rate_limit_requests_per_second)
+        api_key_list.append(
+            ApiKey(api_access_key_id, api_key_map.get(ApiKey.SECRET_KEY), rate_limiter)
+        )
+    if api_config_parameters.api_key_quarantine_seconds != None:
+        return ApiKeyPool(
+            api_key_list, quarantine_seconds=api_config_parameters.api_key_quarantine_seconds
+        )
+    return ApiKeyPool(api_key_list)
+
+
+def api_endpoint_family(api_request_url):
+    # The first path segment after /api/v2/, e.g. "Queries" for both
+    # .../api/v2/Queries and .../api/v2/Queries/validate.
+    api_request_path = urlsplit(api_request_url).path
+    API_PATH_PREFIX = "/api/v2/"
+    if API_PATH_PREFIX in api_request_path:
+        api_request_path = api_request_path.split(API_PATH_PREFIX, 1)[1]
+    return api_request_path.strip("/").split("/")[0]
+
+
+# A path segment naming a collection or an action, e.g. "Queries", "AzureSubscriptions"
+# or "validate", rather than a resource ID such as "LW_Global_AWS_CTA_AccessKeyDeleted"
+# or a GUID.
+_API_PATH_NAME_SEGMENT_PATTERN = re.compile(r"^[A-Z]?[a-z]+(?:[A-Z][a-z]+)*$")
+
+
+def api_path_template(api_request_url):
+    # The path after /api/v2/ with its resource IDs replaced by "{id}", e.g.
+    # "Queries/{id}/execute" for .../api/v2/Queries/LW_Custom_DNS/execute, so the
+    # requests of one API operation can be told from the other operations of their
+    # endpoint family.
+    api_request_path = urlsplit(api_request_url).path
+    API_PATH_PREFIX = "/api/v2/"
+    if API_PATH_PREFIX in api_request_path:
+        api_request_path = api_request_path.split(API_PATH_PREFIX, 1)[1]
+    path_segment_list = api_request_path.strip("/").split("/")
+    return "/".join(
+        path_segment_list[:1]
+        + [
+            path_segment if _API_PATH_NAME_SEGMENT_PATTERN.match(path_segment) else "{id}"
+            for path_segment in path_segment_list[1:]
+        ]
+    )
+
+
+def _next_page_url(http_response):
+    try:
+        http_response_json_map = http_response.json()
+    except ValueError:
+        return None
+    if not isinstance(http_response_json_map, dict):
+        return None
+    paging_map = http_response_json_map.get("paging")
+    if not isinstance(paging_map, dict) or not isinstance(paging_map.get("urls"), dict):
+        return None
+    return paging_map["urls"].get("nextPage")
+
+
+def _expires_at_timestamp(expires_at_utc_time_str, default_timestamp):
+    # The API returns an ISO 8601 formatted UTC date time string: "yyyy-MM-ddTHH:mm:ss.SSSZ"
+    if not isinstance(expires_at_utc_time_str, str):
+        return default_timestamp
+    try:
+        return datetime.fromisoformat(
+            expires_at_utc_time_str.replace("Z", "+00:00")
+        ).timestamp()
+    except ValueError:
+        return default_timestamp
+
+
 def configure_test_environment(json_config_file_uri=None):
     if None == json_config_file_uri:
         json_config_file_uri = ".api-test-config.json"
@@ -192,3 +1271,33 @@ def configure_test_environment(json_config_file_uri=None):
         api_config_parameters = ApiConfigParameters(**validated_config_file_map)
 
     return api_config_parameters
+
+
+def configure_multi_tenant_test_environment(json_config_file_uri=None):
+    # A multi-tenant configuration file holds a "tenants" list. Each entry uses the
+    # same data names as a single tenant configuration file. Any data name set at the
+    # top level of the file is used as the default for every tenant.
+    # A single tenant configuration file yields a list holding one tenant.
+    TENANTS_JSON_DATA_NAME = "tenants"
+    if None == json_config_file_uri:
+        json_config_file_uri = ".api-test-config.json"
+    api_config_parameters_list = []
+    if isinstance(json_config_file_uri, str) and os.path.exists(json_config_file_uri):
+        config_file_map = json_file_to_map(json_file_uri=json_config_file_uri)
+        if not isinstance(config_file_map, dict):
+            return api_config_parameters_list
+        tenant_config_map_list = config_file_map.get(TENANTS_JSON_DATA_NAME)
+        if not isinstance(tenant_config_map_list, list):
+            tenant_config_map_list = [{}]
+
+        for tenant_config_map in tenant_config_map_list:
+            validated_config_file_map = ApiConfigParameters().as_map()
+            for config_map in [config_file_map, tenant_config_map]:
+                for key, value in config_map.items():
+                    if key in validated_config_file_map:
+                        validated_config_file_map[key] = value
+            api_config_parameters_list.append(
+                ApiConfigParameters(**validated_config_file_map)
+            )
+
+    return api_config_parameters_list
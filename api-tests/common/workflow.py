@@ -0,0 +1,497 @@
+#!/usr/bin/python3
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import sys
+import threading
+import time
+import unittest
+
+from common.timeouts import deadline_scope
+from common.timeouts import deadline_seconds_of
+from common.utils import log_warning
+
+MODULE_NAME = "workflow"
+
+DEFAULT_MAX_WORKERS = 8
+# The test attribute holding the declared dependencies of a workflow step.
+WORKFLOW_STEP_ATTRIBUTE = "workflow_step"
+# The test attribute a workflow step's measured duration is left in, as its outcome
+# is reported to the test result after the step ran.
+WORKFLOW_DURATION_ATTRIBUTE = "workflow_duration_seconds"
+
+
+class WorkflowError(Exception):
+    pass
+
+
+class StepOutcome:
+    PASSED = "passed"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+def workflow_step(produces=(), consumes=()):
+    # Declares the values, e.g. created resource GUIDs, a test produces for other
+    # tests and the values it consumes from them:
+    #
+    #   @workflow_step(consumes=["alert_channel_guid"], produces=["alert_rule_guid"])
+    #   def test_create_alert_rule(self):
+    #       alert_channel_guid = self.consumed_value("alert_channel_guid")
+    #       ...
+    #       self.produce_value("alert_rule_guid", alert_rule_guid)
+    def decorator(test_function):
+        setattr(
+            test_function,
+            WORKFLOW_STEP_ATTRIBUTE,
+            {"produces": list(produces), "consumes": list(consumes)},
+        )
+        return test_function
+
+    return decorator
+
+
+def step_dependencies(test):
+    # The {"produces": [...], "consumes": [...]} of a workflow step, or None for a
+    # test which is not one.
+    test_method = getattr(test, getattr(test, "_testMethodName", ""), None)
+    return getattr(test_method, WORKFLOW_STEP_ATTRIBUTE, None)
+
+
+def _iterate_tests(test_suite):
+    for test in test_suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _iterate_tests(test)
+        else:
+            yield test
+
+
+def split_workflow_tests(test_suite):
+    # Returns the tests of the suite which are not workflow steps, and those which are.
+    test_list = []
+    workflow_test_list = []
+    for test in _iterate_tests(test_suite):
+        if step_dependencies(test) != None:
+            workflow_test_list.append(test)
+        else:
+            test_list.append(test)
+    return test_list, workflow_test_list
+
+
+class WorkflowValueStore:
+    # The values produced by the steps of one workflow run, and the cleanups they
+    # registered.
+    def __init__(self):
+        self._value_map = {}
+        self._cleanup_list = []
+        self._lock = threading.Lock()
+
+    def produce(self, value_name, value):
+        with self._lock:
+            self._value_map[value_name] = value
+
+    def produced(self, value_name):
+        with self._lock:
+            return value_name in self._value_map
+
+    def get(self, value_name):
+        with self._lock:
+            return self._value_map[value_name]
+
+    def value_map(self):
+        with self._lock:
+            return dict(self._value_map)
+
+    def add_cleanup(self, cleanup_function, *args, **kwargs):
+        with self._lock:
+            self._cleanup_list.append((cleanup_function, args, kwargs))
+
+    def run_cleanups(self):
+        # Runs the cleanups, the last registered first, so the resources of consumers
+        # are deleted before the resources they were created from. Returns the errors.
+        error_list = []
+        while True:
+            with self._lock:
+                if not self._cleanup_list:
+                    return error_list
+                cleanup_function, args, kwargs = self._cleanup_list.pop()
+            try:
+                cleanup_function(*args, **kwargs)
+            except Exception as error:
+                log_message = "A workflow cleanup failed: {}".format(error)
+                log_warning(MODULE_NAME, log_message)
+                error_list.append(str(error))
+
+
+class WorkflowTestCase(unittest.TestCase):
+    # A test case whose workflow steps pass values to each other. Run outside a
+    # workflow suite, a step consuming a value is skipped.
+    _workflow_value_store = None
+
+    def consumed_value(self, value_name):
+        if self._workflow_value_store == None or not self._workflow_value_store.produced(
+            value_name
+        ):
+            self.skipTest('"{}" was not produced.'.format(value_name))
+        return self._workflow_value_store.get(value_name)
+
+    def produce_value(self, value_name, value):
+        if self._workflow_value_store != None:
+            self._workflow_value_store.produce(value_name, value)
+
+    def add_workflow_cleanup(self, cleanup_function, *args, **kwargs):
+        # Runs the cleanup once the whole workflow has run, rather than at the end of
+        # the step, as later steps consume what the step created. Outside a workflow
+        # suite it runs at the end of the step.
+        if self._workflow_value_store == None:
+            self.addCleanup(cleanup_function, *args, **kwargs)
+        else:
+            self._workflow_value_store.add_cleanup(cleanup_function, *args, **kwargs)
+
+
+class _StepTestResult(unittest.TestResult):
+    # Records the outcome of one step while it runs in a worker thread, to be replayed
+    # into the suite's test result from the scheduling thread.
+    def __init__(self):
+        super().__init__()
+        self.event_list = []
+
+    def _add_event(self, method_name, *args):
+        self.event_list.append((method_name, args))
+
+    def addSuccess(self, test):
+        self._add_event("addSuccess", test)
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._add_event("addFailure", test, err)
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self._add_event("addError", test, err)
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._add_event("addSkip", test, reason)
+
+    def addExpectedFailure(self, test, err):
+        self._add_event("addExpectedFailure", test, err)
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._add_event("addUnexpectedSuccess", test)
+
+    def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
+        self._add_event("addSubTest", test, subtest, err)
+
+    def addDuration(self, test, elapsed):
+        self._add_event("addDuration", test, elapsed)
+
+    def step_outcome(self):
+        if self.failures or self.errors or self.unexpectedSuccesses:
+            return StepOutcome.FAILED
+        if self.skipped:
+            return StepOutcome.SKIPPED
+        return StepOutcome.PASSED
+
+
+class WorkflowTestSuite(unittest.TestSuite):
+    # Runs workflow steps as a dependency graph. A step starts as soon as every value
+    # it consumes has been produced, so independent branches run in parallel, up to
+    # max_workers steps at once, and only true dependency chains run one after
+    # another. A step which does not pass, or does not produce what it declared,
+    # causes the steps consuming its values to be skipped; other branches carry on.
+    #
+    # The suite handles the module and class fixtures of its steps itself: every
+    # module and class is set up before the first step runs. After the last step the
+    # cleanups the steps registered are run, then the classes and modules are torn
+    # down. A test module runs its steps in a workflow by returning the suite from
+    # load_tests:
+    #
+    #   def load_tests(loader, standard_tests, pattern):
+    #       return WorkflowTestSuite(standard_tests)
+    #
+    # With deadline_seconds, every step runs under that deadline, or its own.
+    def __init__(self, tests=(), max_workers=DEFAULT_MAX_WORKERS, deadline_seconds=None):
+        super().__init__(tests)
+        self._max_workers = max_workers
+        self._deadline_seconds = deadline_seconds
+        self._report_map = None
+
+    def report(self):
+        # The report of the last run, or None.
+        return self._report_map
+
+    def run(self, result, debug=False):
+        value_store = WorkflowValueStore()
+        test_list = [test for test in _iterate_tests(self)]
+        step_map_list = [self._step_map(test) for test in test_list]
+        run_start_time = time.perf_counter()
+        fixture_error_map, torn_down_fixture_list = self._set_up_fixtures(test_list)
+        try:
+            self._run_steps(step_map_list, value_store, fixture_error_map, result)
+        finally:
+            cleanup_error_list = value_store.run_cleanups()
+            for tear_down_name, tear_down_function in reversed(torn_down_fixture_list):
+                try:
+                    tear_down_function()
+                except Exception as error:
+                    log_message = "{} failed: {}".format(tear_down_name, error)
+                    log_warning(MODULE_NAME, log_message)
+        self._report_map = _workflow_report(
+            step_map_list, time.perf_counter() - run_start_time, cleanup_error_list
+        )
+        return result
+
+    @staticmethod
+    def _step_map(test):
+        step_dependency_map = step_dependencies(test) or {"produces": [], "consumes": []}
+        return {
+            "test": test,
+            "produces": step_dependency_map["produces"],
+            "consumes": step_dependency_map["consumes"],
+            "outcome": None,
+            "start_time": None,
+            "duration_seconds": None,
+        }
+
+    def _set_up_fixtures(self, test_list):
+        # Sets up every module and class of the steps. Returns the exc_info of the
+        # failed setups by module name and class, and the teardowns to run.
+        fixture_error_map = {}
+        torn_down_fixture_list = []
+        for test in test_list:
+            test_class = test.__class__
+            module_name = test_class.__module__
+            if module_name not in fixture_error_map:
+                fixture_error_map[module_name] = None
+                test_module = sys.modules.get(module_name)
+                try:
+                    if hasattr(test_module, "setUpModule"):
+                        test_module.setUpModule()
+                    if hasattr(test_module, "tearDownModule"):
+                        torn_down_fixture_list.append(
+                            ("{}.tearDownModule".format(module_name), test_module.tearDownModule)
+                        )
+                except Exception:
+                    fixture_error_map[module_name] = sys.exc_info()
+            if test_class not in fixture_error_map:
+                fixture_error_map[test_class] = None
+                if fixture_error_map[module_name] != None:
+                    continue
+                try:
+                    test_class.setUpClass()
+                    torn_down_fixture_list.append(
+                        ("{}.tearDownClass".format(test_class.__name__), test_class.tearDownClass)
+                    )
+                except Exception:
+                    fixture_error_map[test_class] = sys.exc_info()
+        return fixture_error_map, torn_down_fixture_list
+
+    def _run_steps(self, step_map_list, value_store, fixture_error_map, result):
+        producer_map = {}
+        for step_map in step_map_list:
+            for value_name in step_map["produces"]:
+                producer_map.setdefault(value_name, []).append(step_map)
+        pending_step_map_list = list(step_map_list)
+        # The values which will never be produced, as their step did not pass.
+        blocked_value_name_set = set()
+
+        # Steps which cannot run at all are reported before the others start.
+        for step_map in list(pending_step_map_list):
+            test = step_map["test"]
+            fixture_error = fixture_error_map.get(test.__class__.__module__) or (
+                fixture_error_map.get(test.__class__)
+            )
+            if fixture_error != None:
+                self._report_error(result, step_map, fixture_error)
+                blocked_value_name_set.update(step_map["produces"])
+                pending_step_map_list.remove(step_map)
+                continue
+            duplicate_value_name_list = [
+                value_name
+                for value_name in step_map["produces"]
+                if len(producer_map[value_name]) > 1
+            ]
+            if duplicate_value_name_list:
+                self._report_error(
+                    result,
+                    step_map,
+                    _workflow_error_info(
+                        "{} produced by more than one step.".format(duplicate_value_name_list)
+                    ),
+                )
+                blocked_value_name_set.update(step_map["produces"])
+                pending_step_map_list.remove(step_map)
+                continue
+            unproduced_value_name_list = [
+                value_name for value_name in step_map["consumes"] if value_name not in producer_map
+            ]
+            if unproduced_value_name_list:
+                self._report_skip(
+                    result,
+                    step_map,
+                    "{} produced by no selected test.".format(unproduced_value_name_list),
+                )
+                blocked_value_name_set.update(step_map["produces"])
+                pending_step_map_list.remove(step_map)
+
+        with ThreadPoolExecutor(max_workers=max(1, self._max_workers)) as executor:
+            future_step_map = {}
+            while pending_step_map_list or future_step_map:
+                for step_map in list(pending_step_map_list):
+                    blocking_value_name_list = [
+                        value_name
+                        for value_name in step_map["consumes"]
+                        if value_name in blocked_value_name_set
+                    ]
+                    if blocking_value_name_list:
+                        self._report_skip(
+                            result,
+                            step_map,
+                            "{} not produced.".format(blocking_value_name_list),
+                        )
+                        blocked_value_name_set.update(step_map["produces"])
+                        pending_step_map_list.remove(step_map)
+                    elif all(
+                        value_store.produced(value_name) for value_name in step_map["consumes"]
+                    ) and not result.shouldStop:
+                        pending_step_map_list.remove(step_map)
+                        future_step_map[
+                            executor.submit(self._run_step, step_map, value_store)
+                        ] = step_map
+                if not future_step_map:
+                    # Nothing is running and nothing can start: a dependency cycle,
+                    # or a stop requested by the test result.
+                    for step_map in pending_step_map_list:
+                        self._report_skip(
+                            result,
+                            step_map,
+                            "{} not produced, as its steps depend on each other.".format(
+                                step_map["consumes"]
+                            )
+                            if not result.shouldStop
+                            else "The test run was stopped.",
+                        )
+                    return None
+                done_future_set, _ = wait(future_step_map, return_when=FIRST_COMPLETED)
+                for future in done_future_set:
+                    step_map = future_step_map.pop(future)
+                    step_test_result = future.result()
+                    self._replay(result, step_map, step_test_result)
+                    step_map["outcome"] = step_test_result.step_outcome()
+                    for value_name in step_map["produces"]:
+                        if step_map["outcome"] != StepOutcome.PASSED or not (
+                            value_store.produced(value_name)
+                        ):
+                            blocked_value_name_set.add(value_name)
+
+    def _run_step(self, step_map, value_store):
+        test = step_map["test"]
+        test._workflow_value_store = value_store
+        step_test_result = _StepTestResult()
+        step_map["start_time"] = time.perf_counter()
+        with deadline_scope(deadline_seconds_of(test, self._deadline_seconds)):
+            test.run(step_test_result)
+        step_map["duration_seconds"] = time.perf_counter() - step_map["start_time"]
+        setattr(test, WORKFLOW_DURATION_ATTRIBUTE, step_map["duration_seconds"])
+        return step_test_result
+
+    @staticmethod
+    def _replay(result, step_map, step_test_result):
+        test = step_map["test"]
+        result.startTest(test)
+        for method_name, args in step_test_result.event_list:
+            result_method = getattr(result, method_name, None)
+            if result_method != None:
+                result_method(*args)
+        result.stopTest(test)
+
+    @staticmethod
+    def _report_skip(result, step_map, reason):
+        step_map["outcome"] = StepOutcome.SKIPPED
+        result.startTest(step_map["test"])
+        result.addSkip(step_map["test"], reason)
+        result.stopTest(step_map["test"])
+
+    @staticmethod
+    def _report_error(result, step_map, error_info):
+        step_map["outcome"] = StepOutcome.FAILED
+        result.startTest(step_map["test"])
+        result.addError(step_map["test"], error_info)
+        result.stopTest(step_map["test"])
+
+
+def _workflow_error_info(message):
+    try:
+        raise WorkflowError(message)
+    except WorkflowError:
+        return sys.exc_info()
+
+
+def _workflow_report(step_map_list, makespan_seconds, cleanup_error_list):
+    # The critical path is the chain of steps, each consuming a value of the one
+    # before, with the longest total duration: the shortest the workflow could take.
+    producer_map = {
+        value_name: step_map for step_map in step_map_list for value_name in step_map["produces"]
+    }
+    path_map = {}
+
+    def critical_path(step_map):
+        step_id = id(step_map)
+        if step_id not in path_map:
+            path_map[step_id] = (step_map["duration_seconds"] or 0.0, [step_map])
+            longest_upstream_path = max(
+                (
+                    critical_path(producer_map[value_name])
+                    for value_name in step_map["consumes"]
+                    if value_name in producer_map
+                ),
+                key=lambda path: path[0],
+                default=(0.0, []),
+            )
+            path_map[step_id] = (
+                longest_upstream_path[0] + (step_map["duration_seconds"] or 0.0),
+                longest_upstream_path[1] + [step_map],
+            )
+        return path_map[step_id]
+
+    critical_path_seconds, critical_path_step_map_list = max(
+        (critical_path(step_map) for step_map in step_map_list),
+        key=lambda path: path[0],
+        default=(0.0, []),
+    )
+    run_start_time = min(
+        (step_map["start_time"] for step_map in step_map_list if step_map["start_time"] != None),
+        default=None,
+    )
+    return {
+        "step_count": len(step_map_list),
+        "makespan_seconds": round(makespan_seconds, 3),
+        "serial_duration_seconds": round(
+            sum(step_map["duration_seconds"] or 0.0 for step_map in step_map_list), 3
+        ),
+        "critical_path_seconds": round(critical_path_seconds, 3),
+        "critical_path": [step_map["test"].id() for step_map in critical_path_step_map_list],
+        "steps": [
+            {
+                "test": step_map["test"].id(),
+                "produces": step_map["produces"],
+                "consumes": step_map["consumes"],
+                "outcome": step_map["outcome"],
+                "start_offset_seconds": (
+                    round(step_map["start_time"] - run_start_time, 3)
+                    if step_map["start_time"] != None
+                    else None
+                ),
+                "duration_seconds": (
+                    round(step_map["duration_seconds"], 3)
+                    if step_map["duration_seconds"] != None
+                    else None
+                ),
+            }
+            for step_map in step_map_list
+        ],
+        "cleanup_errors": cleanup_error_list,
+    }
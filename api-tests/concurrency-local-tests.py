@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+import threading
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.concurrency import AdaptiveConcurrencyLimiter
+from common.concurrency import ConcurrencyLimitTimeoutError
+from common.utils import api_path_template
+
+MODULE_NAME = "concurrency-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+_HEALTHY_LATENCY_SECONDS = 0.1
+
+
+class _FakeClock:
+    # A monotonic clock which only moves when the test advances it.
+    def __init__(self):
+        self._time_seconds = 0.0
+
+    def __call__(self):
+        return self._time_seconds
+
+    def advance(self, seconds):
+        self._time_seconds += seconds
+
+
+class ConcurrencyFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._fake_clock = _FakeClock()
+
+    def _limiter(self, **limiter_map):
+        return AdaptiveConcurrencyLimiter(time_function=self._fake_clock, **limiter_map)
+
+    def _complete_requests(self, limiter, request_count):
+        # Completes request_count requests started together, so the limit is in use.
+        for _ in range(request_count):
+            self.assertTrue(limiter.acquire(0))
+        for _ in range(request_count):
+            limiter.release(_HEALTHY_LATENCY_SECONDS, http_status_code=200)
+
+    def test_additive_increase(self):
+        limiter = self._limiter(initial_limit=4, maximum_limit=6)
+        while limiter.current_limit() == 4:
+            self._complete_requests(limiter, 4)
+        increased_limit = limiter.current_limit()
+        for _ in range(20):
+            self._complete_requests(limiter, 1)
+        serial_limit = limiter.current_limit()
+        for _ in range(5):
+            self._complete_requests(limiter, limiter.current_limit())
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that healthy requests using the limit grew it by the additive
+        # increase, and that a serial caller did not grow it further.
+        self.assertEqual(increased_limit, 5)
+        self.assertEqual(serial_limit, 5)
+
+        # 2.0 Assert that the limit stopped growing at its maximum.
+        self.assertEqual(limiter.current_limit(), 6)
+        self.assertEqual(limiter.statistics()["increase_count"], 2)
+        return None
+
+    def test_multiplicative_decrease_on_throttling(self):
+        limiter = self._limiter(initial_limit=8, decrease_cooldown_seconds=1.0)
+        current_limit_list = []
+        for http_status_code, failed, advance_seconds in [
+            (429, False, 0.0),
+            (503, False, 0.5),
+            (503, False, 0.5),
+            (None, True, 1.0),
+            (429, False, 1.0),
+        ]:
+            self._fake_clock.advance(advance_seconds)
+            limiter.acquire()
+            limiter.release(
+                _HEALTHY_LATENCY_SECONDS, http_status_code=http_status_code, failed=failed
+            )
+            current_limit_list.append(limiter.current_limit())
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that throttled responses and failed requests halved the limit, once
+        # per cooldown, down to its minimum.
+        self.assertEqual(current_limit_list, [4, 4, 2, 1, 1])
+        self.assertEqual(limiter.statistics()["decrease_count"], 4)
+
+        # 2.0 Assert that every change of limit was recorded at the time of its clock.
+        self.assertEqual(limiter.limit_history(), [(0.0, 8), (0.0, 4), (1.0, 2), (2.0, 1)])
+        return None
+
+    def test_multiplicative_decrease_on_latency_spike(self):
+        limiter = self._limiter(initial_limit=8, latency_spike_ratio=3.0)
+        for _ in range(AdaptiveConcurrencyLimiter.MINIMUM_LATENCY_SAMPLE_COUNT):
+            limiter.acquire()
+            limiter.release(_HEALTHY_LATENCY_SECONDS, http_status_code=200, latency_key="Queries")
+        healthy_limit = limiter.current_limit()
+        # Another endpoint's first slow response is not a spike.
+        limiter.acquire()
+        limiter.release(
+            _HEALTHY_LATENCY_SECONDS * 5, http_status_code=200, latency_key="UserProfile"
+        )
+        other_endpoint_limit = limiter.current_limit()
+        limiter.acquire()
+        limiter.release(_HEALTHY_LATENCY_SECONDS * 5, http_status_code=200, latency_key="Queries")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a response slower than the spike ratio times its endpoint's
+        # average latency halved the limit, and that endpoints were tracked apart.
+        self.assertEqual(healthy_limit, 8)
+        self.assertEqual(other_endpoint_limit, 8)
+        self.assertEqual(limiter.current_limit(), 4)
+        return None
+
+    def test_latency_keys_per_operation(self):
+        api_base_url = "https://stand-in.lacework.net/api/v2/"
+        path_template_list = [
+            api_path_template(api_base_url + api_request)
+            for api_request in [
+                "Queries",
+                "Queries/validate",
+                "Queries/LW_Custom_DNS/execute",
+                "Queries/LW_Custom_Other/execute",
+                "AlertChannels/TECHALLY_8C3F52E6A1B2C3D4",
+                "Configs/AzureSubscriptions",
+                "access/tokens",
+            ]
+        ]
+        limiter = self._limiter(initial_limit=8, latency_spike_ratio=3.0)
+        for _ in range(AdaptiveConcurrencyLimiter.MINIMUM_LATENCY_SAMPLE_COUNT):
+            limiter.acquire()
+            limiter.release(
+                _HEALTHY_LATENCY_SECONDS, http_status_code=200, latency_key="GET Queries"
+            )
+        # The slow execution of a query is not a spike of listing queries.
+        limiter.acquire()
+        limiter.release(
+            _HEALTHY_LATENCY_SECONDS * 5,
+            http_status_code=200,
+            latency_key="POST Queries/{id}/execute",
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that resource IDs were templated, and collection and action names
+        # kept.
+        self.assertEqual(
+            path_template_list,
+            [
+                "Queries",
+                "Queries/validate",
+                "Queries/{id}/execute",
+                "Queries/{id}/execute",
+                "AlertChannels/{id}",
+                "Configs/AzureSubscriptions",
+                "access/tokens",
+            ],
+        )
+
+        # 2.0 Assert that operations of one endpoint family kept apart latency averages.
+        self.assertEqual(limiter.current_limit(), 8)
+        return None
+
+    def test_limit_history_bounded(self):
+        limiter = self._limiter(
+            initial_limit=2, minimum_limit=1, maximum_limit=2, decrease_cooldown_seconds=0
+        )
+        for _ in range(AdaptiveConcurrencyLimiter.LIMIT_HISTORY_LENGTH):
+            self._fake_clock.advance(1.0)
+            limiter.acquire()
+            limiter.release(_HEALTHY_LATENCY_SECONDS, failed=True)
+            self._complete_requests(limiter, 1)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that only the most recent changes of limit were kept.
+        limit_history = limiter.limit_history()
+        self.assertEqual(len(limit_history), AdaptiveConcurrencyLimiter.LIMIT_HISTORY_LENGTH)
+        self.assertEqual(limit_history[-1][1], limiter.current_limit())
+        self.assertGreater(limit_history[0][0], 0.0)
+        return None
+
+    def test_limit_bounds(self):
+        above_maximum_limiter = AdaptiveConcurrencyLimiter.from_map(
+            {"initial_limit": 100, "maximum_limit": 16, "unknown_limit_name": 1}
+        )
+        below_minimum_limiter = self._limiter(initial_limit=0, minimum_limit=2)
+        for _ in range(3):
+            self._fake_clock.advance(10)
+            below_minimum_limiter.acquire()
+            below_minimum_limiter.release(_HEALTHY_LATENCY_SECONDS, http_status_code=429)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the initial limit was kept within the limit's bounds, and that
+        # throttling did not take the limit below its minimum.
+        self.assertEqual(above_maximum_limiter.current_limit(), 16)
+        self.assertEqual(below_minimum_limiter.current_limit(), 2)
+        return None
+
+    def test_acquire_timeout(self):
+        limiter = self._limiter(initial_limit=1, maximum_limit=1)
+        limiter.acquire()
+        acquire_start_time = time.monotonic()
+        slot_acquired = limiter.acquire(timeout_seconds=0.1)
+        acquire_wait_seconds = time.monotonic() - acquire_start_time
+        with self.assertRaises(ConcurrencyLimitTimeoutError):
+            limiter.call(lambda: None, acquire_timeout_seconds=0.1)
+        waiting_acquire_result_list = []
+        waiting_thread = threading.Thread(
+            target=lambda: waiting_acquire_result_list.append(limiter.acquire(timeout_seconds=5))
+        )
+        waiting_thread.start()
+        time.sleep(0.1)
+        limiter.release(_HEALTHY_LATENCY_SECONDS, http_status_code=200)
+        waiting_thread.join(5)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that waiting for a slot gave up after the timeout while the limit
+        # was in use.
+        self.assertFalse(slot_acquired)
+        self.assertGreaterEqual(acquire_wait_seconds, 0.1)
+        self.assertLess(acquire_wait_seconds, 1.0)
+
+        # 2.0 Assert that a waiting caller was woken by a released slot.
+        self.assertEqual(waiting_acquire_result_list, [True])
+        self.assertEqual(limiter.in_flight_count(), 1)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests do not make API requests.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+import requests
+
+from apiunittestcore import HttpResponseValidator
+import common.profiling
+import common.utils
+from common.network import DnsCache
+from common.network import installed_dns_cache
+from common.standin import StandInResponse
+from common.standin import create_self_signed_certificate
+from common.standin import server_ssl_context
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "connection-warmup-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local TLS stand-in server with a self-signed certificate,
+# not a Lacework tenant.
+_certificate_directory_uri = None
+_certificate_file_uri = None
+_stand_in_server = None
+
+# The name lookup of the process before any helper was made.
+_PROCESS_GETADDRINFO = socket.getaddrinfo
+
+# Pre-warm requests are held open long enough for all of them to overlap, so each one
+# opens a connection of its own.
+_PREWARM_RESPONSE_DELAY_SECONDS = 0.2
+
+
+def setUpModule():
+    global _certificate_directory_uri, _certificate_file_uri, _stand_in_server
+    _certificate_directory_uri = tempfile.mkdtemp(prefix="stand-in-tls-")
+    certificate_file_uris = create_self_signed_certificate(_certificate_directory_uri)
+    if certificate_file_uris == None:
+        raise unittest.SkipTest("The openssl command is not installed.")
+    _certificate_file_uri, key_file_uri = certificate_file_uris
+    _stand_in_server = start_stand_in_server(
+        ssl_context=server_ssl_context(_certificate_file_uri, key_file_uri)
+    )
+    _stand_in_server.add_json_route("GET", "/api/v2/UserProfile", {"data": []})
+
+    def delayed_head_response(stand_in_request):
+        time.sleep(_PREWARM_RESPONSE_DELAY_SECONDS)
+        return StandInResponse(status_code=404)
+
+    _stand_in_server.add_route("HEAD", "/api/v2/", delayed_head_response)
+
+
+def tearDownModule():
+    if _stand_in_server != None:
+        _stand_in_server.stop()
+    shutil.rmtree(_certificate_directory_uri, ignore_errors=True)
+
+
+class ConnectionWarmupFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._api_helper_util_list = []
+
+    def tearDown(self):
+        for api_helper_util in self._api_helper_util_list:
+            api_helper_util.close()
+
+    def _make_api_helper_util(self, **api_config_kwargs):
+        api_helper_util = stand_in_api_helper_util(
+            "https://localhost:{}".format(_stand_in_server.port()),
+            **api_config_kwargs
+        )
+        # A CA bundle set in the environment would take precedence over the session's.
+        api_helper_util.http_session().trust_env = False
+        api_helper_util.http_session().verify = _certificate_file_uri
+        self._api_helper_util_list.append(api_helper_util)
+        return api_helper_util
+
+    def _client_port_set(self, http_method, path, request_log_start_index=0):
+        return {
+            stand_in_request.client_address[1]
+            for stand_in_request in _stand_in_server.request_log()[request_log_start_index:]
+            if stand_in_request.http_method == http_method and stand_in_request.path == path
+        }
+
+    def test_prewarm_connections(self):
+        prewarm_request_count = len(self._client_port_set("HEAD", "/api/v2/"))
+        # The connections are pre-warmed once the helper trusts the stand-in's
+        # certificate, rather than at start-up.
+        api_helper_util = self._make_api_helper_util()
+        prewarm_connection_count = api_helper_util.prewarm_connections(4)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the connections were opened concurrently.
+        self.assertEqual(prewarm_connection_count, 4)
+        self.assertEqual(
+            len(self._client_port_set("HEAD", "/api/v2/")) - prewarm_request_count, 4
+        )
+
+        # 2.0 Assert that later requests are sent on the pre-warmed connections.
+        prewarm_client_port_set = self._client_port_set("HEAD", "/api/v2/")
+        request_log_start_index = len(_stand_in_server.request_log())
+        http_response = api_helper_util.make_get_request("UserProfile")
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertTrue(
+            self._client_port_set("GET", "/api/v2/UserProfile", request_log_start_index)
+            <= prewarm_client_port_set
+        )
+        self.assertEqual(
+            api_helper_util.request_statistics()["connections"]["prewarm_connection_count"], 4
+        )
+        return None
+
+    def test_prewarm_held_to_limits(self):
+        prewarm_request_count = len(self._client_port_set("HEAD", "/api/v2/"))
+        api_helper_util = self._make_api_helper_util(
+            adaptive_concurrency={"initial_limit": 2, "maximum_limit": 8}
+        )
+        prewarm_connection_count = api_helper_util.prewarm_connections(4)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that no more connections were opened than the concurrency limit
+        # lets requests use.
+        self.assertEqual(prewarm_connection_count, 2)
+        self.assertEqual(
+            len(self._client_port_set("HEAD", "/api/v2/")) - prewarm_request_count, 2
+        )
+
+        # 2.0 Assert that the pre-warm requests were sent through the helper, like its
+        # other requests.
+        self.assertEqual(api_helper_util.request_statistics()["request_count"], 2)
+        self.assertEqual(
+            api_helper_util.concurrency_limiter().statistics()["limit_history"][0][1], 2
+        )
+        return None
+
+    def test_verify_settings_not_shared(self):
+        # The first helper trusts the stand-in's self-signed certificate; the second
+        # verifies nothing.
+        self._make_api_helper_util().make_get_request("UserProfile")
+        unverified_api_helper_util = self._make_api_helper_util()
+        unverified_api_helper_util.http_session().verify = False
+        unverified_http_response = unverified_api_helper_util.make_get_request("UserProfile")
+        default_api_helper_util = self._make_api_helper_util()
+        default_api_helper_util.http_session().verify = True
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a helper verifying against the default CA bundle rejected the
+        # self-signed certificate, although other helpers of the process trusted it or
+        # verified nothing.
+        self.assertTrue(
+            HttpResponseValidator.is_successful_200_ok_response(unverified_http_response)
+        )
+        with self.assertRaises(requests.exceptions.SSLError):
+            default_api_helper_util.make_get_request("UserProfile", coalesce=False)
+        return None
+
+    def test_tls_session_resumption(self):
+        api_helper_util = self._make_api_helper_util()
+        api_helper_util.make_get_request("UserProfile")
+        tls_session_statistics_map = api_helper_util.request_statistics()["connections"][
+            "tls_sessions"
+        ]
+
+        # A second helper has a connection pool of its own, so it opens a new connection.
+        other_api_helper_util = self._make_api_helper_util()
+        http_response = other_api_helper_util.make_get_request("UserProfile")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the new connection resumed the TLS session of the first.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertTrue(_stand_in_server.request_log()[-1].tls_session_reused)
+        self.assertGreater(
+            other_api_helper_util.request_statistics()["connections"]["tls_sessions"][
+                "resumed_session_count"
+            ],
+            tls_session_statistics_map["resumed_session_count"],
+        )
+        return None
+
+    def test_tls_session_resumption_disabled(self):
+        api_helper_util = self._make_api_helper_util(tls_session_resumption=False)
+        api_helper_util.make_get_request("UserProfile")
+        other_api_helper_util = self._make_api_helper_util(tls_session_resumption=False)
+        http_response = other_api_helper_util.make_get_request("UserProfile")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the new connection made a full TLS handshake.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertFalse(_stand_in_server.request_log()[-1].tls_session_reused)
+        self.assertNotIn(
+            "tls_sessions", other_api_helper_util.request_statistics()["connections"]
+        )
+        return None
+
+    def test_dns_cache(self):
+        dns_cache = DnsCache(ttl_seconds=60)
+        resolved_host_list = []
+
+        def stand_in_resolve_function(host, port, *args):
+            resolved_host_list.append(host)
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port))]
+
+        dns_cache._resolve_function = stand_in_resolve_function
+        address_info_list = [
+            dns_cache.getaddrinfo("stand-in.lacework.net", 443) for _ in range(3)
+        ]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the name was resolved once and served from the cache after.
+        self.assertEqual(address_info_list[2][0][4], ("127.0.0.1", 443))
+        self.assertEqual(resolved_host_list, ["stand-in.lacework.net"])
+        self.assertEqual(dns_cache.statistics()["hit_count"], 2)
+        self.assertEqual(dns_cache.statistics()["miss_count"], 1)
+
+        # 2.0 Assert that an expired entry is resolved again.
+        dns_cache._ttl_seconds = 0
+        dns_cache.getaddrinfo("stand-in.lacework.net", 443)
+        self.assertEqual(len(resolved_host_list), 2)
+        return None
+
+    def test_dns_cache_in_connection_path(self):
+        api_helper_util = self._make_api_helper_util(dns_cache_ttl_seconds=60)
+        api_helper_util.make_get_request("UserProfile")
+        dns_cache_statistics_map = installed_dns_cache().statistics()
+        # A second helper has a connection pool of its own, so it opens a new connection.
+        other_api_helper_util = self._make_api_helper_util(dns_cache_ttl_seconds=60)
+        http_response = other_api_helper_util.make_get_request("UserProfile")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the new connections of the helpers looked their host up in the
+        # DNS cache, and connected to the cached address.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertGreaterEqual(
+            dns_cache_statistics_map["hit_count"] + dns_cache_statistics_map["miss_count"], 1
+        )
+        self.assertGreater(
+            installed_dns_cache().statistics()["hit_count"], dns_cache_statistics_map["hit_count"]
+        )
+
+        # 2.0 Assert that the name lookups of the rest of the process were not replaced.
+        self.assertIs(socket.getaddrinfo, _PROCESS_GETADDRINFO)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helpers for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
@@ -2,6 +2,7 @@
 import time
 import unittest
 
+import common.profiling
 import common.utils
 from common.utils import ApiHelperUtil
 
@@ -23,7 +24,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
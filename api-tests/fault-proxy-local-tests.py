@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+import time
+import unittest
+
+from apiunittestcore import HttpResponseValidator
+import common.profiling
+import common.utils
+from common.faultproxy import FaultInjectingProxy
+from common.faultproxy import FaultRule
+from common.faultproxy import lognormal_latency
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.timeouts import DeadlineExceededError
+from common.timeouts import TimeoutKind
+from common.timeouts import deadline_scope
+from common.timeouts import without_deadline
+import requests
+
+MODULE_NAME = "fault-proxy-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant, through a
+# fault-injecting proxy.
+_stand_in_server = None
+_fault_proxy = None
+
+_LARGE_BODY_RECORD_COUNT = 4000
+
+
+def setUpModule():
+    global _stand_in_server
+    global _fault_proxy
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_json_route(
+        "GET", "/api/v2/UserProfile", {"data": [{"username": "stand-in@lacework.net"}]}
+    )
+    _stand_in_server.add_json_route(
+        "GET",
+        "/api/v2/Queries",
+        {
+            "data": [
+                {"queryId": "Query_{}".format(record_index)}
+                for record_index in range(_LARGE_BODY_RECORD_COUNT)
+            ]
+        },
+    )
+    _fault_proxy = FaultInjectingProxy(_stand_in_server.base_url()).start()
+
+
+def tearDownModule():
+    _fault_proxy.stop()
+    _stand_in_server.stop()
+
+
+class FaultProxyFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        _fault_proxy.clear_rules()
+        self._api_helper_util = stand_in_api_helper_util(_fault_proxy.base_url())
+        # The first token is issued before any fault is injected.
+        self._api_helper_util.bearer_access_token()
+
+    def tearDown(self):
+        _fault_proxy.clear_rules()
+        self._api_helper_util.close()
+
+    def _timed_get_request(self, api_request):
+        request_start_time = time.perf_counter()
+        http_response = self._api_helper_util.make_get_request(api_request, coalesce=False)
+        return http_response, time.perf_counter() - request_start_time
+
+    def test_requests_pass_through(self):
+        http_response, _ = self._timed_get_request("UserProfile")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a request without a matching rule is forwarded unchanged.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertEqual(http_response.json()["data"][0]["username"], "stand-in@lacework.net")
+        self.assertGreaterEqual(_fault_proxy.statistics()["forwarded_request_count"], 1)
+        return None
+
+    def test_latency_and_jitter(self):
+        _fault_proxy.add_rule(
+            FaultRule("/api/v2/UserProfile", latency_seconds=0.1, jitter_seconds=0.05)
+        )
+        latency_list = [self._timed_get_request("UserProfile")[1] for _ in range(5)]
+        _fault_proxy.clear_rules()
+        lognormal_rule = _fault_proxy.add_rule(
+            FaultRule("/api/v2/User*", latency_function=lognormal_latency(0.02, sigma=0.3))
+        )
+        lognormal_latency_list = [self._timed_get_request("UserProfile")[1] for _ in range(5)]
+
+        # 1.0 Assert that every response was delayed by the latency and at most the
+        # jitter on top.
+        self.assertGreaterEqual(min(latency_list), 0.1)
+        self.assertLess(max(latency_list), 0.15 + 0.1)
+
+        # 2.0 Assert that a latency distribution delays every matching request.
+        self.assertEqual(lognormal_rule.injected_count, 5)
+        self.assertGreater(min(lognormal_latency_list), 0.005)
+        return None
+
+    def test_rate_limit_burst(self):
+        burst_rule = _fault_proxy.add_rule(
+            FaultRule("/api/v2/UserProfile", status_code=429, retry_after_seconds=1, max_count=3)
+        )
+        status_code_list = [
+            self._timed_get_request("UserProfile")[0].status_code for _ in range(5)
+        ]
+
+        # 1.0 Assert that the burst answered three requests with 429 and Retry-After,
+        # and then let the requests through.
+        self.assertEqual(status_code_list, [429, 429, 429, 200, 200])
+        self.assertEqual(burst_rule.injected_count, 3)
+        self.assertEqual(burst_rule.match_count, 5)
+
+        # 2.0 Assert that the adaptive concurrency limit backed off on the throttled
+        # responses.
+        concurrency_statistics_map = self._api_helper_util.concurrency_limiter().statistics()
+        self.assertGreater(concurrency_statistics_map["decrease_count"], 0)
+        return None
+
+    def test_service_unavailable_after_warmup(self):
+        _fault_proxy.add_rule(FaultRule("/api/v2/UserProfile", status_code=503, after_count=2))
+        status_code_list = [
+            self._timed_get_request("UserProfile")[0].status_code for _ in range(4)
+        ]
+
+        # 1.0 Assert that the outage started after the first two requests.
+        self.assertEqual(status_code_list, [200, 200, 503, 503])
+        return None
+
+    def test_bandwidth_cap(self):
+        http_response, uncapped_duration_seconds = self._timed_get_request("Queries")
+        body_size_bytes = len(http_response.content)
+        bandwidth_bytes_per_second = body_size_bytes / 0.5
+        _fault_proxy.add_rule(
+            FaultRule("/api/v2/Queries", bandwidth_bytes_per_second=bandwidth_bytes_per_second)
+        )
+        capped_http_response, capped_duration_seconds = self._timed_get_request("Queries")
+
+        # 1.0 Assert that the capped body arrived whole, at no more than the bandwidth.
+        self.assertEqual(capped_http_response.content, http_response.content)
+        self.assertGreaterEqual(capped_duration_seconds, 0.45)
+        self.assertLess(uncapped_duration_seconds, 0.45)
+        return None
+
+    def test_connection_reset_and_truncated_body(self):
+        _fault_proxy.add_rule(
+            FaultRule("/api/v2/UserProfile", connection_reset=True, max_count=1)
+        )
+        _fault_proxy.add_rule(
+            FaultRule("/api/v2/Queries", truncate_body_fraction=0.5, max_count=1)
+        )
+
+        # 1.0 Assert that a reset connection fails the request.
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self._api_helper_util.make_get_request("UserProfile", coalesce=False)
+
+        # 2.0 Assert that a truncated body fails the request.
+        with self.assertRaises(requests.exceptions.RequestException):
+            self._api_helper_util.make_get_request("Queries", coalesce=False)
+
+        # 3.0 Assert that the helper recovers once the faults have passed.
+        http_response, _ = self._timed_get_request("UserProfile")
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        return None
+
+    def test_slow_loris_defeats_read_timeout(self):
+        _fault_proxy.add_rule(
+            FaultRule("/api/v2/UserProfile", slow_loris_interval_seconds=0.01)
+        )
+        request_start_time = time.perf_counter()
+        http_response = self._api_helper_util.http_session().get(
+            self._api_helper_util.get_api_endpoint("UserProfile"),
+            headers=self._api_helper_util.http_authentication_header(
+                self._api_helper_util.bearer_access_token()
+            ),
+            timeout=(1.0, 0.2),
+        )
+        duration_seconds = time.perf_counter() - request_start_time
+
+        # 1.0 Assert that a body trickling in one byte at a time never tripped the 0.2s
+        # read timeout, though the whole response took far longer.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertGreater(duration_seconds, 0.2)
+        self.assertGreaterEqual(duration_seconds, len(http_response.content) * 0.01 * 0.9)
+        return None
+
+    def test_deadline_cuts_slow_loris_body(self):
+        _fault_proxy.add_rule(FaultRule("/api/v2/Queries", slow_loris_interval_seconds=0.01))
+        request_start_time = time.perf_counter()
+        with without_deadline(), deadline_scope(0.5):
+            with self.assertRaises(DeadlineExceededError):
+                self._api_helper_util.make_get_request("Queries", coalesce=False)
+        duration_seconds = time.perf_counter() - request_start_time
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the trickling body, which never trips the read timeout, was
+        # cut off at the deadline and counted as a deadline timeout.
+        self.assertLess(duration_seconds, 1.5)
+        self.assertEqual(
+            self._api_helper_util.request_statistics()["timeouts"],
+            {"Queries": {TimeoutKind.DEADLINE: 1}},
+        )
+
+        # 2.0 Assert that the helper's later requests were not affected by the cut off
+        # connection.
+        _fault_proxy.clear_rules()
+        http_response, _ = self._timed_get_request("UserProfile")
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
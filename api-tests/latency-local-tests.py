@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+import random
+import time
+import unittest
+import uuid
+
+from apiunittestcore import HttpResponseValidator
+from apiunittestcore import LatencyBudget
+from apiunittestcore import LatencyBudgetVerdict
+from apiunittestcore import LatencyDistribution
+import common.profiling
+import common.utils
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "latency-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant. Its
+# UserProfile route answers after _RESPONSE_DELAY_SECONDS, and its tokens are issued
+# after _TOKEN_ISSUE_DELAY_SECONDS.
+_stand_in_server = None
+_RESPONSE_DELAY_SECONDS = 0.1
+_TOKEN_ISSUE_DELAY_SECONDS = 0.5
+
+
+def _delayed_user_profile(stand_in_request):
+    time.sleep(_RESPONSE_DELAY_SECONDS)
+    return StandInResponse(json_data={"data": [{"username": "stand-in@lacework.net"}]})
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_route("GET", "/api/v2/UserProfile", _delayed_user_profile)
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class _FakeHttpResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class LatencyFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+
+    def _stand_in_api_helper_util(self):
+        # Every helper uses its own key, so its first token is issued, not shared.
+        api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(),
+            api_access_key_id="LATENCY_KEY_{}".format(uuid.uuid4().hex[:8]),
+            adaptive_concurrency={"initial_limit": 1, "minimum_limit": 1, "maximum_limit": 1},
+        )
+        self.addCleanup(api_helper_util.close)
+        return api_helper_util
+
+    def test_latency_distribution_percentiles(self):
+        latency_seconds_list = [sample_index / 100.0 for sample_index in range(1, 11)]
+        random.shuffle(latency_seconds_list)
+        latency_distribution = LatencyDistribution(latency_seconds_list, 2.0)
+        empty_latency_distribution = LatencyDistribution([], 0.0)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the nearest-rank percentiles were taken from the sorted
+        # samples.
+        self.assertAlmostEqual(latency_distribution.percentile_ms(0), 10.0)
+        self.assertAlmostEqual(latency_distribution.p50_ms(), 50.0)
+        self.assertAlmostEqual(latency_distribution.percentile_ms(90), 90.0)
+        self.assertAlmostEqual(latency_distribution.p95_ms(), 100.0)
+        self.assertAlmostEqual(latency_distribution.max_ms(), 100.0)
+        self.assertAlmostEqual(latency_distribution.throughput_rps(), 5.0)
+        self.assertEqual(
+            latency_distribution.as_map()["latencies_ms"],
+            [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0, 100.0],
+        )
+
+        # 2.0 Assert that a distribution without samples reports zeros.
+        self.assertEqual(empty_latency_distribution.p95_ms(), 0.0)
+        self.assertEqual(empty_latency_distribution.throughput_rps(), 0.0)
+        return None
+
+    def test_latency_budget_verdict(self):
+        latency_distribution = LatencyDistribution(
+            [0.1, 0.2, 0.3, 0.4], 2.0, unsuccessful_response_count=1
+        )
+        latency_budget = LatencyBudget.from_map(
+            {"iterations": 4, "p50_ms": 500, "unknown_budget_name": 1}
+        )
+        met_latency_budget_verdict = LatencyBudgetVerdict(
+            "UserProfile", LatencyDistribution([0.1, 0.2], 1.0), latency_budget
+        )
+        missed_latency_budget_verdict = LatencyBudgetVerdict(
+            "UserProfile",
+            latency_distribution,
+            LatencyBudget(p50_ms=500, p95_ms=300, min_throughput_rps=3),
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a budget is read from its map, without unknown data names, and
+        # that unset limits are not checked.
+        self.assertEqual(latency_budget.iterations, 4)
+        self.assertEqual(latency_budget.p50_ms, 500)
+        self.assertIsNone(latency_budget.p95_ms)
+        self.assertTrue(met_latency_budget_verdict)
+        self.assertEqual(met_latency_budget_verdict.violation_list, [])
+
+        # 2.0 Assert that every missed limit and unsuccessful response is a violation,
+        # and that the verdict's message holds them with the latency distribution.
+        self.assertFalse(missed_latency_budget_verdict)
+        self.assertEqual(
+            missed_latency_budget_verdict.violation_list,
+            [
+                "p95_ms 400.0 exceeds the budget of 300",
+                "min_throughput_rps 2.00 is below the budget of 3",
+                "1 of 4 responses were unsuccessful",
+            ],
+        )
+        self.assertIn("Latency budget missed for UserProfile", str(missed_latency_budget_verdict))
+        self.assertIn("'p95_ms': 400.0", str(missed_latency_budget_verdict))
+        return None
+
+    def test_raised_requests_kept(self):
+        call_count_list = []
+
+        def request_function():
+            call_count_list.append(1)
+            if len(call_count_list) % 2 == 0:
+                raise ConnectionError("The connection was reset.")
+            return _FakeHttpResponse(200)
+
+        latency_budget_verdict = HttpResponseValidator.validate_response_latency(
+            "UserProfile", request_function, LatencyBudget(iterations=10, concurrency=2)
+        )
+        latency_distribution = latency_budget_verdict.latency_distribution
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the calls which raised an error were kept as unsuccessful
+        # samples, rather than ending the measurement.
+        self.assertEqual(latency_distribution.sample_count(), 10)
+        self.assertEqual(latency_distribution.unsuccessful_response_count(), 5)
+        self.assertEqual(len(latency_distribution.request_error_list()), 5)
+
+        # 2.0 Assert that the errors missed the budget, and are named in its message.
+        self.assertFalse(latency_budget_verdict)
+        self.assertIn(
+            "5 requests raised an error, the first: ConnectionError('The connection was reset.')",
+            latency_budget_verdict.violation_list,
+        )
+        return None
+
+    def test_token_and_queueing_not_timed(self):
+        _stand_in_server.add_access_token_route(delay_seconds=_TOKEN_ISSUE_DELAY_SECONDS)
+        self.addCleanup(_stand_in_server.add_access_token_route)
+        # The helpers send one request at a time, so concurrent calls queue for it.
+        api_helper_util = self._stand_in_api_helper_util()
+        wall_clock_api_helper_util = self._stand_in_api_helper_util()
+        latency_distribution = HttpResponseValidator.measure_response_latency(
+            lambda: api_helper_util.make_get_request("UserProfile", coalesce=False),
+            iteration_count=8,
+            concurrency=4,
+            api_helper_util=api_helper_util,
+        )
+        wall_clock_latency_distribution = HttpResponseValidator.measure_response_latency(
+            lambda: wall_clock_api_helper_util.make_get_request("UserProfile", coalesce=False),
+            iteration_count=8,
+            concurrency=4,
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that, given the helper, the calls were timed without the token's
+        # issuance or the time they queued for the concurrency limit.
+        self.assertEqual(latency_distribution.unsuccessful_response_count(), 0)
+        self.assertGreaterEqual(
+            latency_distribution.percentile_ms(0), _RESPONSE_DELAY_SECONDS * 1000
+        )
+        self.assertLess(latency_distribution.max_ms(), _RESPONSE_DELAY_SECONDS * 2.5 * 1000)
+
+        # 2.0 Assert that, timed by the wall clock, the slowest call took the token's
+        # issuance and queued behind other calls.
+        self.assertGreaterEqual(
+            wall_clock_latency_distribution.max_ms(),
+            (_TOKEN_ISSUE_DELAY_SECONDS + 2 * _RESPONSE_DELAY_SECONDS) * 1000,
+        )
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helpers for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
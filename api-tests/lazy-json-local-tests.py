@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+import json
+import time
+import unittest
+
+from apiunittestcore import HttpResponseValidator
+import common.lazyjson
+import common.profiling
+import common.utils
+from common.lazyjson import LazyJsonArray
+from common.lazyjson import LazyJsonError
+from common.lazyjson import LazyJsonObject
+from common.lazyjson import lazy_json_view
+from common.lazyjson import lazy_response_json
+from common.lazyjson import to_python
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.synthetic import SyntheticPayload
+from common.synthetic import SyntheticPayloadGenerator
+
+MODULE_NAME = "lazy-json-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant.
+_stand_in_server = None
+
+_QUERY_COUNT = 20000
+_EDGE_CASE_JSON_TEXTS = [
+    '{"a": "x\\"y", "b": [1, 2.5e3, -3, true, false, null, {"c": []}], "d": {}, "e": "\\u00e9"}',
+    ' [ 1 , [ ] , { } , "]}" ] ',
+    '{"a": {"b": [{"c": "]}"}]}, "z": 1}',
+    "[]",
+    '"text"',
+    "12",
+]
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_route(
+        "GET",
+        "/api/v2/Queries",
+        SyntheticPayloadGenerator().stand_in_response_function(
+            SyntheticPayload.QUERIES, _QUERY_COUNT
+        ),
+    )
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class LazyJsonFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+
+    def _assert_views_match_json(self, use_simdjson):
+        for json_text in _EDGE_CASE_JSON_TEXTS:
+            json_view = lazy_json_view(json_text, use_simdjson=use_simdjson)
+            self.assertEqual(to_python(json_view), json.loads(json_text), msg=json_text)
+        raw_json = b"".join(
+            SyntheticPayloadGenerator().iter_chunks(SyntheticPayload.QUERIES, 1000)
+        )
+        json_view = lazy_json_view(raw_json, use_simdjson=use_simdjson)
+        query_list = json.loads(raw_json)["data"]
+        self.assertEqual(len(json_view["data"]), len(query_list))
+        self.assertEqual(json_view["data"][-1]["queryId"], query_list[-1]["queryId"])
+        self.assertEqual(
+            [query["queryText"] for query in json_view["data"]],
+            [query_map["queryText"] for query_map in query_list],
+        )
+        self.assertEqual(to_python(json_view), {"data": query_list})
+
+    def test_pure_python_views_match_json(self):
+        # 1.0 Assert that the pure Python views read the same values as json.loads.
+        self._assert_views_match_json(use_simdjson=False)
+        json_view = lazy_json_view(_EDGE_CASE_JSON_TEXTS[0], use_simdjson=False)
+        self.assertIsInstance(json_view, LazyJsonObject)
+        self.assertIsInstance(json_view["b"], LazyJsonArray)
+        self.assertEqual(list(json_view), ["a", "b", "d", "e"])
+        self.assertEqual(json_view["b"][1:3], [2500.0, -3])
+        self.assertIsNone(json_view.get("missing"))
+
+        # 2.0 Assert that malformed JSON is reported when it is read.
+        with self.assertRaises(LazyJsonError):
+            lazy_json_view(" ", use_simdjson=False)
+        with self.assertRaises(LazyJsonError):
+            len(lazy_json_view('["open', use_simdjson=False))
+        return None
+
+    @unittest.skipIf(common.lazyjson.simdjson == None, "pysimdjson is not installed")
+    def test_simdjson_views_match_json(self):
+        # 1.0 Assert that the simdjson views read the same values as json.loads.
+        self._assert_views_match_json(use_simdjson=True)
+        return None
+
+    def test_reading_one_record_does_not_decode_the_payload(self):
+        raw_json = b"".join(
+            SyntheticPayloadGenerator().iter_chunks(SyntheticPayload.QUERIES, _QUERY_COUNT)
+        )
+        decode_start_time = time.perf_counter()
+        first_query_id = json.loads(raw_json)["data"][0]["queryId"]
+        decode_duration_seconds = time.perf_counter() - decode_start_time
+
+        lazy_start_time = time.perf_counter()
+        json_view = lazy_json_view(raw_json, use_simdjson=False)
+        lazy_query_id = json_view["data"][0]["queryId"]
+        lazy_duration_seconds = time.perf_counter() - lazy_start_time
+
+        # 1.0 Assert that the first record was read many times faster than the payload
+        # is decoded, since none of the other records was touched.
+        self.assertEqual(lazy_query_id, first_query_id)
+        self.assertLess(lazy_duration_seconds * 10, decode_duration_seconds)
+        return None
+
+    def test_lazy_response_json(self):
+        api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        try:
+            http_response = api_helper_util.make_get_request("Queries")
+        finally:
+            api_helper_util.close()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a successful response was returned.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+
+        # 2.0 Assert that the lazy view reads the queryId of every query.
+        query_id_list = [query["queryId"] for query in lazy_response_json(http_response)["data"]]
+        self.assertEqual(
+            query_id_list, [query_map["queryId"] for query_map in http_response.json()["data"]]
+        )
+        self.assertEqual(len(query_id_list), _QUERY_COUNT)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.lql import LqlPreValidator
+from common.lql import LqlValidationMode
+from common.lql import validate_lql_query_text
+
+MODULE_NAME = "lql-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+_VALID_QUERY_TEXT = """LW_CUSTOM_DISTINCT_DNS {
+    source {
+        LW_HA_DNS_REQUESTS
+    }
+    return distinct {HOSTNAME}
+}"""
+_INVALID_QUERY_TEXT = """LW_CUSTOM_BROKEN_DNS {
+    source {
+        LW_HA_DNS_REQUESTS
+    }
+    return distinct {HOSTNAME
+}"""
+
+
+class _FakeHttpResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class LqlFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+
+    def test_valid_query_structures(self):
+        valid_query_text_list = [
+            _VALID_QUERY_TEXT,
+            # A query without a name, starting with the '{' of its body.
+            "{ source { CloudTrailRawEvents } return { EVENT_NAME } }",
+            # A query with parameters, comments and a filter section.
+            """LW_CUSTOM_FILTERED (StartTimeRange := '-1d') {
+                // The DNS requests of one host.
+                source { LW_HA_DNS_REQUESTS d }
+                filter { d.HOSTNAME = 'stand-in' /* exact */ and d.PORT <> 53 }
+                return { d.HOSTNAME, d.PORT }
+            }""",
+            # Operators and JSON path characters the structure checks do not interpret.
+            """LW_CUSTOM_OPERATORS {
+                source { CloudTrailRawEvents e }
+                filter { !(e.ERROR_CODE = 'x') && e.EVENT:userIdentity?.arn <> '' | e.A ^ ~e.B }
+                return { e.EVENT_NAME, e.EVENT:tags[@name = '#owner'] # @id }
+            }""",
+        ]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every structurally valid query text was accepted.
+        for query_text in valid_query_text_list:
+            self.assertIsNone(validate_lql_query_text(query_text), msg=query_text)
+        return None
+
+    def test_invalid_query_structures(self):
+        invalid_query_expectation_list = [
+            ("", "Empty query text", 1, 1),
+            (None, "Empty query text", 1, 1),
+            ("Q { source { A } return { B } ", "Unclosed '{' of the query body", 1, 1),
+            (_INVALID_QUERY_TEXT, "Unclosed '{' of the query body", 1, 1),
+            ("Q { source { A ) } return { B } }", "Mismatched ')', expected '}'", 1, 16),
+            ("Q { source { A } }", "The query has no return section", 1, 18),
+            ("Q { return { B } }", "The query must start with a source section", 1, 5),
+            ("Q { source { A } source { A } return { B } }", "Duplicate source section", 1, 18),
+            ("Q { source { A } return { B } filter { C } }", "The return section must be", 1, 31),
+            ("Q { source { } return { B } }", "Empty source section", 1, 12),
+            ("Q { source { A } return { B } } Q", "Unexpected 'Q' after the query body", 1, 33),
+            ("Q { source { A } select { B } }", "Expected a source, filter or return", 1, 18),
+            ("Q { source { 'A } return { B } }", "Unterminated string literal", 1, 14),
+            ("Q { source { A /* } return { B } }", "Unterminated comment", 1, 16),
+            ("} source { A }", "Expected a query name or '{'", 1, 1),
+        ]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every structurally invalid query text was rejected at the line
+        # and column of its first error.
+        for query_text, message, line_number, column_number in invalid_query_expectation_list:
+            lql_syntax_error = validate_lql_query_text(query_text)
+            self.assertIsNotNone(lql_syntax_error, msg=repr(query_text))
+            self.assertIn(message, lql_syntax_error.message, msg=repr(query_text))
+            self.assertEqual(
+                (lql_syntax_error.line_number, lql_syntax_error.column_number),
+                (line_number, column_number),
+                msg=repr(query_text),
+            )
+        return None
+
+    def test_pre_validator_modes(self):
+        sent_query_text_list = []
+
+        def server_validation_function(query_text):
+            # A server which rejects only the invalid query text.
+            sent_query_text_list.append(query_text)
+            return _FakeHttpResponse(400 if query_text == _INVALID_QUERY_TEXT else 200)
+
+        lql_pre_validator_map = {
+            validation_mode: LqlPreValidator(validation_mode)
+            for validation_mode in [
+                LqlValidationMode.LOCAL_FIRST,
+                LqlValidationMode.COMPARE,
+                LqlValidationMode.SERVER_ONLY,
+            ]
+        }
+        validation_result_map = {
+            validation_mode: [
+                lql_pre_validator.validate(query_text, server_validation_function)
+                for query_text in [_VALID_QUERY_TEXT, _INVALID_QUERY_TEXT]
+            ]
+            for validation_mode, lql_pre_validator in lql_pre_validator_map.items()
+        }
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the local first mode rejected the invalid query text without
+        # sending it.
+        local_first_result_list = validation_result_map[LqlValidationMode.LOCAL_FIRST]
+        self.assertIsNone(local_first_result_list[0][0])
+        self.assertEqual(local_first_result_list[0][1].status_code, 200)
+        self.assertIsNotNone(local_first_result_list[1][0])
+        self.assertIsNone(local_first_result_list[1][1])
+        self.assertEqual(
+            lql_pre_validator_map[LqlValidationMode.LOCAL_FIRST].statistics()[
+                "local_rejection_count"
+            ],
+            1,
+        )
+
+        # 2.0 Assert that the compare and server only modes sent every query text, and
+        # that only the server only mode left the local parser out.
+        self.assertEqual(len(sent_query_text_list), 5)
+        self.assertIsNotNone(validation_result_map[LqlValidationMode.COMPARE][1][0])
+        self.assertIsNone(validation_result_map[LqlValidationMode.SERVER_ONLY][1][0])
+        self.assertEqual(
+            validation_result_map[LqlValidationMode.SERVER_ONLY][1][1].status_code, 400
+        )
+
+        # 3.0 Assert that agreeing verdicts were not recorded as disagreements.
+        self.assertEqual(lql_pre_validator_map[LqlValidationMode.COMPARE].disagreements(), [])
+        return None
+
+    def test_verdict_disagreements(self):
+        # A server which accepts every query text, and one which rejects every one.
+        lql_pre_validator = LqlPreValidator(LqlValidationMode.COMPARE)
+        lql_pre_validator.validate(_INVALID_QUERY_TEXT, lambda query_text: _FakeHttpResponse(200))
+        lql_pre_validator.validate(_VALID_QUERY_TEXT, lambda query_text: _FakeHttpResponse(400))
+        # Other status codes say nothing about the query text.
+        lql_pre_validator.validate(_VALID_QUERY_TEXT, lambda query_text: _FakeHttpResponse(500))
+        lql_verdict_disagreements = lql_pre_validator.disagreements()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the parser being looser or stricter than the server was
+        # recorded, with both verdicts.
+        self.assertEqual(len(lql_verdict_disagreements), 2)
+        self.assertIsNotNone(lql_verdict_disagreements[0].local_syntax_error)
+        self.assertEqual(lql_verdict_disagreements[0].http_status_code, 200)
+        self.assertIsNone(lql_verdict_disagreements[1].local_syntax_error)
+        self.assertIn("local verdict: valid, server status: 400", str(lql_verdict_disagreements[1]))
+        self.assertEqual(lql_pre_validator.statistics()["disagreement_count"], 2)
+        self.assertEqual(lql_pre_validator.statistics()["server_request_count"], 3)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests do not make API requests.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
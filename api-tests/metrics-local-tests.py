@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+
+import common.profiling
+import common.utils
+from common.metrics import Metric
+from common.metrics import MetricsExporter
+from common.metrics import MetricsRecorder
+from common.metrics import OPENMETRICS_CONTENT_TYPE
+from common.metrics import PROMETHEUS_TEXT_CONTENT_TYPE
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "metrics-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant. Its
+# UserProfile route answers 200, and its Alerts route 404.
+_stand_in_server = None
+
+
+def _record_worker_metrics(metrics_directory_uri, worker_name, request_count):
+    # Runs in a worker process, which publishes its own metrics file.
+    metrics_recorder = MetricsRecorder(
+        worker_name=worker_name, metrics_directory_uri=metrics_directory_uri
+    )
+    for _ in range(request_count):
+        metrics_recorder.increment(Metric.REQUESTS, {"endpoint": "Alerts", "status_code": 200})
+        metrics_recorder.observe(Metric.REQUEST_LATENCY_SECONDS, 0.2, {"endpoint": "Alerts"})
+    metrics_recorder.add_sample_function(
+        lambda: [("gauge", Metric.IN_FLIGHT_REQUESTS, {"worker": worker_name}, request_count)]
+    )
+    metrics_recorder.publish()
+
+
+def _sample_line_map(exposition_text):
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in exposition_text.splitlines()
+        if line and not line.startswith("#")
+    }
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_route(
+        "GET",
+        "/api/v2/UserProfile",
+        lambda stand_in_request: StandInResponse(json_data={"data": [{"username": "stand-in"}]}),
+    )
+    _stand_in_server.add_route(
+        "GET",
+        "/api/v2/Alerts",
+        lambda stand_in_request: StandInResponse(status_code=404, json_data={"message": "None"}),
+    )
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class MetricsFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        self._metrics_directory_uri = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self._api_helper_util.close()
+        shutil.rmtree(self._metrics_directory_uri, ignore_errors=True)
+
+    def test_requests_are_exposed(self):
+        metrics_recorder = MetricsRecorder(worker_name="main").attach(
+            self._api_helper_util, "stand-in"
+        )
+        for _ in range(3):
+            self._api_helper_util.make_get_request("UserProfile", coalesce=False)
+        self._api_helper_util.make_get_request("Alerts", coalesce=False)
+        metrics_exporter = MetricsExporter(recorder_list=[metrics_recorder]).serve()
+        try:
+            http_response = requests.get(
+                metrics_exporter.base_url() + "/metrics",
+                headers={"Accept": "application/openmetrics-text; version=1.0.0"},
+            )
+            prometheus_http_response = requests.get(metrics_exporter.base_url() + "/metrics")
+        finally:
+            metrics_exporter.stop()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that OpenMetrics was served to the scraper accepting it, ending
+        # with its EOF marker.
+        self.assertEqual(http_response.status_code, 200)
+        self.assertEqual(http_response.headers["Content-Type"], OPENMETRICS_CONTENT_TYPE)
+        self.assertTrue(http_response.text.endswith("# EOF\n"))
+        self.assertIn("# TYPE lacework_api_test_requests counter", http_response.text)
+
+        # 2.0 Assert that the requests were counted by endpoint and status code, and
+        # their latencies fell in the histogram.
+        sample_line_map = _sample_line_map(http_response.text)
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_requests_total{endpoint="UserProfile",status_code="200",'
+                'tenant="stand-in"}'
+            ],
+            3,
+        )
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_requests_total{endpoint="Alerts",status_code="404",'
+                'tenant="stand-in"}'
+            ],
+            1,
+        )
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_request_latency_seconds_count{endpoint="UserProfile",'
+                'tenant="stand-in"}'
+            ],
+            3,
+        )
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_request_latency_seconds_bucket{endpoint="UserProfile",'
+                'tenant="stand-in",le="+Inf"}'
+            ],
+            3,
+        )
+
+        # 3.0 Assert that the helper's in-flight requests, concurrency limit and
+        # issued tokens were sampled.
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_in_flight_requests{tenant="stand-in",worker="main"}'
+            ],
+            0,
+        )
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_concurrency_limit{tenant="stand-in",worker="main"}'
+            ],
+            self._api_helper_util.concurrency_limiter().current_limit(),
+        )
+        self.assertEqual(
+            sample_line_map['lacework_api_test_access_tokens_issued_total{tenant="stand-in"}'],
+            self._api_helper_util.access_token_issue_count(),
+        )
+
+        # 4.0 Assert that other scrapers were served the Prometheus text format.
+        self.assertEqual(
+            prometheus_http_response.headers["Content-Type"], PROMETHEUS_TEXT_CONTENT_TYPE
+        )
+        self.assertIn(
+            "# TYPE lacework_api_test_requests_total counter", prometheus_http_response.text
+        )
+        self.assertNotIn("# EOF", prometheus_http_response.text)
+        return None
+
+    def test_threads_record_without_losing_counts(self):
+        metrics_recorder = MetricsRecorder()
+
+        def record_requests(_):
+            for _ in range(1000):
+                metrics_recorder.increment(Metric.REQUESTS, {"endpoint": "Alerts"})
+                metrics_recorder.observe(
+                    Metric.REQUEST_LATENCY_SECONDS, 0.001, {"endpoint": "Alerts"}
+                )
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(record_requests, range(16)))
+        sample_line_map = _sample_line_map(
+            MetricsExporter(recorder_list=[metrics_recorder]).exposition_text()
+        )
+
+        # 1.0 Assert that every thread's counts were summed.
+        self.assertEqual(
+            sample_line_map['lacework_api_test_requests_total{endpoint="Alerts"}'], 16000
+        )
+        self.assertEqual(
+            sample_line_map['lacework_api_test_request_latency_seconds_count{endpoint="Alerts"}'],
+            16000,
+        )
+        return None
+
+    def test_worker_processes_are_merged(self):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            list(
+                executor.map(
+                    _record_worker_metrics,
+                    [self._metrics_directory_uri] * 2,
+                    ["worker-1", "worker-2"],
+                    [5, 7],
+                )
+            )
+        textfile_uri = os.path.join(self._metrics_directory_uri, "run.prom")
+        metrics_exporter = MetricsExporter(self._metrics_directory_uri).start_textfile_writer(
+            textfile_uri, interval_seconds=0.05
+        )
+        metrics_exporter.stop()
+        with open(textfile_uri, "r") as textfile:
+            exposition_text = textfile.read()
+        sample_line_map = _sample_line_map(exposition_text)
+
+        # 1.0 Assert that the counters and histograms of the workers were summed.
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_requests_total{endpoint="Alerts",status_code="200"}'
+            ],
+            12,
+        )
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_request_latency_seconds_bucket{endpoint="Alerts",le="0.25"}'
+            ],
+            12,
+        )
+        self.assertEqual(
+            sample_line_map[
+                'lacework_api_test_request_latency_seconds_bucket{endpoint="Alerts",le="0.1"}'
+            ],
+            0,
+        )
+
+        # 2.0 Assert that the gauges were kept per worker.
+        self.assertEqual(
+            sample_line_map['lacework_api_test_in_flight_requests{worker="worker-1"}'], 5
+        )
+        self.assertEqual(
+            sample_line_map['lacework_api_test_in_flight_requests{worker="worker-2"}'], 7
+        )
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+import argparse
+import io
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.profiling import ProfilerMode
+from common.profiling import ProfilingTextTestRunner
+from common.profiling import TestProfiler
+from common.profiling import add_profile_arguments
+from common.profiling import profile_file_name
+
+MODULE_NAME = "profiling-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+_BUSY_SECONDS = 0.2
+_SAMPLING_INTERVAL_SECONDS = 0.002
+
+
+def _busy_test_function():
+    busy_end_time = time.monotonic() + _BUSY_SECONDS
+    while time.monotonic() < busy_end_time:
+        pass
+
+
+def _busy_worker_function():
+    busy_end_time = time.monotonic() + _BUSY_SECONDS
+    while time.monotonic() < busy_end_time:
+        pass
+
+
+def _idle_thread_function(stop_event):
+    stop_event.wait(10)
+
+
+class _ProfiledTests(unittest.TestCase):
+    # The tests run under the profiling test runner.
+    def test_profiled(self):
+        _busy_test_function()
+
+
+class ProfilingFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._profile_directory_uri = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._profile_directory_uri, True)
+
+    def _read_profile(self, test_id):
+        # The collapsed stacks and pstats of a profiled test.
+        profile_file_uri = os.path.join(self._profile_directory_uri, profile_file_name(test_id))
+        with open(profile_file_uri + ".collapsed") as collapsed_file:
+            collapsed_stack_text = collapsed_file.read()
+        return collapsed_stack_text, pstats.Stats(profile_file_uri + ".pstats")
+
+    def test_sampler_leaves_out_idle_threads(self):
+        # A thread of the test module, started before the test and idle during it.
+        idle_stop_event = threading.Event()
+        idle_thread = threading.Thread(target=_idle_thread_function, args=(idle_stop_event,))
+        idle_thread.start()
+        self.addCleanup(idle_thread.join)
+        self.addCleanup(idle_stop_event.set)
+        test_profiler = TestProfiler(
+            output_directory_uri=self._profile_directory_uri,
+            profiler_mode=ProfilerMode.SAMPLING,
+            sampling_interval_seconds=_SAMPLING_INTERVAL_SECONDS,
+        )
+        test_profiler.start("sampled.test")
+        worker_thread = threading.Thread(target=_busy_worker_function)
+        worker_thread.start()
+        _busy_test_function()
+        worker_thread.join()
+        test_profiler.stop()
+        collapsed_stack_text, profile_stats = self._read_profile("sampled.test")
+        profiled_function_name_set = set(
+            function_name for _, _, function_name in profile_stats.stats
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the test's thread and the worker thread it started were
+        # sampled.
+        self.assertIn("_busy_test_function", collapsed_stack_text)
+        self.assertIn("_busy_worker_function", collapsed_stack_text)
+        self.assertIn("_busy_worker_function", profiled_function_name_set)
+
+        # 2.0 Assert that the thread running before the test was left out.
+        self.assertNotIn("_idle_thread_function", collapsed_stack_text)
+        self.assertNotIn("_idle_thread_function", profiled_function_name_set)
+        return None
+
+    def test_deterministic_profile(self):
+        test_profiler = TestProfiler(
+            output_directory_uri=self._profile_directory_uri,
+            profiler_mode=ProfilerMode.DETERMINISTIC,
+        )
+        test_profiler.start("deterministic.test")
+        _busy_test_function()
+        test_profiler.stop()
+        # Stopping a profiler which was not started does nothing.
+        test_profiler.stop()
+        collapsed_stack_text, profile_stats = self._read_profile("deterministic.test")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the traced test function was written to both profile files.
+        self.assertIn("_busy_test_function", collapsed_stack_text)
+        self.assertIn(
+            "_busy_test_function",
+            [function_name for _, _, function_name in profile_stats.stats],
+        )
+        return None
+
+    def test_profiling_test_runner(self):
+        test_profiler = TestProfiler(
+            output_directory_uri=self._profile_directory_uri,
+            sampling_interval_seconds=_SAMPLING_INTERVAL_SECONDS,
+        )
+        test_suite = unittest.defaultTestLoader.loadTestsFromTestCase(_ProfiledTests)
+        test_result = ProfilingTextTestRunner(test_profiler, stream=io.StringIO()).run(
+            test_suite
+        )
+        collapsed_stack_text, _ = self._read_profile(
+            "{}._ProfiledTests.test_profiled".format(__name__)
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the test run by the profiling runner was profiled into files
+        # named by its test id.
+        self.assertTrue(test_result.wasSuccessful())
+        self.assertIn("_busy_test_function", collapsed_stack_text)
+        return None
+
+    def test_profile_arguments(self):
+        # The runner's command line: profile options followed by test module names.
+        argument_parser = argparse.ArgumentParser()
+        argument_parser.add_argument("test_modules", nargs="*")
+        add_profile_arguments(argument_parser)
+        profiled_arguments = argument_parser.parse_args(["--profile", "queries-tests"])
+        deterministic_arguments = argument_parser.parse_args(
+            ["--profile", "--profile-mode", "deterministic", "queries-tests"]
+        )
+        unprofiled_arguments = argument_parser.parse_args(["queries-tests"])
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that --profile did not take the test module following it as its
+        # value, and selected the sampling profiler.
+        self.assertTrue(profiled_arguments.profile)
+        self.assertEqual(profiled_arguments.profile_mode, ProfilerMode.SAMPLING)
+        self.assertEqual(profiled_arguments.test_modules, ["queries-tests"])
+
+        # 2.0 Assert that the profiler is picked by --profile-mode, and that tests are
+        # not profiled without --profile.
+        self.assertEqual(deterministic_arguments.profile_mode, ProfilerMode.DETERMINISTIC)
+        self.assertEqual(deterministic_arguments.test_modules, ["queries-tests"])
+        self.assertFalse(unprofiled_arguments.profile)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests do not make API requests.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
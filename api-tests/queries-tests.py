@@ -1,58 +1,86 @@
 #!/usr/bin/python3
+from concurrent.futures import ThreadPoolExecutor
 import json
-import requests
 import time
 import unittest
 
 from apiunittestcore import HttpResponseValidator
 from apiunittestcore import JsonDataValidator
+from apiunittestcore import LatencyBudget
+import common.profiling
 import common.utils
+from common.lazyjson import lazy_response_json
+from common.lql import LqlPreValidator
+from common.lql import LqlValidationMode
+from common.lql import validate_lql_query_text
+from common.models import Query
+from common.queryexport import ExportStatus
+from common.queryexport import QueryResultExport
+from common.scheduling import shard_items
+from common.snapshots import assert_no_response_drift
+from common.timeouts import propagate_deadline
 from common.utils import ApiHelperUtil
 
 MODULE_NAME = "queries-tests"
 _TEST_START_TIMESTAMP = time.time()
 
 _api_helper_util = None
+_lql_pre_validator = None
+# The runner splits these tests into shards, one per worker, and sets _test_shard to
+# the shard to run.
+SHARDABLE_TESTS = ["test_validate_all_account_queries"]
+_test_shard = None
 
 class _UtilFunctions():
     @staticmethod
     def make_queries_request():
-        api_request_url = _api_helper_util.get_api_endpoint("Queries")
-        bearer_access_token = _api_helper_util.create_new_bearer_access_token()
-        http_headers = _api_helper_util.http_authentication_header(bearer_access_token)
-
-        return requests.get(api_request_url, headers=http_headers)
+        return _api_helper_util.make_get_request("Queries")
     
     def make_query_text_validation_request(query_text):
         http_response = None
         if isinstance(query_text, str):
-            # Create the API Request URL
-            api_request_url = _api_helper_util.get_api_endpoint("Queries/validate")
-            bearer_access_token = _api_helper_util.create_new_bearer_access_token()
-            http_headers = _api_helper_util.http_authentication_header(bearer_access_token)
-            http_headers.update(_api_helper_util.http_content_type_header("application/json"))
             post_data_map = {
                 "queryText": query_text,
             }
-            http_response = requests.post(api_request_url, headers=http_headers, json=post_data_map)
+            http_response = _api_helper_util.make_post_request(
+                "Queries/validate", json_data=post_data_map
+            )
         return http_response
+
+    def validate_query_text(query_text):
+        # Validates the query text locally and, depending on the LQL validation mode,
+        # on the server. Returns the local syntax error, or None, and the
+        # Queries/validate response, or None when the query was not sent.
+        return _lql_pre_validator.validate(
+            query_text, _UtilFunctions.make_query_text_validation_request
+        )
+
+    def assert_lql_verdicts_agree(test_case):
+        # In the compare validation mode, assert that the local parser and the server
+        # agreed on every query.
+        lql_verdict_disagreements = _lql_pre_validator.disagreements()
+        test_case.assertEqual(
+            lql_verdict_disagreements,
+            [],
+            msg="\n".join(str(disagreement) for disagreement in lql_verdict_disagreements),
+        )
+        return None
    
     def make_detailed_query_info_request(query_id):
         http_response = None
         if isinstance(query_id, str):
             query_endpoint = "Queries/{}".format(query_id)
-            # Create the API Request URL
-            api_request_url = _api_helper_util.get_api_endpoint(query_endpoint)
-            bearer_access_token = _api_helper_util.create_new_bearer_access_token()
-            http_headers = _api_helper_util.http_authentication_header(bearer_access_token)
-            http_response = requests.get(api_request_url, headers=http_headers)
+            http_response = _api_helper_util.make_get_request(query_endpoint)
 
         return http_response
 
 class QueriesFunctionalTests(unittest.TestCase):
     def setUp(self):
+        global _lql_pre_validator
         log_message = "Performing Test ::{}".format(self._testMethodName)
         common.utils.log_info(MODULE_NAME, log_message)
+        # Every test compares the local and server verdicts of its own queries only.
+        _lql_pre_validator = LqlPreValidator(_api_helper_util.lql_validation_mode())
          
     def test_list_all_queries(self):
         http_response = _UtilFunctions.make_queries_request()  
@@ -66,6 +94,26 @@ class QueriesFunctionalTests(unittest.TestCase):
         # 200 A list of all registered LQL queries in the Lacework instance is returned.
         self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
         return None
+
+    def test_list_all_queries_latency(self):
+        # The latency budget of the endpoint is set by "latency_budgets" in the
+        # configuration file.
+        ENDPOINT_NAME = "Queries"
+        latency_budget = LatencyBudget.from_map(
+            _api_helper_util.latency_budget_map(ENDPOINT_NAME)
+        )
+        if latency_budget == None:
+            self.skipTest("No latency budget is configured for {}.".format(ENDPOINT_NAME))
+
+        # 1.0 Assert that the endpoint meets its latency budget.
+        latency_budget_verdict = HttpResponseValidator.validate_response_latency(
+            ENDPOINT_NAME,
+            lambda: _api_helper_util.make_get_request(ENDPOINT_NAME, coalesce=False),
+            latency_budget,
+            api_helper_util=_api_helper_util,
+        )
+        self.assertTrue(latency_budget_verdict, msg=str(latency_budget_verdict))
+        return None
         
     def test_validate_all_account_queries(self):
         # Get a list of all available QueryIds
@@ -73,25 +121,49 @@ class QueriesFunctionalTests(unittest.TestCase):
         available_queries = None
         self.assertTrue(HttpResponseValidator.is_successful_response(http_response))
         if HttpResponseValidator.is_successful_response(http_response):
-            available_queries = http_response.json()['data']
-            
-        for query in available_queries:
+            # Only the queryId of each query is read, so the list is decoded lazily.
+            available_queries = shard_items(lazy_response_json(http_response)['data'], _test_shard)
+
+        def validate_query(query):
             query_id = query['queryId']
             # Request the detailed query info
-            http_response = _UtilFunctions.make_detailed_query_info_request(query_id)
-            self.assertTrue(HttpResponseValidator.is_successful_response(http_response))
+            detail_http_response = _UtilFunctions.make_detailed_query_info_request(query_id)
             query_text = None
-            if HttpResponseValidator.is_successful_response(http_response):
-                query_text = http_response.json()['data']['queryText']
-            # Validate the query text
-            # Make the validation request
-            http_response = _UtilFunctions.make_query_text_validation_request(query_text)
-            # Begin assertions and validations
-           
-            # 1.0 Assert that a successful response was returned.
+            if HttpResponseValidator.is_successful_response(detail_http_response):
+                query_text = lazy_response_json(detail_http_response)['data']['queryText']
+            # Validate the query text. Only locally valid query texts are sent to the
+            # server, unless the LQL validation mode says otherwise.
+            local_syntax_error, validation_http_response = _UtilFunctions.validate_query_text(query_text)
+            return query_id, detail_http_response, local_syntax_error, validation_http_response
+
+        # The queries are validated in parallel. The helper's adaptive concurrency
+        # limit decides how many requests are in flight at once.
+        with ThreadPoolExecutor(
+            max_workers=_api_helper_util.max_request_concurrency()
+        ) as executor:
+            query_http_responses = list(
+                executor.map(propagate_deadline(validate_query), available_queries)
+            )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the local and server verdicts agree in the compare mode, before
+        # a locally invalid query text fails the test.
+        _UtilFunctions.assert_lql_verdicts_agree(self)
+
+        for query_id, detail_http_response, local_syntax_error, http_response in query_http_responses:
+            self.assertTrue(HttpResponseValidator.is_successful_response(detail_http_response))
+
+            # 2.0 Assert that the query text is locally valid. A locally invalid query
+            # text fails here without a round trip to the server.
+            self.assertIsNone(
+                local_syntax_error, msg="{}: {}".format(query_id, local_syntax_error)
+            )
+
+            # 3.0 Assert that a successful response was returned.
             self.assertTrue(HttpResponseValidator.is_successful_response(http_response))
 
-            # 2.0 Assert that the expected response was returned as defined by the documentation:
+            # 4.0 Assert that the expected response was returned as defined by the documentation:
             # https://yourlacework.lacework.net/api/v2/docs#tag/Queries
             # 200 A list of all registered LQL queries in the Lacework instance is returned.
             self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
@@ -116,23 +188,10 @@ class QueriesFunctionalTests(unittest.TestCase):
         # 3.0 Assert that the expected reponse schema is present.
         # *Note*: Only Lacework global CloudTrail queries require an evaluatorId. At present,
         #         no other query is expected to contain an evaluatorId in the JSON response.
+        # The Query response model's field table holds every data name, including the
+        # evaluatorId.
         DATA_JSON_NAME = "data"
-        EVALUATOR_ID_JSON_DATA_NAME = "evaluatorId"
-        QUERY_ID_JSON_DATA_NAME = "queryId"
-        QUERY_TEXT_JSON_DATA_NAME = "queryText"
-        OWNER_JSON_DATA_NAME = "owner"
-        LAST_UPDATE_TIME_JSON_DATA_NAME = "lastUpdateTime"
-        LAST_UPDATE_USER_JSON_DATA_NAME = "lastUpdateUser"
-        RESULTS_SCHEMA_JSON_DATA_NAME = "resultSchema"
-        EXPECTED_RESPONSE_JSON_DATA_NAMES = [
-            EVALUATOR_ID_JSON_DATA_NAME,
-            QUERY_ID_JSON_DATA_NAME,
-            QUERY_TEXT_JSON_DATA_NAME,
-            OWNER_JSON_DATA_NAME,
-            LAST_UPDATE_TIME_JSON_DATA_NAME,
-            LAST_UPDATE_USER_JSON_DATA_NAME,
-            RESULTS_SCHEMA_JSON_DATA_NAME
-        ]
+        EXPECTED_RESPONSE_JSON_DATA_NAMES = list(Query.FIELD_NAMES)
         
         http_response_json_map = http_response.json()
         query_detail_map = http_response_json_map.get(DATA_JSON_NAME)
@@ -145,6 +204,12 @@ class QueriesFunctionalTests(unittest.TestCase):
                 match_set_explicitly=True,
             )
         )
+
+        # 4.0 Assert that the response structure has not drifted from the snapshot
+        # baseline, when "response_snapshot_file" is configured.
+        assert_no_response_drift(
+            self, _api_helper_util, "Queries/{queryId}", http_response_json_map
+        )
         return None
         
     def test_validate_query_without_evaluator_id(self):
@@ -160,11 +225,13 @@ class QueriesFunctionalTests(unittest.TestCase):
         print(expected_valid_query_str)
         
         # Make the validation request
-        http_response = _UtilFunctions.make_query_text_validation_request(expected_valid_query_str)
+        local_syntax_error, http_response = _UtilFunctions.validate_query_text(expected_valid_query_str)
               
         # Begin assertions and validations
 
-        # 1.0 Assert that a successful response was returned.
+        # 1.0 Assert that the query text is locally valid and a successful response was returned.
+        _UtilFunctions.assert_lql_verdicts_agree(self)
+        self.assertIsNone(local_syntax_error, msg=str(local_syntax_error))
         self.assertTrue(HttpResponseValidator.is_successful_response(http_response))
 
         # 2.0 Assert that the expected response was returned as defined by the documentation:
@@ -177,21 +244,9 @@ class QueriesFunctionalTests(unittest.TestCase):
         #         no other query is expected to contain an evaluatorId in the JSON response.
         #         Hence, in this unit test, no evaluatorId data name is presented validating
         #         the JSON response.
+        # The Query response model's required data names leave out the evaluatorId.
         DATA_JSON_NAME = "data"
-        QUERY_ID_JSON_DATA_NAME = "queryId"
-        QUERY_TEXT_JSON_DATA_NAME = "queryText"
-        OWNER_JSON_DATA_NAME = "owner"
-        LAST_UPDATE_TIME_JSON_DATA_NAME = "lastUpdateTime"
-        LAST_UPDATE_USER_JSON_DATA_NAME = "lastUpdateUser"
-        RESULTS_SCHEMA_JSON_DATA_NAME = "resultSchema"
-        EXPECTED_RESPONSE_JSON_DATA_NAMES = [
-            QUERY_ID_JSON_DATA_NAME,
-            QUERY_TEXT_JSON_DATA_NAME,
-            OWNER_JSON_DATA_NAME,
-            LAST_UPDATE_TIME_JSON_DATA_NAME,
-            LAST_UPDATE_USER_JSON_DATA_NAME,
-            RESULTS_SCHEMA_JSON_DATA_NAME
-        ]
+        EXPECTED_RESPONSE_JSON_DATA_NAMES = list(Query.REQUIRED_FIELD_NAMES)
         
         http_response_json_map = http_response.json()
         query_detail_map = http_response_json_map.get(DATA_JSON_NAME)
@@ -206,13 +261,70 @@ class QueriesFunctionalTests(unittest.TestCase):
         )
         return None
 
+    def test_validate_broken_query(self):
+        # The query's return section is missing its closing brace.
+        expected_invalid_query_str = str(
+            "LW_CUSTOM_BROKEN_DNS {\n\
+                source {\n\
+                    LW_HA_DNS_REQUESTS\n\
+                }\n\
+                return distinct {HOSTNAME\n\
+            }")
+
+        _, http_response = _UtilFunctions.validate_query_text(expected_invalid_query_str)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the query text is locally invalid, after the local and server
+        # verdicts were compared in the compare mode.
+        _UtilFunctions.assert_lql_verdicts_agree(self)
+        self.assertIsNotNone(validate_lql_query_text(expected_invalid_query_str))
+
+        # 2.0 Assert that the query text was only sent to the server when the LQL
+        # validation mode asks for it, and that the server rejected it.
+        if _lql_pre_validator.validation_mode() == LqlValidationMode.LOCAL_FIRST:
+            self.assertIsNone(http_response)
+        else:
+            self.assertFalse(HttpResponseValidator.is_successful_response(http_response))
+        return None
+
+    def test_execute_and_export_queries(self):
+        # The export is set by "query_export" in the configuration file. It executes
+        # the registered queries over its time window and writes their results to
+        # NDJSON or Parquet files.
+        query_result_export = QueryResultExport.from_map(_api_helper_util.query_export_map())
+        if query_result_export == None:
+            self.skipTest("No query export is configured.")
+        export_report_map = query_result_export.run(_api_helper_util)
+        log_message = "Exported {} rows of {} queries at {} rows/s, {} bytes/s".format(
+            export_report_map["row_count"],
+            export_report_map["exported_count"],
+            export_report_map["rows_per_second"],
+            export_report_map["bytes_per_second"],
+        )
+        common.utils.log_info(MODULE_NAME, log_message)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every query was executed and its results exported.
+        self.assertGreater(export_report_map["query_count"], 0)
+        self.assertEqual(
+            [
+                query_report_map
+                for query_report_map in export_report_map["queries"]
+                if query_report_map["status"] != ExportStatus.EXPORTED
+            ],
+            [],
+        )
+        return None
+
 if __name__ == "__main__":
     try:
         # Configure the unit test
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
@@ -0,0 +1,345 @@
+#!/usr/bin/python3
+from datetime import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import common.profiling
+import common.queryexport
+import common.utils
+from common.queryexport import ExportFormat
+from common.queryexport import ExportStatus
+from common.queryexport import QueryExportError
+from common.queryexport import QueryResultExport
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "query-export-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant. It has
+# registered queries returning _PAGE_COUNT pages of _PAGE_ROW_COUNT rows, no rows, or
+# a 400 error, _SLOW_QUERY_COUNT queries taking _SLOW_QUERY_SECONDS each, and queries
+# whose columns change from page to page.
+_stand_in_server = None
+_PAGED_QUERY_ID = "StandIn_Paged"
+_EMPTY_QUERY_ID = "StandIn_Empty"
+_BROKEN_QUERY_ID = "StandIn_Broken"
+_WIDENING_QUERY_ID = "StandIn_Widening"
+_CONFLICTING_QUERY_ID = "StandIn_Conflicting"
+# The rows of every page of the queries whose columns change.
+_PAGE_ROW_LIST_MAP = {
+    _WIDENING_QUERY_ID: [
+        [{"EVENT_ID": 0, "SCORE": 1, "REGION": None}],
+        [{"EVENT_ID": 1, "SCORE": 2.5}, {"EVENT_ID": 2, "SCORE": 3, "ACCOUNT": "stand-in"}],
+        [{"EVENT_ID": 3}],
+    ],
+    _CONFLICTING_QUERY_ID: [
+        [{"EVENT_ID": 0, "SCORE": 1}],
+        [{"EVENT_ID": 1, "SCORE": "high"}],
+    ],
+}
+_PAGE_COUNT = 3
+_PAGE_ROW_COUNT = 50
+_SLOW_QUERY_COUNT = 6
+_SLOW_QUERY_SECONDS = 0.1
+
+
+class _SlowQueries:
+    # Records the most slow queries executed at once.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight_count = 0
+        self.max_in_flight_count = 0
+
+    def __call__(self, stand_in_request):
+        with self._lock:
+            self._in_flight_count += 1
+            self.max_in_flight_count = max(self.max_in_flight_count, self._in_flight_count)
+        time.sleep(_SLOW_QUERY_SECONDS)
+        with self._lock:
+            self._in_flight_count -= 1
+        return StandInResponse(json_data={"data": [{"slow": True}]})
+
+
+_slow_queries = _SlowQueries()
+
+
+def _paged_query_row(row_index):
+    return {
+        "EVENT_ID": row_index,
+        "USERNAME": "user-{}".format(row_index),
+        "EVENT": {"source": "stand-in", "tags": ["a", "b"]},
+    }
+
+
+def _execute_paged_query(stand_in_request):
+    page_index = int(stand_in_request.query_map.get("page", ["0"])[0])
+    next_page_url = None
+    if page_index + 1 < _PAGE_COUNT:
+        next_page_url = "{}/api/v2/Queries/{}/execute?page={}".format(
+            _stand_in_server.base_url(), _PAGED_QUERY_ID, page_index + 1
+        )
+    return StandInResponse(
+        json_data={
+            "data": [
+                _paged_query_row(page_index * _PAGE_ROW_COUNT + row_index)
+                for row_index in range(_PAGE_ROW_COUNT)
+            ],
+            "paging": {
+                "rows": _PAGE_ROW_COUNT,
+                "totalRows": _PAGE_COUNT * _PAGE_ROW_COUNT,
+                "urls": {"nextPage": next_page_url},
+            },
+        }
+    )
+
+
+def _execute_page_row_list_query(stand_in_request):
+    query_id = stand_in_request.path.split("/")[-2]
+    page_index = int(stand_in_request.query_map.get("page", ["0"])[0])
+    next_page_url = None
+    if page_index + 1 < len(_PAGE_ROW_LIST_MAP[query_id]):
+        next_page_url = "{}/api/v2/Queries/{}/execute?page={}".format(
+            _stand_in_server.base_url(), query_id, page_index + 1
+        )
+    return StandInResponse(
+        json_data={
+            "data": _PAGE_ROW_LIST_MAP[query_id][page_index],
+            "paging": {"urls": {"nextPage": next_page_url}},
+        }
+    )
+
+
+def _slow_query_ids():
+    return ["StandIn_Slow_{}".format(query_index) for query_index in range(_SLOW_QUERY_COUNT)]
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_json_route(
+        "GET",
+        "/api/v2/Queries",
+        {
+            "data": [
+                {"queryId": query_id}
+                for query_id in [_PAGED_QUERY_ID, _EMPTY_QUERY_ID, _BROKEN_QUERY_ID]
+            ]
+        },
+    )
+    execute_path = "/api/v2/Queries/{}/execute"
+    for http_method in ["POST", "GET"]:
+        _stand_in_server.add_route(
+            http_method, execute_path.format(_PAGED_QUERY_ID), _execute_paged_query
+        )
+        for query_id in _PAGE_ROW_LIST_MAP:
+            _stand_in_server.add_route(
+                http_method, execute_path.format(query_id), _execute_page_row_list_query
+            )
+    _stand_in_server.add_json_route("POST", execute_path.format(_EMPTY_QUERY_ID), {"data": []})
+    _stand_in_server.add_json_route(
+        "POST",
+        execute_path.format(_BROKEN_QUERY_ID),
+        {"message": "Invalid query text"},
+        status_code=400,
+    )
+    for query_id in _slow_query_ids():
+        _stand_in_server.add_route("POST", execute_path.format(query_id), _slow_queries)
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class QueryExportFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        self._output_directory_uri = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self._api_helper_util.close()
+        shutil.rmtree(self._output_directory_uri, ignore_errors=True)
+
+    def _query_report_map(self, export_report_map, query_id):
+        return next(
+            query_report_map
+            for query_report_map in export_report_map["queries"]
+            if query_report_map["query_id"] == query_id
+        )
+
+    def test_results_are_streamed_to_ndjson(self):
+        export_report_map = QueryResultExport.from_map(
+            {"output_dir": self._output_directory_uri, "concurrency": 2, "time_window_hours": 2}
+        ).run(self._api_helper_util)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every registered query was executed, and only the broken
+        # one failed.
+        self.assertEqual(export_report_map["query_count"], 3)
+        self.assertEqual(export_report_map["exported_count"], 2)
+        self.assertEqual(export_report_map["failed_count"], 1)
+        broken_query_report_map = self._query_report_map(export_report_map, _BROKEN_QUERY_ID)
+        self.assertEqual(broken_query_report_map["status"], ExportStatus.FAILED)
+        self.assertEqual(broken_query_report_map["status_code"], 400)
+        self.assertIn("Invalid query text", broken_query_report_map["error"])
+        self.assertEqual(
+            sorted(os.listdir(self._output_directory_uri)),
+            ["{}.ndjson".format(_EMPTY_QUERY_ID), "{}.ndjson".format(_PAGED_QUERY_ID)],
+        )
+
+        # 2.0 Assert that every page of the paged query was written, a row per line.
+        paged_query_report_map = self._query_report_map(export_report_map, _PAGED_QUERY_ID)
+        self.assertEqual(paged_query_report_map["page_count"], _PAGE_COUNT)
+        self.assertEqual(paged_query_report_map["row_count"], _PAGE_COUNT * _PAGE_ROW_COUNT)
+        with open(paged_query_report_map["file"], "r") as result_file:
+            row_list = [json.loads(line) for line in result_file]
+        self.assertEqual(
+            row_list, [_paged_query_row(row_index) for row_index in range(len(row_list))]
+        )
+        self.assertEqual(len(row_list), _PAGE_COUNT * _PAGE_ROW_COUNT)
+        self.assertEqual(
+            paged_query_report_map["bytes_written"],
+            os.path.getsize(paged_query_report_map["file"]),
+        )
+
+        # 3.0 Assert that the report totals the rows and gives the throughput.
+        self.assertEqual(export_report_map["row_count"], _PAGE_COUNT * _PAGE_ROW_COUNT)
+        self.assertGreater(export_report_map["rows_per_second"], 0)
+        self.assertGreater(export_report_map["bytes_per_second"], 0)
+
+        # 4.0 Assert that the queries were executed over the time window.
+        execute_request = next(
+            stand_in_request
+            for stand_in_request in reversed(_stand_in_server.request_log())
+            if stand_in_request.http_method == "POST"
+            and stand_in_request.path.endswith("{}/execute".format(_PAGED_QUERY_ID))
+        )
+        argument_map = {
+            argument["name"]: datetime.fromisoformat(argument["value"].replace("Z", "+00:00"))
+            for argument in json.loads(execute_request.body)["arguments"]
+        }
+        self.assertEqual(
+            (argument_map["EndTimeRange"] - argument_map["StartTimeRange"]).total_seconds(),
+            2 * 3600,
+        )
+        return None
+
+    @unittest.skipIf(common.queryexport.pyarrow == None, "pyarrow is not installed.")
+    def test_results_are_exported_to_parquet(self):
+        export_report_map = QueryResultExport(
+            query_ids=[_PAGED_QUERY_ID],
+            output_dir=self._output_directory_uri,
+            format=ExportFormat.PARQUET,
+        ).run(self._api_helper_util)
+        query_report_map = export_report_map["queries"][0]
+        result_table = common.queryexport.pyarrow.parquet.read_table(query_report_map["file"])
+
+        # 1.0 Assert that every page was written as a row group of the same columns,
+        # with nested objects stored as JSON.
+        self.assertEqual(query_report_map["status"], ExportStatus.EXPORTED)
+        self.assertEqual(result_table.num_rows, _PAGE_COUNT * _PAGE_ROW_COUNT)
+        self.assertEqual(
+            common.queryexport.pyarrow.parquet.ParquetFile(
+                query_report_map["file"]
+            ).num_row_groups,
+            _PAGE_COUNT,
+        )
+        self.assertEqual(
+            json.loads(result_table.column("EVENT")[0].as_py()), _paged_query_row(0)["EVENT"]
+        )
+        return None
+
+    @unittest.skipIf(common.queryexport.pyarrow == None, "pyarrow is not installed.")
+    def test_parquet_columns_follow_every_page(self):
+        export_report_map = QueryResultExport(
+            query_ids=[_WIDENING_QUERY_ID, _CONFLICTING_QUERY_ID],
+            output_dir=self._output_directory_uri,
+            format=ExportFormat.PARQUET,
+        ).run(self._api_helper_util)
+        widening_query_report_map = self._query_report_map(export_report_map, _WIDENING_QUERY_ID)
+        conflicting_query_report_map = self._query_report_map(
+            export_report_map, _CONFLICTING_QUERY_ID
+        )
+        result_table = common.queryexport.pyarrow.parquet.read_table(
+            widening_query_report_map["file"]
+        )
+        pyarrow = common.queryexport.pyarrow
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the columns of later pages were added, null in the rows of
+        # other pages, and that integers followed by floats were widened to doubles.
+        self.assertEqual(widening_query_report_map["status"], ExportStatus.EXPORTED)
+        self.assertEqual(
+            result_table.schema,
+            pyarrow.schema(
+                [
+                    ("EVENT_ID", pyarrow.int64()),
+                    ("SCORE", pyarrow.float64()),
+                    ("REGION", pyarrow.string()),
+                    ("ACCOUNT", pyarrow.string()),
+                ]
+            ),
+        )
+        self.assertEqual(
+            result_table.to_pylist(),
+            [
+                {"EVENT_ID": 0, "SCORE": 1.0, "REGION": None, "ACCOUNT": None},
+                {"EVENT_ID": 1, "SCORE": 2.5, "REGION": None, "ACCOUNT": None},
+                {"EVENT_ID": 2, "SCORE": 3.0, "REGION": None, "ACCOUNT": "stand-in"},
+                {"EVENT_ID": 3, "SCORE": None, "REGION": None, "ACCOUNT": None},
+            ],
+        )
+        self.assertEqual(
+            pyarrow.parquet.ParquetFile(widening_query_report_map["file"]).num_row_groups, 3
+        )
+
+        # 2.0 Assert that a column of numbers and strings failed the export, leaving no
+        # file behind.
+        self.assertEqual(conflicting_query_report_map["status"], ExportStatus.FAILED)
+        self.assertIn(
+            "The column types of page 2 do not match", conflicting_query_report_map["error"]
+        )
+        self.assertEqual(
+            sorted(os.listdir(self._output_directory_uri)),
+            ["{}.parquet".format(_WIDENING_QUERY_ID)],
+        )
+        return None
+
+    def test_queries_are_exported_concurrently(self):
+        export_report_map = QueryResultExport(
+            query_ids=_slow_query_ids(), output_dir=self._output_directory_uri, concurrency=3
+        ).run(self._api_helper_util)
+
+        # 1.0 Assert that the queries were executed three at a time.
+        self.assertEqual(export_report_map["exported_count"], _SLOW_QUERY_COUNT)
+        self.assertEqual(_slow_queries.max_in_flight_count, 3)
+        self.assertLess(
+            export_report_map["duration_seconds"], _SLOW_QUERY_COUNT * _SLOW_QUERY_SECONDS
+        )
+        return None
+
+    def test_unknown_format_is_rejected(self):
+        # 1.0 Assert that an unknown export format is rejected before any query runs.
+        with self.assertRaises(QueryExportError):
+            QueryResultExport(format="csv")
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
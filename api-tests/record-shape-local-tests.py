@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+import time
+import unittest
+
+from apiunittestcore import JsonDataValidator
+from apiunittestcore import JsonRecordShapeValidator
+import common.profiling
+import common.utils
+
+MODULE_NAME = "record-shape-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+_EXPECTED_RECORD_JSON_DATA_NAMES = ["eventId", "eventType", "startTime"]
+_RECORD_COUNT = 1000
+
+
+class _CountingShapeValidator(JsonRecordShapeValidator):
+    # Counts the shapes whose data names were checked, rather than found in the cache.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checked_shape_count = 0
+
+    def _validate_shape(self, json_data_names):
+        self.checked_shape_count += 1
+        return super()._validate_shape(json_data_names)
+
+
+def _record_map(event_index, **json_data_map):
+    record_map = {
+        "eventId": "event-{}".format(event_index),
+        "eventType": "CreateUser",
+        "startTime": "2026-10-19T00:00:00Z",
+    }
+    record_map.update(json_data_map)
+    return record_map
+
+
+class RecordShapeFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+
+    def test_shape_checked_once(self):
+        record_shape_validator = _CountingShapeValidator(_EXPECTED_RECORD_JSON_DATA_NAMES)
+        record_map_list = [_record_map(event_index) for event_index in range(_RECORD_COUNT)]
+        records_valid = record_shape_validator.validate_all(record_map_list)
+        records_revalidated = record_shape_validator.validate_all(record_map_list)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that records of one shape were valid, and that the shape's data
+        # names were checked once, then found in the cache for every other record.
+        self.assertTrue(records_valid)
+        self.assertTrue(records_revalidated)
+        self.assertEqual(record_shape_validator.checked_shape_count, 1)
+        self.assertEqual(record_shape_validator.unique_shape_count(), 1)
+        return None
+
+    def test_changed_shape_checked_again(self):
+        record_shape_validator = _CountingShapeValidator(_EXPECTED_RECORD_JSON_DATA_NAMES)
+        explicit_record_shape_validator = JsonRecordShapeValidator(
+            _EXPECTED_RECORD_JSON_DATA_NAMES, match_set_explicitly=True
+        )
+        extra_name_record_map = _record_map(1, eventSource="iam")
+        reordered_record_map = dict(reversed(list(_record_map(2).items())))
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a record with another data name is a new shape that was
+        # checked rather than taken from the cache, while a record with the same data
+        # names in another order is not.
+        self.assertTrue(record_shape_validator.validate(_record_map(0)))
+        self.assertTrue(record_shape_validator.validate(extra_name_record_map))
+        self.assertTrue(record_shape_validator.validate(reordered_record_map))
+        self.assertEqual(record_shape_validator.checked_shape_count, 2)
+        self.assertEqual(record_shape_validator.unique_shape_count(), 2)
+
+        # 2.0 Assert that an extra data name fails the shape when the set must match
+        # explicitly.
+        self.assertTrue(explicit_record_shape_validator.validate(reordered_record_map))
+        self.assertFalse(explicit_record_shape_validator.validate(extra_name_record_map))
+        return None
+
+    def test_missing_required_name(self):
+        record_shape_validator = _CountingShapeValidator(_EXPECTED_RECORD_JSON_DATA_NAMES)
+        missing_name_record_map = _record_map(1)
+        del missing_name_record_map["startTime"]
+        record_map_list = [_record_map(0), missing_name_record_map, _record_map(2)]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a record without a required data name failed validation, on
+        # its own and in a list, and that the failing verdict was cached.
+        self.assertFalse(record_shape_validator.validate(missing_name_record_map))
+        self.assertFalse(record_shape_validator.validate(dict(missing_name_record_map)))
+        self.assertFalse(record_shape_validator.validate_all(record_map_list))
+        self.assertEqual(record_shape_validator.checked_shape_count, 2)
+
+        # 2.0 Assert that the verdicts agree with the per-record data name validator.
+        for record_map in record_map_list:
+            self.assertEqual(
+                record_shape_validator.validate(record_map),
+                JsonDataValidator.validate_json_data_names(
+                    record_map, _EXPECTED_RECORD_JSON_DATA_NAMES
+                ),
+            )
+
+        # 3.0 Assert that a record or a record list of the wrong type failed validation.
+        self.assertFalse(record_shape_validator.validate(["eventId"]))
+        self.assertFalse(record_shape_validator.validate_all(_record_map(0)))
+        return None
+
+    def test_value_validators(self):
+        record_shape_validator = JsonRecordShapeValidator(
+            _EXPECTED_RECORD_JSON_DATA_NAMES,
+            json_data_value_validators={
+                "eventId": str,
+                "eventCount": (int, float),
+                "eventType": lambda event_type: event_type in ["CreateUser", "DeleteUser"],
+            },
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the values of a record in a valid shape were checked by type,
+        # tuple of types or function, and that a missing optional data name passed.
+        self.assertTrue(record_shape_validator.validate(_record_map(0, eventCount=2.5)))
+        self.assertTrue(record_shape_validator.validate(_record_map(1)))
+        self.assertFalse(record_shape_validator.validate(_record_map(2, eventCount="2")))
+        self.assertFalse(record_shape_validator.validate(_record_map(3, eventId=3)))
+        self.assertFalse(record_shape_validator.validate(_record_map(4, eventType="Unknown")))
+
+        # 2.0 Assert that a failing value did not cache a failing shape.
+        self.assertEqual(record_shape_validator.unique_shape_count(), 2)
+        self.assertTrue(record_shape_validator.validate(_record_map(5, eventCount=1)))
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests do not make API requests.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
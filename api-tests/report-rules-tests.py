@@ -1,9 +1,14 @@
 #!/usr/bin/python3
 import time
-import unittest
 
+import common.profiling
 import common.utils
+from common.fixtures import ResourceFixtureManager
+from common.fixtures import report_rule_fixture
 from common.utils import ApiHelperUtil
+from common.workflow import WorkflowTestCase
+from common.workflow import WorkflowTestSuite
+from common.workflow import workflow_step
 
 MODULE_NAME = "report-rules-tests"
 _TEST_START_TIMESTAMP = time.time()
@@ -11,11 +16,33 @@ _TEST_START_TIMESTAMP = time.time()
 _api_helper_util = None
 
 
-class ReportRulesFunctionalTests(unittest.TestCase):
+def load_tests(loader, standard_tests, pattern):
+    # A report rule needs an email alert channel, created by the alert channels tests.
+    # Run them together:
+    #   python3 run-tests.py alert-channels-tests report-rules-tests
+    return WorkflowTestSuite(standard_tests)
+
+
+class ReportRulesFunctionalTests(WorkflowTestCase):
     def setUp(self):
         log_message = "Performing Test ::{}".format(self._testMethodName)
         common.utils.log_info(MODULE_NAME, log_message)
 
+    @workflow_step(consumes=["email_alert_channel_guid"], produces=["report_rule_guid"])
+    def test_create_report_rule(self):
+        intg_guid = self.consumed_value("email_alert_channel_guid")
+        resource_fixture_manager = ResourceFixtureManager(_api_helper_util)
+        resource_fixture_manager.add_fixture(report_rule_fixture(alert_channel_guid=intg_guid))
+        self.add_workflow_cleanup(resource_fixture_manager.teardown)
+        mc_guid = resource_fixture_manager.setup()["report_rule"]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the report rule was created.
+        self.assertIsNotNone(mc_guid)
+        self.produce_value("report_rule_guid", mc_guid)
+        return None
+
 
 if __name__ == "__main__":
     try:
@@ -23,7 +50,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+
+import requests
+
+import common.profiling
+import common.utils
+from common.fixtures import ResourceFixture
+from common.fixtures import ResourceFixtureError
+from common.fixtures import ResourceFixtureManager
+from common.fixtures import alert_rule_fixture
+from common.fixtures import aws_resource_group_fixture
+from common.fixtures import email_alert_channel_fixture
+from common.fixtures import report_rule_fixture
+from common.fixtures import webhook_alert_channel_fixture
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "resource-fixtures-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant.
+_stand_in_server = None
+
+# Every create and delete takes this long, so serial and parallel fixture handling
+# are easy to tell apart.
+_STAND_IN_RESPONSE_DELAY_SECONDS = 0.2
+
+# The resources are listed this many to a page.
+_STAND_IN_PAGE_SIZE = 1
+
+
+class _StandInResourceStore:
+    # The resources of one API endpoint of the stand-in server.
+    def __init__(self, guid_data_name):
+        self._guid_data_name = guid_data_name
+        self.resource_map = {}
+        self._lock = threading.Lock()
+
+    def create(self, stand_in_request):
+        time.sleep(_STAND_IN_RESPONSE_DELAY_SECONDS)
+        data_map = dict(stand_in_request.json())
+        if "reject" in str(data_map):
+            return StandInResponse(status_code=400, json_data={"message": "Rejected"})
+        data_map[self._guid_data_name] = uuid.uuid4().hex
+        with self._lock:
+            self.resource_map[data_map[self._guid_data_name]] = data_map
+        return StandInResponse(status_code=201, json_data={"data": data_map})
+
+    def list(self, stand_in_request):
+        page_index = int(stand_in_request.query_map.get("page", ["0"])[0])
+        with self._lock:
+            data_list = list(self.resource_map.values())
+        next_page_url = None
+        if (page_index + 1) * _STAND_IN_PAGE_SIZE < len(data_list):
+            next_page_url = "{}{}?page={}".format(
+                _stand_in_server.base_url(), stand_in_request.path, page_index + 1
+            )
+        return StandInResponse(
+            json_data={
+                "data": data_list[
+                    page_index * _STAND_IN_PAGE_SIZE : (page_index + 1) * _STAND_IN_PAGE_SIZE
+                ],
+                "paging": {"urls": {"nextPage": next_page_url}},
+            }
+        )
+
+    def delete(self, stand_in_request):
+        time.sleep(_STAND_IN_RESPONSE_DELAY_SECONDS)
+        guid = stand_in_request.path.rsplit("/", 1)[1]
+        with self._lock:
+            if self.resource_map.pop(guid, None) == None:
+                return StandInResponse(status_code=404, json_data={"message": "Not Found"})
+        return StandInResponse(status_code=204)
+
+
+_resource_store_map = {}
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    for api_request, guid_data_name in [
+        ("AlertChannels", "intgGuid"),
+        ("ResourceGroups", "resourceGuid"),
+        ("AlertRules", "mcGuid"),
+        ("ReportRules", "mcGuid"),
+    ]:
+        resource_store = _StandInResourceStore(guid_data_name)
+        _resource_store_map[api_request] = resource_store
+        resource_path = "/api/v2/{}".format(api_request)
+        _stand_in_server.add_route("POST", resource_path, resource_store.create)
+        _stand_in_server.add_route("GET", resource_path, resource_store.list)
+        _stand_in_server.add_route("DELETE", resource_path + "/*", resource_store.delete)
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class ResourceFixturesFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        journal_file_descriptor, self._journal_file_uri = tempfile.mkstemp(suffix=".journal")
+        os.close(journal_file_descriptor)
+        for resource_store in _resource_store_map.values():
+            resource_store.resource_map.clear()
+
+    def tearDown(self):
+        self._api_helper_util.close()
+        for file_uri in [self._journal_file_uri, self._journal_file_uri + ".lock"]:
+            if os.path.exists(file_uri):
+                os.remove(file_uri)
+
+    def _make_resource_fixture_manager(self):
+        return ResourceFixtureManager(
+            self._api_helper_util, journal_file_uri=self._journal_file_uri
+        )
+
+    def _stand_in_resource_count(self):
+        return sum(
+            len(resource_store.resource_map) for resource_store in _resource_store_map.values()
+        )
+
+    def test_parallel_setup_and_teardown(self):
+        resource_fixture_manager = self._make_resource_fixture_manager()
+        for fixture_index in range(3):
+            resource_fixture_manager.add_fixture(
+                webhook_alert_channel_fixture("webhook_alert_channel_{}".format(fixture_index))
+            )
+        resource_fixture_manager.add_fixture(aws_resource_group_fixture())
+        resource_fixture_manager.add_fixture(
+            alert_rule_fixture("webhook_alert_channel_0", "aws_resource_group")
+        )
+        guid_map = resource_fixture_manager.setup()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every fixture was created and tracked by its GUID.
+        self.assertEqual(len(guid_map), 5)
+        self.assertEqual(self._stand_in_resource_count(), 5)
+        alert_rule_map = _resource_store_map["AlertRules"].resource_map[guid_map["alert_rule"]]
+        self.assertEqual(alert_rule_map["intgGuidList"], [guid_map["webhook_alert_channel_0"]])
+        self.assertEqual(
+            alert_rule_map["filters"]["resourceGroups"], [guid_map["aws_resource_group"]]
+        )
+
+        # 2.0 Assert that the independent fixtures were created concurrently: two waves
+        # of creation rather than five serial ones.
+        statistics_map = resource_fixture_manager.statistics()
+        self.assertLess(
+            statistics_map["setup_duration_seconds"], 4 * _STAND_IN_RESPONSE_DELAY_SECONDS
+        )
+
+        # 3.0 Assert that teardown deleted everything concurrently and left no live
+        # journal entries.
+        self.assertEqual(resource_fixture_manager.teardown(), [])
+        self.assertEqual(self._stand_in_resource_count(), 0)
+        self.assertLess(
+            resource_fixture_manager.statistics()["teardown_duration_seconds"],
+            4 * _STAND_IN_RESPONSE_DELAY_SECONDS,
+        )
+        self.assertEqual(resource_fixture_manager.journal().live_entries(), {})
+        return None
+
+    def test_fixtures_of_existing_resources(self):
+        # The alert channels and resource group were created by earlier steps, e.g. of
+        # another module's workflow.
+        prerequisite_resource_fixture_manager = self._make_resource_fixture_manager()
+        prerequisite_resource_fixture_manager.add_fixture(webhook_alert_channel_fixture())
+        prerequisite_resource_fixture_manager.add_fixture(email_alert_channel_fixture())
+        prerequisite_resource_fixture_manager.add_fixture(aws_resource_group_fixture())
+        prerequisite_guid_map = prerequisite_resource_fixture_manager.setup()
+        resource_fixture_manager = self._make_resource_fixture_manager()
+        resource_fixture_manager.add_fixture(
+            alert_rule_fixture(
+                alert_channel_guid=prerequisite_guid_map["webhook_alert_channel"],
+                resource_group_guid=prerequisite_guid_map["aws_resource_group"],
+            )
+        )
+        resource_fixture_manager.add_fixture(
+            report_rule_fixture(alert_channel_guid=prerequisite_guid_map["email_alert_channel"])
+        )
+        guid_map = resource_fixture_manager.setup()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the rules were created at once, with the GUIDs they were given.
+        self.assertEqual(len(guid_map), 2)
+        alert_rule_map = _resource_store_map["AlertRules"].resource_map[guid_map["alert_rule"]]
+        self.assertEqual(
+            alert_rule_map["intgGuidList"], [prerequisite_guid_map["webhook_alert_channel"]]
+        )
+        self.assertEqual(
+            alert_rule_map["filters"]["resourceGroups"],
+            [prerequisite_guid_map["aws_resource_group"]],
+        )
+        report_rule_map = _resource_store_map["ReportRules"].resource_map[guid_map["report_rule"]]
+        self.assertEqual(
+            report_rule_map["intgGuidList"], [prerequisite_guid_map["email_alert_channel"]]
+        )
+        self.assertLess(
+            resource_fixture_manager.statistics()["setup_duration_seconds"],
+            2 * _STAND_IN_RESPONSE_DELAY_SECONDS,
+        )
+
+        # 2.0 Assert that only the rules were deleted by their manager.
+        self.assertEqual(resource_fixture_manager.teardown(), [])
+        self.assertEqual(self._stand_in_resource_count(), 3)
+        prerequisite_resource_fixture_manager.teardown()
+        return None
+
+    def test_failed_setup_deletes_created_fixtures(self):
+        resource_fixture_manager = self._make_resource_fixture_manager()
+        resource_fixture_manager.add_fixture(webhook_alert_channel_fixture())
+        resource_fixture_manager.add_fixture(
+            ResourceFixture(
+                "rejected_resource_group",
+                "ResourceGroups",
+                lambda resource_name, guid_map: {"resourceName": "reject"},
+            )
+        )
+
+        # 1.0 Assert that setup failed and deleted the fixture it had created.
+        with self.assertRaises(ResourceFixtureError):
+            resource_fixture_manager.setup()
+        self.assertEqual(self._stand_in_resource_count(), 0)
+        self.assertEqual(resource_fixture_manager.journal().live_entries(), {})
+        return None
+
+    def test_raised_setup_error_deletes_created_fixtures(self):
+        def raise_connection_error(resource_name, guid_map):
+            raise requests.exceptions.ConnectionError("The connection was reset.")
+
+        resource_fixture_manager = self._make_resource_fixture_manager()
+        resource_fixture_manager.add_fixture(webhook_alert_channel_fixture())
+        resource_fixture_manager.add_fixture(aws_resource_group_fixture())
+        # The second wave: one fixture is created, the other raises while it is built.
+        resource_fixture_manager.add_fixture(
+            alert_rule_fixture("webhook_alert_channel", "aws_resource_group")
+        )
+        resource_fixture_manager.add_fixture(
+            ResourceFixture(
+                "unreachable_alert_rule",
+                "AlertRules",
+                raise_connection_error,
+                depends_on=["webhook_alert_channel"],
+            )
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the raised error reached the caller, and that the fixtures of
+        # both waves created before it were deleted.
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            resource_fixture_manager.setup()
+        self.assertEqual(self._stand_in_resource_count(), 0)
+        self.assertEqual(resource_fixture_manager.guid_map(), {})
+        self.assertEqual(resource_fixture_manager.statistics()["deleted_count"], 3)
+        self.assertEqual(resource_fixture_manager.journal().live_entries(), {})
+        return None
+
+    def test_orphan_cleanup(self):
+        # An aborted run: its fixtures were never torn down and its process is gone.
+        # One of them was cut off before its GUID was journaled. A resource group of
+        # another user is listed before it, so it is found on a later page.
+        _resource_store_map["ResourceGroups"].resource_map["OTHER_RESOURCE_GUID"] = {
+            "resourceName": "other",
+            "resourceGuid": "OTHER_RESOURCE_GUID",
+        }
+        aborted_resource_fixture_manager = self._make_resource_fixture_manager()
+        aborted_resource_fixture_manager.add_fixture(webhook_alert_channel_fixture())
+        aborted_resource_fixture_manager.add_fixture(aws_resource_group_fixture())
+        aborted_resource_fixture_manager.setup()
+        exited_process = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited_process.wait()
+        journal = aborted_resource_fixture_manager.journal()
+        journal_entry_list = list(journal.live_entries().values())
+        for journal_entry_map in journal_entry_list:
+            journal_entry_map["process_id"] = exited_process.pid
+            if journal_entry_map["api_request"] == "ResourceGroups":
+                journal_entry_map["event"] = "creating"
+                journal_entry_map["guid"] = None
+        os.remove(journal.journal_file_uri())
+        for journal_entry_map in journal_entry_list:
+            journal.append(journal_entry_map)
+
+        resource_fixture_manager = self._make_resource_fixture_manager()
+        orphan_deleted_count = resource_fixture_manager.cleanup_orphaned_resources()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that both orphans were deleted, including the one found by name,
+        # and nothing else.
+        self.assertEqual(orphan_deleted_count, 2)
+        self.assertEqual(
+            list(_resource_store_map["ResourceGroups"].resource_map), ["OTHER_RESOURCE_GUID"]
+        )
+        self.assertEqual(self._stand_in_resource_count(), 1)
+        self.assertEqual(resource_fixture_manager.journal().live_entries(), {})
+        return None
+
+    def test_live_run_fixtures_are_not_orphans(self):
+        running_resource_fixture_manager = self._make_resource_fixture_manager()
+        running_resource_fixture_manager.add_fixture(webhook_alert_channel_fixture())
+        running_resource_fixture_manager.setup()
+
+        # 1.0 Assert that the fixtures of a run which is still alive are left alone.
+        resource_fixture_manager = self._make_resource_fixture_manager()
+        self.assertEqual(resource_fixture_manager.cleanup_orphaned_resources(), 0)
+        self.assertEqual(self._stand_in_resource_count(), 1)
+        running_resource_fixture_manager.teardown()
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
@@ -1,9 +1,15 @@
 #!/usr/bin/python3
 import time
-import unittest
 
+from apiunittestcore import HttpResponseValidator
+import common.profiling
 import common.utils
+from common.fixtures import ResourceFixtureManager
+from common.fixtures import aws_resource_group_fixture
 from common.utils import ApiHelperUtil
+from common.workflow import WorkflowTestCase
+from common.workflow import WorkflowTestSuite
+from common.workflow import workflow_step
 
 MODULE_NAME = "resource-groups-tests"
 _TEST_START_TIMESTAMP = time.time()
@@ -11,11 +17,35 @@ _TEST_START_TIMESTAMP = time.time()
 _api_helper_util = None
 
 
-class ResourceGroupsFunctionalTests(unittest.TestCase):
+def load_tests(loader, standard_tests, pattern):
+    # The resource group created here is consumed by the alert rules tests when they
+    # are run together.
+    return WorkflowTestSuite(standard_tests)
+
+
+class ResourceGroupsFunctionalTests(WorkflowTestCase):
     def setUp(self):
         log_message = "Performing Test ::{}".format(self._testMethodName)
         common.utils.log_info(MODULE_NAME, log_message)
 
+    @workflow_step(produces=["aws_resource_group_guid"])
+    def test_create_aws_resource_group(self):
+        resource_fixture_manager = ResourceFixtureManager(_api_helper_util)
+        resource_fixture_manager.add_fixture(aws_resource_group_fixture())
+        self.add_workflow_cleanup(resource_fixture_manager.teardown)
+        resource_guid = resource_fixture_manager.setup()["aws_resource_group"]
+        http_response = _api_helper_util.make_get_request(
+            "ResourceGroups/{}".format(resource_guid)
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the created resource group can be read back.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        self.assertEqual(http_response.json()["data"]["resourceType"], "AWS")
+        self.produce_value("aws_resource_group_guid", resource_guid)
+        return None
+
 
 if __name__ == "__main__":
     try:
@@ -23,7 +53,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.models import AccessToken
+from common.models import Query
+from common.models import ResponseModel
+from common.models import ResponseModelError
+from common.models import UserProfileAccount
+from common.models import UserProfileOrganization
+from common.models import response_model_from_json_schema
+from common.synthetic import SyntheticPayload
+from common.synthetic import SyntheticPayloadGenerator
+
+MODULE_NAME = "response-models-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+
+class ResponseModelsFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+
+    def test_response_models_round_trip(self):
+        # The response models the suite validates with, generated from the API v2
+        # schema file, round trip schema-faithful payloads without loss.
+        synthetic_payload_generator = SyntheticPayloadGenerator(seed=1)
+        for response_model_class, payload_name, data_function in [
+            (
+                UserProfileOrganization,
+                SyntheticPayload.USER_PROFILE,
+                lambda payload_map: payload_map["data"][0],
+            ),
+            (Query, SyntheticPayload.QUERY_DETAILS, lambda payload_map: payload_map["data"]),
+            (AccessToken, SyntheticPayload.ACCESS_TOKEN, lambda payload_map: payload_map),
+        ]:
+            json_map = data_function(synthetic_payload_generator.payload_map(payload_name, 10))
+
+            # Begin assertions and validations
+
+            # 1.0 Assert that the model is slotted and its required data names are
+            # schema data names.
+            self.assertTrue(issubclass(response_model_class, ResponseModel))
+            self.assertFalse(
+                hasattr(response_model_class.__new__(response_model_class), "__dict__")
+            )
+            self.assertLessEqual(
+                set(response_model_class.REQUIRED_FIELD_NAMES),
+                set(response_model_class.FIELD_NAMES),
+            )
+
+            # 2.0 Assert that the payload round trips through the model.
+            self.assertEqual(response_model_class.from_json(json_map).as_map(), json_map)
+        return None
+
+    def test_property_types_checked(self):
+        account_map = UserProfileAccount.from_json_list(
+            SyntheticPayloadGenerator(seed=1).payload_map(SyntheticPayload.USER_PROFILE, 1)[
+                "data"
+            ][0]["accounts"]
+        )[0].as_map()
+        response_model_class = response_model_from_json_schema(
+            "StandInRecord",
+            {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "count": {"type": "integer"},
+                    "ratio": {"type": "number"},
+                    "note": {"type": ["string", "null"]},
+                    "anything": {},
+                },
+                "required": ["name", "count", "note"],
+            },
+        )
+        record_map = {"name": "stand-in", "count": 1, "ratio": 0.5, "note": None, "anything": []}
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that records with values of their schema types were accepted, and
+        # that optional data names may be null.
+        self.assertTrue(UserProfileAccount.validate(account_map))
+        self.assertTrue(response_model_class.validate(record_map))
+        self.assertTrue(response_model_class.validate(dict(record_map, ratio=None)))
+        self.assertTrue(response_model_class.validate(dict(record_map, ratio=2)))
+
+        # 2.0 Assert that values of other types were rejected, a bool being neither an
+        # integer nor a number.
+        for data_name, value in [
+            ("name", 1),
+            ("count", "1"),
+            ("count", True),
+            ("count", None),
+            ("ratio", False),
+        ]:
+            self.assertFalse(
+                response_model_class.validate(dict(record_map, **{data_name: value})),
+                msg="{}={!r}".format(data_name, value),
+            )
+        self.assertFalse(UserProfileAccount.validate(dict(account_map, userEnabled="1")))
+        with self.assertRaises(ResponseModelError):
+            UserProfileAccount.from_json(dict(account_map, admin="true"))
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests do not make API requests.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
@@ -0,0 +1,892 @@
+#!/usr/bin/python3
+import argparse
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from datetime import datetime
+import fnmatch
+import glob
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from common.fixtures import ResourceFixtureManager
+import common.metrics
+from common.metrics import Metric
+from common.metrics import MetricsExporter
+from common.metrics import MetricsRecorder
+import common.profiling
+from common.profiling import TestProfiler
+import common.scheduling
+from common.scheduling import TestDurationHistory
+from common.scheduling import TestUnit
+from common.scheduling import longest_processing_time_schedule
+import common.soak
+import common.timeouts
+import common.utils
+from common.utils import ApiConfigParameters
+from common.utils import ApiHelperUtil
+import common.workflow
+from common.workflow import WorkflowTestSuite
+
+MODULE_NAME = "run-tests"
+_RUNNER_DIRECTORY_URI = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_REPORT_FILE_URI = "api-test-report.json"
+TEST_MODULE_FILE_PATTERN = "*-tests.py"
+# The local test modules run against stand-in servers, not a tenant, so the runner
+# leaves them out. Run them directly, e.g. python3 timeouts-local-tests.py.
+LOCAL_TEST_MODULE_FILE_PATTERN = "*-local-tests.py"
+
+
+class _TestOutcome:
+    PASSED = "passed"
+    FAILED = "failed"
+    ERROR = "error"
+    SKIPPED = "skipped"
+    EXPECTED_FAILURE = "expected_failure"
+    UNEXPECTED_SUCCESS = "unexpected_success"
+
+
+class _RecordingTestResult(unittest.TestResult):
+    # Records the outcome and duration of every test so they can be written to the
+    # run report. Without a module name, every test is recorded under its own module.
+    # With deadline_seconds, the helper calls of every test, from setUp to its
+    # cleanups, are bounded by that deadline, or the test's own.
+    def __init__(self, module_name=None, deadline_seconds=None):
+        super().__init__()
+        self._module_name = module_name
+        self._deadline_seconds = deadline_seconds
+        self._deadline_token = None
+        self._test_start_time = None
+        self.test_record_list = []
+
+    def startTest(self, test):
+        super().startTest(test)
+        self._test_start_time = time.perf_counter()
+        self._deadline_token = common.timeouts.enter_deadline(
+            common.timeouts.deadline_seconds_of(test, self._deadline_seconds)
+        )
+
+    def stopTest(self, test):
+        if self._deadline_token != None:
+            common.timeouts.exit_deadline(self._deadline_token)
+            self._deadline_token = None
+        super().stopTest(test)
+
+    def _record(self, test, outcome, message=None, error=None):
+        # Workflow steps are reported once they ran, with their measured duration.
+        duration_seconds = getattr(test, common.workflow.WORKFLOW_DURATION_ATTRIBUTE, None)
+        if duration_seconds == None:
+            duration_seconds = time.perf_counter() - self._test_start_time
+        self.test_record_list.append(
+            {
+                "module": self._module_name or test.__class__.__module__.replace("_", "-"),
+                "test": test.id(),
+                "outcome": outcome,
+                "duration_seconds": round(duration_seconds, 3),
+                "message": message,
+            }
+        )
+        # A test which failed on a timeout is classified by the timeout's kind:
+        # connect, read or deadline.
+        timeout_kind = common.timeouts.timeout_kind(error)
+        if timeout_kind != None:
+            self.test_record_list[-1]["timeout"] = timeout_kind
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self._record(test, _TestOutcome.PASSED)
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._record(test, _TestOutcome.FAILED, self.failures[-1][1], err[1])
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self._record(test, _TestOutcome.ERROR, self.errors[-1][1], err[1])
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._record(test, _TestOutcome.SKIPPED, reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self._record(test, _TestOutcome.EXPECTED_FAILURE)
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._record(test, _TestOutcome.UNEXPECTED_SUCCESS)
+
+
+def discover_test_module_uris(module_names=None):
+    test_module_uris = sorted(
+        test_module_uri
+        for test_module_uri in glob.glob(
+            os.path.join(_RUNNER_DIRECTORY_URI, TEST_MODULE_FILE_PATTERN)
+        )
+        if os.path.abspath(test_module_uri) != os.path.abspath(__file__)
+        and not fnmatch.fnmatch(os.path.basename(test_module_uri), LOCAL_TEST_MODULE_FILE_PATTERN)
+    )
+    if module_names:
+        selected_module_uris = []
+        for module_name in module_names:
+            module_file_name = os.path.basename(module_name)
+            if not module_file_name.endswith(".py"):
+                module_file_name += ".py"
+            module_uri = os.path.join(_RUNNER_DIRECTORY_URI, module_file_name)
+            if module_uri in test_module_uris:
+                selected_module_uris.append(module_uri)
+            elif fnmatch.fnmatch(module_file_name, LOCAL_TEST_MODULE_FILE_PATTERN):
+                log_message = 'The local test module "{}" is not run against tenants.'.format(
+                    module_name
+                )
+                common.utils.log_warning(MODULE_NAME, log_message)
+            else:
+                log_message = 'The test module "{}" was not found.'.format(module_name)
+                common.utils.log_warning(MODULE_NAME, log_message)
+        test_module_uris = selected_module_uris
+    return test_module_uris
+
+
+def load_test_module(test_module_uri):
+    # The test modules are named with hyphens, so they are loaded from their file
+    # location rather than imported by name.
+    module_name = os.path.splitext(os.path.basename(test_module_uri))[0]
+    module_spec = importlib.util.spec_from_file_location(
+        module_name.replace("-", "_"), test_module_uri
+    )
+    test_module = importlib.util.module_from_spec(module_spec)
+    # unittest only runs the setUpModule and tearDownModule of registered modules.
+    sys.modules[module_spec.name] = test_module
+    module_spec.loader.exec_module(test_module)
+    return module_name, test_module
+
+
+def _test_name_patterns(test_name_patterns):
+    # Match unittest's own -k handling: a pattern without wildcards matches any test
+    # name containing it.
+    if not test_name_patterns:
+        return None
+    return [
+        pattern if "*" in pattern else "*{}*".format(pattern)
+        for pattern in test_name_patterns
+    ]
+
+
+def _test_units(test_module_list, test_loader, shard_count):
+    # Every selected test is a unit, except the tests a module lists as shardable,
+    # which are split into shard_count units. Workflow steps are not units: they pass
+    # values to each other, so they are run together by the tenant process.
+    test_unit_list = []
+    for module_name, test_module in test_module_list:
+        shardable_test_names = getattr(test_module, common.scheduling.SHARDABLE_TESTS_NAME, [])
+        test_list, _ = common.workflow.split_workflow_tests(
+            test_loader.loadTestsFromModule(test_module)
+        )
+        for test in test_list:
+            test_id = test.id()
+            test_name = test_id[len(test_module.__name__) + 1 :]
+            if shard_count > 1 and test_id.rsplit(".", 1)[-1] in shardable_test_names:
+                test_unit_list.extend(
+                    TestUnit(test_module.__file__, test_id, test_name, shard_index, shard_count)
+                    for shard_index in range(shard_count)
+                )
+            else:
+                test_unit_list.append(TestUnit(test_module.__file__, test_id, test_name))
+    return test_unit_list
+
+
+def _start_metrics_recorder(api_helper_util, tenant_name, metrics_options_map):
+    # Records the requests of the helper and publishes them for the run's metrics
+    # exporter, or returns None without metrics.
+    if not metrics_options_map:
+        return None
+    return (
+        MetricsRecorder(
+            worker_name="{}-{}".format(tenant_name, os.getpid()),
+            metrics_directory_uri=metrics_options_map["metrics_dir"],
+            publish_interval_seconds=metrics_options_map["metrics_interval"],
+        )
+        .attach(api_helper_util, tenant_name)
+        .start()
+    )
+
+
+def _record_test_metrics(metrics_recorder, tenant_name, test_record_list):
+    if metrics_recorder == None:
+        return None
+    for test_record in test_record_list:
+        metrics_recorder.increment(
+            Metric.TESTS, {"tenant": tenant_name, "outcome": test_record["outcome"]}
+        )
+
+
+# The state of a test unit worker process, which runs the units of one tenant.
+_worker_tenant_name = None
+_worker_api_helper_util = None
+_worker_test_profiler = None
+_worker_metrics_recorder = None
+_worker_test_module_map = {}
+
+
+def _initialize_test_unit_worker(
+    tenant_name, api_config_map, profile_options_map, metrics_options_map=None
+):
+    global _worker_tenant_name
+    global _worker_api_helper_util
+    global _worker_test_profiler
+    global _worker_metrics_recorder
+    if _RUNNER_DIRECTORY_URI not in sys.path:
+        sys.path.insert(0, _RUNNER_DIRECTORY_URI)
+    _worker_tenant_name = tenant_name
+    _worker_api_helper_util = ApiHelperUtil(ApiConfigParameters(**api_config_map))
+    _worker_metrics_recorder = _start_metrics_recorder(
+        _worker_api_helper_util, tenant_name, metrics_options_map
+    )
+    if profile_options_map:
+        _worker_test_profiler = TestProfiler(
+            output_directory_uri=os.path.join(
+                profile_options_map["profile_dir"], common.profiling.profile_file_name(tenant_name)
+            ),
+            profiler_mode=profile_options_map["profile_mode"],
+            sampling_interval_seconds=profile_options_map["profile_interval"],
+        )
+
+
+def run_test_unit(test_unit):
+    # Runs in a test unit worker process. Test modules are loaded once per worker.
+    if test_unit.module_uri not in _worker_test_module_map:
+        module_name, test_module = load_test_module(test_unit.module_uri)
+        test_module._api_helper_util = _worker_api_helper_util
+        _worker_test_module_map[test_unit.module_uri] = (module_name, test_module)
+    module_name, test_module = _worker_test_module_map[test_unit.module_uri]
+    unit_start_time = time.perf_counter()
+    test_result = _RecordingTestResult(module_name, _worker_api_helper_util.test_deadline_seconds())
+    if _worker_test_profiler != None:
+        common.profiling.profile_test_result(test_result, _worker_test_profiler)
+    setattr(test_module, common.scheduling.TEST_SHARD_NAME, test_unit.test_shard())
+    try:
+        unittest.TestLoader().loadTestsFromNames([test_unit.test_name], test_module).run(
+            test_result
+        )
+    finally:
+        setattr(test_module, common.scheduling.TEST_SHARD_NAME, None)
+    if test_unit.shard_count != None:
+        for test_record in test_result.test_record_list:
+            test_record["shard"] = "{}/{}".format(test_unit.shard_index + 1, test_unit.shard_count)
+    # Worker processes exit without running the publisher's last write, so the
+    # metrics are published after every unit.
+    if _worker_metrics_recorder != None:
+        _record_test_metrics(
+            _worker_metrics_recorder, _worker_tenant_name, test_result.test_record_list
+        )
+        _worker_metrics_recorder.publish()
+    return {
+        "test_records": test_result.test_record_list,
+        "duration_seconds": time.perf_counter() - unit_start_time,
+        "worker": os.getpid(),
+        "api_request_statistics": _worker_api_helper_util.request_statistics(),
+    }
+
+
+def _run_scheduled_test_units(
+    tenant_name,
+    api_config_map,
+    test_unit_list,
+    worker_count,
+    test_duration_history,
+    profile_options_map=None,
+    metrics_options_map=None,
+):
+    # Runs the test units in worker_count processes, longest predicted first. Returns
+    # the unit results in schedule order and the schedule report.
+    ordered_test_unit_list, predicted_makespan_seconds, worker_load_list = (
+        longest_processing_time_schedule(
+            test_unit_list, worker_count, test_duration_history.predicted_duration_seconds
+        )
+    )
+    schedule_start_time = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=worker_count,
+        initializer=_initialize_test_unit_worker,
+        initargs=(tenant_name, api_config_map, profile_options_map, metrics_options_map),
+    ) as executor:
+        # The pool hands out units in submission order, so a free worker always takes
+        # the longest unit left.
+        future_list = [
+            executor.submit(run_test_unit, test_unit) for test_unit in ordered_test_unit_list
+        ]
+        unit_result_list = [future.result() for future in future_list]
+    actual_makespan_seconds = time.perf_counter() - schedule_start_time
+
+    worker_busy_time_map = {}
+    worker_api_request_statistics_map = {}
+    unit_schedule_list = []
+    for test_unit, unit_result_map in zip(ordered_test_unit_list, unit_result_list):
+        test_duration_history.record_test_unit(test_unit, unit_result_map["duration_seconds"])
+        worker_name = str(unit_result_map["worker"])
+        worker_busy_time_map[worker_name] = (
+            worker_busy_time_map.get(worker_name, 0.0) + unit_result_map["duration_seconds"]
+        )
+        worker_api_request_statistics_map[worker_name] = unit_result_map["api_request_statistics"]
+        unit_schedule_list.append(
+            {
+                "unit": test_unit.unit_key(),
+                "predicted_duration_seconds": round(
+                    test_duration_history.predicted_duration_seconds(test_unit), 3
+                ),
+                "duration_seconds": round(unit_result_map["duration_seconds"], 3),
+                "worker": worker_name,
+            }
+        )
+    schedule_report_map = {
+        "worker_count": worker_count,
+        "unit_count": len(ordered_test_unit_list),
+        "predicted_makespan_seconds": round(predicted_makespan_seconds, 3),
+        "actual_makespan_seconds": round(actual_makespan_seconds, 3),
+        "predicted_serial_duration_seconds": round(sum(worker_load_list), 3),
+        "predicted_worker_loads_seconds": [round(load, 3) for load in worker_load_list],
+        "worker_busy_seconds": {
+            worker_name: round(busy_time_seconds, 3)
+            for worker_name, busy_time_seconds in worker_busy_time_map.items()
+        },
+        "worker_api_request_statistics": worker_api_request_statistics_map,
+        "units": unit_schedule_list,
+    }
+    return unit_result_list, schedule_report_map
+
+
+def _cleanup_orphaned_resources(api_helper_util, tenant_name):
+    # Deletes the fixture resources left behind by aborted runs against the tenant,
+    # and compacts its fixture journal. Returns the number of orphans deleted, or None
+    # when the cleanup failed, which does not stop the tests.
+    try:
+        return ResourceFixtureManager(api_helper_util).cleanup_orphaned_resources()
+    except Exception as error:
+        log_message = "The orphaned fixtures of {} were not cleaned up: {}".format(
+            tenant_name, error
+        )
+        common.utils.log_warning(MODULE_NAME, log_message)
+        return None
+
+
+def run_tenant_tests(
+    tenant_name,
+    api_config_map,
+    test_module_uris,
+    test_name_patterns,
+    profile_options_map=None,
+    soak_options_map=None,
+    schedule_options_map=None,
+    metrics_options_map=None,
+):
+    # Runs in its own worker process. Every tenant therefore gets its own helper,
+    # connection pool, bearer token and rate limiter.
+    #
+    # With more than one worker in schedule_options_map, the tests are split into
+    # units run by that many worker processes, longest predicted first. Each worker
+    # has its own helper.
+    if _RUNNER_DIRECTORY_URI not in sys.path:
+        sys.path.insert(0, _RUNNER_DIRECTORY_URI)
+    tenant_start_time = time.perf_counter()
+    api_helper_util = ApiHelperUtil(ApiConfigParameters(**api_config_map))
+    metrics_recorder = _start_metrics_recorder(api_helper_util, tenant_name, metrics_options_map)
+    test_loader = unittest.TestLoader()
+    test_loader.testNamePatterns = _test_name_patterns(test_name_patterns)
+    test_profiler = None
+    if profile_options_map:
+        test_profiler = TestProfiler(
+            output_directory_uri=os.path.join(
+                profile_options_map["profile_dir"], common.profiling.profile_file_name(tenant_name)
+            ),
+            profiler_mode=profile_options_map["profile_mode"],
+            sampling_interval_seconds=profile_options_map["profile_interval"],
+        )
+
+    schedule_options_map = schedule_options_map or {}
+    worker_count = schedule_options_map.get("workers") or 1
+    test_duration_history = None
+    if schedule_options_map.get("durations_file"):
+        test_duration_history = TestDurationHistory(schedule_options_map["durations_file"])
+    test_record_list = []
+    outcome_count_map = collections.Counter()
+    soak_report_map = None
+    schedule_report_map = None
+    workflow_report_map = None
+    timeout_count_map = collections.Counter()
+    orphan_deleted_count = None
+    try:
+        # Once per tenant, before any module creates fixtures of its own.
+        orphan_deleted_count = _cleanup_orphaned_resources(api_helper_util, tenant_name)
+        test_module_list = []
+        for test_module_uri in test_module_uris:
+            module_name, test_module = load_test_module(test_module_uri)
+            test_module._api_helper_util = api_helper_util
+            test_module_list.append((module_name, test_module))
+
+        def record_test_result(test_result, soak_iteration=None):
+            _record_test_metrics(metrics_recorder, tenant_name, test_result.test_record_list)
+            for test_record in test_result.test_record_list:
+                outcome_count_map[test_record["outcome"]] += 1
+                if "timeout" in test_record:
+                    timeout_count_map[test_record["timeout"]] += 1
+                # A soak keeps the records of its first iteration and of every test
+                # which did not pass, so the report does not grow with the soak
+                # duration.
+                if soak_iteration != None:
+                    test_record["soak_iteration"] = soak_iteration
+                    if soak_iteration > 0 and test_record["outcome"] in [
+                        _TestOutcome.PASSED,
+                        _TestOutcome.SKIPPED,
+                    ]:
+                        continue
+                test_record_list.append(test_record)
+
+        def run_workflow(workflow_test_list, soak_iteration=None):
+            # The workflow steps of every module run together as one dependency
+            # graph, so values pass between modules.
+            nonlocal workflow_report_map
+            if not workflow_test_list:
+                return None
+            workflow_test_suite = WorkflowTestSuite(
+                workflow_test_list,
+                max_workers=api_helper_util.max_request_concurrency(),
+                deadline_seconds=api_helper_util.test_deadline_seconds(),
+            )
+            test_result = _RecordingTestResult()
+            workflow_test_suite.run(test_result)
+            workflow_report_map = workflow_test_suite.report()
+            record_test_result(test_result, soak_iteration)
+
+        def run_test_modules(soak_iteration=None):
+            workflow_test_list = []
+            for module_name, test_module in test_module_list:
+                test_list, module_workflow_test_list = common.workflow.split_workflow_tests(
+                    test_loader.loadTestsFromModule(test_module)
+                )
+                workflow_test_list.extend(module_workflow_test_list)
+                test_result = _RecordingTestResult(
+                    module_name, api_helper_util.test_deadline_seconds()
+                )
+                if test_profiler != None:
+                    common.profiling.profile_test_result(test_result, test_profiler)
+                unittest.TestSuite(test_list).run(test_result)
+                record_test_result(test_result, soak_iteration)
+            run_workflow(workflow_test_list, soak_iteration)
+
+        def add_test_records(test_unit_record_list):
+            for test_record in test_unit_record_list:
+                outcome_count_map[test_record["outcome"]] += 1
+                if "timeout" in test_record:
+                    timeout_count_map[test_record["timeout"]] += 1
+                test_record_list.append(test_record)
+
+        if soak_options_map:
+            # The selected tests are run again and again for the soak duration while
+            # the helper and the process are sampled.
+            soak_report_map = common.soak.run_soak(
+                api_helper_util,
+                run_test_modules,
+                soak_options_map["soak_duration"],
+                sample_interval_seconds=soak_options_map["soak_interval"],
+            )
+        elif worker_count > 1:
+            unit_result_list, schedule_report_map = _run_scheduled_test_units(
+                tenant_name,
+                api_config_map,
+                _test_units(test_module_list, test_loader, worker_count),
+                worker_count,
+                test_duration_history or TestDurationHistory(os.devnull),
+                profile_options_map,
+                metrics_options_map,
+            )
+            for unit_result_map in unit_result_list:
+                add_test_records(unit_result_map["test_records"])
+            run_workflow(
+                [
+                    workflow_test
+                    for module_name, test_module in test_module_list
+                    for workflow_test in common.workflow.split_workflow_tests(
+                        test_loader.loadTestsFromModule(test_module)
+                    )[1]
+                ]
+            )
+        else:
+            run_test_modules()
+            if test_duration_history != None:
+                for test_record in test_record_list:
+                    test_duration_history.record(
+                        test_record["test"], test_record["duration_seconds"]
+                    )
+    finally:
+        if metrics_recorder != None:
+            metrics_recorder.stop()
+        api_helper_util.close()
+    if test_duration_history != None:
+        test_duration_history.save()
+
+    tenant_result_map = {
+        "tenant": tenant_name,
+        "customer_account_name": api_config_map.get(
+            ApiConfigParameters.CUSTOMER_ACCOUNT_NAME
+        ),
+        "duration_seconds": round(time.perf_counter() - tenant_start_time, 3),
+        "api_request_statistics": api_helper_util.request_statistics(),
+        "tests": test_record_list,
+    }
+    if soak_report_map != None:
+        tenant_result_map["soak"] = soak_report_map
+    if schedule_report_map != None:
+        tenant_result_map["schedule"] = schedule_report_map
+    if workflow_report_map != None:
+        tenant_result_map["workflow"] = workflow_report_map
+    if timeout_count_map:
+        tenant_result_map["timeouts"] = dict(timeout_count_map)
+    if orphan_deleted_count:
+        tenant_result_map["orphan_deleted_count"] = orphan_deleted_count
+    for outcome in [
+        _TestOutcome.PASSED,
+        _TestOutcome.FAILED,
+        _TestOutcome.ERROR,
+        _TestOutcome.SKIPPED,
+    ]:
+        tenant_result_map[outcome] = outcome_count_map[outcome]
+    return tenant_result_map
+
+
+def _unique_tenant_names(api_config_parameters_list):
+    tenant_name_list = []
+    for api_config_parameters in api_config_parameters_list:
+        tenant_name = str(api_config_parameters.customer_account_name)
+        if tenant_name in tenant_name_list:
+            tenant_name = "{}#{}".format(tenant_name, len(tenant_name_list) + 1)
+        tenant_name_list.append(tenant_name)
+    return tenant_name_list
+
+
+def run_tests(
+    api_config_parameters_list,
+    test_module_uris,
+    test_name_patterns=None,
+    max_concurrent_tenants=None,
+    profile_options_map=None,
+    soak_options_map=None,
+    schedule_options_map=None,
+    metrics_options_map=None,
+):
+    # With metrics_options_map the run's live metrics are served on its metrics_port
+    # and/or written to its metrics_textfile. Every tenant and worker process
+    # publishes its own metrics to a directory the exporter merges them from.
+    run_start_date_time = datetime.utcnow()
+    run_start_time = time.perf_counter()
+    tenant_name_list = _unique_tenant_names(api_config_parameters_list)
+    # The tenant runs spend most of their time waiting on the network, so by default
+    # every tenant is tested at the same time.
+    if not max_concurrent_tenants:
+        max_concurrent_tenants = len(api_config_parameters_list)
+
+    metrics_exporter = None
+    if metrics_options_map:
+        metrics_options_map = dict(metrics_options_map, metrics_dir=tempfile.mkdtemp())
+        metrics_exporter = MetricsExporter(metrics_options_map["metrics_dir"])
+        if metrics_options_map.get("metrics_port") != None:
+            metrics_exporter.serve(metrics_options_map["metrics_port"])
+            log_message = "Serving live run metrics at {}/metrics".format(
+                metrics_exporter.base_url()
+            )
+            common.utils.log_info(MODULE_NAME, log_message)
+        if metrics_options_map.get("metrics_textfile"):
+            metrics_exporter.start_textfile_writer(
+                metrics_options_map["metrics_textfile"], metrics_options_map["metrics_interval"]
+            )
+
+    tenant_result_map = {}
+    try:
+        tenant_result_map = _run_tenants(
+            tenant_name_list,
+            api_config_parameters_list,
+            test_module_uris,
+            test_name_patterns,
+            max_concurrent_tenants,
+            profile_options_map,
+            soak_options_map,
+            schedule_options_map,
+            metrics_options_map,
+        )
+    finally:
+        if metrics_exporter != None:
+            metrics_exporter.stop()
+            shutil.rmtree(metrics_options_map["metrics_dir"], ignore_errors=True)
+
+    return {
+        "run_start_time": run_start_date_time.isoformat() + "Z",
+        "run_duration_seconds": round(time.perf_counter() - run_start_time, 3),
+        "tenants": [tenant_result_map[tenant_name] for tenant_name in tenant_name_list],
+    }
+
+
+def _run_tenants(
+    tenant_name_list,
+    api_config_parameters_list,
+    test_module_uris,
+    test_name_patterns,
+    max_concurrent_tenants,
+    profile_options_map,
+    soak_options_map,
+    schedule_options_map,
+    metrics_options_map,
+):
+    tenant_result_map = {}
+    with ProcessPoolExecutor(max_workers=max(1, max_concurrent_tenants)) as executor:
+        future_tenant_name_map = {
+            executor.submit(
+                run_tenant_tests,
+                tenant_name,
+                api_config_parameters.as_map(),
+                test_module_uris,
+                test_name_patterns,
+                profile_options_map,
+                soak_options_map,
+                schedule_options_map,
+                metrics_options_map,
+            ): tenant_name
+            for tenant_name, api_config_parameters in zip(
+                tenant_name_list, api_config_parameters_list
+            )
+        }
+        for future in as_completed(future_tenant_name_map):
+            tenant_name = future_tenant_name_map[future]
+            try:
+                tenant_result_map[tenant_name] = future.result()
+            except Exception as error:
+                log_message = 'The tests for tenant "{}" could not be run: {}'.format(
+                    tenant_name, error
+                )
+                common.utils.log_error(MODULE_NAME, log_message)
+                tenant_result_map[tenant_name] = {
+                    "tenant": tenant_name,
+                    "run_error": str(error),
+                    "tests": [],
+                }
+    return tenant_result_map
+
+
+def write_run_report(run_report_map, report_file_uri):
+    with open(report_file_uri, "w") as report_file:
+        json.dump(run_report_map, report_file, indent=2)
+
+
+def log_run_report_summary(run_report_map):
+    for tenant_result_map in run_report_map["tenants"]:
+        if "run_error" in tenant_result_map:
+            log_message = "{}: run error: {}".format(
+                tenant_result_map["tenant"], tenant_result_map["run_error"]
+            )
+        else:
+            log_message = "{}: {} passed, {} failed, {} errors, {} skipped in {}s".format(
+                tenant_result_map["tenant"],
+                tenant_result_map[_TestOutcome.PASSED],
+                tenant_result_map[_TestOutcome.FAILED],
+                tenant_result_map[_TestOutcome.ERROR],
+                tenant_result_map[_TestOutcome.SKIPPED],
+                tenant_result_map["duration_seconds"],
+            )
+        common.utils.log_info(MODULE_NAME, log_message)
+        timeout_count_map = tenant_result_map.get("timeouts")
+        if timeout_count_map:
+            log_message = "{}: tests timed out: {}".format(
+                tenant_result_map["tenant"],
+                ", ".join(
+                    "{} {}".format(timeout_count, timeout_kind)
+                    for timeout_kind, timeout_count in sorted(timeout_count_map.items())
+                ),
+            )
+            common.utils.log_warning(MODULE_NAME, log_message)
+        schedule_report_map = tenant_result_map.get("schedule")
+        if schedule_report_map != None:
+            log_message = "{}: {} test units on {} workers, makespan {}s (predicted {}s)".format(
+                tenant_result_map["tenant"],
+                schedule_report_map["unit_count"],
+                schedule_report_map["worker_count"],
+                schedule_report_map["actual_makespan_seconds"],
+                schedule_report_map["predicted_makespan_seconds"],
+            )
+            common.utils.log_info(MODULE_NAME, log_message)
+        soak_report_map = tenant_result_map.get("soak")
+        if soak_report_map == None:
+            continue
+        log_message = "{}: {} soak iterations in {}s".format(
+            tenant_result_map["tenant"],
+            soak_report_map["iteration_count"],
+            soak_report_map["duration_seconds"],
+        )
+        common.utils.log_info(MODULE_NAME, log_message)
+        if soak_report_map["leak_suspected_metrics"]:
+            log_message = "{}: leak suspected, rising over the soak: {}".format(
+                tenant_result_map["tenant"], ", ".join(soak_report_map["leak_suspected_metrics"])
+            )
+            common.utils.log_warning(MODULE_NAME, log_message)
+        if soak_report_map["latency_drift_suspected"]:
+            log_message = "{}: latency drift, p95 {}ms in the first window, {}ms in the last".format(
+                tenant_result_map["tenant"],
+                soak_report_map["latency"]["first_window"]["p95_ms"],
+                soak_report_map["latency"]["last_window"]["p95_ms"],
+            )
+            common.utils.log_warning(MODULE_NAME, log_message)
+
+
+def run_report_successful(run_report_map):
+    for tenant_result_map in run_report_map["tenants"]:
+        if "run_error" in tenant_result_map:
+            return False
+        if tenant_result_map[_TestOutcome.FAILED] or tenant_result_map[_TestOutcome.ERROR]:
+            return False
+    return True
+
+
+def _parse_arguments(argv=None):
+    argument_parser = argparse.ArgumentParser(
+        description="Run the Lacework API v2 functional tests against one or more tenants."
+    )
+    argument_parser.add_argument(
+        "modules",
+        nargs="*",
+        help="The test modules to run, e.g. queries-tests. All modules are run by default.",
+    )
+    argument_parser.add_argument(
+        "-k",
+        dest="test_name_patterns",
+        action="append",
+        help="Only run the tests matching the pattern. May be given more than once.",
+    )
+    argument_parser.add_argument(
+        "--config",
+        default=".api-test-config.json",
+        help="The single or multi-tenant configuration file.",
+    )
+    argument_parser.add_argument(
+        "--max-concurrent-tenants",
+        type=int,
+        default=None,
+        help="The number of tenants tested at the same time.",
+    )
+    argument_parser.add_argument(
+        "--report",
+        default=DEFAULT_REPORT_FILE_URI,
+        help="The JSON run report file.",
+    )
+    argument_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The worker processes running the tests of each tenant, longest predicted "
+        "first. Shardable tests are split into this many shards.",
+    )
+    argument_parser.add_argument(
+        "--durations",
+        default=common.scheduling.DEFAULT_TEST_DURATIONS_FILE_URI,
+        help="The file the test durations are kept in to predict the next runs.",
+    )
+    argument_parser.add_argument(
+        "--soak-duration",
+        type=float,
+        default=None,
+        help="Soak mode: run the selected tests again and again for this many seconds, "
+        "sampling memory, file descriptors, connection pools, token refreshes and latency.",
+    )
+    argument_parser.add_argument(
+        "--soak-interval",
+        type=float,
+        default=common.soak.DEFAULT_SAMPLE_INTERVAL_SECONDS,
+        help="The soak mode's sampling interval in seconds.",
+    )
+    argument_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve live run metrics in the OpenMetrics text format at "
+        "http://127.0.0.1:<port>/metrics. Port 0 picks a free port.",
+    )
+    argument_parser.add_argument(
+        "--metrics-textfile",
+        default=None,
+        help="Write live run metrics in the Prometheus text format to this file, e.g. "
+        "for the node exporter's textfile collector.",
+    )
+    argument_parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=common.metrics.DEFAULT_PUBLISH_INTERVAL_SECONDS,
+        help="How often the live run metrics are gathered from the workers, in seconds.",
+    )
+    argument_parser.add_argument(
+        "--test-deadline",
+        type=float,
+        default=None,
+        help="The deadline of every test in seconds, bounding all of its API requests and "
+        "retries. Overrides the configured test_deadline_seconds.",
+    )
+    common.profiling.add_profile_arguments(argument_parser)
+    return argument_parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = _parse_arguments()
+    api_config_parameters_list = common.utils.configure_multi_tenant_test_environment(
+        arguments.config
+    )
+    if not api_config_parameters_list:
+        log_message = 'No tenants were configured in "{}".'.format(arguments.config)
+        common.utils.log_error(MODULE_NAME, log_message)
+        sys.exit(1)
+    if arguments.test_deadline != None:
+        for api_config_parameters in api_config_parameters_list:
+            api_config_parameters.test_deadline_seconds = arguments.test_deadline
+
+    profile_options_map = None
+    if arguments.profile:
+        profile_options_map = {
+            "profile_mode": arguments.profile_mode,
+            "profile_dir": arguments.profile_dir,
+            "profile_interval": arguments.profile_interval,
+        }
+
+    soak_options_map = None
+    if arguments.soak_duration != None:
+        soak_options_map = {
+            "soak_duration": arguments.soak_duration,
+            "soak_interval": arguments.soak_interval,
+        }
+
+    schedule_options_map = {
+        "workers": arguments.workers,
+        "durations_file": arguments.durations,
+    }
+
+    metrics_options_map = None
+    if arguments.metrics_port != None or arguments.metrics_textfile:
+        metrics_options_map = {
+            "metrics_port": arguments.metrics_port,
+            "metrics_textfile": arguments.metrics_textfile,
+            "metrics_interval": arguments.metrics_interval,
+        }
+
+    run_report_map = run_tests(
+        api_config_parameters_list,
+        discover_test_module_uris(arguments.modules),
+        test_name_patterns=arguments.test_name_patterns,
+        max_concurrent_tenants=arguments.max_concurrent_tenants,
+        profile_options_map=profile_options_map,
+        soak_options_map=soak_options_map,
+        schedule_options_map=schedule_options_map,
+        metrics_options_map=metrics_options_map,
+    )
+    write_run_report(run_report_map, arguments.report)
+    log_run_report_summary(run_report_map)
+    sys.exit(0 if run_report_successful(run_report_map) else 1)
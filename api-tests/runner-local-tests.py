@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.fixtures import ResourceFixtureManager
+from common.standin import STAND_IN_API_ACCESS_KEY_ID
+from common.standin import StandInResponse
+from common.standin import bearer_token_api_access_key_id
+from common.standin import stand_in_api_config_parameters
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "runner-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run the batch runner against a local stand-in server, not a Lacework
+# tenant. Its Processes route answers any process ID, so the tenant test below can
+# tell the stand-in which process it runs in.
+_stand_in_server = None
+
+_TENANT_TEST_MODULE_SOURCE = '''
+import os
+import unittest
+
+_api_helper_util = None
+
+
+class TenantTests(unittest.TestCase):
+    def test_tenant_request(self):
+        http_response = _api_helper_util.make_get_request("Processes/{}".format(os.getpid()))
+        self.assertEqual(http_response.status_code, 200)
+'''
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_json_route("GET", "/api/v2/Processes/*", {"data": []})
+    _stand_in_server.add_route(
+        "DELETE",
+        "/api/v2/AlertChannels/*",
+        lambda stand_in_request: StandInResponse(status_code=204),
+    )
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+def _load_runner_module():
+    # The runner is named with a hyphen. It is registered so its tenant function can be
+    # sent to worker processes.
+    module_spec = importlib.util.spec_from_file_location(
+        "run_tests", os.path.join(os.path.dirname(os.path.abspath(__file__)), "run-tests.py")
+    )
+    runner_module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_spec.name] = runner_module
+    module_spec.loader.exec_module(runner_module)
+    return runner_module
+
+
+class RunnerFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._runner_module = _load_runner_module()
+        self._temporary_directory_uri = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temporary_directory_uri, ignore_errors=True)
+
+    def _write_json_file(self, file_name, json_data):
+        json_file_uri = os.path.join(self._temporary_directory_uri, file_name)
+        with open(json_file_uri, "w") as json_file:
+            json.dump(json_data, json_file)
+        return json_file_uri
+
+    def test_discovery_leaves_out_local_modules(self):
+        test_module_file_names = [
+            os.path.basename(test_module_uri)
+            for test_module_uri in self._runner_module.discover_test_module_uris()
+        ]
+        selected_module_uris = self._runner_module.discover_test_module_uris(
+            ["queries-tests", "timeouts-local-tests", "runner-local-tests.py"]
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the tenant test modules are discovered, but neither the local
+        # test modules nor the runner itself.
+        self.assertIn("queries-tests.py", test_module_file_names)
+        self.assertIn("user-profiles-tests.py", test_module_file_names)
+        self.assertNotIn("run-tests.py", test_module_file_names)
+        self.assertEqual(
+            [
+                test_module_file_name
+                for test_module_file_name in test_module_file_names
+                if test_module_file_name.endswith("-local-tests.py")
+            ],
+            [],
+        )
+
+        # 2.0 Assert that naming a local test module does not select it.
+        self.assertEqual(
+            [os.path.basename(test_module_uri) for test_module_uri in selected_module_uris],
+            ["queries-tests.py"],
+        )
+        return None
+
+    def test_multi_tenant_configuration(self):
+        multi_tenant_config_file_uri = self._write_json_file(
+            "multi-tenant-config.json",
+            {
+                "api_access_key_expiry_time_seconds": 600,
+                "rate_limit_requests_per_second": 5,
+                "unknown_data_name": "ignored",
+                "tenants": [
+                    {
+                        "customer_account_name": "tenant-a",
+                        "api_access_key_id": "TENANT_A_KEY_ID",
+                        "secret_key": "TENANT_A_SECRET_KEY",
+                    },
+                    {
+                        "customer_account_name": "tenant-b",
+                        "api_access_key_id": "TENANT_B_KEY_ID",
+                        "secret_key": "TENANT_B_SECRET_KEY",
+                        "rate_limit_requests_per_second": 20,
+                    },
+                ],
+            },
+        )
+        single_tenant_config_file_uri = self._write_json_file(
+            "single-tenant-config.json",
+            {"customer_account_name": "tenant-c", "api_access_key_id": "TENANT_C_KEY_ID"},
+        )
+        api_config_parameters_list = common.utils.configure_multi_tenant_test_environment(
+            multi_tenant_config_file_uri
+        )
+        single_api_config_parameters_list = common.utils.configure_multi_tenant_test_environment(
+            single_tenant_config_file_uri
+        )
+        missing_api_config_parameters_list = common.utils.configure_multi_tenant_test_environment(
+            os.path.join(self._temporary_directory_uri, "missing-config.json")
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every tenant was configured with its own data names, and the
+        # top-level data names as defaults.
+        self.assertEqual(
+            [
+                api_config_parameters.customer_account_name
+                for api_config_parameters in api_config_parameters_list
+            ],
+            ["tenant-a", "tenant-b"],
+        )
+        self.assertEqual(api_config_parameters_list[0].api_access_key_id, "TENANT_A_KEY_ID")
+        self.assertEqual(api_config_parameters_list[1].secret_key, "TENANT_B_SECRET_KEY")
+        self.assertEqual(api_config_parameters_list[0].rate_limit_requests_per_second, 5)
+        self.assertEqual(api_config_parameters_list[1].rate_limit_requests_per_second, 20)
+        self.assertEqual(
+            [
+                api_config_parameters.api_access_key_expiry_time_seconds
+                for api_config_parameters in api_config_parameters_list
+            ],
+            [600, 600],
+        )
+        self.assertNotIn("unknown_data_name", api_config_parameters_list[0].as_map())
+
+        # 2.0 Assert that a single tenant file yields one tenant, and a missing file none.
+        self.assertEqual(len(single_api_config_parameters_list), 1)
+        self.assertEqual(single_api_config_parameters_list[0].api_access_key_id, "TENANT_C_KEY_ID")
+        self.assertEqual(missing_api_config_parameters_list, [])
+        return None
+
+    def test_tenants_run_in_their_own_processes(self):
+        test_module_uri = os.path.join(self._temporary_directory_uri, "tenant-tests.py")
+        with open(test_module_uri, "w") as test_module_file:
+            test_module_file.write(_TENANT_TEST_MODULE_SOURCE)
+        tenant_api_access_key_id_list = ["TENANT_A_KEY_ID", "TENANT_B_KEY_ID"]
+        api_config_parameters_list = [
+            stand_in_api_config_parameters(
+                _stand_in_server.base_url(), api_access_key_id=api_access_key_id
+            )
+            for api_access_key_id in tenant_api_access_key_id_list
+        ]
+        # The third tenant's configuration cannot be used, which fails its run only.
+        api_config_parameters_list.append(
+            stand_in_api_config_parameters(
+                _stand_in_server.base_url(), request_timeouts=["not a timeouts map"]
+            )
+        )
+        request_log_start_index = len(_stand_in_server.request_log())
+        run_report_map = self._runner_module.run_tests(
+            api_config_parameters_list, [test_module_uri]
+        )
+        tenant_process_id_map = {}
+        tenant_token_request_count_map = {}
+        for stand_in_request in _stand_in_server.request_log()[request_log_start_index:]:
+            if stand_in_request.path.startswith("/api/v2/Processes/"):
+                tenant_process_id_map.setdefault(
+                    bearer_token_api_access_key_id(stand_in_request), set()
+                ).add(stand_in_request.path.rsplit("/", 1)[1])
+            elif stand_in_request.path == "/api/v2/access/tokens":
+                api_access_key_id = stand_in_request.json()["keyId"]
+                tenant_token_request_count_map[api_access_key_id] = (
+                    tenant_token_request_count_map.get(api_access_key_id, 0) + 1
+                )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the tenants sharing a customer account name were told apart,
+        # and that the tests of both usable tenants passed.
+        self.assertEqual(
+            [tenant_result_map["tenant"] for tenant_result_map in run_report_map["tenants"]],
+            ["stand-in", "stand-in#2", "stand-in#3"],
+        )
+        self.assertEqual(run_report_map["tenants"][0]["passed"], 1)
+        self.assertEqual(run_report_map["tenants"][1]["passed"], 1)
+
+        # 2.0 Assert that every tenant ran in a process of its own, neither this one
+        # nor another tenant's, with its own bearer token.
+        self.assertEqual(sorted(tenant_process_id_map), tenant_api_access_key_id_list)
+        tenant_process_id_list = [
+            process_id
+            for process_id_set in tenant_process_id_map.values()
+            for process_id in process_id_set
+        ]
+        self.assertEqual(len(tenant_process_id_list), 2)
+        self.assertEqual(len(set(tenant_process_id_list)), 2)
+        self.assertNotIn(str(os.getpid()), tenant_process_id_list)
+        self.assertEqual(
+            tenant_token_request_count_map, {"TENANT_A_KEY_ID": 1, "TENANT_B_KEY_ID": 1}
+        )
+
+        # 3.0 Assert that the tenant which could not be run was reported without
+        # stopping the others, and failed the run.
+        self.assertIn("run_error", run_report_map["tenants"][2])
+        self.assertEqual(run_report_map["tenants"][2]["tests"], [])
+        self.assertFalse(self._runner_module.run_report_successful(run_report_map))
+        self.assertNotIn(STAND_IN_API_ACCESS_KEY_ID, tenant_token_request_count_map)
+        return None
+
+    def test_orphaned_fixtures_deleted_before_tests(self):
+        test_module_uri = os.path.join(self._temporary_directory_uri, "tenant-tests.py")
+        with open(test_module_uri, "w") as test_module_file:
+            test_module_file.write(_TENANT_TEST_MODULE_SOURCE)
+        # An alert channel journaled by a run whose process is gone.
+        api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        journal = ResourceFixtureManager(api_helper_util).journal()
+        api_helper_util.close()
+
+        def remove_journal_files():
+            for file_uri in [journal.journal_file_uri(), journal.journal_file_uri() + ".lock"]:
+                if os.path.exists(file_uri):
+                    os.remove(file_uri)
+
+        self.addCleanup(remove_journal_files)
+        exited_process = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited_process.wait()
+        journal.append(
+            {
+                "event": "created",
+                "run_id": "aborted-run",
+                "host_name": socket.gethostname(),
+                "process_id": exited_process.pid,
+                "api_request": "AlertChannels",
+                "resource_name": "api-test-aborted-run-webhook_alert_channel",
+                "guid": "ORPHANED_INTG_GUID",
+            }
+        )
+        request_log_start_index = len(_stand_in_server.request_log())
+        run_report_map = self._runner_module.run_tests(
+            [stand_in_api_config_parameters(_stand_in_server.base_url())], [test_module_uri]
+        )
+        request_path_list = [
+            stand_in_request.path
+            for stand_in_request in _stand_in_server.request_log()[request_log_start_index:]
+            if stand_in_request.path != "/api/v2/access/tokens"
+        ]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the orphan was deleted once, before the tenant's tests ran,
+        # and reported.
+        self.assertEqual(request_path_list[0], "/api/v2/AlertChannels/ORPHANED_INTG_GUID")
+        self.assertEqual(
+            request_path_list.count("/api/v2/AlertChannels/ORPHANED_INTG_GUID"), 1
+        )
+        self.assertEqual(run_report_map["tenants"][0]["passed"], 1)
+        self.assertEqual(run_report_map["tenants"][0]["orphan_deleted_count"], 1)
+
+        # 2.0 Assert that the journal was compacted to no entries.
+        with open(journal.journal_file_uri()) as journal_file:
+            self.assertEqual(journal_file.read(), "")
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helpers for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
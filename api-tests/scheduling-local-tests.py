@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.scheduling import TestDurationHistory
+from common.scheduling import TestUnit
+from common.scheduling import longest_processing_time_schedule
+from common.scheduling import shard_items
+from common.standin import stand_in_api_config_parameters
+
+MODULE_NAME = "scheduling-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# A test module of uneven tests for the runner to schedule: one long test, a shardable
+# test and a few short tests.
+_SCHEDULED_TEST_MODULE_SOURCE = '''
+import time
+import unittest
+
+from common.scheduling import shard_items
+
+SHARDABLE_TESTS = ["test_sharded_items"]
+_test_shard = None
+_api_helper_util = None
+
+
+class ScheduledTests(unittest.TestCase):
+    def test_long(self):
+        time.sleep(0.6)
+
+    def test_sharded_items(self):
+        for item in shard_items(range(8), _test_shard):
+            time.sleep(0.1)
+
+    def test_short_1(self):
+        time.sleep(0.1)
+
+    def test_short_2(self):
+        time.sleep(0.1)
+
+    def test_short_3(self):
+        time.sleep(0.1)
+'''
+
+
+def _load_runner_module():
+    # The runner is named with a hyphen. It is registered so its worker function can
+    # be sent to worker processes.
+    module_spec = importlib.util.spec_from_file_location(
+        "run_tests", os.path.join(os.path.dirname(os.path.abspath(__file__)), "run-tests.py")
+    )
+    runner_module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_spec.name] = runner_module
+    module_spec.loader.exec_module(runner_module)
+    return runner_module
+
+
+class SchedulingFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._temporary_directory_uri = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temporary_directory_uri)
+
+    def test_longest_processing_time_schedule(self):
+        duration_map = {"a": 7.0, "b": 5.0, "c": 4.0, "d": 3.0, "e": 3.0, "f": 2.0}
+        test_unit_list = [
+            TestUnit("module.py", test_id, test_id) for test_id in sorted(duration_map)
+        ]
+        ordered_test_unit_list, predicted_makespan_seconds, worker_load_list = (
+            longest_processing_time_schedule(
+                test_unit_list, 2, lambda test_unit: duration_map[test_unit.test_id]
+            )
+        )
+
+        # 1.0 Assert that the units are ordered longest first and spread evenly: the
+        # 24 seconds of work take 12 seconds on two workers.
+        self.assertEqual(
+            [test_unit.test_id for test_unit in ordered_test_unit_list], list("abcdef")
+        )
+        self.assertEqual(predicted_makespan_seconds, 12.0)
+        self.assertEqual(sorted(worker_load_list), [12.0, 12.0])
+        return None
+
+    def test_shard_items(self):
+        # 1.0 Assert that the shards of a test cover every item exactly once.
+        item_list = list(range(10))
+        shard_item_list = [shard_items(item_list, (shard_index, 3)) for shard_index in range(3)]
+        self.assertEqual(sorted(sum(shard_item_list, [])), item_list)
+        self.assertEqual([len(items) for items in shard_item_list], [4, 3, 3])
+        self.assertEqual(shard_items(item_list, None), item_list)
+        return None
+
+    def test_duration_history(self):
+        durations_file_uri = os.path.join(self._temporary_directory_uri, "durations.json")
+        test_duration_history = TestDurationHistory(durations_file_uri)
+        known_test_unit = TestUnit("module.py", "module.Tests.test_known", "Tests.test_known")
+        sharded_test_unit = TestUnit(
+            "module.py", "module.Tests.test_sharded", "Tests.test_sharded", 0, 2
+        )
+
+        # 1.0 Assert that a test never run is predicted with the default duration.
+        self.assertEqual(test_duration_history.predicted_duration_seconds(known_test_unit), 1.0)
+
+        # 2.0 Assert that recorded durations are smoothed, persisted and predict the
+        # next run, including a sharded test run with another shard count.
+        test_duration_history.record_test_unit(known_test_unit, 4.0)
+        test_duration_history.record_test_unit(sharded_test_unit, 3.0)
+        test_duration_history.save()
+        test_duration_history = TestDurationHistory(durations_file_uri)
+        test_duration_history.record_test_unit(known_test_unit, 2.0)
+        test_duration_history.save()
+        test_duration_history = TestDurationHistory(durations_file_uri)
+        self.assertEqual(test_duration_history.predicted_duration_seconds(known_test_unit), 3.0)
+        self.assertEqual(
+            test_duration_history.predicted_duration_seconds(sharded_test_unit), 3.0
+        )
+        self.assertEqual(
+            test_duration_history.predicted_duration_seconds(
+                TestUnit("module.py", "module.Tests.test_sharded", "Tests.test_sharded", 0, 3)
+            ),
+            1.0,
+        )
+        self.assertEqual(
+            test_duration_history.predicted_duration_seconds(
+                TestUnit("module.py", "module.Tests.test_new", "Tests.test_new")
+            ),
+            3.0,
+        )
+        return None
+
+    def test_scheduled_run(self):
+        runner_module = _load_runner_module()
+        test_module_uri = os.path.join(self._temporary_directory_uri, "scheduled-tests.py")
+        with open(test_module_uri, "w") as test_module_file:
+            test_module_file.write(_SCHEDULED_TEST_MODULE_SOURCE)
+        durations_file_uri = os.path.join(self._temporary_directory_uri, "durations.json")
+        api_config_map = stand_in_api_config_parameters("http://127.0.0.1:9").as_map()
+
+        def run_scheduled_tests():
+            return runner_module.run_tenant_tests(
+                "stand-in",
+                api_config_map,
+                [test_module_uri],
+                None,
+                schedule_options_map={"workers": 2, "durations_file": durations_file_uri},
+            )
+
+        first_tenant_result_map = run_scheduled_tests()
+        second_tenant_result_map = run_scheduled_tests()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every test and both shards of the shardable test passed.
+        self.assertEqual(first_tenant_result_map["passed"], 6)
+        self.assertEqual(first_tenant_result_map["failed"] + first_tenant_result_map["error"], 0)
+        self.assertEqual(
+            sorted(
+                test_record["shard"]
+                for test_record in first_tenant_result_map["tests"]
+                if "shard" in test_record
+            ),
+            ["1/2", "2/2"],
+        )
+
+        # 2.0 Assert that the durations were persisted for every unit and the sharded
+        # test as a whole.
+        with open(durations_file_uri, "r") as durations_file:
+            duration_map = json.load(durations_file)["durations"]
+        self.assertEqual(len(duration_map), 7)
+
+        # 3.0 Assert that the second run scheduled the long test first, predicted its
+        # makespan from the first run, and beat a serial run of the same tests.
+        schedule_report_map = second_tenant_result_map["schedule"]
+        self.assertEqual(schedule_report_map["unit_count"], 6)
+        self.assertTrue(schedule_report_map["units"][0]["unit"].endswith("test_long"))
+        self.assertAlmostEqual(
+            schedule_report_map["predicted_makespan_seconds"],
+            schedule_report_map["actual_makespan_seconds"],
+            delta=0.5,
+        )
+        self.assertLess(
+            schedule_report_map["predicted_makespan_seconds"],
+            schedule_report_map["predicted_serial_duration_seconds"],
+        )
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper where they need one.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
@@ -2,7 +2,10 @@
 import time
 import unittest
 
+from apiunittestcore import HttpResponseValidator
+import common.profiling
 import common.utils
+from common.models import response_model_from_json_schema
 from common.utils import ApiHelperUtil
 
 MODULE_NAME = "schemas-tests"
@@ -16,6 +19,46 @@ class SchemasFunctionalTests(unittest.TestCase):
         log_message = "Performing Test ::{}".format(self._testMethodName)
         common.utils.log_info(MODULE_NAME, log_message)
 
+    def test_list_schemas(self):
+        http_response = _api_helper_util.make_get_request("schemas")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a successful response was returned.
+        self.assertTrue(HttpResponseValidator.is_successful_response(http_response))
+
+        # 2.0 Assert that the expected response was returned as defined by the documentation:
+        # https://yourlacework.lacework.net/api/v2/docs#tag/Schemas
+        # 200 A list of the API's schema types is returned.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        return None
+
+    def test_generate_response_models_from_api_schemas(self):
+        http_response = _api_helper_util.make_get_request("schemas")
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+        schema_type_list = http_response.json()
+        if isinstance(schema_type_list, dict):
+            schema_type_list = schema_type_list.get("data")
+        self.assertTrue(isinstance(schema_type_list, list))
+
+        # 1.0 Assert that a response model can be generated from every object schema,
+        # with one field per schema property.
+        for schema_type in schema_type_list:
+            schema_http_response = _api_helper_util.make_get_request(
+                "schemas/{}".format(schema_type)
+            )
+            self.assertTrue(HttpResponseValidator.is_successful_response(schema_http_response))
+            json_schema_map = schema_http_response.json()
+            if not isinstance(json_schema_map, dict) or not json_schema_map.get("properties"):
+                continue
+            response_model_class = response_model_from_json_schema(
+                str(schema_type), json_schema_map
+            )
+            self.assertEqual(
+                list(response_model_class.FIELD_NAMES), list(json_schema_map["properties"])
+            )
+        return None
+
 
 if __name__ == "__main__":
     try:
@@ -23,7 +66,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
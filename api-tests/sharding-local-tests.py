@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+from datetime import datetime
+from datetime import timedelta
+import threading
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.sharding import TimeWindowShardedFetcher
+from common.sharding import make_time_window_fetch_function
+from common.sharding import parse_api_time
+from common.sharding import record_time_from_data_name
+from common.timeouts import deadline_scope
+from common.timeouts import remaining_deadline_seconds
+from common.timeouts import without_deadline
+
+MODULE_NAME = "sharding-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# The fake time-windowed endpoint holds one record a minute from _RECORD_START_TIME,
+# unless given another record interval.
+_RECORD_START_TIME = datetime(2026, 10, 1)
+_TIME_JSON_DATA_NAME = "startTime"
+
+
+class _FakeHttpResponse:
+    def __init__(self, json_map):
+        self._json_map = json_map
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return self._json_map
+
+
+class _FakeTimeWindowEndpoint:
+    # Stands in for a time-windowed endpoint, e.g. CloudActivities, behind the API
+    # helper the fetch function sends its requests through. Like the API, it reads the
+    # window from the formatted "startTime" and "endTime" parameters, and returns the
+    # records on both edges of a window, in no particular order.
+    def __init__(
+        self,
+        record_count,
+        fetch_delay_seconds_function=None,
+        record_interval=timedelta(minutes=1),
+    ):
+        self._record_count = record_count
+        self._fetch_delay_seconds_function = fetch_delay_seconds_function
+        self._record_interval = record_interval
+        self.remaining_deadline_seconds_list = []
+        self._lock = threading.Lock()
+
+    def fetch_time_window_function(self):
+        return make_time_window_fetch_function(self, "CloudActivities")
+
+    def make_paged_get_requests(self, api_request, params=None):
+        with self._lock:
+            self.remaining_deadline_seconds_list.append(remaining_deadline_seconds())
+        start_time = parse_api_time(params["startTime"])
+        end_time = parse_api_time(params["endTime"])
+        if self._fetch_delay_seconds_function != None:
+            time.sleep(self._fetch_delay_seconds_function(start_time))
+        record_list = []
+        for record_index in range(self._record_count):
+            record_time = _RECORD_START_TIME + record_index * self._record_interval
+            if start_time <= record_time <= end_time:
+                record_list.append(
+                    {
+                        "eventId": record_index,
+                        _TIME_JSON_DATA_NAME: record_time.isoformat(timespec="milliseconds")
+                        + "Z",
+                    }
+                )
+        record_list.reverse()
+        return [_FakeHttpResponse({"data": record_list})]
+
+
+class ShardingFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+
+    def test_records_time_ordered_without_duplicates(self):
+        time_range_hours = 6
+        # Earlier windows take longer, so later shards complete first.
+        fake_time_window_endpoint = _FakeTimeWindowEndpoint(
+            time_range_hours * 60,
+            fetch_delay_seconds_function=lambda start_time: 0.02
+            * (time_range_hours - (start_time - _RECORD_START_TIME).total_seconds() / 3600),
+        )
+        sharded_fetcher = TimeWindowShardedFetcher(
+            fake_time_window_endpoint.fetch_time_window_function(),
+            record_time_function=record_time_from_data_name(_TIME_JSON_DATA_NAME),
+            max_concurrent_shards=4,
+            initial_shard_duration=timedelta(hours=1),
+            target_records_per_shard=60,
+        )
+        event_id_list = [
+            record_map["eventId"]
+            for record_map in sharded_fetcher.fetch(
+                _RECORD_START_TIME, _RECORD_START_TIME + timedelta(hours=time_range_hours)
+            )
+        ]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the records of every shard were yielded in time order,
+        # although the shards completed out of order and returned unordered records.
+        self.assertEqual(event_id_list, sorted(event_id_list))
+
+        # 2.0 Assert that the records on the shared edge of two windows were yielded
+        # once, by the later shard.
+        self.assertEqual(event_id_list, list(range(time_range_hours * 60)))
+        self.assertEqual(sharded_fetcher.statistics()["shard_count"], time_range_hours)
+        self.assertEqual(sharded_fetcher.statistics()["record_count"], time_range_hours * 60)
+        return None
+
+    def test_shard_duration_adapts(self):
+        # The records are in the first 2 hours only, so later windows are empty.
+        density_sharded_fetcher = TimeWindowShardedFetcher(
+            _FakeTimeWindowEndpoint(120).fetch_time_window_function(),
+            record_time_function=record_time_from_data_name(_TIME_JSON_DATA_NAME),
+            max_concurrent_shards=1,
+            initial_shard_duration=timedelta(hours=1),
+            maximum_shard_duration=timedelta(hours=4),
+            target_records_per_shard=30,
+        )
+        list(
+            density_sharded_fetcher.fetch(
+                _RECORD_START_TIME, _RECORD_START_TIME + timedelta(hours=12)
+            )
+        )
+        latency_sharded_fetcher = TimeWindowShardedFetcher(
+            _FakeTimeWindowEndpoint(
+                180, fetch_delay_seconds_function=lambda start_time: 0.1
+            ).fetch_time_window_function(),
+            record_time_function=record_time_from_data_name(_TIME_JSON_DATA_NAME),
+            max_concurrent_shards=1,
+            initial_shard_duration=timedelta(hours=1),
+            minimum_shard_duration=timedelta(minutes=10),
+            target_records_per_shard=60,
+            target_shard_latency_seconds=0.05,
+        )
+        list(
+            latency_sharded_fetcher.fetch(
+                _RECORD_START_TIME, _RECORD_START_TIME + timedelta(hours=3)
+            )
+        )
+        density_shard_duration_seconds_history = density_sharded_fetcher.statistics()[
+            "shard_duration_seconds_history"
+        ]
+        latency_shard_duration_seconds_history = latency_sharded_fetcher.statistics()[
+            "shard_duration_seconds_history"
+        ]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the shard duration was sized to the target record count at the
+        # observed record density, and doubled over empty windows up to its maximum.
+        self.assertEqual(
+            density_shard_duration_seconds_history[:6],
+            [3600, 1800, 1800, 1800, 3600, 7200],
+        )
+        self.assertEqual(max(density_shard_duration_seconds_history), 4 * 3600)
+
+        # 2.0 Assert that the shard duration was shortened while shards took longer than
+        # the target latency, down to its minimum.
+        self.assertEqual(latency_shard_duration_seconds_history[0], 3600)
+        self.assertLessEqual(latency_shard_duration_seconds_history[1], 1800)
+        self.assertLessEqual(
+            latency_shard_duration_seconds_history[2], latency_shard_duration_seconds_history[1] / 2
+        )
+        self.assertEqual(latency_shard_duration_seconds_history[3], 600)
+        self.assertEqual(min(latency_shard_duration_seconds_history[:-1]), 600)
+        return None
+
+    def test_fractional_record_times_not_lost(self):
+        # Millisecond timestamped records, at a density which sizes the shards to a
+        # fractional number of seconds.
+        record_count = 3000
+        sharded_fetcher = TimeWindowShardedFetcher(
+            _FakeTimeWindowEndpoint(
+                record_count, record_interval=timedelta(milliseconds=900)
+            ).fetch_time_window_function(),
+            record_time_function=record_time_from_data_name(_TIME_JSON_DATA_NAME),
+            max_concurrent_shards=4,
+            initial_shard_duration=timedelta(minutes=10),
+            minimum_shard_duration=timedelta(seconds=1),
+            target_records_per_shard=43,
+        )
+        event_id_list = [
+            record_map["eventId"]
+            for record_map in sharded_fetcher.fetch(
+                _RECORD_START_TIME, _RECORD_START_TIME + timedelta(seconds=2700)
+            )
+        ]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every record was yielded once, including the records in the
+        # last fraction of a second of a shard.
+        self.assertEqual(event_id_list, list(range(record_count)))
+
+        # 2.0 Assert that the adapted shard durations were whole seconds.
+        for shard_duration_seconds in sharded_fetcher.statistics()[
+            "shard_duration_seconds_history"
+        ]:
+            self.assertEqual(shard_duration_seconds, int(shard_duration_seconds))
+        return None
+
+    def test_deadline_propagates_to_shards(self):
+        fake_time_window_endpoint = _FakeTimeWindowEndpoint(240)
+        sharded_fetcher = TimeWindowShardedFetcher(
+            fake_time_window_endpoint.fetch_time_window_function(),
+            max_concurrent_shards=4,
+            initial_shard_duration=timedelta(hours=1),
+        )
+        # The run's own test deadline, if any, is lifted, so only the deadlines of the
+        # test are in force.
+        with without_deadline(), deadline_scope(30):
+            list(sharded_fetcher.fetch(_RECORD_START_TIME, _RECORD_START_TIME + timedelta(hours=4)))
+        deadline_remaining_seconds_list = list(
+            fake_time_window_endpoint.remaining_deadline_seconds_list
+        )
+        with without_deadline():
+            list(sharded_fetcher.fetch(_RECORD_START_TIME, _RECORD_START_TIME + timedelta(hours=1)))
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every shard was fetched in a worker thread under the deadline
+        # of the test consuming the records.
+        self.assertEqual(len(deadline_remaining_seconds_list), 4)
+        for remaining_seconds in deadline_remaining_seconds_list:
+            self.assertGreater(remaining_seconds, 0)
+            self.assertLessEqual(remaining_seconds, 30)
+
+        # 2.0 Assert that shards fetched without a deadline had none.
+        self.assertIsNone(fake_time_window_endpoint.remaining_deadline_seconds_list[-1])
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests do not make API requests.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
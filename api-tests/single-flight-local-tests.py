@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.timeouts import DeadlineExceededError
+from common.timeouts import deadline_scope
+from common.timeouts import without_deadline
+from common.utils import SingleFlightGroup
+
+MODULE_NAME = "single-flight-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant. Its
+# UserProfile route answers after _RESPONSE_DELAY_SECONDS, so identical requests
+# overlap.
+_stand_in_server = None
+_RESPONSE_DELAY_SECONDS = 0.3
+_CALLER_COUNT = 4
+
+
+def _delayed_user_profile(stand_in_request):
+    time.sleep(_RESPONSE_DELAY_SECONDS)
+    return StandInResponse(json_data={"data": [{"username": "stand-in@lacework.net"}]})
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_route("GET", "/api/v2/UserProfile", _delayed_user_profile)
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class SingleFlightFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._single_flight_group = SingleFlightGroup()
+        self._release_event = threading.Event()
+        self._call_count = 0
+
+    def _blocking_call(self, call_result):
+        # The leading call holds the key until the test releases it.
+        def call_function():
+            self._call_count += 1
+            self._release_event.wait(5)
+            if isinstance(call_result, Exception):
+                raise call_result
+            return call_result
+
+        return call_function
+
+    def _run_callers(self, call_function, copy_function=None):
+        # Runs _CALLER_COUNT identical calls, releasing the leading call once every
+        # other caller waits on it. Returns the result or error of every caller.
+        def caller():
+            try:
+                return self._single_flight_group.do("call-key", call_function, copy_function)
+            except Exception as error:
+                return error
+
+        with ThreadPoolExecutor(max_workers=_CALLER_COUNT) as executor:
+            future_list = [executor.submit(caller) for _ in range(_CALLER_COUNT)]
+            wait_end_time = time.monotonic() + 5
+            while (
+                self._single_flight_group.statistics()["coalesced_call_count"]
+                < _CALLER_COUNT - 1
+                and time.monotonic() < wait_end_time
+            ):
+                time.sleep(0.01)
+            self._release_event.set()
+            return [future.result(timeout=5) for future in future_list]
+
+    def test_identical_calls_coalesced(self):
+        call_result_list = self._run_callers(self._blocking_call({"data": []}))
+        other_key_result = self._single_flight_group.do("other-call-key", lambda: "other")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that one call was made and every waiting caller was woken with its
+        # result.
+        self.assertEqual(self._call_count, 1)
+        self.assertEqual(call_result_list, [{"data": []}] * _CALLER_COUNT)
+        self.assertEqual(self._single_flight_group.statistics()["executed_call_count"], 2)
+        self.assertEqual(
+            self._single_flight_group.statistics()["coalesced_call_count"], _CALLER_COUNT - 1
+        )
+
+        # 2.0 Assert that a call with another key was not coalesced with them.
+        self.assertEqual(other_key_result, "other")
+        return None
+
+    def test_leader_failure_shared(self):
+        leader_error = RuntimeError("The leading call failed.")
+        call_result_list = self._run_callers(self._blocking_call(leader_error))
+        later_call_result = self._single_flight_group.do("call-key", lambda: "later")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every waiting caller was woken with the leading call's error.
+        self.assertEqual(self._call_count, 1)
+        self.assertEqual(call_result_list, [leader_error] * _CALLER_COUNT)
+
+        # 2.0 Assert that the failed call was not kept: a later call is made anew.
+        self.assertEqual(later_call_result, "later")
+        return None
+
+    def test_waiters_get_copies(self):
+        call_result = {"data": []}
+        call_result_list = self._run_callers(
+            self._blocking_call(call_result), copy_function=dict
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the leading caller got the call's result and every waiting
+        # caller a copy of its own.
+        self.assertEqual(
+            len([result for result in call_result_list if result is call_result]), 1
+        )
+        self.assertEqual(len(set(id(result) for result in call_result_list)), _CALLER_COUNT)
+        self.assertEqual(call_result_list, [call_result] * _CALLER_COUNT)
+        return None
+
+    def test_coalesced_get_responses(self):
+        api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        self.addCleanup(api_helper_util.close)
+        # The token is issued first, so the GET requests start together.
+        api_helper_util.bearer_access_token()
+        request_log_start_index = len(_stand_in_server.request_log())
+        with ThreadPoolExecutor(max_workers=_CALLER_COUNT) as executor:
+            http_response_list = list(
+                executor.map(
+                    lambda _: api_helper_util.make_get_request("UserProfile"),
+                    range(_CALLER_COUNT),
+                )
+            )
+        user_profile_request_count = len(
+            [
+                stand_in_request
+                for stand_in_request in _stand_in_server.request_log()[request_log_start_index:]
+                if stand_in_request.path == "/api/v2/UserProfile"
+            ]
+        )
+        http_response_list[0].headers["X-Changed-By-Caller"] = "1"
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the identical requests made at the same time were sent once.
+        self.assertEqual(user_profile_request_count, 1)
+
+        # 2.0 Assert that every caller got a response of its own, with the same body,
+        # and that changing one caller's response did not change the others.
+        self.assertEqual(
+            len(set(id(http_response) for http_response in http_response_list)), _CALLER_COUNT
+        )
+        for http_response in http_response_list:
+            self.assertEqual(http_response.status_code, 200)
+            self.assertEqual(http_response.json()["data"][0]["username"], "stand-in@lacework.net")
+        for http_response in http_response_list[1:]:
+            self.assertNotIn("X-Changed-By-Caller", http_response.headers)
+        return None
+
+    def test_leader_deadline_not_shared(self):
+        api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        self.addCleanup(api_helper_util.close)
+        api_helper_util.bearer_access_token()
+
+        def leading_request():
+            # The leading request runs out of its own test's deadline.
+            with without_deadline(), deadline_scope(_RESPONSE_DELAY_SECONDS / 3):
+                try:
+                    return api_helper_util.make_get_request("UserProfile")
+                except Exception as error:
+                    return error
+
+        with ThreadPoolExecutor(max_workers=_CALLER_COUNT) as executor:
+            leading_future = executor.submit(leading_request)
+            time.sleep(_RESPONSE_DELAY_SECONDS / 10)
+            # The waiting requests, made without a deadline, join the leading one.
+            waiting_future_list = [
+                executor.submit(api_helper_util.make_get_request, "UserProfile")
+                for _ in range(_CALLER_COUNT - 1)
+            ]
+            leading_result = leading_future.result(timeout=5)
+            waiting_http_response_list = [
+                future.result(timeout=5) for future in waiting_future_list
+            ]
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the leading request failed on its deadline.
+        self.assertIsInstance(leading_result, DeadlineExceededError)
+
+        # 2.0 Assert that the requests which had joined it were made again, under
+        # their own deadlines, and succeeded.
+        for http_response in waiting_http_response_list:
+            self.assertEqual(http_response.status_code, 200)
+        self.assertGreaterEqual(
+            api_helper_util.request_statistics()["get_request_coalescing"]["executed_call_count"], 2
+        )
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
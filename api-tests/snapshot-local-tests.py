@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+import copy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import common.profiling
+import common.utils
+from common.snapshots import DriftKind
+from common.snapshots import ResponseSnapshotStore
+from common.snapshots import ShapeDrift
+from common.snapshots import StructuralSnapshot
+from common.snapshots import assert_no_response_drift
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.synthetic import SyntheticPayload
+from common.synthetic import SyntheticPayloadGenerator
+
+MODULE_NAME = "snapshot-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant.
+_stand_in_server = None
+
+_ACCOUNT_COUNT = 5000
+_ACCOUNTS_JSON_PATH = "$.data[].accounts[]"
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_route(
+        "GET",
+        "/api/v2/UserProfile",
+        SyntheticPayloadGenerator().stand_in_response_function(
+            SyntheticPayload.USER_PROFILE, _ACCOUNT_COUNT
+        ),
+    )
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+def _user_profile_map(account_count=_ACCOUNT_COUNT):
+    return SyntheticPayloadGenerator().payload_map(SyntheticPayload.USER_PROFILE, account_count)
+
+
+def _account_list(user_profile_map):
+    return user_profile_map["data"][0]["accounts"]
+
+
+class SnapshotFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._temporary_directory_uri = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temporary_directory_uri)
+
+    def _drifts(self, old_json_value, new_json_value):
+        old_snapshot = StructuralSnapshot()
+        old_snapshot.add("UserProfile", old_json_value)
+        new_snapshot = StructuralSnapshot()
+        new_snapshot.add("UserProfile", new_json_value)
+        return old_snapshot.diff(new_snapshot)
+
+    def test_records_share_one_shape(self):
+        structural_snapshot = StructuralSnapshot()
+        root_hash = structural_snapshot.add("UserProfile", _user_profile_map())
+
+        # 1.0 Assert that thousands of accounts of one structure take a single shape:
+        # the root, the data list, the organization, the accounts list, the account and
+        # its three scalar kinds.
+        self.assertEqual(structural_snapshot.as_map()["roots"], {"UserProfile": root_hash})
+        self.assertEqual(len(structural_snapshot.as_map()["nodes"]), 8)
+
+        # 2.0 Assert that the structure does not depend on the number of records or
+        # their values.
+        other_snapshot = StructuralSnapshot()
+        self.assertEqual(other_snapshot.add("UserProfile", _user_profile_map(3)), root_hash)
+        self.assertEqual(structural_snapshot.diff(other_snapshot), [])
+        return None
+
+    def test_drifted_json_paths(self):
+        user_profile_map = _user_profile_map(50)
+        drifted_user_profile_map = copy.deepcopy(user_profile_map)
+        drifted_account_list = _account_list(drifted_user_profile_map)
+        del drifted_account_list[7]["custGuid"]
+        drifted_account_list[9]["admin"] = "false"
+        for account_map in drifted_account_list:
+            del account_map["userEnabled"]
+            account_map["accountAlias"] = None
+        drifted_user_profile_map["data"][0]["orgUser"] = None
+
+        # 1.0 Assert that every drift is reported once, at its JSON path, and nothing
+        # else is.
+        self.assertEqual(
+            self._drifts(user_profile_map, drifted_user_profile_map),
+            [
+                ShapeDrift(
+                    "UserProfile", _ACCOUNTS_JSON_PATH + ".accountAlias", DriftKind.ADDED
+                ),
+                ShapeDrift(
+                    "UserProfile",
+                    _ACCOUNTS_JSON_PATH + ".admin",
+                    DriftKind.TYPE_CHANGED,
+                    ["boolean"],
+                    ["boolean", "string"],
+                ),
+                ShapeDrift(
+                    "UserProfile", _ACCOUNTS_JSON_PATH + ".custGuid", DriftKind.BECAME_OPTIONAL
+                ),
+                ShapeDrift(
+                    "UserProfile", _ACCOUNTS_JSON_PATH + ".userEnabled", DriftKind.REMOVED
+                ),
+                ShapeDrift(
+                    "UserProfile",
+                    "$.data[].orgUser",
+                    DriftKind.TYPE_CHANGED,
+                    ["boolean"],
+                    ["null"],
+                ),
+            ],
+        )
+
+        # 2.0 Assert that the reverse diff reports the reverse drifts.
+        reverse_drift_kind_list = [
+            shape_drift.drift_kind
+            for shape_drift in self._drifts(drifted_user_profile_map, user_profile_map)
+        ]
+        self.assertEqual(
+            reverse_drift_kind_list,
+            [
+                DriftKind.REMOVED,
+                DriftKind.TYPE_CHANGED,
+                DriftKind.BECAME_REQUIRED,
+                DriftKind.ADDED,
+                DriftKind.TYPE_CHANGED,
+            ],
+        )
+        return None
+
+    def test_diff_skips_unchanged_structures(self):
+        structural_snapshot = StructuralSnapshot()
+        structural_snapshot.add("UserProfile", _user_profile_map())
+        structural_snapshot.add("Queries/{queryId}", {"data": {"queryId": "Query"}})
+        other_snapshot = StructuralSnapshot.from_map(structural_snapshot.as_map())
+        other_snapshot.add("Queries/{queryId}", {"data": {"queryId": 1}})
+
+        diff_start_time = time.perf_counter()
+        shape_drift_list = structural_snapshot.diff(other_snapshot)
+        diff_duration_seconds = time.perf_counter() - diff_start_time
+
+        # 1.0 Assert that only the changed key was descended into, which takes no
+        # longer than comparing a few hashes.
+        self.assertEqual(
+            [str(shape_drift) for shape_drift in shape_drift_list],
+            ["Queries/{queryId} $.data.queryId: type_changed string -> number|string"],
+        )
+        self.assertLess(diff_duration_seconds, 0.01)
+        return None
+
+    def test_store_compares_against_baseline(self):
+        snapshot_file_uri = os.path.join(self._temporary_directory_uri, "snapshots.json")
+        api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(),
+            response_snapshot_file=snapshot_file_uri,
+        )
+        http_response = api_helper_util.make_get_request("UserProfile")
+        user_profile_map = http_response.json()
+        api_helper_util.close()
+
+        # 1.0 Assert that the first response recorded a baseline far smaller than the
+        # response, and a second response of the same structure matched it.
+        assert_no_response_drift(self, api_helper_util, "UserProfile", user_profile_map)
+        self.assertTrue(os.path.exists(snapshot_file_uri))
+        self.assertLess(os.path.getsize(snapshot_file_uri) * 100, len(http_response.content))
+        assert_no_response_drift(self, api_helper_util, "UserProfile", user_profile_map)
+
+        # 2.0 Assert that a drifted response is reported against the baseline, which
+        # is left unchanged.
+        del _account_list(user_profile_map)[0]["userGuid"]
+        snapshot_store = ResponseSnapshotStore(snapshot_file_uri)
+        drift_list = [
+            ShapeDrift("UserProfile", _ACCOUNTS_JSON_PATH + ".userGuid", DriftKind.BECAME_OPTIONAL)
+        ]
+        for _ in range(2):
+            self.assertEqual(
+                snapshot_store.compare_and_record("UserProfile", user_profile_map), drift_list
+            )
+        with self.assertRaises(AssertionError):
+            assert_no_response_drift(self, api_helper_util, "UserProfile", user_profile_map)
+
+        # 3.0 Assert that a new key is recorded beside the existing baseline.
+        self.assertEqual(snapshot_store.compare_and_record("Queries/{queryId}", {"data": {}}), [])
+        self.assertEqual(
+            StructuralSnapshot.load(snapshot_file_uri).keys(), ["Queries/{queryId}", "UserProfile"]
+        )
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
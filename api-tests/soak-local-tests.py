@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+import os
+import threading
+import time
+import unittest
+
+from apiunittestcore import HttpResponseValidator
+import common.profiling
+import common.utils
+from common.soak import SoakMonitor
+from common.soak import resource_trends
+from common.soak import run_soak
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "soak-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant.
+_stand_in_server = None
+
+_SOAK_DURATION_SECONDS = 1.5
+_SOAK_SAMPLE_INTERVAL_SECONDS = 0.1
+
+
+class _SlowingResponder:
+    # Every response takes a little longer than the one before while slowing.
+    def __init__(self):
+        self.slowing = False
+        self._delay_seconds = 0.001
+        self._lock = threading.Lock()
+
+    def respond(self, stand_in_request):
+        with self._lock:
+            delay_seconds = self._delay_seconds
+            if self.slowing:
+                self._delay_seconds += 0.001
+        time.sleep(delay_seconds)
+        return StandInResponse(json_data={"data": [{"username": "stand-in@lacework.net"}]})
+
+
+_slowing_responder = _SlowingResponder()
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_json_route(
+        "GET", "/api/v2/UserProfile", {"data": [{"username": "stand-in@lacework.net"}]}
+    )
+    _stand_in_server.add_route("GET", "/api/v2/Queries", _slowing_responder.respond)
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class SoakFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+
+    def tearDown(self):
+        self._api_helper_util.close()
+
+    def test_healthy_soak(self):
+        http_response_list = []
+
+        def make_requests(soak_iteration):
+            http_response_list.append(self._api_helper_util.make_get_request("UserProfile"))
+            time.sleep(0.01)
+
+        soak_report_map = run_soak(
+            self._api_helper_util,
+            make_requests,
+            _SOAK_DURATION_SECONDS,
+            sample_interval_seconds=_SOAK_SAMPLE_INTERVAL_SECONDS,
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that successful responses were returned throughout the soak.
+        self.assertTrue(
+            all(
+                HttpResponseValidator.is_successful_200_ok_response(http_response)
+                for http_response in http_response_list
+            )
+        )
+
+        # 2.0 Assert that the tests were looped for the soak duration and sampled at
+        # every interval.
+        self.assertEqual(soak_report_map["iteration_count"], len(http_response_list))
+        self.assertGreater(soak_report_map["iteration_count"], 10)
+        self.assertGreaterEqual(soak_report_map["duration_seconds"], _SOAK_DURATION_SECONDS)
+        self.assertGreaterEqual(soak_report_map["sample_count"], 10)
+        for metric_name in [
+            "rss_bytes",
+            "open_file_descriptor_count",
+            "thread_count",
+            "pool_count",
+            "opened_connection_count",
+        ]:
+            self.assertIn(metric_name, soak_report_map["trends"])
+
+        # 3.0 Assert that neither a leak nor a latency drift was reported, and that one
+        # bearer token, issued or shared by an earlier helper, served the whole soak.
+        self.assertEqual(soak_report_map["leak_suspected_metrics"], [])
+        self.assertEqual(soak_report_map["trends"]["pool_count"]["last"], 1)
+        self.assertLessEqual(soak_report_map["access_tokens"]["issue_count"], 1)
+        self.assertEqual(soak_report_map["access_tokens"]["expired_token_sample_count"], 0)
+        self.assertGreater(soak_report_map["latency"]["first_window"]["sample_count"], 0)
+        return None
+
+    def test_file_descriptor_leak_is_reported(self):
+        leaked_file_list = []
+
+        def leak_file_descriptors(soak_iteration):
+            self._api_helper_util.make_get_request("UserProfile")
+            leaked_file_list.append(open(os.devnull, "r"))
+            time.sleep(0.01)
+
+        try:
+            soak_report_map = run_soak(
+                self._api_helper_util,
+                leak_file_descriptors,
+                _SOAK_DURATION_SECONDS,
+                sample_interval_seconds=_SOAK_SAMPLE_INTERVAL_SECONDS,
+            )
+        finally:
+            for leaked_file in leaked_file_list:
+                leaked_file.close()
+
+        # 1.0 Assert that the steadily rising file descriptor count was reported as a
+        # suspected leak.
+        if soak_report_map["trends"].get("open_file_descriptor_count") == None:
+            self.skipTest("Open file descriptors cannot be counted on this platform.")
+        self.assertIn("open_file_descriptor_count", soak_report_map["leak_suspected_metrics"])
+        self.assertGreater(
+            soak_report_map["trends"]["open_file_descriptor_count"]["slope_per_hour"], 0
+        )
+        return None
+
+    def test_latency_drift_is_reported(self):
+        _slowing_responder.slowing = True
+        try:
+            soak_report_map = run_soak(
+                self._api_helper_util,
+                lambda soak_iteration: self._api_helper_util.make_get_request("Queries"),
+                _SOAK_DURATION_SECONDS,
+                sample_interval_seconds=_SOAK_SAMPLE_INTERVAL_SECONDS,
+            )
+        finally:
+            _slowing_responder.slowing = False
+
+        # 1.0 Assert that the latencies of the last window were reported as drifting
+        # from those of the first window.
+        latency_drift_map = soak_report_map["latency"]
+        self.assertTrue(soak_report_map["latency_drift_suspected"])
+        self.assertGreater(
+            latency_drift_map["last_window"]["p95_ms"], latency_drift_map["first_window"]["p95_ms"]
+        )
+        self.assertGreater(latency_drift_map["drift_ratio"]["p95_ms"], 1.5)
+        return None
+
+    def test_flat_trend_is_not_a_leak(self):
+        # 1.0 Assert that a metric which only fluctuates is not reported as a leak,
+        # while one which keeps growing is.
+        sample_list = [
+            {
+                "elapsed_seconds": sample_index * 60.0,
+                "open_file_descriptor_count": 20 + sample_index % 3,
+                "thread_count": 4 + sample_index,
+            }
+            for sample_index in range(30)
+        ]
+        trend_map = resource_trends(sample_list)
+        self.assertFalse(trend_map["open_file_descriptor_count"]["leak_suspected"])
+        self.assertTrue(trend_map["thread_count"]["leak_suspected"])
+        self.assertNotIn("rss_bytes", trend_map)
+        return None
+
+    def test_monitor_samples_on_demand(self):
+        soak_monitor = SoakMonitor(self._api_helper_util, sample_interval_seconds=3600)
+        soak_monitor.start()
+        self._api_helper_util.make_get_request("UserProfile")
+        sample_map = soak_monitor.sample()
+        soak_monitor.stop()
+
+        # 1.0 Assert that a sample holds the request latencies of its interval, and the
+        # helper's connection pool and token state.
+        self.assertEqual(sample_map["latency"]["sample_count"], 1)
+        self.assertEqual(sample_map["pool_count"], 1)
+        self.assertGreater(sample_map["access_token_time_remaining_seconds"], 0)
+        self.assertEqual(len(soak_monitor.samples()), 3)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
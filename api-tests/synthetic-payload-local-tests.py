@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+import hashlib
+import os
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+from apiunittestcore import HttpResponseValidator
+from apiunittestcore import JsonDataValidator
+import common.profiling
+import common.utils
+from common.lql import validate_lql_query_text
+from common.standin import ContentEncoding
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.synthetic import SyntheticPayload
+from common.synthetic import SyntheticPayloadGenerator
+
+MODULE_NAME = "synthetic-payload-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant.
+_stand_in_server = None
+
+_QUERY_JSON_DATA_NAMES = [
+    "queryId",
+    "queryText",
+    "owner",
+    "lastUpdateTime",
+    "lastUpdateUser",
+    "resultSchema",
+]
+_ACCOUNTS_JSON_DATA_NAMES = ["admin", "accountName", "custGuid", "userGuid", "userEnabled"]
+_ORGANIZATION_JSON_DATA_NAMES = [
+    "username",
+    "orgAccount",
+    "url",
+    "orgAdmin",
+    "orgUser",
+    "accounts",
+]
+_USER_PROFILE_ACCOUNT_COUNT = 20000
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    synthetic_payload_generator = SyntheticPayloadGenerator(seed=7)
+    _stand_in_server.add_route(
+        "GET",
+        "/api/v2/UserProfile",
+        synthetic_payload_generator.stand_in_response_function(
+            SyntheticPayload.USER_PROFILE,
+            _USER_PROFILE_ACCOUNT_COUNT,
+            content_encoding=ContentEncoding.GZIP,
+        ),
+    )
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class SyntheticPayloadFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+
+    def _payload_digest(self, synthetic_payload_generator, payload_name, record_count):
+        payload_hash = hashlib.sha256()
+        for payload_chunk in synthetic_payload_generator.iter_chunks(payload_name, record_count):
+            payload_hash.update(payload_chunk)
+        return payload_hash.hexdigest()
+
+    def test_seeded_payloads_are_deterministic(self):
+        # 1.0 Assert that a seed always generates the same payload, and another seed
+        # a different one.
+        for payload_name in [
+            SyntheticPayload.QUERIES,
+            SyntheticPayload.QUERY_DETAILS,
+            SyntheticPayload.USER_PROFILE,
+            SyntheticPayload.ACCESS_TOKEN,
+        ]:
+            self.assertEqual(
+                self._payload_digest(SyntheticPayloadGenerator(seed=1), payload_name, 100),
+                self._payload_digest(SyntheticPayloadGenerator(seed=1), payload_name, 100),
+            )
+            self.assertNotEqual(
+                self._payload_digest(SyntheticPayloadGenerator(seed=1), payload_name, 100),
+                self._payload_digest(SyntheticPayloadGenerator(seed=2), payload_name, 100),
+            )
+        return None
+
+    def test_payloads_match_validated_schemas(self):
+        synthetic_payload_generator = SyntheticPayloadGenerator()
+
+        # 1.0 Assert that the Queries list and details have the validated data names
+        # and locally valid LQL.
+        query_list = synthetic_payload_generator.payload_map(SyntheticPayload.QUERIES, 500)["data"]
+        self.assertEqual(len(query_list), 500)
+        self.assertTrue(
+            JsonDataValidator.validate_json_data_names_list(
+                query_list, _QUERY_JSON_DATA_NAMES, match_set_explicitly=True
+            )
+        )
+        for query_map in query_list:
+            self.assertIsNone(validate_lql_query_text(query_map["queryText"]))
+        query_detail_map = synthetic_payload_generator.payload_map(
+            SyntheticPayload.QUERY_DETAILS, 50
+        )["data"]
+        self.assertTrue(
+            JsonDataValidator.validate_json_data_names(
+                query_detail_map,
+                ["evaluatorId"] + _QUERY_JSON_DATA_NAMES,
+                match_set_explicitly=True,
+            )
+        )
+        self.assertEqual(len(query_detail_map["resultSchema"]), 50)
+
+        # 2.0 Assert that UserProfile has the validated organization and account data
+        # names.
+        organization_map = synthetic_payload_generator.payload_map(
+            SyntheticPayload.USER_PROFILE, 1000
+        )["data"][0]
+        self.assertTrue(
+            JsonDataValidator.validate_json_data_names(
+                organization_map, _ORGANIZATION_JSON_DATA_NAMES, match_set_explicitly=True
+            )
+        )
+        self.assertEqual(len(organization_map["accounts"]), 1000)
+        self.assertTrue(
+            JsonDataValidator.validate_json_data_names_list(
+                organization_map["accounts"], _ACCOUNTS_JSON_DATA_NAMES, match_set_explicitly=True
+            )
+        )
+
+        # 3.0 Assert that the access token response has the validated data names.
+        self.assertTrue(
+            JsonDataValidator.validate_json_data_names(
+                synthetic_payload_generator.payload_map(SyntheticPayload.ACCESS_TOKEN, 1),
+                ["expiresAt", "token"],
+                match_set_explicitly=True,
+            )
+        )
+        return None
+
+    def test_write_streams_with_flat_memory(self):
+        payload_file_descriptor, payload_file_uri = tempfile.mkstemp(suffix=".json")
+        os.close(payload_file_descriptor)
+        try:
+            tracemalloc.start()
+            byte_count = SyntheticPayloadGenerator().write(
+                payload_file_uri, SyntheticPayload.USER_PROFILE, 50000
+            )
+            _, peak_allocated_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            # 1.0 Assert that a payload many times larger than the memory it took was
+            # written in full.
+            self.assertEqual(os.path.getsize(payload_file_uri), byte_count)
+            self.assertGreater(byte_count, 5 * 1024 * 1024)
+            self.assertLess(peak_allocated_bytes, 1024 * 1024)
+        finally:
+            os.remove(payload_file_uri)
+        return None
+
+    def test_stand_in_serves_large_user_profile(self):
+        api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        try:
+            http_response = api_helper_util.make_get_request("UserProfile")
+        finally:
+            api_helper_util.close()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a successful response was returned.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+
+        # 2.0 Assert that every account of the streamed payload was received and has the
+        # validated data names.
+        accounts_list = http_response.json()["data"][0]["accounts"]
+        self.assertEqual(len(accounts_list), _USER_PROFILE_ACCOUNT_COUNT)
+        self.assertTrue(
+            JsonDataValidator.validate_json_data_names_list(
+                accounts_list, _ACCOUNTS_JSON_DATA_NAMES, match_set_explicitly=True
+            )
+        )
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
@@ -0,0 +1,380 @@
+#!/usr/bin/python3
+from concurrent.futures import ThreadPoolExecutor
+import importlib.util
+import os
+import sys
+import time
+import unittest
+
+import requests
+import urllib3
+
+import common.profiling
+import common.utils
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.timeouts import DeadlineExceededError
+from common.timeouts import RequestTimeouts
+from common.timeouts import TimeoutKind
+from common.timeouts import deadline
+from common.timeouts import deadline_scope
+from common.timeouts import propagate_deadline
+from common.timeouts import remaining_deadline_seconds
+from common.timeouts import timeout_kind
+from common.timeouts import without_deadline
+
+MODULE_NAME = "timeouts-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant.
+_stand_in_server = None
+
+# The stand-in endpoints answer after these delays.
+_SLOW_RESPONSE_DELAY_SECONDS = 1.0
+_FAST_RESPONSE_DELAY_SECONDS = 0.2
+
+
+def _delayed_response_function(delay_seconds):
+    def delayed_response(stand_in_request):
+        time.sleep(delay_seconds)
+        return StandInResponse(json_data={"data": []})
+
+    return delayed_response
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    _stand_in_server.add_route(
+        "GET", "/api/v2/Queries", _delayed_response_function(_SLOW_RESPONSE_DELAY_SECONDS)
+    )
+    _stand_in_server.add_route(
+        "GET", "/api/v2/AuditLogs", _delayed_response_function(_SLOW_RESPONSE_DELAY_SECONDS)
+    )
+    _stand_in_server.add_route(
+        "GET", "/api/v2/UserProfile", _delayed_response_function(_FAST_RESPONSE_DELAY_SECONDS)
+    )
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+def _load_runner_module():
+    # The runner is named with a hyphen, so it is loaded from its file location.
+    module_spec = importlib.util.spec_from_file_location(
+        "run_tests", os.path.join(os.path.dirname(os.path.abspath(__file__)), "run-tests.py")
+    )
+    runner_module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_spec.name] = runner_module
+    module_spec.loader.exec_module(runner_module)
+    return runner_module
+
+
+class TimeoutsFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        # Queries reads time out long before the stand-in answers; every other
+        # endpoint family keeps the default timeouts.
+        self._api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(),
+            coalesce_get_requests=False,
+            request_timeouts={
+                RequestTimeouts.DEFAULT: {
+                    RequestTimeouts.CONNECT_SECONDS: 5,
+                    RequestTimeouts.READ_SECONDS: 10,
+                },
+                "Queries": {RequestTimeouts.READ_SECONDS: 0.2},
+            },
+        )
+
+    def tearDown(self):
+        self._api_helper_util.close()
+
+    def test_request_timeouts_per_endpoint_family(self):
+        request_start_time = time.perf_counter()
+        with self.assertRaises(requests.exceptions.RequestException) as error_context:
+            self._api_helper_util.make_get_request("Queries")
+        request_duration_seconds = time.perf_counter() - request_start_time
+        http_response = self._api_helper_util.make_get_request("UserProfile")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the request to the endpoint family with a short read timeout
+        # was given up long before the stand-in answered, and classified as a read
+        # timeout.
+        self.assertLess(request_duration_seconds, _SLOW_RESPONSE_DELAY_SECONDS)
+        self.assertEqual(timeout_kind(error_context.exception), TimeoutKind.READ)
+
+        # 2.0 Assert that the other endpoint families kept the default timeouts.
+        self.assertEqual(http_response.status_code, 200)
+        self.assertEqual(self._api_helper_util.request_timeouts().timeout("UserProfile"), (5, 10))
+
+        # 3.0 Assert that the timeout was counted by endpoint family and kind.
+        self.assertEqual(
+            self._api_helper_util.request_statistics()["timeouts"],
+            {"Queries": {TimeoutKind.READ: 1}},
+        )
+        return None
+
+    def test_deadline_bounds_every_helper_call(self):
+        request_start_time = time.perf_counter()
+        with without_deadline(), deadline_scope(0.3):
+            with self.assertRaises(DeadlineExceededError) as error_context:
+                self._api_helper_util.make_get_request("AuditLogs")
+            request_duration_seconds = time.perf_counter() - request_start_time
+            request_count = len(_stand_in_server.request_log())
+            # A later call, such as a retry, is not sent once the deadline has passed.
+            with self.assertRaises(DeadlineExceededError):
+                self._api_helper_util.make_get_request("UserProfile")
+        with without_deadline():
+            http_response = self._api_helper_util.make_get_request("UserProfile")
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the request was cut short by the deadline, not its read
+        # timeout, and classified as a deadline timeout.
+        self.assertLess(request_duration_seconds, _SLOW_RESPONSE_DELAY_SECONDS)
+        self.assertEqual(timeout_kind(error_context.exception), TimeoutKind.DEADLINE)
+        self.assertEqual(
+            self._api_helper_util.request_statistics()["timeouts"],
+            {"AuditLogs": {TimeoutKind.DEADLINE: 1}},
+        )
+
+        # 2.0 Assert that no request was sent after the deadline, and that requests
+        # were no longer bounded by it once it was lifted.
+        self.assertEqual(len(_stand_in_server.request_log()), request_count + 1)
+        self.assertEqual(http_response.status_code, 200)
+        return None
+
+    def _assert_cut_short_by_deadline(self, api_helper_util, request_function):
+        # Runs request_function under a short deadline, and returns how long it took to
+        # raise DeadlineExceededError.
+        request_start_time = time.perf_counter()
+        with without_deadline(), deadline_scope(0.3):
+            with self.assertRaises(DeadlineExceededError):
+                request_function()
+        return time.perf_counter() - request_start_time
+
+    def test_deadline_bounds_queued_requests(self):
+        # A request slot held elsewhere, with a limit of one request in flight.
+        limited_api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(),
+            adaptive_concurrency={"initial_limit": 1, "minimum_limit": 1, "maximum_limit": 1},
+        )
+        self.addCleanup(limited_api_helper_util.close)
+        limited_api_helper_util.bearer_access_token()
+        limited_api_helper_util.concurrency_limiter().acquire()
+        try:
+            limited_duration_seconds = self._assert_cut_short_by_deadline(
+                limited_api_helper_util,
+                lambda: limited_api_helper_util.make_get_request("UserProfile"),
+            )
+        finally:
+            limited_api_helper_util.concurrency_limiter().release(0.0)
+        # A rate limit whose only token was taken, after the bearer token was issued or
+        # read from the token cache.
+        rate_limited_api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(), rate_limit_requests_per_second=0.2
+        )
+        self.addCleanup(rate_limited_api_helper_util.close)
+        rate_limited_api_helper_util.bearer_access_token()
+        rate_limited_api_helper_util._rate_limiter.try_acquire()
+        rate_limited_duration_seconds = self._assert_cut_short_by_deadline(
+            rate_limited_api_helper_util,
+            lambda: rate_limited_api_helper_util.make_get_request("UserProfile"),
+        )
+        # A key pool whose only key spent its budget on the first request.
+        pooled_api_helper_util = stand_in_api_helper_util(
+            _stand_in_server.base_url(),
+            api_access_key_id=None,
+            secret_key=None,
+            api_keys=[
+                {
+                    "api_access_key_id": "STAND_IN_POOLED_KEY",
+                    "secret_key": "SECRET",
+                    "rate_limit_requests_per_second": 0.2,
+                }
+            ],
+        )
+        self.addCleanup(pooled_api_helper_util.close)
+        pooled_api_helper_util.make_get_request("UserProfile")
+        pooled_duration_seconds = self._assert_cut_short_by_deadline(
+            pooled_api_helper_util,
+            lambda: pooled_api_helper_util.make_get_request("UserProfile"),
+        )
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the requests queued for a concurrency slot, a rate limit token
+        # and a pooled key were given up at the deadline rather than after the wait.
+        for duration_seconds in [
+            limited_duration_seconds,
+            rate_limited_duration_seconds,
+            pooled_duration_seconds,
+        ]:
+            self.assertLess(duration_seconds, _SLOW_RESPONSE_DELAY_SECONDS)
+
+        # 2.0 Assert that each was counted as a deadline timeout of its endpoint family.
+        for api_helper_util in [
+            limited_api_helper_util,
+            rate_limited_api_helper_util,
+            pooled_api_helper_util,
+        ]:
+            self.assertEqual(
+                api_helper_util.request_statistics()["timeouts"],
+                {"UserProfile": {TimeoutKind.DEADLINE: 1}},
+            )
+        return None
+
+    def test_deadline_bounds_coalesced_waiters(self):
+        coalescing_api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+        self.addCleanup(coalescing_api_helper_util.close)
+        coalescing_api_helper_util.bearer_access_token()
+        with without_deadline(), ThreadPoolExecutor(max_workers=1) as executor:
+            # The leading request, made without a deadline, takes the slow response.
+            leading_future = executor.submit(
+                coalescing_api_helper_util.make_get_request, "AuditLogs"
+            )
+            time.sleep(_FAST_RESPONSE_DELAY_SECONDS)
+            waiting_duration_seconds = self._assert_cut_short_by_deadline(
+                coalescing_api_helper_util,
+                lambda: coalescing_api_helper_util.make_get_request("AuditLogs"),
+            )
+            leading_http_response = leading_future.result()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the request which joined the in-flight one gave up waiting for
+        # it at the deadline, while the leading request completed.
+        self.assertLess(
+            waiting_duration_seconds, _SLOW_RESPONSE_DELAY_SECONDS - _FAST_RESPONSE_DELAY_SECONDS
+        )
+        self.assertEqual(leading_http_response.status_code, 200)
+        self.assertEqual(
+            coalescing_api_helper_util.request_statistics()["timeouts"],
+            {"AuditLogs": {TimeoutKind.DEADLINE: 1}},
+        )
+        return None
+
+    def test_deadline_propagates_to_threads(self):
+        # The run's own test deadline, if any, is lifted, so only the deadlines of the
+        # test are in force.
+        with without_deadline(), deadline_scope(30):
+            # A deadline inside another keeps the earlier one.
+            with deadline_scope(60):
+                nested_remaining_seconds = remaining_deadline_seconds()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                propagated_remaining_seconds = executor.submit(
+                    propagate_deadline(remaining_deadline_seconds)
+                ).result()
+                unpropagated_remaining_seconds = executor.submit(
+                    remaining_deadline_seconds
+                ).result()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the nested deadline did not extend the outer one.
+        self.assertLessEqual(nested_remaining_seconds, 30)
+
+        # 2.0 Assert that work handed to a thread pool runs under the caller's deadline
+        # only when it is propagated.
+        self.assertGreater(propagated_remaining_seconds, 0)
+        self.assertLessEqual(propagated_remaining_seconds, 30)
+        self.assertIsNone(unpropagated_remaining_seconds)
+        return None
+
+    def test_timeout_classification(self):
+        def chained_error():
+            try:
+                raise DeadlineExceededError("The test deadline passed.")
+            except DeadlineExceededError as error:
+                try:
+                    raise RuntimeError("The query results were not fetched.") from error
+                except RuntimeError as chained_error:
+                    return chained_error
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every kind of timeout is told apart, including a read timeout
+        # raised while the body is read and a timeout causing another error.
+        self.assertEqual(timeout_kind(requests.exceptions.ConnectTimeout()), TimeoutKind.CONNECT)
+        self.assertEqual(timeout_kind(requests.exceptions.ReadTimeout()), TimeoutKind.READ)
+        self.assertEqual(
+            timeout_kind(
+                requests.exceptions.ConnectionError(
+                    urllib3.exceptions.ReadTimeoutError(None, None, "Read timed out.")
+                )
+            ),
+            TimeoutKind.READ,
+        )
+        self.assertEqual(timeout_kind(chained_error()), TimeoutKind.DEADLINE)
+
+        # 2.0 Assert that other errors are not timeouts.
+        self.assertIsNone(timeout_kind(requests.exceptions.ConnectionError()))
+        self.assertIsNone(timeout_kind(AssertionError()))
+        self.assertIsNone(timeout_kind(None))
+        return None
+
+    def test_runner_reports_timeouts(self):
+        runner_module = _load_runner_module()
+        api_helper_util = self._api_helper_util
+
+        # The test case is defined here, so the loader of this module does not run it.
+        class StuckRequestTests(unittest.TestCase):
+            def test_stuck_audit_logs(self):
+                api_helper_util.make_get_request("AuditLogs")
+
+            def test_stuck_queries(self):
+                api_helper_util.make_get_request("Queries")
+
+            @deadline(5)
+            def test_slow_audit_logs(self):
+                api_helper_util.make_get_request("AuditLogs")
+
+            def test_failed_assertion(self):
+                self.fail("Not a timeout.")
+
+        test_result = runner_module._RecordingTestResult("stuck-request-tests", 0.3)
+        with without_deadline():
+            unittest.defaultTestLoader.loadTestsFromTestCase(StuckRequestTests).run(test_result)
+            remaining_seconds = remaining_deadline_seconds()
+        test_record_map = {
+            test_record["test"].rsplit(".", 1)[1]: test_record
+            for test_record in test_result.test_record_list
+        }
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the tests which ran out of time were classified by the kind
+        # of their timeout.
+        self.assertEqual(test_record_map["test_stuck_audit_logs"]["outcome"], "error")
+        self.assertEqual(test_record_map["test_stuck_audit_logs"]["timeout"], TimeoutKind.DEADLINE)
+        self.assertEqual(test_record_map["test_stuck_queries"]["timeout"], TimeoutKind.READ)
+        self.assertLess(
+            test_record_map["test_stuck_audit_logs"]["duration_seconds"],
+            _SLOW_RESPONSE_DELAY_SECONDS,
+        )
+
+        # 2.0 Assert that a test's own deadline replaced the run's.
+        self.assertEqual(test_record_map["test_slow_audit_logs"]["outcome"], "passed")
+        self.assertNotIn("timeout", test_record_map["test_slow_audit_logs"])
+
+        # 3.0 Assert that other failures were not classified as timeouts, and that the
+        # deadline ended with the tests.
+        self.assertEqual(test_record_map["test_failed_assertion"]["outcome"], "failed")
+        self.assertNotIn("timeout", test_record_map["test_failed_assertion"])
+        self.assertIsNone(remaining_seconds)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
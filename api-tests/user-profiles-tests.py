@@ -1,11 +1,14 @@
 #!/usr/bin/python3
-import requests
 import time
 import unittest
 
 from apiunittestcore import HttpResponseValidator
-from apiunittestcore import JsonDataValidator
+from apiunittestcore import LatencyBudget
+import common.profiling
 import common.utils
+from common.models import UserProfileAccount
+from common.models import UserProfileOrganization
+from common.snapshots import assert_no_response_drift
 from common.utils import ApiHelperUtil
 
 MODULE_NAME = "user-profiles-tests"
@@ -20,12 +23,7 @@ class UserProfilesFunctionalTests(unittest.TestCase):
         common.utils.log_info(MODULE_NAME, log_message)
 
     def test_list_sub_accounts(self):
-        # Create the API Request URL
-        api_request_url = _api_helper_util.get_api_endpoint("UserProfile")
-        bearer_access_token = _api_helper_util.create_new_bearer_access_token()
-        http_headers = _api_helper_util.http_authentication_header(bearer_access_token)
-
-        http_response = requests.get(api_request_url, headers=http_headers)
+        http_response = _api_helper_util.make_get_request("UserProfile")
 
         # Begin assertions and validations
 
@@ -41,35 +39,10 @@ class UserProfilesFunctionalTests(unittest.TestCase):
 
         # 3.0 Assert that the expected reponse schema is present.
         # At least one account should be returned in the application/json schema
-        # Top level org data json names
+        # The organization and account data names are the field tables of the response
+        # models generated from the API v2 schema.
         DATA_JSON_NAME = "data"
-        USERNAME_JSON_NAME = "username"
-        ORG_ACCOUNT_JSON_NAME = "orgAccount"
-        URL_JSON_NAME = "url"
-        ORG_ADMIN_JSON_NAME = "orgAdmin"
-        ORG_USER_JSON_NAME = "orgUser"
         ACCOUNTS_JSON_NAME = "accounts"
-        DATA_ORGANIZATION_JSON_DATA_NAMES_LIST = [
-            USERNAME_JSON_NAME,
-            ORG_ACCOUNT_JSON_NAME,
-            URL_JSON_NAME,
-            ORG_ADMIN_JSON_NAME,
-            ORG_USER_JSON_NAME,
-            ACCOUNTS_JSON_NAME,
-        ]
-        # Account based json names
-        ADMIN_JSON_NAME = "admin"
-        ACCOUNT_NAME_JSON_NAME = "accountName"
-        CUST_GUID_JSON_NAME = "custGuid"
-        USER_GUID_JSON_NAME = "userGuid"
-        USER_ENABLED_JSON_NAME = "userEnabled"
-        ACCOUNTS_JSON_DATA_NAMES_LIST = [
-            ADMIN_JSON_NAME,
-            ACCOUNT_NAME_JSON_NAME,
-            CUST_GUID_JSON_NAME,
-            USER_GUID_JSON_NAME,
-            USER_ENABLED_JSON_NAME,
-        ]
 
         # Extract the json response.
         # If a known account setup is provided, a JSON with explict key-value
@@ -81,24 +54,41 @@ class UserProfilesFunctionalTests(unittest.TestCase):
         for organization_data_map in organization_data_list:
             # Validate each JSON object found in the list.
             self.assertTrue(isinstance(organization_data_map, dict))
+            self.assertTrue(UserProfileOrganization.validate(organization_data_map))
+            # Organizations may hold many accounts, so they are validated in bulk.
             self.assertTrue(
-                JsonDataValidator.validate_json_data_names(
-                    organization_data_map,
-                    DATA_ORGANIZATION_JSON_DATA_NAMES_LIST,
-                    match_set_explicitly=True,
+                UserProfileAccount.validate_list(
+                    organization_data_map.get(ACCOUNTS_JSON_NAME)
                 )
             )
-            accounts_list = organization_data_map.get(ACCOUNTS_JSON_NAME)
-            self.assertTrue(isinstance(accounts_list, list))
-            for account_data_map in accounts_list:
-                self.assertTrue(isinstance(account_data_map, dict))
-                self.assertTrue(
-                    JsonDataValidator.validate_json_data_names(
-                        account_data_map,
-                        ACCOUNTS_JSON_DATA_NAMES_LIST,
-                        match_set_explicitly=True,
-                    )
-                )
+            organization = UserProfileOrganization.from_json(organization_data_map)
+            self.assertEqual(
+                len(organization.accounts), len(organization_data_map[ACCOUNTS_JSON_NAME])
+            )
+
+        # 4.0 Assert that the response structure has not drifted from the snapshot
+        # baseline, when "response_snapshot_file" is configured.
+        assert_no_response_drift(self, _api_helper_util, "UserProfile", http_response_json_map)
+        return None
+
+    def test_list_sub_accounts_latency(self):
+        # The latency budget of the endpoint is set by "latency_budgets" in the
+        # configuration file.
+        ENDPOINT_NAME = "UserProfile"
+        latency_budget = LatencyBudget.from_map(
+            _api_helper_util.latency_budget_map(ENDPOINT_NAME)
+        )
+        if latency_budget == None:
+            self.skipTest("No latency budget is configured for {}.".format(ENDPOINT_NAME))
+
+        # 1.0 Assert that the endpoint meets its latency budget.
+        latency_budget_verdict = HttpResponseValidator.validate_response_latency(
+            ENDPOINT_NAME,
+            lambda: _api_helper_util.make_get_request(ENDPOINT_NAME, coalesce=False),
+            latency_budget,
+            api_helper_util=_api_helper_util,
+        )
+        self.assertTrue(latency_budget_verdict, msg=str(latency_budget_verdict))
         return None
 
 
@@ -108,7 +98,7 @@ if __name__ == "__main__":
         api_config_parameters = common.utils.configure_test_environment()
         _api_helper_util = ApiHelperUtil(api_config_parameters)
         # Run the module's unit test.
-        unittest.main()
+        common.profiling.unittest_main()
 
     except SystemExit as error:
         if error.args[0] == True:
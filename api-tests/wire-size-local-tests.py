@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+import time
+import unittest
+
+from apiunittestcore import HttpResponseValidator
+import common.profiling
+import common.utils
+from common.standin import ContentEncoding
+from common.standin import available_content_encodings
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+
+MODULE_NAME = "wire-size-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# These tests run against a local stand-in server, not a Lacework tenant.
+_stand_in_server = None
+
+
+def _large_queries_response_map(query_count=500):
+    return {
+        "data": [
+            {
+                "queryId": "Stand_In_Query_{}".format(query_index),
+                "queryText": "Stand_In_Query_{} {{ source {{ LW_HA_DNS_REQUESTS }} return distinct {{ HOSTNAME }} }}".format(
+                    query_index
+                ),
+                "owner": "Lacework",
+                "lastUpdateTime": "2022-01-01T00:00:00.000Z",
+                "lastUpdateUser": "stand-in@lacework.net",
+            }
+            for query_index in range(query_count)
+        ]
+    }
+
+
+def setUpModule():
+    global _stand_in_server
+    _stand_in_server = start_stand_in_server()
+    for content_encoding in available_content_encodings():
+        _stand_in_server.add_json_route(
+            "GET",
+            "/api/v2/{}".format(content_encoding),
+            _large_queries_response_map(),
+            content_encoding=content_encoding,
+        )
+
+
+def tearDownModule():
+    _stand_in_server.stop()
+
+
+class WireSizeFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+        self._api_helper_util = stand_in_api_helper_util(_stand_in_server.base_url())
+
+    def tearDown(self):
+        self._api_helper_util.close()
+
+    def _validate_content_encoding(self, content_encoding):
+        if content_encoding not in available_content_encodings():
+            self.skipTest("The {} content encoding is not installed.".format(content_encoding))
+        http_response = self._api_helper_util.make_get_request(content_encoding)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that a successful response was returned.
+        self.assertTrue(HttpResponseValidator.is_successful_200_ok_response(http_response))
+
+        # 2.0 Assert that the content encoding was advertised and the body was decoded.
+        stand_in_request = _stand_in_server.request_log()[-1]
+        if content_encoding != ContentEncoding.IDENTITY:
+            self.assertIn(content_encoding, stand_in_request.accepted_content_encodings())
+            self.assertEqual(http_response.headers.get("Content-Encoding"), content_encoding)
+        self.assertEqual(http_response.json(), _large_queries_response_map())
+
+        # 3.0 Assert that the wire size was accounted for the endpoint.
+        endpoint_statistics_map = self._api_helper_util.wire_statistics().endpoint_statistics(
+            content_encoding
+        )
+        self.assertEqual(endpoint_statistics_map["response_count"], 1)
+        self.assertEqual(
+            endpoint_statistics_map["uncompressed_response_bytes"], len(http_response.content)
+        )
+        self.assertEqual(endpoint_statistics_map["content_encodings"], {content_encoding: 1})
+        if content_encoding == ContentEncoding.IDENTITY:
+            self.assertEqual(
+                endpoint_statistics_map["compressed_response_bytes"],
+                endpoint_statistics_map["uncompressed_response_bytes"],
+            )
+        else:
+            self.assertLess(
+                endpoint_statistics_map["compressed_response_bytes"],
+                endpoint_statistics_map["uncompressed_response_bytes"],
+            )
+        return None
+
+    def test_identity_content_encoding(self):
+        return self._validate_content_encoding(ContentEncoding.IDENTITY)
+
+    def test_gzip_content_encoding(self):
+        return self._validate_content_encoding(ContentEncoding.GZIP)
+
+    def test_deflate_content_encoding(self):
+        return self._validate_content_encoding(ContentEncoding.DEFLATE)
+
+    def test_brotli_content_encoding(self):
+        return self._validate_content_encoding(ContentEncoding.BROTLI)
+
+    def test_zstandard_content_encoding(self):
+        return self._validate_content_encoding(ContentEncoding.ZSTANDARD)
+
+    def test_wire_statistics_report(self):
+        self._api_helper_util.make_get_request(ContentEncoding.GZIP)
+        self._api_helper_util.make_get_request(ContentEncoding.GZIP)
+
+        # 1.0 Assert that the run report holds the compression ratio and transfer time.
+        wire_statistics_map = self._api_helper_util.request_statistics()["wire_statistics"]
+        self.assertEqual(wire_statistics_map[ContentEncoding.GZIP]["response_count"], 2)
+        self.assertGreater(wire_statistics_map[ContentEncoding.GZIP]["compression_ratio"], 1.0)
+        self.assertGreater(wire_statistics_map[ContentEncoding.GZIP]["transfer_time_seconds"], 0)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise
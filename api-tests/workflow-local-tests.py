@@ -0,0 +1,344 @@
+#!/usr/bin/python3
+import importlib.util
+import os
+import sys
+import threading
+import time
+import unittest
+import uuid
+
+import common.profiling
+import common.utils
+from common.standin import StandInResponse
+from common.standin import stand_in_api_helper_util
+from common.standin import start_stand_in_server
+from common.workflow import StepOutcome
+from common.workflow import WorkflowTestCase
+from common.workflow import WorkflowTestSuite
+from common.workflow import split_workflow_tests
+from common.workflow import workflow_step
+
+MODULE_NAME = "workflow-local-tests"
+_TEST_START_TIMESTAMP = time.time()
+
+# Every timed step takes this long, so parallel and serial steps are easy to tell apart.
+_STEP_DURATION_SECONDS = 0.3
+
+# The resource workflow modules, run together as in run-tests.py.
+_RESOURCE_WORKFLOW_MODULE_NAMES = [
+    "alert-channels-tests",
+    "resource-groups-tests",
+    "alert-rules-tests",
+    "report-rules-tests",
+]
+
+
+class _StandInResourceStore:
+    # The resources of one API endpoint of the stand-in server.
+    def __init__(self, guid_data_name):
+        self._guid_data_name = guid_data_name
+        self.resource_map = {}
+        self._lock = threading.Lock()
+
+    def create(self, stand_in_request):
+        data_map = dict(stand_in_request.json())
+        data_map[self._guid_data_name] = uuid.uuid4().hex
+        with self._lock:
+            self.resource_map[data_map[self._guid_data_name]] = data_map
+        return StandInResponse(status_code=201, json_data={"data": data_map})
+
+    def get(self, stand_in_request):
+        guid = stand_in_request.path.rsplit("/", 1)[1]
+        with self._lock:
+            data_map = self.resource_map.get(guid)
+        if data_map == None:
+            return StandInResponse(status_code=404, json_data={"message": "Not Found"})
+        return StandInResponse(json_data={"data": data_map})
+
+    def delete(self, stand_in_request):
+        guid = stand_in_request.path.rsplit("/", 1)[1]
+        with self._lock:
+            if self.resource_map.pop(guid, None) == None:
+                return StandInResponse(status_code=404, json_data={"message": "Not Found"})
+        return StandInResponse(status_code=204)
+
+
+def _start_resource_stand_in_server():
+    # A local stand-in server for the resource endpoints of the workflow modules.
+    # Returns it with its resource stores, by endpoint.
+    stand_in_server = start_stand_in_server()
+    resource_store_map = {}
+    for api_request, guid_data_name in [
+        ("AlertChannels", "intgGuid"),
+        ("ResourceGroups", "resourceGuid"),
+        ("AlertRules", "mcGuid"),
+        ("ReportRules", "mcGuid"),
+    ]:
+        resource_store = _StandInResourceStore(guid_data_name)
+        resource_store_map[api_request] = resource_store
+        resource_path = "/api/v2/{}".format(api_request)
+        stand_in_server.add_route("POST", resource_path, resource_store.create)
+        stand_in_server.add_route("GET", resource_path + "/*", resource_store.get)
+        stand_in_server.add_route("DELETE", resource_path + "/*", resource_store.delete)
+    return stand_in_server, resource_store_map
+
+
+def _load_test_module(module_name):
+    # The test modules are named with hyphens, so they are loaded from their file
+    # location. They are registered, as the workflow suite runs their module fixtures.
+    module_spec = importlib.util.spec_from_file_location(
+        module_name.replace("-", "_"),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), module_name + ".py"),
+    )
+    test_module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_spec.name] = test_module
+    module_spec.loader.exec_module(test_module)
+    return test_module
+
+
+def _step_outcome_map(workflow_test_suite):
+    return {
+        step_map["test"].rsplit(".", 1)[1]: step_map["outcome"]
+        for step_map in workflow_test_suite.report()["steps"]
+    }
+
+
+class WorkflowFunctionalTests(unittest.TestCase):
+    def setUp(self):
+        log_message = "Performing Test ::{}".format(self._testMethodName)
+        common.utils.log_info(MODULE_NAME, log_message)
+
+    def _run_workflow(self, workflow_test_case_class):
+        # The step classes are defined inside the tests, so the loader of this module
+        # does not run them as tests of their own. This module has no module fixtures
+        # for the workflow suite to run again.
+        workflow_test_suite = WorkflowTestSuite(
+            unittest.defaultTestLoader.loadTestsFromTestCase(workflow_test_case_class)
+        )
+        test_result = unittest.TestResult()
+        workflow_test_suite.run(test_result)
+        return workflow_test_suite, test_result
+
+    def test_parallel_branches_and_chains(self):
+        consumed_value_list = []
+
+        class TimedWorkflowTests(WorkflowTestCase):
+            @workflow_step(produces=["alert_channel_guid"])
+            def test_create_alert_channel(self):
+                time.sleep(_STEP_DURATION_SECONDS)
+                self.produce_value("alert_channel_guid", "channel-1")
+
+            @workflow_step(produces=["resource_group_guid"])
+            def test_create_resource_group(self):
+                time.sleep(_STEP_DURATION_SECONDS)
+                self.produce_value("resource_group_guid", "group-1")
+
+            @workflow_step(
+                consumes=["alert_channel_guid", "resource_group_guid"],
+                produces=["alert_rule_guid"],
+            )
+            def test_create_alert_rule(self):
+                consumed_value_list.append(self.consumed_value("alert_channel_guid"))
+                consumed_value_list.append(self.consumed_value("resource_group_guid"))
+                time.sleep(_STEP_DURATION_SECONDS)
+                self.produce_value("alert_rule_guid", "rule-1")
+
+        workflow_test_suite, test_result = self._run_workflow(TimedWorkflowTests)
+        report_map = workflow_test_suite.report()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every step passed and received the values it consumed.
+        self.assertTrue(test_result.wasSuccessful())
+        self.assertEqual(test_result.testsRun, 3)
+        self.assertEqual(consumed_value_list, ["channel-1", "group-1"])
+
+        # 2.0 Assert that the independent steps ran in parallel and the dependent step
+        # after them: the workflow took two step durations, not three.
+        self.assertEqual(report_map["step_count"], 3)
+        self.assertGreaterEqual(report_map["serial_duration_seconds"], 3 * _STEP_DURATION_SECONDS)
+        self.assertGreaterEqual(report_map["makespan_seconds"], 2 * _STEP_DURATION_SECONDS)
+        self.assertLess(report_map["makespan_seconds"], 2.8 * _STEP_DURATION_SECONDS)
+
+        # 3.0 Assert that the critical path ends with the dependent step.
+        self.assertEqual(len(report_map["critical_path"]), 2)
+        self.assertTrue(report_map["critical_path"][1].endswith("test_create_alert_rule"))
+        self.assertGreaterEqual(report_map["critical_path_seconds"], 2 * _STEP_DURATION_SECONDS)
+        return None
+
+    def test_failure_skips_downstream_steps(self):
+        class FailingWorkflowTests(WorkflowTestCase):
+            @workflow_step(produces=["alert_channel_guid"])
+            def test_create_alert_channel(self):
+                self.fail("The alert channel was not created.")
+
+            @workflow_step(consumes=["alert_channel_guid"], produces=["alert_rule_guid"])
+            def test_create_alert_rule(self):
+                self.produce_value("alert_rule_guid", "rule-1")
+
+            @workflow_step(consumes=["alert_rule_guid"])
+            def test_alert_rule_details(self):
+                pass
+
+            @workflow_step(produces=["resource_group_guid"])
+            def test_create_resource_group(self):
+                # Passes without producing what it declared.
+                pass
+
+            @workflow_step(consumes=["resource_group_guid"])
+            def test_resource_group_details(self):
+                pass
+
+            @workflow_step(produces=["report_rule_guid"])
+            def test_create_report_rule(self):
+                self.produce_value("report_rule_guid", "report-1")
+
+        workflow_test_suite, test_result = self._run_workflow(FailingWorkflowTests)
+        step_outcome_map = _step_outcome_map(workflow_test_suite)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the failed step was reported once and every step downstream
+        # of it was skipped.
+        self.assertEqual(len(test_result.failures), 1)
+        self.assertEqual(step_outcome_map["test_create_alert_channel"], StepOutcome.FAILED)
+        self.assertEqual(step_outcome_map["test_create_alert_rule"], StepOutcome.SKIPPED)
+        self.assertEqual(step_outcome_map["test_alert_rule_details"], StepOutcome.SKIPPED)
+
+        # 2.0 Assert that a step consuming a value which was never produced was skipped.
+        self.assertEqual(step_outcome_map["test_create_resource_group"], StepOutcome.PASSED)
+        self.assertEqual(step_outcome_map["test_resource_group_details"], StepOutcome.SKIPPED)
+
+        # 3.0 Assert that the independent branch still ran.
+        self.assertEqual(step_outcome_map["test_create_report_rule"], StepOutcome.PASSED)
+        self.assertEqual(len(test_result.skipped), 3)
+        self.assertEqual(test_result.testsRun, 6)
+        return None
+
+    def test_cleanups_run_after_the_last_step(self):
+        event_list = []
+
+        class CleanupWorkflowTests(WorkflowTestCase):
+            @workflow_step(produces=["alert_channel_guid"])
+            def test_create_alert_channel(self):
+                event_list.append("create alert channel")
+                self.add_workflow_cleanup(event_list.append, "delete alert channel")
+                self.produce_value("alert_channel_guid", "channel-1")
+
+            @workflow_step(consumes=["alert_channel_guid"], produces=["alert_rule_guid"])
+            def test_create_alert_rule(self):
+                event_list.append("create alert rule")
+                self.add_workflow_cleanup(event_list.append, "delete alert rule")
+                self.produce_value("alert_rule_guid", "rule-1")
+
+            @workflow_step(consumes=["alert_rule_guid"])
+            def test_alert_rule_details(self):
+                event_list.append("read alert rule")
+
+        workflow_test_suite, test_result = self._run_workflow(CleanupWorkflowTests)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the resources were deleted once no step needed them, those
+        # created last first.
+        self.assertTrue(test_result.wasSuccessful())
+        self.assertEqual(
+            event_list,
+            [
+                "create alert channel",
+                "create alert rule",
+                "read alert rule",
+                "delete alert rule",
+                "delete alert channel",
+            ],
+        )
+        self.assertEqual(workflow_test_suite.report()["cleanup_errors"], [])
+        return None
+
+    def test_unproduced_and_cyclic_values_are_skipped(self):
+        class UnrunnableWorkflowTests(WorkflowTestCase):
+            @workflow_step(consumes=["team_member_guid"])
+            def test_team_member_details(self):
+                pass
+
+            @workflow_step(consumes=["resource_group_guid"], produces=["alert_rule_guid"])
+            def test_create_alert_rule(self):
+                pass
+
+            @workflow_step(consumes=["alert_rule_guid"], produces=["resource_group_guid"])
+            def test_create_resource_group(self):
+                pass
+
+        workflow_test_suite, test_result = self._run_workflow(UnrunnableWorkflowTests)
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that the steps which could never run were skipped, not failed,
+        # and did not hang the workflow.
+        self.assertTrue(test_result.wasSuccessful())
+        self.assertEqual(len(test_result.skipped), 3)
+        self.assertEqual(
+            set(_step_outcome_map(workflow_test_suite).values()), {StepOutcome.SKIPPED}
+        )
+        return None
+
+    def test_resource_workflow_modules(self):
+        stand_in_server, resource_store_map = _start_resource_stand_in_server()
+        api_helper_util = stand_in_api_helper_util(stand_in_server.base_url())
+        workflow_test_list = []
+        for module_name in _RESOURCE_WORKFLOW_MODULE_NAMES:
+            test_module = _load_test_module(module_name)
+            test_module._api_helper_util = api_helper_util
+            _, module_workflow_test_list = split_workflow_tests(
+                unittest.defaultTestLoader.loadTestsFromModule(test_module)
+            )
+            workflow_test_list.extend(module_workflow_test_list)
+        workflow_test_suite = WorkflowTestSuite(workflow_test_list)
+        test_result = unittest.TestResult()
+        try:
+            workflow_test_suite.run(test_result)
+        finally:
+            api_helper_util.close()
+            stand_in_server.stop()
+        report_map = workflow_test_suite.report()
+
+        # Begin assertions and validations
+
+        # 1.0 Assert that every step of the modules passed, consuming the resources
+        # created by the other modules.
+        self.assertEqual(test_result.failures + test_result.errors, [])
+        self.assertEqual(test_result.skipped, [])
+        self.assertEqual(test_result.testsRun, 6)
+
+        # 2.0 Assert that every step started only once the steps producing what it
+        # consumes had finished.
+        producer_map = {}
+        for step_map in report_map["steps"]:
+            for value_name in step_map["produces"]:
+                producer_map[value_name] = step_map
+        for step_map in report_map["steps"]:
+            for value_name in step_map["consumes"]:
+                producer_step_map = producer_map[value_name]
+                self.assertGreaterEqual(
+                    step_map["start_offset_seconds"] + 0.001,
+                    producer_step_map["start_offset_seconds"]
+                    + producer_step_map["duration_seconds"],
+                    step_map["test"],
+                )
+        self.assertGreaterEqual(len(report_map["critical_path"]), 2)
+
+        # 3.0 Assert that every created resource was deleted after the workflow.
+        self.assertEqual(report_map["cleanup_errors"], [])
+        for api_request, resource_store in resource_store_map.items():
+            self.assertEqual(resource_store.resource_map, {}, api_request)
+        return None
+
+
+if __name__ == "__main__":
+    try:
+        # The tests configure their own API helper for the stand-in server.
+        common.profiling.unittest_main()
+
+    except SystemExit as error:
+        if error.args[0] == True:
+            raise